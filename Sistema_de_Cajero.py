@@ -1,8 +1,23 @@
 import datetime
+import gc
+import hashlib
 import os
 import sys
-import random
-from collections import defaultdict
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from math import gcd
+
+import antifraude
+import credenciales
+import dinero
+import enrutador
+import instantaneas
+import metricas
+from diario import DENOMINACIONES, MAX_BILLETES, MAX_CUENTA, Diario, registro
+from dinero import CENTAVOS, a_centavos, formatear
+from pantalla import Pantalla
 
 # Configuración de colores para la interfaz
 class Colors:
@@ -15,41 +30,844 @@ class Colors:
     BOLD = '\033[1m'
 
 # Clases principales del sistema
+# Las entidades usan __slots__: con millones de clientes y cuentas el
+# __dict__ de cada instancia es la mayor parte de la memoria del proceso
+# 'credencial' es el hash de la contraseña (ver credenciales.py)
 class Cliente:
-    def __init__(self, id, nombre, password):
+    __slots__ = ('id', 'nombre', 'credencial')
+
+    def __init__(self, id, nombre, credencial):
         self.id = id
         self.nombre = nombre
-        self.password = password
+        self.credencial = credencial
+
+# Columna de saldos en centavos: un array('q') que además lleva el índice
+# por rango de saldo (IndiceSaldos) una vez que alguien lo pide
+class ColumnaSaldos(array):
+    __slots__ = ('indice',)
 
+    def __new__(cls, saldos=()):
+        columna = super().__new__(cls, 'q', saldos)
+        columna.indice = None
+        return columna
+
+# El saldo, en centavos (ver dinero.py), vive en una columna array('q'):
+# la del banco desde que la cuenta se agrega (Banco.saldos), o una propia
+# de un elemento mientras tanto. Asignar un float falla.
 class Cuenta:
+    __slots__ = ('numero', 'cliente_id', '_saldos', '_fila', '_movimientos')
+
     def __init__(self, numero, cliente_id, saldo=0):
         self.numero = numero
         self.cliente_id = cliente_id
-        self.saldo = saldo
-        self.movimientos = []
+        self._saldos = ColumnaSaldos((saldo,))
+        self._fila = 0
+        self._movimientos = None
+
+    # Cuenta ya ubicada en la fila 'fila' de una columna de saldos
+    @classmethod
+    def en_columna(cls, numero, cliente_id, saldos, fila):
+        cuenta = cls.__new__(cls)
+        cuenta.numero = numero
+        cuenta.cliente_id = cliente_id
+        cuenta._saldos = saldos
+        cuenta._fila = fila
+        cuenta._movimientos = None
+        return cuenta
+
+    @property
+    def saldo(self):
+        return self._saldos[self._fila]
+
+    @saldo.setter
+    def saldo(self, saldo):
+        saldos = self._saldos
+        if saldos.indice is None:
+            saldos[self._fila] = saldo
+        else:
+            fila = self._fila
+            anterior = saldos[fila]
+            saldos[fila] = saldo
+            saldos.indice.mover(fila, anterior, saldo)
+
+    # El historial se crea con el primer acceso: la mayoría de las cuentas
+    # de una carga masiva nunca lo usan. Con diario, _movimientos guarda el
+    # Diario hasta que se pide el historial.
+    @property
+    def movimientos(self):
+        historial = self._movimientos
+        if historial is None:
+            historial = self._movimientos = HistorialMovimientos(self.numero)
+        elif type(historial) is Diario:
+            historial = self._movimientos = HistorialDiario(historial, self.numero)
+        return historial
+
+    @movimientos.setter
+    def movimientos(self, historial):
+        self._movimientos = historial
+
+    # Consulta filtrada y paginada del historial; ver IndiceMovimientos.consultar
+    @metricas.medir("movimientos")
+    def consultar_movimientos(self, desde=None, hasta=None, tipo=None, servicio=None,
+                              contraparte=None, limite=20, cursor=None, descendente=True):
+        with bloqueo_cuenta(self):
+            return self.movimientos.consultar(desde=desde, hasta=hasta, tipo=tipo, servicio=servicio,
+                                              contraparte=contraparte, limite=limite, cursor=cursor,
+                                              descendente=descendente)
+
+# Inventario de billetes: un dict que avisa al dispensador de cada cambio
+# para mantener al día la caché de montos alcanzables
+class Inventario(dict):
+    __slots__ = ('_dispensador',)
+
+    def __init__(self, dispensador, billetes=()):
+        super().__init__(billetes)
+        self._dispensador = dispensador
+
+    def __setitem__(self, denom, cantidad):
+        anterior = self.get(denom, 0)
+        super().__setitem__(denom, cantidad)
+        self._dispensador._billetes_cambiados(denom, anterior, cantidad)
+
+    def __delitem__(self, denom):
+        anterior = self[denom]
+        super().__delitem__(denom)
+        self._dispensador._billetes_cambiados(denom, anterior, 0)
+
+    def update(self, *args, **kwargs):
+        for denom, cantidad in dict(*args, **kwargs).items():
+            self[denom] = cantidad
+
+    def setdefault(self, denom, cantidad=0):
+        if denom not in self:
+            self[denom] = cantidad
+        return self[denom]
+
+    def pop(self, denom, *default):
+        if denom not in self:
+            return super().pop(denom, *default)
+        cantidad = self[denom]
+        del self[denom]
+        return cantidad
 
+    def popitem(self):
+        denom, cantidad = super().popitem()
+        self._dispensador._billetes_cambiados(denom, cantidad, 0)
+        return denom, cantidad
+
+    # Suma cantidades (negativas para sacar) a varias denominaciones de una
+    # vez: el efectivo y el enrutador se actualizan una sola vez por
+    # operación y no una por denominación
+    def sumar(self, cambios):
+        dispensador = self._dispensador
+        efectivo = dispensador.efectivo
+        for denom, cantidad in cambios.items():
+            if cantidad:
+                anterior = self.get(denom, 0)
+                super().__setitem__(denom, anterior + cantidad)
+                efectivo += denom * cantidad
+                dispensador._mascara_cambiada(denom, anterior, anterior + cantidad)
+        if efectivo != dispensador.efectivo:
+            dispensador._efectivo_cambiado(efectivo)
+
+    def clear(self):
+        super().clear()
+        self._dispensador._prefijos = None
+        self._dispensador._alcance = None
+        self._dispensador._efectivo_cambiado(0)
+
+# 'efectivo' es el total en pesos del inventario, al día con cada cambio de
+# billetes; si el dispensador está en un Enrutador, cada cambio le avisa.
+# La máscara de montos alcanzables se guarda por prefijos: _prefijos[i] es
+# la de las primeras i denominaciones de _orden, de menor a mayor. Un
+# cambio en una denominación solo toca los prefijos que la incluyen: un
+# depósito los amplía y un retiro descarta esos y se rehacen desde el
+# anterior. Los retiros sacan sobre todo billetes grandes, que van al
+# final, así casi nunca se rehace la máscara entera.
 class Dispensador:
+    __slots__ = ('id', 'ubicacion', 'bloqueo', 'efectivo', '_billetes', '_orden', '_prefijos',
+                 '_alcance', '_enrutador')
+
+    # Montos hasta este límite se responden desde la caché; uno mayor se
+    # calcula en el momento. Acotar la máscara mantiene su costo fijo aunque
+    # el cajero acumule mucho efectivo.
+    LIMITE_ALCANCE = 20000
+
     def __init__(self, id, ubicacion):
         self.id = id
         self.ubicacion = ubicacion
+        self.bloqueo = threading.Lock()
+        self._orden = None
+        self._prefijos = None
+        self._alcance = None
+        self._enrutador = None
         self.billetes = {200: 0, 100: 0, 50: 0, 20: 0}
 
+    @property
+    def billetes(self):
+        return self._billetes
+
+    @billetes.setter
+    def billetes(self, billetes):
+        self._billetes = Inventario(self, billetes)
+        self._prefijos = None
+        self._alcance = None
+        self._efectivo_cambiado(sum(denom * cantidad for denom, cantidad in self._billetes.items()))
+
+    def _efectivo_cambiado(self, efectivo):
+        self.efectivo = efectivo
+        if self._enrutador is not None:
+            self._enrutador._mover(self)
+
+    # Se llama desde Inventario. Solo importa la cantidad recortada a lo que
+    # cabe bajo el límite: si no cambia, la máscara sigue valiendo. Si sube,
+    # los prefijos que incluyen la denominación se amplían; si baja, se
+    # descartan y se rehacen en la próxima consulta. Una denominación nueva
+    # o quitada cambia el orden: se rehace todo.
+    def _billetes_cambiados(self, denom, anterior, cantidad):
+        if cantidad != anterior:
+            self._efectivo_cambiado(self.efectivo + denom * (cantidad - anterior))
+        self._mascara_cambiada(denom, anterior, cantidad)
+
+    def _mascara_cambiada(self, denom, anterior, cantidad):
+        tope = self.LIMITE_ALCANCE // denom
+        anterior, cantidad = min(anterior, tope), min(cantidad, tope)
+        prefijos = self._prefijos
+        if anterior == cantidad or prefijos is None:
+            if anterior != cantidad:
+                self._alcance = None
+            return
+        self._alcance = None
+        if denom not in self._orden or denom not in self._billetes:
+            self._prefijos = None
+            return
+        posicion = self._orden.index(denom) + 1
+        if cantidad > anterior:
+            self._prefijos = prefijos[:posicion] + [
+                _agregar_billetes(mascara, denom, cantidad - anterior, self.LIMITE_ALCANCE)
+                for mascara in prefijos[posicion:]]
+        else:
+            self._prefijos = prefijos[:posicion]
+
+    # Máscara de bits: el bit i está encendido si el monto i se puede entregar
+    def montos_alcanzables(self, limite=None):
+        if limite is not None and limite != self.LIMITE_ALCANCE:
+            return _mascara_alcanzable(self._billetes, limite)
+        prefijos = self._prefijos
+        if prefijos is None:
+            self._orden = sorted(self._billetes)
+            prefijos = [1]
+        if len(prefijos) <= len(self._orden):
+            prefijos = list(prefijos)
+            for denom in self._orden[len(prefijos) - 1:]:
+                cantidad = min(self._billetes[denom], self.LIMITE_ALCANCE // denom)
+                prefijos.append(_agregar_billetes(prefijos[-1], denom, cantidad,
+                                                  self.LIMITE_ALCANCE))
+            self._prefijos = prefijos
+        return prefijos[-1]
+
+    # Consulta O(1) sobre la máscara ya convertida a bytes
+    def puede_dispensar(self, monto):
+        if monto < 0:
+            return False
+        if monto > self.LIMITE_ALCANCE:
+            return bool(self.montos_alcanzables(monto) >> monto & 1)
+        if self._alcance is None:
+            mascara = self.montos_alcanzables()
+            self._alcance = mascara.to_bytes((mascara.bit_length() + 7) // 8, 'little')
+        if (monto >> 3) >= len(self._alcance):
+            return False
+        return bool(self._alcance[monto >> 3] >> (monto & 7) & 1)
+
+_recortes = {}
+
+def _mascara_alcanzable(billetes, limite):
+    mascara = 1
+    for denom, cantidad in billetes.items():
+        mascara = _agregar_billetes(mascara, denom, min(cantidad, limite // denom), limite)
+    return mascara
+
+# Agrega 'cantidad' billetes de 'denom' a una máscara de montos alcanzables
+# usando división binaria (1, 2, 4, ...) para que sean log(cantidad)
+# desplazamientos, descartando los montos por encima de 'limite'
+def _agregar_billetes(mascara, denom, cantidad, limite):
+    recorte = _recortes.get(limite)
+    if recorte is None:
+        recorte = _recortes[limite] = (1 << (limite + 1)) - 1
+    lote = 1
+    while cantidad > 0:
+        tomar = min(lote, cantidad)
+        mascara = (mascara | mascara << (denom * tomar)) & recorte
+        cantidad -= tomar
+        lote <<= 1
+    return mascara
+
+# La fecha se guarda como microsegundos desde epoch (int) y se convierte a
+# datetime solo cuando se lee el atributo 'fecha'
+# Retiros y depósitos llevan además el dispensador y los billetes
+# ({denominación: cantidad}) que salieron o entraron
+# 'clave' y 'referencia' solo los lleva un pago idempotente (ver pagos.py)
+# hasta escribirse en el diario; al leer el historial son None
 class Movimiento:
-    def __init__(self, tipo, monto, cuenta_numero, cuenta_destino=None, servicio=None):
-        self.fecha = datetime.datetime.now()
+    __slots__ = ('fecha_us', 'tipo', 'monto', 'cuenta_numero', 'cuenta_destino', 'servicio',
+                 'dispensador_id', 'billetes', 'clave', 'referencia')
+
+    def __init__(self, tipo, monto, cuenta_numero, cuenta_destino=None, servicio=None, fecha=None,
+                 dispensador_id=None, billetes=None, clave=None, referencia=None):
+        if fecha is None:
+            self.fecha_us = time.time_ns() // 1000
+        else:
+            self.fecha = fecha
         self.tipo = tipo
         self.monto = monto
         self.cuenta_numero = cuenta_numero
         self.cuenta_destino = cuenta_destino
         self.servicio = servicio
+        self.dispensador_id = dispensador_id
+        self.billetes = billetes
+        self.clave = clave
+        self.referencia = referencia
+
+    @property
+    def fecha(self):
+        return datetime.datetime.fromtimestamp(self.fecha_us / 1_000_000)
+
+    @fecha.setter
+    def fecha(self, fecha):
+        self.fecha_us = round(fecha.timestamp() * 1_000_000)
+
+    @classmethod
+    def desde_columnas(cls, fecha_us, tipo, monto, cuenta_numero, cuenta_destino, servicio,
+                       dispensador_id=None, billetes=None):
+        movimiento = cls.__new__(cls)
+        movimiento.fecha_us = fecha_us
+        movimiento.tipo = tipo
+        movimiento.monto = monto
+        movimiento.cuenta_numero = cuenta_numero
+        movimiento.cuenta_destino = cuenta_destino
+        movimiento.servicio = servicio
+        movimiento.dispensador_id = dispensador_id
+        movimiento.billetes = billetes
+        movimiento.clave = None
+        movimiento.referencia = None
+        return movimiento
+
+# Tabla de internado: asigna un código entero a cada texto distinto
+# (tipos, servicios, números de cuenta) para guardarlos en arreglos
+class Catalogo:
+    __slots__ = ('_codigos', '_textos', '_lock')
+
+    def __init__(self, textos=()):
+        self._codigos = {}
+        self._textos = []
+        self._lock = threading.Lock()
+        for texto in textos:
+            self.codigo(texto)
+
+    def codigo(self, texto):
+        codigo = self._codigos.get(texto)
+        if codigo is None:
+            with self._lock:
+                codigo = self._codigos.get(texto)
+                if codigo is None:
+                    self._textos.append(texto)
+                    codigo = self._codigos[texto] = len(self._textos) - 1
+        return codigo
+
+    def texto(self, codigo):
+        return self._textos[codigo]
+
+    # Código de un texto ya registrado, sin registrarlo si no existe
+    def buscar(self, texto):
+        return self._codigos.get(texto)
+
+# El código 0 de servicios es "sin servicio"
+TIPOS_MOVIMIENTO = Catalogo(("RETIRO", "DEPÓSITO", "TRANSFERENCIA", "PAGO_SERVICIO"))
+SERVICIOS_MOVIMIENTO = Catalogo((None, "Luz", "Agua", "Gas", "Internet"))
+NUMEROS_CUENTA = Catalogo()
+_SIN_DESTINO = -1
+
+def _a_microsegundos(valor):
+    if valor is None or isinstance(valor, int):
+        return valor
+    if not isinstance(valor, datetime.datetime):
+        valor = datetime.datetime.combine(valor, datetime.time())
+    return round(valor.timestamp() * 1_000_000)
+
+class PaginaMovimientos:
+    __slots__ = ('movimientos', 'cursor')
+
+    def __init__(self, movimientos, cursor):
+        self.movimientos = movimientos
+        # Pasar este cursor a la siguiente consulta continúa donde terminó
+        # esta página; None si no hay más resultados
+        self.cursor = cursor
+
+# Índices del historial de una cuenta: las posiciones de cada tipo, servicio
+# y contraparte, en orden de llegada. Como los movimientos llegan en orden de
+# fecha, tanto las fechas como cualquier lista de posiciones se pueden
+# recorrer con bisect. Si llegara un movimiento con fecha anterior al último
+# se marca 'ordenado' en falso y las fechas se filtran fila por fila.
+class IndiceMovimientos:
+    __slots__ = ('fechas', 'ordenado', 'por_tipo', 'por_servicio', 'por_contraparte', '_propias')
+
+    def __init__(self, fechas=None):
+        self._propias = fechas is None
+        self.fechas = array('q') if fechas is None else fechas
+        self.ordenado = True
+        self.por_tipo = {}
+        self.por_servicio = {}
+        self.por_contraparte = {}
+
+    # Se llama después de que la fila i ya está en el historial
+    def agregar(self, i, fecha, tipo, servicio, destino):
+        if self._propias:
+            self.fechas.append(fecha)
+        if i > 0 and fecha < self.fechas[i - 1]:
+            self.ordenado = False
+        self.por_tipo.setdefault(tipo, array('q')).append(i)
+        if servicio:
+            self.por_servicio.setdefault(servicio, array('q')).append(i)
+        if destino != _SIN_DESTINO:
+            self.por_contraparte.setdefault(destino, array('q')).append(i)
+
+    def consultar(self, historial, desde=None, hasta=None, tipo=None, servicio=None,
+                  contraparte=None, limite=20, cursor=None, descendente=True):
+        filtros = []
+        for valor, catalogo, indice in ((tipo, TIPOS_MOVIMIENTO, self.por_tipo),
+                                        (servicio, SERVICIOS_MOVIMIENTO, self.por_servicio),
+                                        (contraparte, NUMEROS_CUENTA, self.por_contraparte)):
+            if valor is None:
+                filtros.append(None)
+                continue
+            codigo = catalogo.buscar(valor)
+            if codigo not in indice:
+                return PaginaMovimientos([], None)
+            filtros.append(codigo)
+        desde, hasta = _a_microsegundos(desde), _a_microsegundos(hasta)
+
+        # Se recorre la lista de posiciones más corta entre los filtros pedidos
+        candidatas = [indice[codigo] for codigo, indice in
+                      zip(filtros, (self.por_tipo, self.por_servicio, self.por_contraparte))
+                      if codigo is not None]
+        base = min(candidatas, key=len) if candidatas else None
+        total = len(base) if base is not None else len(self.fechas)
+        fila = base.__getitem__ if base is not None else int
+        fecha_de = self.fechas.__getitem__
+
+        inicio, fin = 0, total
+        if self.ordenado:
+            clave = (lambda j: fecha_de(base[j])) if base is not None else fecha_de
+            if desde is not None:
+                inicio = bisect_left(range(total), desde, key=clave)
+            if hasta is not None:
+                fin = bisect_left(range(total), hasta, key=clave, lo=inicio)
+        if cursor is not None:
+            posiciones = base if base is not None else range(total)
+            if descendente:
+                fin = min(fin, bisect_left(posiciones, cursor))
+            else:
+                inicio = max(inicio, bisect_right(posiciones, cursor))
+
+        tipo_codigo, servicio_codigo, contraparte_codigo = filtros
+        resultado = []
+        ultima = None
+        recorrido = range(fin - 1, inicio - 1, -1) if descendente else range(inicio, fin)
+        for j in recorrido:
+            i = fila(j)
+            if not self.ordenado:
+                fecha = fecha_de(i)
+                if (desde is not None and fecha < desde) or (hasta is not None and fecha >= hasta):
+                    continue
+            if len(candidatas) > 1:
+                codigos = historial._codigos_fila(i)
+                if ((tipo_codigo is not None and codigos[0] != tipo_codigo)
+                        or (servicio_codigo is not None and codigos[1] != servicio_codigo)
+                        or (contraparte_codigo is not None and codigos[2] != contraparte_codigo)):
+                    continue
+            if len(resultado) == limite:
+                return PaginaMovimientos(resultado, ultima)
+            resultado.append(historial._fila(i))
+            ultima = i
+        return PaginaMovimientos(resultado, None)
+
+# Dispensador y billetes de los movimientos en efectivo de un historial:
+# solo las filas que los tienen, en orden, con los billetes en el orden de
+# DENOMINACIONES (cuatro cantidades por fila)
+class EfectivoMovimientos:
+    __slots__ = ('filas', 'dispensadores', 'billetes')
+
+    def __init__(self):
+        self.filas = array('q')
+        self.dispensadores = array('q')
+        self.billetes = array('H')
+
+    def agregar(self, fila, dispensador_id, billetes):
+        self.filas.append(fila)
+        self.dispensadores.append(dispensador_id)
+        self.billetes.extend([billetes.get(denom, 0) for denom in DENOMINACIONES])
+
+    # (dispensador_id, billetes) de la fila, o (None, None)
+    def buscar(self, fila):
+        i = bisect_left(self.filas, fila)
+        if i == len(self.filas) or self.filas[i] != fila:
+            return None, None
+        cantidades = self.billetes[i * len(DENOMINACIONES):(i + 1) * len(DENOMINACIONES)]
+        return self.dispensadores[i], {denom: cant for denom, cant in zip(DENOMINACIONES, cantidades)
+                                       if cant}
+
+# Historial en columnas: fecha en microsegundos (int64), monto (centavos),
+# tipo y servicio como códigos de un byte y la cuenta destino como código
+# entero de NUMEROS_CUENTA. Se comporta como una lista de Movimiento; los objetos se crean
+# solo al leerlos. Las columnas se reservan con el primer movimiento y las
+# de efectivo con el primer retiro o depósito.
+class HistorialMovimientos:
+    __slots__ = ('cuenta_numero', 'fechas', 'montos', 'tipos', 'servicios', 'destinos', 'efectivo',
+                 '_indice')
+
+    def __init__(self, cuenta_numero):
+        self.cuenta_numero = cuenta_numero
+        self.fechas = None
+        self.efectivo = None
+        self._indice = None
+
+    def _reservar(self):
+        self.fechas = array('q')
+        self.montos = array('q')
+        self.tipos = array('B')
+        self.servicios = array('B')
+        self.destinos = array('q')
+
+    def append(self, movimiento):
+        if self.fechas is None:
+            self._reservar()
+        tipo = TIPOS_MOVIMIENTO.codigo(movimiento.tipo)
+        servicio = SERVICIOS_MOVIMIENTO.codigo(movimiento.servicio)
+        destino = movimiento.cuenta_destino
+        destino = _SIN_DESTINO if destino is None else NUMEROS_CUENTA.codigo(destino)
+        self.fechas.append(movimiento.fecha_us)
+        self.montos.append(movimiento.monto)
+        self.tipos.append(tipo)
+        self.servicios.append(servicio)
+        self.destinos.append(destino)
+        if movimiento.dispensador_id is not None:
+            if self.efectivo is None:
+                self.efectivo = EfectivoMovimientos()
+            self.efectivo.agregar(len(self.fechas) - 1, movimiento.dispensador_id,
+                                  movimiento.billetes or {})
+        if self._indice is not None:
+            self._indice.agregar(len(self.fechas) - 1, movimiento.fecha_us, tipo, servicio, destino)
+
+    # Los índices se arman con la primera consulta y desde ahí se mantienen
+    # en cada append; las cuentas que nunca se consultan no los pagan
+    def consultar(self, **filtros):
+        if self._indice is None:
+            if self.fechas is None:
+                self._reservar()
+            indice = IndiceMovimientos(self.fechas)
+            for i in range(len(self.fechas)):
+                indice.agregar(i, self.fechas[i], self.tipos[i], self.servicios[i], self.destinos[i])
+            self._indice = indice
+        return self._indice.consultar(self, **filtros)
+
+    def _codigos_fila(self, i):
+        return self.tipos[i], self.servicios[i], self.destinos[i]
+
+    def _fila(self, i):
+        return self._leer(i)
+
+    def __len__(self):
+        return 0 if self.fechas is None else len(self.fechas)
+
+    def _leer(self, i):
+        destino = self.destinos[i]
+        dispensador_id, billetes = (None, None) if self.efectivo is None else self.efectivo.buscar(i)
+        return Movimiento.desde_columnas(
+            self.fechas[i], TIPOS_MOVIMIENTO.texto(self.tipos[i]), self.montos[i], self.cuenta_numero,
+            None if destino == _SIN_DESTINO else NUMEROS_CUENTA.texto(destino),
+            SERVICIOS_MOVIMIENTO.texto(self.servicios[i]), dispensador_id, billetes)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._leer(i) for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return self._leer(indice)
 
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._leer(i)
+
+# Historial de una cuenta respaldado por el diario: solo guarda la posición
+# de cada registro y crea los Movimiento bajo demanda al leerlos
+class HistorialDiario:
+    __slots__ = ('diario', 'cuenta_numero', 'posiciones', '_indice')
+
+    def __init__(self, diario, cuenta_numero, posiciones=None):
+        self.diario = diario
+        self.cuenta_numero = cuenta_numero
+        self.posiciones = posiciones if posiciones is not None else array('q')
+        self._indice = None
+
+    def append(self, movimiento):
+        self._agregado(self.diario.agregar_registros([_registro(movimiento)])[0], movimiento)
+
+    # El movimiento ya está en el diario con el número 'seq'
+    def _agregado(self, seq, movimiento):
+        self.posiciones.append(seq)
+        if self._indice is not None:
+            self._indice.agregar(len(self.posiciones) - 1, movimiento.fecha_us,
+                                 *self._codigos_fila(len(self.posiciones) - 1))
+
+    # Igual que en HistorialMovimientos, pero las fechas del índice se copian
+    # del diario porque no hay columnas en memoria
+    def consultar(self, **filtros):
+        if self._indice is None:
+            indice = IndiceMovimientos()
+            for i, seq in enumerate(self.posiciones):
+                indice.agregar(i, self.diario.vista[seq][1], *self._codigos_fila(i))
+            self._indice = indice
+        return self._indice.consultar(self, **filtros)
+
+    def _codigos_fila(self, i):
+        _, _, tipo, servicio, _, _, destino, _, _ = self.diario.vista[self.posiciones[i]]
+        return (TIPOS_MOVIMIENTO.codigo(tipo), SERVICIOS_MOVIMIENTO.codigo(servicio),
+                _SIN_DESTINO if destino is None else NUMEROS_CUENTA.codigo(destino))
+
+    def _fila(self, i):
+        return self._leer(self.posiciones[i])
+
+    def __len__(self):
+        return len(self.posiciones)
+
+    def __bool__(self):
+        return len(self.posiciones) > 0
+
+    def _leer(self, seq):
+        _, fecha, tipo, servicio, monto, cuenta, destino, dispensador_id, billetes = self.diario.vista[seq]
+        return Movimiento.desde_columnas(fecha, tipo, monto, cuenta, destino, servicio,
+                                         dispensador_id, billetes)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._leer(seq) for seq in self.posiciones[indice]]
+        return self._leer(self.posiciones[indice])
+
+    def __iter__(self):
+        for seq in self.posiciones:
+            yield self._leer(seq)
+
+def _registro(movimiento):
+    return registro(movimiento.tipo, movimiento.monto, movimiento.cuenta_numero,
+                    movimiento.cuenta_destino, movimiento.servicio, movimiento.fecha_us,
+                    movimiento.dispensador_id, movimiento.billetes, movimiento.clave,
+                    movimiento.referencia)
+
+# Registra los movimientos de una operación, pares (cuenta, movimiento).
+# Las operaciones lo llaman antes de tocar saldos y billetes: si el diario
+# falla (cerrado, sin espacio, un valor que no puede guardar) lanza el
+# error sin que nada haya cambiado. Con diario van todos en una escritura.
+def _registrar(*pares):
+    if len(pares) == 1:
+        cuenta, movimiento = pares[0]
+        cuenta.movimientos.append(movimiento)
+        return
+    historiales = [cuenta.movimientos for cuenta, _ in pares]
+    diario = getattr(historiales[0], 'diario', None)
+    if diario is None or any(getattr(historial, 'diario', None) is not diario
+                                                for historial in historiales):
+        for historial, (_, movimiento) in zip(historiales, pares):
+            historial.append(movimiento)
+        return
+    posiciones = diario.agregar_registros([_registro(movimiento) for _, movimiento in pares])
+    for historial, (_, movimiento), seq in zip(historiales, pares, posiciones):
+        historial._agregado(seq, movimiento)
+
+# Índice ordenado por un atributo (id o número): claves y objetos en dos
+# listas paralelas ordenadas. Como los ids suelen crecer, insertar casi
+# siempre es agregar al final. Las claves que llegan desordenadas esperan en
+# una lista aparte y se mezclan en la siguiente lectura con un solo sort
+# (Timsort aprovecha que la parte principal ya está ordenada), así una carga
+# masiva en cualquier orden no paga un insert O(n) por elemento.
+class IndiceOrdenado:
+    __slots__ = ('atributo', 'claves', '_objetos', '_pendientes')
+
+    def __init__(self, atributo):
+        self.atributo = atributo
+        self.claves = []
+        self._objetos = []
+        self._pendientes = []
+
+    def agregar(self, objeto):
+        clave = getattr(objeto, self.atributo)
+        if not self._pendientes and (not self.claves or clave > self.claves[-1]):
+            self.claves.append(clave)
+            self._objetos.append(objeto)
+        else:
+            self._pendientes.append(objeto)
+
+    # Carga masiva: si los objetos ya vienen ordenados y después de la última
+    # clave (por ejemplo, desde una instantánea) se agregan sin ordenar nada
+    def extender(self, objetos):
+        claves = [getattr(objeto, self.atributo) for objeto in objetos]
+        if (not self._pendientes and (not self.claves or not claves or claves[0] > self.claves[-1])
+                and all(a < b for a, b in zip(claves, claves[1:]))):
+            self.claves.extend(claves)
+            self._objetos.extend(objetos)
+        else:
+            self._pendientes.extend(objetos)
+
+    # Mezcla los pendientes; con claves repetidas queda el último agregado
+    def _consolidar(self):
+        if not self._pendientes:
+            return
+        atributo = self.atributo
+        todos = self._objetos + self._pendientes
+        todos.sort(key=lambda objeto: getattr(objeto, atributo))
+        objetos = []
+        claves = []
+        for objeto in todos:
+            clave = getattr(objeto, atributo)
+            if claves and claves[-1] == clave:
+                objetos[-1] = objeto
+            else:
+                claves.append(clave)
+                objetos.append(objeto)
+        self.claves = claves
+        self._objetos = objetos
+        self._pendientes = []
+
+    @property
+    def objetos(self):
+        self._consolidar()
+        return self._objetos
+
+    def quitar(self, clave):
+        self._consolidar()
+        i = bisect_left(self.claves, clave)
+        if i < len(self.claves) and self.claves[i] == clave:
+            del self.claves[i]
+            del self._objetos[i]
+
+    def buscar(self, clave):
+        self._consolidar()
+        i = bisect_left(self.claves, clave)
+        if i < len(self.claves) and self.claves[i] == clave:
+            return self._objetos[i]
+        return None
+
+    # Objetos con clave en [desde, hasta), en orden
+    def rango(self, desde=None, hasta=None):
+        self._consolidar()
+        claves, objetos = self.claves, self._objetos
+        inicio = 0 if desde is None else bisect_left(claves, desde)
+        fin = len(claves) if hasta is None else bisect_left(claves, hasta)
+        for i in range(inicio, fin):
+            yield objetos[i]
+
+    def __len__(self):
+        self._consolidar()
+        return len(self.claves)
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+# Índice de saldos por bloques de ANCHO_BLOQUE_SALDOS centavos: cada bloque
+# guarda el conjunto de filas de la columna con saldo en su rango, y las
+# claves de los bloques no vacíos están ordenadas para recorrer un rango.
+# Un cambio de saldo dentro del mismo bloque (el caso común) no toca nada.
+ANCHO_BLOQUE_SALDOS = 1_000 * CENTAVOS
+
+class IndiceSaldos:
+    __slots__ = ('ancho', 'bloques', 'claves', '_lock')
+
+    def __init__(self, saldos=(), ancho=ANCHO_BLOQUE_SALDOS):
+        self.ancho = ancho
+        self.bloques = {}
+        self._lock = threading.Lock()
+        for fila, saldo in enumerate(saldos):
+            filas = self.bloques.get(saldo // ancho)
+            if filas is None:
+                filas = self.bloques[saldo // ancho] = set()
+            filas.add(fila)
+        self.claves = sorted(self.bloques)
+
+    def _agregar(self, fila, bloque):
+        filas = self.bloques.get(bloque)
+        if filas is None:
+            filas = self.bloques[bloque] = set()
+            insort(self.claves, bloque)
+        filas.add(fila)
+
+    def _quitar(self, fila, bloque):
+        filas = self.bloques[bloque]
+        filas.discard(fila)
+        if not filas:
+            del self.bloques[bloque]
+            del self.claves[bisect_left(self.claves, bloque)]
+
+    def agregar(self, fila, saldo):
+        with self._lock:
+            self._agregar(fila, saldo // self.ancho)
+
+    def quitar(self, fila, saldo):
+        with self._lock:
+            self._quitar(fila, saldo // self.ancho)
+
+    def mover(self, fila, anterior, saldo):
+        desde, hasta = anterior // self.ancho, saldo // self.ancho
+        if desde != hasta:
+            with self._lock:
+                self._quitar(fila, desde)
+                self._agregar(fila, hasta)
+
+    # Filas de los bloques que se cruzan con [desde, hasta); en los bloques
+    # de los extremos puede haber saldos fuera del rango
+    def filas(self, desde=None, hasta=None):
+        with self._lock:
+            claves = self.claves
+            inicio = 0 if desde is None else bisect_left(claves, desde // self.ancho)
+            fin = len(claves) if hasta is None else bisect_left(claves, -(-hasta // self.ancho))
+            return [fila for bloque in claves[inicio:fin] for fila in self.bloques[bloque]]
+
+# Cuentas indexadas por número (dict), por cliente y por rango de saldo.
+# Cada cliente tiene una cuenta principal, la de menor número, que es la
+# que usan la autenticación y las transferencias por ID de cliente; las
+# demás quedan en cuentas_adicionales (la mayoría de los clientes tiene
+# una sola y así no se paga una lista por cliente). Altas y bajas de
+# cuentas actualizan todos los índices bajo 'bloqueo' y validan antes de
+# modificar nada.
 class Banco:
     def __init__(self):
         self.clientes = []
         self.cuentas = []
         self.dispensadores = []
+        self.cuentas_por_numero = {}
         self.cuentas_por_cliente = {}
+        self.cuentas_adicionales = {}
         self.clientes_por_id = {}
+        self.diario = None
+        self.bloqueo = threading.Lock()
+        self.autenticador = credenciales.Autenticador()
+        # Reglas de velocidad y montos para retiros y transferencias
+        self.antifraude = antifraude.Antifraude()
+        # Cajeros ordenados por efectivo para enrutar retiros (ver enrutador.py)
+        self.enrutador = enrutador.Enrutador()
+        # Saldos de todas las cuentas en centavos: la cuenta banco.cuentas[i]
+        # usa la fila i; ver dinero.py para las operaciones masivas
+        self.saldos = ColumnaSaldos()
+        # Índices ordenados que reemplazan a quicksort en los listados
+        self.indice_clientes = IndiceOrdenado('id')
+        self.indice_cuentas = IndiceOrdenado('numero')
+        self.indice_dispensadores = IndiceOrdenado('id')
+        # Altas desde el último punto de control (None: no se registran);
+        # ver PuntoControl
+        self.altas_clientes = None
+        self.altas_cuentas = None
+        self.bajas_cuentas = None
+        self.cambios_credenciales = None
         
     # Algoritmo de ordenamiento: Quicksort
     def quicksort(self, arr, key='id'):
@@ -75,104 +893,975 @@ class Banco:
         return None
     
     def agregar_cliente(self, cliente):
-        self.clientes.append(cliente)
-        self.clientes_por_id[cliente.id] = cliente
+        with self.bloqueo:
+            if cliente.id in self.clientes_por_id:
+                raise OperacionError(f"Ya existe un cliente con ID {cliente.id}")
+            self.clientes.append(cliente)
+            self.clientes_por_id[cliente.id] = cliente
+            self.indice_clientes.agregar(cliente)
+            if self.altas_clientes is not None:
+                self.altas_clientes.append((cliente.id, cliente.nombre, cliente.credencial))
     
     def agregar_cuenta(self, cuenta):
-        self.cuentas.append(cuenta)
-        self.cuentas_por_cliente[cuenta.cliente_id] = cuenta
+        if len(cuenta.numero.encode('utf-8')) > MAX_CUENTA:
+            raise OperacionError(f"El número de cuenta no puede pasar de {MAX_CUENTA} bytes")
+        with self.bloqueo:
+            if cuenta.numero in self.cuentas_por_numero:
+                raise OperacionError(f"Ya existe la cuenta {cuenta.numero}")
+            fila = len(self.saldos)
+            self.saldos.append(cuenta.saldo)
+            cuenta._saldos, cuenta._fila = self.saldos, fila
+            self.cuentas.append(cuenta)
+            self.cuentas_por_numero[cuenta.numero] = cuenta
+            self._vincular_cliente(cuenta)
+            self.indice_cuentas.agregar(cuenta)
+            if self.saldos.indice is not None:
+                self.saldos.indice.agregar(fila, cuenta.saldo)
+            if self.diario is not None and not isinstance(cuenta._movimientos, HistorialDiario):
+                cuenta.movimientos = self.diario
+            # Saldo inicial: los movimientos posteriores ya quedan en el diario
+            if self.altas_cuentas is not None:
+                self.altas_cuentas.append((cuenta.numero, cuenta.cliente_id, cuenta.saldo))
+    
+    def cambiar_credencial(self, cliente, credencial):
+        with self.bloqueo:
+            cliente.credencial = credencial
+            if self.cambios_credenciales is not None:
+                self.cambios_credenciales.append((cliente.id, credencial))
+    
+    # Versiones masivas para cargar instantáneas, sin registrar altas
+    def agregar_clientes(self, clientes):
+        self.clientes.extend(clientes)
+        self.clientes_por_id.update(zip([cliente.id for cliente in clientes], clientes))
+        self.indice_clientes.extender(clientes)
+    
+    # Crea las cuentas directamente sobre la columna de saldos; 'saldos' es
+    # un array('q') y las cuentas deben venir ordenadas por número
+    def agregar_cuentas(self, numeros, cliente_ids, saldos):
+        inicio = len(self.saldos)
+        self.saldos.extend(saldos)
+        columna = self.saldos
+        cuentas = [Cuenta.en_columna(numero, cliente_id, columna, fila)
+                   for numero, cliente_id, fila in zip(numeros, cliente_ids,
+                                                       range(inicio, len(columna)))]
+        self.cuentas.extend(cuentas)
+        self.cuentas_por_numero.update(zip(numeros, cuentas))
+        principales = self.cuentas_por_cliente
+        for cuenta in cuentas:
+            if principales.setdefault(cuenta.cliente_id, cuenta) is not cuenta:
+                self._vincular_cliente(cuenta)
+        self.indice_cuentas.extender(cuentas)
+        if columna.indice is not None:
+            for cuenta in cuentas:
+                columna.indice.agregar(cuenta._fila, cuenta.saldo)
+        if self.diario is not None:
+            for cuenta in cuentas:
+                cuenta._movimientos = self.diario
+        return cuentas
+    
+    # Cierra una cuenta sin saldo. La última cuenta pasa a la fila que queda
+    # libre, así las filas de la columna siguen contiguas.
+    def quitar_cuenta(self, numero):
+        with self.bloqueo:
+            cuenta = self.cuentas_por_numero.get(numero)
+            if cuenta is None:
+                raise OperacionError(f"Cuenta no encontrada: {numero}")
+            ultima = self.cuentas[-1]
+            with bloquear_cuentas(cuenta, ultima):
+                if cuenta.saldo != 0:
+                    raise OperacionError("Solo se puede cerrar una cuenta sin saldo")
+                saldos, fila = self.saldos, cuenta._fila
+                if saldos.indice is not None:
+                    saldos.indice.quitar(fila, 0)
+                if ultima is not cuenta:
+                    if saldos.indice is not None:
+                        saldos.indice.quitar(ultima._fila, ultima.saldo)
+                        saldos.indice.agregar(fila, ultima.saldo)
+                    saldos[fila] = ultima.saldo
+                    ultima._fila = fila
+                    self.cuentas[fila] = ultima
+                saldos.pop()
+                self.cuentas.pop()
+                # La cuenta cerrada queda suelta, con su propia columna
+                cuenta._saldos, cuenta._fila = ColumnaSaldos((0,)), 0
+            del self.cuentas_por_numero[numero]
+            self._desvincular_cliente(cuenta)
+            self.indice_cuentas.quitar(numero)
+            if self.bajas_cuentas is not None:
+                self.bajas_cuentas.append(numero)
+        return cuenta
+    
+    def _vincular_cliente(self, cuenta):
+        principal = self.cuentas_por_cliente.get(cuenta.cliente_id)
+        if principal is None or principal is cuenta:
+            self.cuentas_por_cliente[cuenta.cliente_id] = cuenta
+            return
+        if cuenta.numero < principal.numero:
+            self.cuentas_por_cliente[cuenta.cliente_id] = cuenta
+            cuenta = principal
+        adicionales = self.cuentas_adicionales.setdefault(cuenta.cliente_id, [])
+        i = bisect_left([otra.numero for otra in adicionales], cuenta.numero)
+        adicionales.insert(i, cuenta)
+    
+    def _desvincular_cliente(self, cuenta):
+        cliente_id = cuenta.cliente_id
+        adicionales = self.cuentas_adicionales.get(cliente_id)
+        if self.cuentas_por_cliente.get(cliente_id) is cuenta:
+            if adicionales:
+                self.cuentas_por_cliente[cliente_id] = adicionales.pop(0)
+            else:
+                del self.cuentas_por_cliente[cliente_id]
+        elif adicionales:
+            adicionales.remove(cuenta)
+        if adicionales is not None and not adicionales:
+            del self.cuentas_adicionales[cliente_id]
+    
+    # Cuentas de un cliente, la principal primero
+    def cuentas_de_cliente(self, cliente_id):
+        principal = self.cuentas_por_cliente.get(cliente_id)
+        if principal is None:
+            return []
+        return [principal] + self.cuentas_adicionales.get(cliente_id, [])
+    
+    # Destino de una transferencia: un número de cuenta (str) o el ID de un
+    # cliente (int), que recibe en su cuenta principal
+    def cuenta_destino(self, destino):
+        if isinstance(destino, str):
+            return self.cuentas_por_numero.get(destino)
+        return self.cuentas_por_cliente.get(destino)
+    
+    # Número libre para una cuenta nueva del cliente: CTA-0007, CTA-0007-2...
+    # (sin reusar uno cerrado desde el último punto de control)
+    def nuevo_numero_cuenta(self, cliente_id):
+        base = f"CTA-{cliente_id:04d}"
+        numero, n = base, 1
+        while numero in self.cuentas_por_numero or numero in (self.bajas_cuentas or ()):
+            n += 1
+            numero = f"{base}-{n}"
+        return numero
+    
+    # Cuentas con saldo en [desde, hasta), de menor a mayor saldo. El índice
+    # se arma con la primera consulta, con todas las franjas de bloqueo
+    # tomadas para que ningún saldo cambie a medias, y desde ahí lo mantiene
+    # cada asignación de Cuenta.saldo.
+    def cuentas_por_saldo(self, desde=None, hasta=None):
+        with self.bloqueo:
+            saldos = self.saldos
+            if saldos.indice is None:
+                with bloquear_todas_las_cuentas():
+                    saldos.indice = IndiceSaldos(saldos)
+            filas = [fila for fila in saldos.indice.filas(desde, hasta)
+                     if (desde is None or saldos[fila] >= desde)
+                     and (hasta is None or saldos[fila] < hasta)]
+            filas.sort(key=saldos.__getitem__)
+            return [self.cuentas[fila] for fila in filas]
+    
+    def total_saldos(self):
+        return dinero.total(self.saldos)
+    
+    def agregar_dispensador(self, dispensador):
+        with self.bloqueo:
+            if dispensador.id in self.enrutador:
+                raise OperacionError(f"Ya existe un cajero con ID {dispensador.id}")
+            self.dispensadores.append(dispensador)
+            self.indice_dispensadores.agregar(dispensador)
+            self.enrutador.agregar(dispensador)
+    
+    # Listados en orden de id/número, opcionalmente acotados a [desde, hasta)
+    def listar_clientes(self, desde=None, hasta=None):
+        return self.indice_clientes.rango(desde, hasta)
+    
+    def listar_cuentas(self, desde=None, hasta=None):
+        return self.indice_cuentas.rango(desde, hasta)
+    
+    def listar_dispensadores(self, desde=None, hasta=None):
+        return self.indice_dispensadores.rango(desde, hasta)
+
+# Abre (o crea) el diario en 'ruta', reaplica sus movimientos sobre los saldos
+# del banco y conecta el historial de cada cuenta al diario. Devuelve la
+# cantidad de registros de cuentas que no existen en el banco.
+def abrir_diario(banco, ruta):
+    banco.diario = Diario(ruta)
+    for cuenta in banco.cuentas:
+        cuenta.movimientos = banco.diario
+    return reaplicar_diario(banco, 0)
+
+# Reaplica los registros del diario desde 'desde' (los anteriores ya están
+# en los saldos, por ejemplo al cargar una instantánea) y agrega sus
+# posiciones al historial de cada cuenta. Por omisión el diario del banco;
+# otro 'diario' debe ser el que ya tienen conectado sus cuentas.
+def reaplicar_diario(banco, desde, diario=None):
+    if diario is None:
+        diario = banco.diario
+    buscar = banco.indice_cuentas.buscar
+    cuenta = None
+    for seq in range(desde, diario.total):
+        _, _, _, _, monto, cuenta_numero, *_ = diario.vista[seq]
+        if cuenta is None or cuenta.numero != cuenta_numero:
+            cuenta = buscar(cuenta_numero)
+            if cuenta is None:
+                diario.descartados += 1
+                continue
+        cuenta.saldo += monto
+        cuenta.movimientos.posiciones.append(seq)
+    return diario.descartados
+
+# Instantáneas y puntos de control (formato en instantaneas.py). En el
+# directorio de datos hay una base (estado completo hasta la posición 'seq'
+# del diario) y deltas encadenados [seq_inicio, seq_fin) con las altas, el
+# efecto neto de los movimientos por cuenta y el inventario de los cajeros.
+# Al arrancar se carga la base, se aplican los deltas y solo se reaplica del
+# diario la cola posterior al último delta.
+#
+# Cada delta lleva un número correlativo: uno con altas pero sin
+# movimientos nuevos cubre [seq, seq) y solo el número lo distingue del
+# anterior. La base guarda el número del último delta que ya incluye, así
+# los que quedan si se cortó una compactación no se vuelven a aplicar.
+_BASE = "base.inst"
+
+def _nombre_delta(numero, inicio, fin):
+    return f"delta-{numero:08d}-{inicio:016d}-{fin:016d}.inst"
+
+# (número, seq_inicio, seq_fin, ruta) de cada delta, en orden de número
+def _deltas(directorio):
+    deltas = []
+    for nombre in os.listdir(directorio):
+        if nombre.startswith("delta-") and nombre.endswith(".inst"):
+            _, numero, inicio, fin = nombre[:-len(".inst")].split("-")
+            deltas.append((int(numero), int(inicio), int(fin), os.path.join(directorio, nombre)))
+    return sorted(deltas)
+
+# Número del último delta escrito en 'directorio', esté o no en la base
+def _ultimo_delta(directorio):
+    ruta_base = os.path.join(directorio, _BASE)
+    ultimo = instantaneas.leer_cabecera(ruta_base)[1] if os.path.exists(ruta_base) else 0
+    for numero, _, _, _ in _deltas(directorio):
+        ultimo = max(ultimo, numero)
+    return ultimo
+
+def _secciones_clientes(ids, nombres, credenciales_clientes):
+    return {b'CLID': instantaneas.empaquetar_numeros(ids),
+            b'CLNO': instantaneas.empaquetar_textos(nombres),
+            b'CLPW': instantaneas.empaquetar_textos(credenciales_clientes)}
+
+def _secciones_cuentas(numeros, cliente_ids, saldos):
+    return {b'CUNU': instantaneas.empaquetar_textos(numeros),
+            b'CUCL': instantaneas.empaquetar_numeros(cliente_ids),
+            b'CUSA': instantaneas.empaquetar_numeros(saldos)}
+
+# Cada inventario se copia bajo el bloqueo de su dispensador
+def _secciones_dispensadores(banco):
+    dispensadores = list(banco.listar_dispensadores())
+    cantidades, billetes = [], []
+    for dispensador in dispensadores:
+        with dispensador.bloqueo:
+            inventario = list(dispensador.billetes.items())
+        cantidades.append(len(inventario))
+        for denom, cantidad in inventario:
+            billetes += (denom, cantidad)
+    return {b'DIID': instantaneas.empaquetar_numeros([d.id for d in dispensadores]),
+            b'DIUB': instantaneas.empaquetar_textos([d.ubicacion for d in dispensadores]),
+            b'DICA': instantaneas.empaquetar_numeros(cantidades),
+            b'DIBI': instantaneas.empaquetar_numeros(billetes)}
+
+def _cargar_clientes(banco, secciones):
+    ids = instantaneas.desempaquetar_numeros(secciones[b'CLID'])
+    nombres = instantaneas.desempaquetar_textos(secciones[b'CLNO'], len(ids))
+    credenciales_clientes = instantaneas.desempaquetar_textos(secciones[b'CLPW'], len(ids))
+    banco.agregar_clientes(list(map(Cliente, ids, nombres, credenciales_clientes)))
+
+def _cargar_cuentas(banco, secciones):
+    cliente_ids = instantaneas.desempaquetar_numeros(secciones[b'CUCL'])
+    numeros = instantaneas.desempaquetar_textos(secciones[b'CUNU'], len(cliente_ids))
+    saldos = instantaneas.desempaquetar_numeros(secciones[b'CUSA'])
+    return banco.agregar_cuentas(numeros, cliente_ids, saldos)
+
+# Reemplaza los dispensadores del banco por los de la instantánea
+def _cargar_dispensadores(banco, secciones):
+    ids = instantaneas.desempaquetar_numeros(secciones[b'DIID'])
+    ubicaciones = instantaneas.desempaquetar_textos(secciones[b'DIUB'], len(ids))
+    cantidades = instantaneas.desempaquetar_numeros(secciones[b'DICA'])
+    billetes = instantaneas.desempaquetar_numeros(secciones[b'DIBI'])
+    banco.dispensadores = []
+    banco.indice_dispensadores = IndiceOrdenado('id')
+    banco.enrutador = enrutador.Enrutador()
+    posicion = 0
+    for dispensador_id, ubicacion, cantidad in zip(ids, ubicaciones, cantidades):
+        dispensador = Dispensador(dispensador_id, ubicacion)
+        pares = billetes[posicion:posicion + 2 * cantidad]
+        dispensador.billetes = dict(zip(pares[::2], pares[1::2]))
+        posicion += 2 * cantidad
+        banco.agregar_dispensador(dispensador)
+
+# Estado completo del banco en 'directorio'. Solo es consistente con el
+# banco en reposo (al arrancar o al salir): reemplaza a la base anterior y
+# borra los deltas. Devuelve la posición del diario que cubre.
+def guardar_instantanea(banco, directorio):
+    os.makedirs(directorio, exist_ok=True)
+    seq = 0
+    if banco.diario is not None:
+        banco.diario.sincronizar()
+        seq = banco.diario.total
+
+    clientes = banco.indice_clientes.objetos
+    cuentas = banco.indice_cuentas.objetos
+    secciones = _secciones_clientes([c.id for c in clientes], [c.nombre for c in clientes],
+                                    [c.credencial for c in clientes])
+    secciones.update(_secciones_cuentas([c.numero for c in cuentas], [c.cliente_id for c in cuentas],
+                                        [c.saldo for c in cuentas]))
+    # Posiciones en el diario del historial de cada cuenta que tiene uno
+    filas, cantidades, posiciones = array('q'), array('q'), array('q')
+    for fila, cuenta in enumerate(cuentas):
+        historial = cuenta._movimientos
+        if isinstance(historial, HistorialDiario) and historial.posiciones:
+            filas.append(fila)
+            cantidades.append(len(historial.posiciones))
+            posiciones.extend(historial.posiciones)
+    secciones[b'HIFI'] = instantaneas.empaquetar_numeros(filas)
+    secciones[b'HICA'] = instantaneas.empaquetar_numeros(cantidades)
+    secciones[b'HIPO'] = instantaneas.empaquetar_numeros(posiciones)
+    secciones.update(_secciones_dispensadores(banco))
+
+    instantaneas.escribir(os.path.join(directorio, _BASE), instantaneas.BASE,
+                          _ultimo_delta(directorio), seq, secciones)
+    for _, _, _, ruta in _deltas(directorio):
+        os.remove(ruta)
+    with banco.bloqueo:
+        if banco.altas_clientes is not None:
+            banco.altas_clientes = []
+            banco.altas_cuentas = []
+            banco.bajas_cuentas = []
+            banco.cambios_credenciales = []
+    return seq
+
+# Escribe el delta [desde, diario.total) y devuelve su fin, o 'desde' si no
+# había nada nuevo. Puede correr con el banco en uso: toma el fin antes de
+# las altas, así toda cuenta con movimientos anteriores a él ya está en el
+# delta y los posteriores quedan para el siguiente o para la cola del diario.
+def guardar_delta(banco, directorio, desde):
+    diario = banco.diario
+    hasta = diario.total
+    # Las altas se agregan con el bloqueo del banco: sin él, una que llega
+    # entre la lectura y el reemplazo de la lista no quedaría en ningún delta
+    with banco.bloqueo:
+        altas_clientes, banco.altas_clientes = banco.altas_clientes or [], []
+        altas_cuentas, banco.altas_cuentas = banco.altas_cuentas or [], []
+        bajas_cuentas, banco.bajas_cuentas = banco.bajas_cuentas or [], []
+        cambios, banco.cambios_credenciales = banco.cambios_credenciales or [], []
+    if (hasta == desde and not altas_clientes and not altas_cuentas and not bajas_cuentas
+            and not cambios):
+        return desde
+
+    # Efecto neto y posiciones por cuenta, en orden de aparición
+    netos = {}
+    for seq in range(desde, hasta):
+        _, _, _, _, monto, cuenta_numero, *_ = diario.vista[seq]
+        neto = netos.get(cuenta_numero)
+        if neto is None:
+            neto = netos[cuenta_numero] = [0, array('q')]
+        neto[0] += monto
+        neto[1].append(seq)
+    posiciones = array('q')
+    for _, seqs in netos.values():
+        posiciones.extend(seqs)
+
+    secciones = _secciones_clientes([c[0] for c in altas_clientes], [c[1] for c in altas_clientes],
+                                    [c[2] for c in altas_clientes])
+    secciones.update(_secciones_cuentas([c[0] for c in altas_cuentas], [c[1] for c in altas_cuentas],
+                                        [c[2] for c in altas_cuentas]))
+    secciones[b'MVNU'] = instantaneas.empaquetar_textos(list(netos))
+    secciones[b'MVMO'] = instantaneas.empaquetar_numeros([n[0] for n in netos.values()])
+    secciones[b'MVCA'] = instantaneas.empaquetar_numeros([len(n[1]) for n in netos.values()])
+    secciones[b'MVPO'] = instantaneas.empaquetar_numeros(posiciones)
+    secciones[b'CUBA'] = instantaneas.empaquetar_textos(bajas_cuentas)
+    secciones[b'CCID'] = instantaneas.empaquetar_numeros([c[0] for c in cambios])
+    secciones[b'CCTX'] = instantaneas.empaquetar_textos([c[1] for c in cambios])
+    secciones.update(_secciones_dispensadores(banco))
+    diario.sincronizar()
+    numero = _ultimo_delta(directorio) + 1
+    instantaneas.escribir(os.path.join(directorio, _nombre_delta(numero, desde, hasta)),
+                          instantaneas.DELTA, desde, hasta, secciones)
+    return hasta
+
+def _aplicar_delta(banco, secciones):
+    _cargar_clientes(banco, secciones)
+    _cargar_cuentas(banco, secciones)
+    cantidades = instantaneas.desempaquetar_numeros(secciones[b'MVCA'])
+    numeros = instantaneas.desempaquetar_textos(secciones[b'MVNU'], len(cantidades))
+    netos = instantaneas.desempaquetar_numeros(secciones[b'MVMO'])
+    posiciones = instantaneas.desempaquetar_numeros(secciones[b'MVPO'])
+    inicio = 0
+    for cuenta_numero, neto, cantidad in zip(numeros, netos, cantidades):
+        cuenta = banco.indice_cuentas.buscar(cuenta_numero)
+        if cuenta is None:
+            banco.diario.descartados += cantidad
+        else:
+            cuenta.saldo += neto
+            cuenta.movimientos.posiciones.extend(posiciones[inicio:inicio + cantidad])
+        inicio += cantidad
+    # Bajas después de los movimientos, que dejaron esas cuentas en cero
+    bajas = secciones.get(b'CUBA')
+    for cuenta_numero in bajas.decode('utf-8').split('\0') if bajas else ():
+        banco.quitar_cuenta(cuenta_numero)
+    # Credenciales rehechas al ingresar (ver autenticar); la última gana
+    if b'CCID' in secciones:
+        ids = instantaneas.desempaquetar_numeros(secciones[b'CCID'])
+        for cliente_id, credencial in zip(ids, instantaneas.desempaquetar_textos(secciones[b'CCTX'],
+                                                                                 len(ids))):
+            cliente = banco.clientes_por_id.get(cliente_id)
+            if cliente is not None:
+                cliente.credencial = credencial
+    _cargar_dispensadores(banco, secciones)
+
+# Carga la base de 'directorio', aplica los deltas encadenados y reaplica la
+# cola del diario 'ruta_diario'. Devuelve (banco, seq) con la posición del
+# diario que cubre la base, o None si no hay instantánea. Un delta dañado
+# corta la cadena: su contenido se recupera de la cola del diario, salvo
+# las altas que solo estaban en él.
+def cargar_instantanea(directorio, ruta_diario):
+    ruta_base = os.path.join(directorio, _BASE)
+    if not os.path.exists(ruta_base):
+        return None
+    _, incluidos, seq, secciones = instantaneas.leer(ruta_base)
+    banco = Banco()
+    banco.diario = Diario(ruta_diario, verificados=seq)
+    if seq > banco.diario.total:
+        banco.diario.cerrar()
+        raise instantaneas.InstantaneaError(
+            f"La instantánea cubre {seq} registros y el diario tiene {banco.diario.total}")
+
+    # Millones de objetos nuevos sin ciclos: el recolector solo los recorrería
+    gc.disable()
+    try:
+        _cargar_clientes(banco, secciones)
+        cuentas = _cargar_cuentas(banco, secciones)
+        filas = instantaneas.desempaquetar_numeros(secciones[b'HIFI'])
+        cantidades = instantaneas.desempaquetar_numeros(secciones[b'HICA'])
+        posiciones = instantaneas.desempaquetar_numeros(secciones[b'HIPO'])
+        inicio = 0
+        for fila, cantidad in zip(filas, cantidades):
+            cuenta = cuentas[fila]
+            cuenta.movimientos = HistorialDiario(banco.diario, cuenta.numero,
+                                                 posiciones[inicio:inicio + cantidad])
+            inicio += cantidad
+        _cargar_dispensadores(banco, secciones)
+    finally:
+        gc.enable()
+    del secciones
+
+    for numero, inicio, fin, ruta in _deltas(directorio):
+        # Deltas ya incluidos en la base quedan si se cortó una compactación
+        if numero <= incluidos:
+            continue
+        if inicio != seq or fin > banco.diario.total:
+            break
+        try:
+            _, _, _, secciones = instantaneas.leer(ruta)
+        except instantaneas.InstantaneaError:
+            break
+        _aplicar_delta(banco, secciones)
+        seq = fin
+    reaplicar_diario(banco, seq)
+    return banco, seq
+
+# Hilo que escribe un delta cada 'intervalo' segundos mientras el banco
+# atiende; 'desde' es la posición del diario que cubre la última base
+class PuntoControl:
+    def __init__(self, banco, directorio, desde, intervalo=30.0):
+        self.banco = banco
+        self.directorio = directorio
+        self.seq = desde
+        self.intervalo = intervalo
+        self._detenido = threading.Event()
+        banco.altas_clientes = []
+        banco.altas_cuentas = []
+        banco.bajas_cuentas = []
+        banco.cambios_credenciales = []
+        self._hilo = threading.Thread(target=self._correr, name="punto-control", daemon=True)
+        self._hilo.start()
+
+    def _correr(self):
+        while not self._detenido.wait(self.intervalo):
+            self.guardar()
+
+    def guardar(self):
+        self.seq = guardar_delta(self.banco, self.directorio, self.seq)
+        return self.seq
+
+    def detener(self):
+        self._detenido.set()
+        self._hilo.join()
+        self.banco.altas_clientes = None
+        self.banco.altas_cuentas = None
+        self.banco.bajas_cuentas = None
+        self.banco.cambios_credenciales = None
 
 # Funciones para la interfaz de usuario
+# Toda la salida de los menús pasa por 'pantalla' (ver pantalla.py): se
+# escribe de una vez al pedir la siguiente entrada
+pantalla = Pantalla.desde_entorno()
+
 def clear_screen():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    pantalla.limpiar()
 
 def print_header(title):
     clear_screen()
-    print(Colors.BOLD + Colors.CYAN + "=" * 60)
-    print(f"{title:^60}")
-    print("=" * 60 + Colors.END)
+    pantalla.escribir(Colors.BOLD + Colors.CYAN + "=" * 60)
+    pantalla.escribir(f"{title:^60}")
+    pantalla.escribir("=" * 60 + Colors.END)
+
+FILAS_POR_PAGINA = 20
+
+# Imprime las filas de un iterador por páginas del alto de la terminal,
+# sin materializar el listado
+def imprimir_paginado(encabezado, filas):
+    pantalla.paginar(encabezado, filas, pantalla.filas_por_pagina(FILAS_POR_PAGINA))
 
 def print_menu(options):
     for key, value in options.items():
-        print(f"{Colors.BOLD}{key}.{Colors.END} {value}")
-    print("-" * 60)
+        pantalla.escribir(f"{Colors.BOLD}{key}.{Colors.END} {value}")
+    pantalla.escribir("-" * 60)
 
 def get_valid_input(prompt, input_type=str, valid_options=None, min_value=None):
     while True:
         try:
-            user_input = input(prompt)
+            user_input = pantalla.pedir(prompt)
             if input_type == int:
                 user_input = int(user_input)
                 if min_value is not None and user_input < min_value:
-                    print(Colors.RED + f"Error: El valor debe ser al menos {min_value}" + Colors.END)
+                    pantalla.escribir(Colors.RED + f"Error: El valor debe ser al menos {min_value}" + Colors.END)
                     continue
             elif input_type == float:
                 user_input = float(user_input)
                 if min_value is not None and user_input < min_value:
-                    print(Colors.RED + f"Error: El valor debe ser al menos {min_value}" + Colors.END)
+                    pantalla.escribir(Colors.RED + f"Error: El valor debe ser al menos {min_value}" + Colors.END)
+                    continue
+            elif input_type == a_centavos:
+                # Montos: centavos exactos, min_value también en centavos
+                user_input = a_centavos(user_input)
+                if min_value is not None and user_input < min_value:
+                    pantalla.escribir(Colors.RED + f"Error: El monto debe ser al menos ${formatear(min_value)}" + Colors.END)
                     continue
                     
             if valid_options and user_input not in valid_options:
                 raise ValueError
             return user_input
         except ValueError:
-            print(Colors.RED + "Entrada inválida. Intente nuevamente." + Colors.END)
+            pantalla.escribir(Colors.RED + "Entrada inválida. Intente nuevamente." + Colors.END)
+
+# Modos de desglose
+MODO_MENOS_BILLETES = "menos_billetes"
+MODO_PRESERVAR_ESCASOS = "preservar_escasos"
+_ESCALA_ESCASEZ = 1000
+
+# Memo de desgloses compartido entre dispensadores. La clave usa el
+# inventario recortado a lo que el monto podría usar (y, para preservar
+# escasos, el peso de cada denominación, que cambia por tramos), así que
+# sigue siendo válida después de retiros que no agotan ninguna denominación.
+_MAX_DESGLOSES_MEMO = 4096
+_desgloses_memo = {}
 
-# Algoritmo voraz para desglose de billetes
-def calcular_desglose_billetes(monto, dispensador):
-    denominaciones = sorted(dispensador.billetes.keys(), reverse=True)
+# Mochila acotada para desglose de billetes: siempre encuentra una combinación
+# si existe. Con MODO_MENOS_BILLETES minimiza la cantidad de billetes; con
+# MODO_PRESERVAR_ESCASOS cada billete cuesta más cuanto menos quedan de su
+# denominación, así se cuidan las denominaciones escasas.
+@metricas.medir("desglose")
+def calcular_desglose_billetes(monto, dispensador, modo=MODO_MENOS_BILLETES):
+    if monto <= 0 or not dispensador.puede_dispensar(monto):
+        return None
+
+    billetes = {d: c for d, c in dispensador.billetes.items() if c > 0}
+    if modo == MODO_PRESERVAR_ESCASOS:
+        clave = (monto, modo, tuple((d, min(c, monto // d), _ESCALA_ESCASEZ // c)
+                                    for d, c in billetes.items()))
+    else:
+        clave = (monto, modo, tuple((d, min(c, monto // d)) for d, c in billetes.items()))
+    desglose = _desgloses_memo.get(clave)
+    if metricas.activas:
+        metricas.contar("cajero_desglose_memo_total",
+                        (("resultado", "miss" if desglose is None else "hit"),))
+    if desglose is not None:
+        return dict(desglose)
+
+    paso = 0
+    for denom in billetes:
+        paso = gcd(paso, denom)
+    objetivo = monto // paso
+
+    infinito = float('inf')
+    costo = [0] + [infinito] * objetivo
+    elecciones = []
+    for denom in sorted(billetes, reverse=True):
+        disponible = billetes[denom]
+        if modo == MODO_PRESERVAR_ESCASOS:
+            peso = 1 + _ESCALA_ESCASEZ // disponible
+        else:
+            peso = 1
+        unidades = denom // paso
+        restante = min(disponible, objetivo // unidades)
+        lote = 1
+        while restante > 0:
+            tomar = min(lote, restante)
+            restante -= tomar
+            lote <<= 1
+            salto = tomar * unidades
+            costo_lote = tomar * peso
+            tomado = bytearray(objetivo + 1)
+            for a in range(objetivo, salto - 1, -1):
+                nuevo = costo[a - salto] + costo_lote
+                if nuevo < costo[a]:
+                    costo[a] = nuevo
+                    tomado[a] = 1
+            elecciones.append((denom, tomar, salto, tomado))
+
+    if costo[objetivo] == infinito:
+        return None
+
+    # Reconstruir la combinación recorriendo las elecciones al revés
     desglose = {}
-    restante = monto
+    a = objetivo
+    for denom, tomar, salto, tomado in reversed(elecciones):
+        if tomado[a]:
+            desglose[denom] = desglose.get(denom, 0) + tomar
+            a -= salto
+    desglose = {d: desglose[d] for d in sorted(desglose, reverse=True)}
+
+    if len(_desgloses_memo) >= _MAX_DESGLOSES_MEMO:
+        _desgloses_memo.clear()
+    _desgloses_memo[clave] = desglose
+    return dict(desglose)
+
+# Operaciones sin interfaz: validan, registran el movimiento y recién
+# entonces lo aplican. Ante cualquier regla incumplida lanzan
+# OperacionError con el mensaje a mostrar, y si el diario falla lanzan
+# DiarioError, en los dos casos sin modificar nada (ver _registrar). Las
+# usan tanto los menús como los lotes.
+# Todos los montos son centavos enteros (ver dinero.py); las
+# denominaciones y los inventarios de billetes siguen en pesos.
+# DENOMINACIONES viene de diario.py, que guarda en ese orden los billetes
+# de cada retiro y depósito.
+
+SERVICIOS = {
+    "1": ("Luz", 180, 350),
+    "2": ("Agua", 80, 200),
+    "3": ("Gas", 120, 300),
+    "4": ("Internet", 250, 500)
+}
+
+_NOMBRES_SERVICIOS = frozenset(nombre for nombre, _, _ in SERVICIOS.values())
+_RANGOS_SERVICIOS = {nombre: (minimo, maximo) for nombre, minimo, maximo in SERVICIOS.values()}
+
+# Monto de la factura de un servicio para una cuenta y un período ("2024-05"),
+# en centavos dentro del rango del servicio. Sale de un hash: la misma
+# factura siempre tiene el mismo monto, aunque se consulte varias veces.
+def monto_factura(cuenta_numero, servicio, periodo):
+    minimo, maximo = _RANGOS_SERVICIOS[servicio]
+    clave = f"{cuenta_numero}|{servicio}|{periodo}".encode("utf-8")
+    valor = int.from_bytes(hashlib.blake2b(clave, digest_size=8).digest(), "little")
+    return minimo * CENTAVOS + valor % ((maximo - minimo) * CENTAVOS + 1)
+
+# Referencias de pago únicas y crecientes: cada valor es max(anterior + 1,
+# reloj en microsegundos), así también ordenan por tiempo. 'nodo' distingue
+# a los procesos que generan referencias a la vez. Con abrir(ruta) se
+# persiste un tope reservado por bloques: después de reiniciar se sigue por
+# encima del tope aunque el reloj haya retrocedido.
+class GeneradorReferencias:
+    BLOQUE = 10_000_000
+
+    def __init__(self, nodo=0):
+        self.nodo = nodo
+        self._ultimo = 0
+        self._tope = None
+        self._archivo = None
+        self._bloqueo = threading.Lock()
+
+    def abrir(self, ruta):
+        with self._bloqueo:
+            self._archivo = open(ruta, "r+b" if os.path.exists(ruta) else "w+b")
+            datos = self._archivo.read(8)
+            self._ultimo = max(self._ultimo, int.from_bytes(datos, "little") if len(datos) == 8 else 0)
+            self._tope = self._ultimo
+
+    # Reserva 'cantidad' valores consecutivos y devuelve su range
+    def reservar(self, cantidad):
+        with self._bloqueo:
+            inicio = max(self._ultimo + 1, time.time_ns() // 1000)
+            self._ultimo = inicio + cantidad - 1
+            if self._archivo is not None and self._ultimo > self._tope:
+                self._tope = self._ultimo + self.BLOQUE
+                self._archivo.seek(0)
+                self._archivo.write(self._tope.to_bytes(8, "little"))
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+        return range(inicio, inicio + cantidad)
+
+    def formatear(self, valor):
+        return f"REF-{valor:016d}-{self.nodo:03d}"
+
+    def siguiente(self):
+        return self.formatear(self.reservar(1)[0])
+
+    def cerrar(self):
+        with self._bloqueo:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+REFERENCIAS = GeneradorReferencias()
+
+class OperacionError(Exception):
+    pass
+
+def _validar_monto(monto):
+    if type(monto) is not int:
+        raise OperacionError(f"Monto inválido: {monto!r} (se esperan centavos enteros)")
+
+# Bloqueos por cuenta repartidos en franjas: cada cuenta usa la franja de
+# su número, así no hace falta un Lock por objeto con millones de cuentas.
+# Orden global para evitar interbloqueos: primero las franjas de cuenta en
+# orden ascendente y después el bloqueo del dispensador.
+FRANJAS_BLOQUEO = 4096
+_bloqueos_cuenta = [threading.Lock() for _ in range(FRANJAS_BLOQUEO)]
+
+def _franja(cuenta):
+    return hash(cuenta.numero) % FRANJAS_BLOQUEO
+
+def bloqueo_cuenta(cuenta):
+    return _bloqueos_cuenta[_franja(cuenta)]
+
+class _BloqueoCuentas:
+    __slots__ = ('_bloqueos',)
+
+    def __init__(self, *cuentas):
+        franjas = sorted({_franja(cuenta) for cuenta in cuentas})
+        self._bloqueos = [_bloqueos_cuenta[f] for f in franjas]
+
+    def __enter__(self):
+        for bloqueo in self._bloqueos:
+            bloqueo.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        for bloqueo in reversed(self._bloqueos):
+            bloqueo.release()
+
+# Bloquea varias cuentas a la vez respetando el orden global
+def bloquear_cuentas(*cuentas):
+    return _BloqueoCuentas(*cuentas)
+
+# Todas las franjas en orden: nadie modifica un saldo mientras tanto
+def bloquear_todas_las_cuentas():
+    bloqueo = _BloqueoCuentas()
+    bloqueo._bloqueos = _bloqueos_cuenta
+    return bloqueo
+
+# Error de retiro contado por motivo en las métricas
+def _rechazo_retiro(motivo, mensaje):
+    if metricas.activas:
+        metricas.contar("cajero_desglose_fallas_total", (("motivo", motivo),))
+    error = OperacionError(mensaje)
+    error.motivo = motivo
+    return error
+
+# Monto de un retiro (centavos) en pesos enteros, o el rechazo
+def _pesos_retiro(monto):
+    _validar_monto(monto)
+    if monto <= 0:
+        raise _rechazo_retiro("monto_invalido", "El monto debe ser mayor a cero")
+    if monto % CENTAVOS:
+        raise _rechazo_retiro("monto_invalido", "El monto a retirar debe ser en pesos enteros")
+    return monto // CENTAVOS
+
+def _registrar_agotamientos(dispensador, desglose):
+    for denom in desglose:
+        if dispensador.billetes[denom] == 0:
+            metricas.contar("cajero_agotamientos_total",
+                            (("cajero", dispensador.id), ("denominacion", denom)))
+            metricas.evento("denominacion_agotada", cajero=dispensador.id, denominacion=denom)
+    if not any(dispensador.billetes.values()):
+        metricas.evento("cajero_sin_efectivo", cajero=dispensador.id)
+
+@metricas.medir("retiro")
+def retirar(banco, cuenta, dispensador, monto, modo=MODO_MENOS_BILLETES):
+    pesos = _pesos_retiro(monto)
+    with bloqueo_cuenta(cuenta), dispensador.bloqueo:
+        if monto > cuenta.saldo:
+            raise _rechazo_retiro("saldo_insuficiente", "Saldo insuficiente en la cuenta")
+        if pesos > dispensador.efectivo:
+            raise _rechazo_retiro("efectivo_insuficiente", "No hay suficiente efectivo en el cajero")
+        if not dispensador.puede_dispensar(pesos):
+            raise _rechazo_retiro("sin_combinacion",
+                                  "No se puede desglosar el monto con los billetes disponibles")
+        motivo = banco.antifraude.revisar_retiro(cuenta.numero, monto)
+        if motivo:
+            raise _rechazo_retiro("antifraude", motivo)
+        
+        desglose = calcular_desglose_billetes(pesos, dispensador, modo)
+        if not desglose:
+            raise _rechazo_retiro("sin_combinacion",
+                                  "No se puede desglosar el monto con los billetes disponibles")
+        
+        _registrar((cuenta, Movimiento("RETIRO", -monto, cuenta.numero,
+                                       dispensador_id=dispensador.id, billetes=desglose)))
+        cuenta.saldo -= monto
+        dispensador.billetes.sumar({denom: -cant for denom, cant in desglose.items()})
+        banco.antifraude.anotar_retiro(cuenta.numero, monto)
+        if metricas.activas:
+            _registrar_agotamientos(dispensador, desglose)
+    return desglose
+
+# Retiro en el cajero que elige el enrutador entre los de 'etiqueta' (o
+# todos), con el desglose que cuida las denominaciones escasas. Si otro
+# retiro se llevó los billetes entre la elección y el bloqueo del cajero,
+# se elige otro. Devuelve (dispensador, desglose).
+def retirar_en_red(banco, cuenta, monto, etiqueta=None):
+    pesos = _pesos_retiro(monto)
+    probados = set()
+    while True:
+        dispensador = banco.enrutador.elegir(pesos, etiqueta, probados)
+        if dispensador is None:
+            if metricas.activas:
+                metricas.contar("cajero_enrutamiento_total", (("resultado", "sin_cajero"),))
+            raise _rechazo_retiro("sin_cajero", "Ningún cajero puede entregar ese monto")
+        try:
+            desglose = retirar(banco, cuenta, dispensador, monto, MODO_PRESERVAR_ESCASOS)
+        except OperacionError as e:
+            if getattr(e, "motivo", None) not in ("efectivo_insuficiente", "sin_combinacion"):
+                raise
+            if metricas.activas:
+                metricas.contar("cajero_enrutamiento_total", (("resultado", "reintento"),))
+            probados.add(dispensador.id)
+            continue
+        if metricas.activas:
+            metricas.contar("cajero_enrutamiento_total", (("resultado", "elegido"),))
+        return dispensador, desglose
+
+@metricas.medir("deposito")
+def depositar(banco, cuenta, dispensador, billetes_deposito):
+    total = 0
+    for denom, cant in billetes_deposito.items():
+        if denom not in DENOMINACIONES:
+            raise OperacionError(f"Denominación no aceptada: ${denom}")
+        if cant < 0:
+            raise OperacionError("La cantidad de billetes no puede ser negativa")
+        if cant > MAX_BILLETES:
+            raise OperacionError(f"Máximo {MAX_BILLETES} billetes por denominación")
+        total += denom * cant * CENTAVOS
+    if total <= 0:
+        raise OperacionError("Debe ingresar al menos un billete")
     
-    for denom in denominaciones:
-        if restante <= 0:
-            break
-            
-        disponible = dispensador.billetes[denom]
-        if denom <= restante and disponible > 0:
-            cantidad = min(restante // denom, disponible)
-            desglose[denom] = cantidad
-            restante -= denom * cantidad
+    with bloqueo_cuenta(cuenta), dispensador.bloqueo:
+        _registrar((cuenta, Movimiento("DEPÓSITO", total, cuenta.numero, dispensador_id=dispensador.id,
+                                       billetes={d: c for d, c in billetes_deposito.items() if c})))
+        cuenta.saldo += total
+        dispensador.billetes.sumar(billetes_deposito)
+    return total
+
+# Destino de una transferencia escrito como texto: solo dígitos es el ID
+# de un cliente, cualquier otra cosa un número de cuenta
+def leer_destino(valor):
+    if isinstance(valor, int):
+        return valor
+    valor = str(valor).strip()
+    return int(valor) if valor.isdigit() else valor
+
+# Ambas cuentas quedan bloqueadas durante toda la transferencia: nadie ve
+# el dinero descontado del origen sin haber llegado al destino. 'destino'
+# es un número de cuenta o un ID de cliente (ver Banco.cuenta_destino).
+@metricas.medir("transferencia")
+def transferir(banco, cuenta_origen, destino, monto):
+    cuenta_destino = banco.cuenta_destino(destino)
+    if not cuenta_destino:
+        raise OperacionError("Cuenta o cliente destinatario no encontrado")
+    if cuenta_destino.numero == cuenta_origen.numero:
+        raise OperacionError("No puede transferir a su propia cuenta")
+    _validar_monto(monto)
+    if monto < 1:
+        raise OperacionError("El monto mínimo a transferir es $0.01")
     
-    return desglose if restante == 0 else None
+    with bloquear_cuentas(cuenta_origen, cuenta_destino):
+        if monto > cuenta_origen.saldo:
+            raise OperacionError("Saldo insuficiente para realizar la transferencia")
+        motivo = banco.antifraude.revisar_transferencia(cuenta_origen.numero, cuenta_destino.numero,
+                                                        monto)
+        if motivo:
+            raise OperacionError(motivo)
+        
+        _registrar((cuenta_origen, Movimiento("TRANSFERENCIA", -monto, cuenta_origen.numero,
+                                              cuenta_destino.numero)),
+                   (cuenta_destino, Movimiento("TRANSFERENCIA", monto, cuenta_destino.numero,
+                                               cuenta_origen.numero)))
+        cuenta_origen.saldo -= monto
+        cuenta_destino.saldo += monto
+        banco.antifraude.anotar_transferencia(cuenta_origen.numero, cuenta_destino.numero, monto)
+    return cuenta_destino
+
+@metricas.medir("pago")
+def pagar_servicio(cuenta, servicio, monto):
+    if servicio not in _NOMBRES_SERVICIOS:
+        raise OperacionError(f"Servicio desconocido: {servicio}")
+    _validar_monto(monto)
+    if monto <= 0:
+        raise OperacionError("El monto debe ser mayor a cero")
+    
+    with bloqueo_cuenta(cuenta):
+        if monto > cuenta.saldo:
+            raise OperacionError("Saldo insuficiente para realizar el pago")
+        
+        referencia = REFERENCIAS.siguiente()
+        _registrar((cuenta, Movimiento("PAGO_SERVICIO", -monto, cuenta.numero, servicio=servicio)))
+        cuenta.saldo -= monto
+    return referencia
+
+# Devuelve la cuenta principal del cliente, o None si la contraseña no es
+# correcta; lanza credenciales.IntentosExcedidos si el cliente o el origen
+# (una IP, un cajero) agotaron sus intentos. Una credencial en claro o con
+# otro costo se reemplaza por un hash con el costo actual.
+@metricas.medir("autenticacion")
+def autenticar(banco, cliente_id, password, origen=None):
+    cliente = banco.clientes_por_id.get(cliente_id)
+    credencial = cliente.credencial if cliente else None
+    correcta, nueva = banco.autenticador.verificar(cliente_id, credencial, password, origen)
+    if not correcta:
+        return None
+    if nueva is not None:
+        banco.cambiar_credencial(cliente, nueva)
+    return banco.cuentas_por_cliente.get(cliente_id)
+
+def buscar_dispensador(banco, dispensador_id):
+    return banco.busqueda_binaria(banco.indice_dispensadores.objetos, dispensador_id)
 
 # Funciones principales del sistema
-def realizar_retiro(banco, cuenta, dispensador):
+# Sin 'dispensador' el retiro se enruta al cajero que pueda entregarlo,
+# entre los de 'etiqueta' si se indica
+def realizar_retiro(banco, cuenta, dispensador=None, etiqueta=None):
     print_header("RETIRO DE EFECTIVO")
     
     # Obtener monto válido
-    max_retiro = min(cuenta.saldo, sum(k*v for k,v in dispensador.billetes.items()))
-    monto = get_valid_input(f"Ingrese monto a retirar (máximo ${max_retiro}): ", int, min_value=1)
-    
-    # Validar fondos
-    if monto > cuenta.saldo:
-        print(Colors.RED + "Error: Saldo insuficiente en la cuenta" + Colors.END)
-        return False
-    if monto > sum(k*v for k,v in dispensador.billetes.items()):
-        print(Colors.RED + "Error: No hay suficiente efectivo en el cajero" + Colors.END)
-        return False
+    if dispensador is None:
+        efectivo = banco.enrutador.efectivo_maximo(etiqueta)
+    else:
+        efectivo = dispensador.efectivo
+    max_retiro = min(cuenta.saldo, efectivo * CENTAVOS)
+    monto = get_valid_input(f"Ingrese monto a retirar (máximo ${formatear(max_retiro)}): ",
+                            a_centavos, min_value=CENTAVOS)
     
-    # Calcular desglose
-    desglose = calcular_desglose_billetes(monto, dispensador)
-    if not desglose:
-        print(Colors.RED + "Error: No se puede desglosar el monto con los billetes disponibles" + Colors.END)
+    try:
+        if dispensador is None:
+            dispensador, desglose = retirar_en_red(banco, cuenta, monto, etiqueta)
+            pantalla.escribir(f"\nRetire su efectivo en el cajero {dispensador.id} ({dispensador.ubicacion})")
+        else:
+            desglose = retirar(banco, cuenta, dispensador, monto)
+    except OperacionError as e:
+        pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
         return False
     
-    # Actualizar saldos y billetes
-    cuenta.saldo -= monto
-    for denom, cant in desglose.items():
-        dispensador.billetes[denom] -= cant
-    
-    # Registrar movimiento
-    movimiento = Movimiento("RETIRO", -monto, cuenta.numero)
-    cuenta.movimientos.append(movimiento)
-    
     # Mostrar resultado
-    print("\n" + Colors.GREEN + "Retiro exitoso!" + Colors.END)
-    print(f"Desglose de billetes:")
+    pantalla.escribir("\n" + Colors.GREEN + "Retiro exitoso!" + Colors.END)
+    pantalla.escribir(f"Desglose de billetes:")
     for denom, cant in desglose.items():
-        print(f" - ${denom}: {cant} billete(s)")
-    print(f"\nNuevo saldo: ${cuenta.saldo}")
+        pantalla.escribir(f" - ${denom}: {cant} billete(s)")
+    pantalla.escribir(f"\nNuevo saldo: ${formatear(cuenta.saldo)}")
     return True
 
 def realizar_deposito(banco, cuenta, dispensador):
@@ -180,156 +1869,186 @@ def realizar_deposito(banco, cuenta, dispensador):
     
     # Obtener billetes
     billetes_deposito = {}
-    total = 0
-    for denom in [200, 100, 50, 20]:
+    for denom in DENOMINACIONES:
         cantidad = get_valid_input(f"Ingrese cantidad de billetes de ${denom}: ", int, min_value=0)
         billetes_deposito[denom] = cantidad
-        total += denom * cantidad
     
-    if total <= 0:
-        print(Colors.RED + "Error: Debe ingresar al menos un billete" + Colors.END)
+    try:
+        total = depositar(banco, cuenta, dispensador, billetes_deposito)
+    except OperacionError as e:
+        pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
         return False
     
-    # Actualizar saldos y billetes
-    cuenta.saldo += total
-    for denom, cant in billetes_deposito.items():
-        dispensador.billetes[denom] += cant
-    
-    # Registrar movimiento
-    movimiento = Movimiento("DEPÓSITO", total, cuenta.numero)
-    cuenta.movimientos.append(movimiento)
-    
     # Mostrar resultado
-    print("\n" + Colors.GREEN + "Depósito exitoso!" + Colors.END)
-    print(f"Monto depositado: ${total}")
-    print(f"Nuevo saldo: ${cuenta.saldo}")
+    pantalla.escribir("\n" + Colors.GREEN + "Depósito exitoso!" + Colors.END)
+    pantalla.escribir(f"Monto depositado: ${formatear(total)}")
+    pantalla.escribir(f"Nuevo saldo: ${formatear(cuenta.saldo)}")
     return True
 
 def realizar_transferencia(banco, cuenta_origen):
     print_header("TRANSFERENCIA ENTRE CUENTAS")
     
-    # Obtener ID del destinatario
-    destinatario_id = get_valid_input("Ingrese ID del cliente destinatario: ", int)
+    # Obtener destino: ID de cliente o número de cuenta
+    destino = leer_destino(pantalla.pedir("Ingrese ID del cliente o número de cuenta destino: "))
     
     # Buscar cuenta de destino
-    cuenta_destino = banco.cuentas_por_cliente.get(destinatario_id)
+    cuenta_destino = banco.cuenta_destino(destino)
     
     if not cuenta_destino:
-        print(Colors.RED + "Error: Cliente destinatario no encontrado" + Colors.END)
+        pantalla.escribir(Colors.RED + "Error: Cuenta o cliente destinatario no encontrado" + Colors.END)
         return False
     
     if cuenta_destino.numero == cuenta_origen.numero:
-        print(Colors.RED + "Error: No puede transferir a su propia cuenta" + Colors.END)
+        pantalla.escribir(Colors.RED + "Error: No puede transferir a su propia cuenta" + Colors.END)
         return False
     
     # Obtener monto a transferir
-    monto = get_valid_input(f"Ingrese monto a transferir (máximo ${cuenta_origen.saldo}): ", float, min_value=0.01)
+    monto = get_valid_input(f"Ingrese monto a transferir (máximo ${formatear(cuenta_origen.saldo)}): ",
+                            a_centavos, min_value=1)
     
-    # Validar fondos
-    if monto > cuenta_origen.saldo:
-        print(Colors.RED + "Error: Saldo insuficiente para realizar la transferencia" + Colors.END)
+    try:
+        transferir(banco, cuenta_origen, cuenta_destino.numero, monto)
+    except OperacionError as e:
+        pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
         return False
     
-    # Realizar transferencia
-    cuenta_origen.saldo -= monto
-    cuenta_destino.saldo += monto
-    
-    # Registrar movimientos
-    movimiento_origen = Movimiento("TRANSFERENCIA", -monto, cuenta_origen.numero, cuenta_destino.numero)
-    movimiento_destino = Movimiento("TRANSFERENCIA", monto, cuenta_destino.numero, cuenta_origen.numero)
-    
-    cuenta_origen.movimientos.append(movimiento_origen)
-    cuenta_destino.movimientos.append(movimiento_destino)
-    
     # Mostrar resultado
-    print("\n" + Colors.GREEN + "Transferencia exitosa!" + Colors.END)
-    print(f"Monto transferido: ${monto}")
-    print(f"Destinatario: {banco.clientes_por_id[destinatario_id].nombre}")
-    print(f"Nuevo saldo: ${cuenta_origen.saldo}")
+    pantalla.escribir("\n" + Colors.GREEN + "Transferencia exitosa!" + Colors.END)
+    pantalla.escribir(f"Monto transferido: ${formatear(monto)}")
+    destinatario = banco.clientes_por_id.get(cuenta_destino.cliente_id)
+    if destinatario:
+        pantalla.escribir(f"Destinatario: {destinatario.nombre}")
+    pantalla.escribir(f"Cuenta destino: {cuenta_destino.numero}")
+    pantalla.escribir(f"Nuevo saldo: ${formatear(cuenta_origen.saldo)}")
     return True
 
 def realizar_pago_servicios(cuenta):
     print_header("PAGO DE SERVICIOS")
     
-    # Menú de servicios
-    servicios = {
-        "1": ("Luz", 180, 350),
-        "2": ("Agua", 80, 200),
-        "3": ("Gas", 120, 300),
-        "4": ("Internet", 250, 500)
-    }
-    
-    print("Seleccione el servicio a pagar:")
-    for key, (nombre, min_cobro, max_cobro) in servicios.items():
-        print(f"{key}. {nombre} (${min_cobro}-${max_cobro})")
-    print("5. Volver")
+    pantalla.escribir("Seleccione el servicio a pagar:")
+    for key, (nombre, min_cobro, max_cobro) in SERVICIOS.items():
+        pantalla.escribir(f"{key}. {nombre} (${min_cobro}-${max_cobro})")
+    pantalla.escribir("5. Volver")
     
-    opcion = get_valid_input("Seleccione una opción: ", str, servicios.keys() | {"5"})
+    opcion = get_valid_input("Seleccione una opción: ", str, SERVICIOS.keys() | {"5"})
     
     if opcion == "5":
         return False
     
-    servicio, min_cobro, max_cobro = servicios[opcion]
+    servicio, min_cobro, max_cobro = SERVICIOS[opcion]
     
-    # Generar monto aleatorio basado en rangos típicos
-    monto = random.randint(min_cobro, max_cobro)
-    print(f"\nMonto a pagar por {servicio}: {Colors.BOLD}${monto}{Colors.END}")
+    # Una factura por servicio y mes: si ya se pagó, un reintento no cobra
+    # de nuevo
+    hoy = datetime.date.today()
+    pagado = cuenta.consultar_movimientos(desde=hoy.replace(day=1), tipo="PAGO_SERVICIO",
+                                          servicio=servicio, limite=1)
+    if pagado.movimientos:
+        pantalla.escribir(Colors.YELLOW + f"La factura de {servicio} de este mes ya está pagada"
+                          + Colors.END)
+        return False
+    monto = monto_factura(cuenta.numero, servicio, hoy.strftime("%Y-%m"))
+    pantalla.escribir(f"\nMonto a pagar por {servicio}: {Colors.BOLD}${formatear(monto)}{Colors.END}")
     
     # Confirmar pago
-    confirmar = input("\n¿Desea realizar el pago? (s/n): ").lower()
+    confirmar = pantalla.pedir("\n¿Desea realizar el pago? (s/n): ").lower()
     if confirmar != 's':
-        print(Colors.YELLOW + "Pago cancelado" + Colors.END)
+        pantalla.escribir(Colors.YELLOW + "Pago cancelado" + Colors.END)
         return False
     
-    # Validar fondos
-    if monto > cuenta.saldo:
-        print(Colors.RED + "Error: Saldo insuficiente para realizar el pago" + Colors.END)
+    try:
+        referencia = pagar_servicio(cuenta, servicio, monto)
+    except OperacionError as e:
+        pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
         return False
     
-    # Realizar pago
-    cuenta.saldo -= monto
-    
-    # Generar número de referencia
-    referencia = f"REF-{random.randint(100000, 999999)}"
-    
-    # Registrar movimiento
-    movimiento = Movimiento("PAGO_SERVICIO", -monto, cuenta.numero, servicio=servicio)
-    cuenta.movimientos.append(movimiento)
-    
     # Mostrar resultado
-    print("\n" + Colors.GREEN + "Pago exitoso!" + Colors.END)
-    print(f"Servicio: {servicio}")
-    print(f"Referencia: {referencia}")
-    print(f"Monto pagado: ${monto}")
-    print(f"Nuevo saldo: ${cuenta.saldo}")
+    pantalla.escribir("\n" + Colors.GREEN + "Pago exitoso!" + Colors.END)
+    pantalla.escribir(f"Servicio: {servicio}")
+    pantalla.escribir(f"Referencia: {referencia}")
+    pantalla.escribir(f"Monto pagado: ${formatear(monto)}")
+    pantalla.escribir(f"Nuevo saldo: ${formatear(cuenta.saldo)}")
     return True
 
 def consultar_saldo(cuenta):
     print_header("CONSULTA DE SALDO")
-    print(f"Saldo actual: {Colors.BOLD}${cuenta.saldo}{Colors.END}")
+    pantalla.escribir(f"Saldo actual: {Colors.BOLD}${formatear(cuenta.saldo)}{Colors.END}")
     return True
 
+MOVIMIENTOS_POR_PAGINA = 20
+
+# Muestra el historial del más reciente al más antiguo, una página por vez
 def mostrar_movimientos(cuenta):
     print_header("HISTORIAL DE MOVIMIENTOS")
     if not cuenta.movimientos:
-        print("No hay movimientos registrados")
+        pantalla.escribir("No hay movimientos registrados")
         return
     
-    print(f"{'Fecha/Hora':<20} {'Tipo':<15} {'Monto':<15} {'Detalle':<25}")
-    print("-" * 60)
-    for mov in cuenta.movimientos:
-        color = Colors.RED if mov.monto < 0 else Colors.BLUE
-        monto_str = f"${abs(mov.monto)}" if mov.monto < 0 else f"${mov.monto}"
-        
-        if mov.tipo == "TRANSFERENCIA":
-            destino = f"A: {mov.cuenta_destino}" if mov.monto < 0 else f"De: {mov.cuenta_destino}"
-            detalle = destino
-        elif mov.tipo == "PAGO_SERVICIO":
-            detalle = mov.servicio
-        else:
-            detalle = ""
+    total = len(cuenta.movimientos)
+    mostrados = 0
+    cursor = None
+    por_pagina = pantalla.filas_por_pagina(MOVIMIENTOS_POR_PAGINA)
+    while True:
+        pagina = cuenta.consultar_movimientos(limite=por_pagina, cursor=cursor)
+        pantalla.escribir(f"{'Fecha/Hora':<20} {'Tipo':<15} {'Monto':<15} {'Detalle':<25}")
+        pantalla.escribir("-" * 60)
+        for mov in pagina.movimientos:
+            color = Colors.RED if mov.monto < 0 else Colors.BLUE
+            monto_str = f"${formatear(abs(mov.monto))}"
             
-        print(f"{mov.fecha.strftime('%d/%m/%Y %H:%M'):<20} {mov.tipo:<15} {color}{monto_str:<15}{Colors.END} {detalle:<25}")
+            if mov.tipo == "TRANSFERENCIA":
+                destino = f"A: {mov.cuenta_destino}" if mov.monto < 0 else f"De: {mov.cuenta_destino}"
+                detalle = destino
+            elif mov.tipo == "PAGO_SERVICIO":
+                detalle = mov.servicio
+            else:
+                detalle = ""
+                
+            pantalla.escribir(f"{mov.fecha.strftime('%d/%m/%Y %H:%M'):<20} {mov.tipo:<15} {color}{monto_str:<15}{Colors.END} {detalle:<25}")
+        
+        mostrados += len(pagina.movimientos)
+        cursor = pagina.cursor
+        if cursor is None:
+            return
+        continuar = pantalla.pedir(f"\n{mostrados}/{total} - Enter para ver más, 's' para salir: ").lower()
+        if continuar == 's':
+            return
+
+# Importación y exportación masiva desde los menús de gestión; ver
+# carga_masiva.py. El formato sale de la extensión (.csv o .jsonl).
+def importar_archivo(banco, entidades):
+    # Import diferido: carga_masiva importa este módulo
+    import carga_masiva
+    entidad = entidades[0] if len(entidades) == 1 else get_valid_input(
+        f"Importar ({' / '.join(entidades)}): ", str, entidades)
+    ruta = pantalla.pedir("Archivo (.csv o .jsonl): ").strip()
+    def progreso(filas):
+        pantalla.escribir(f"{filas} filas validadas...")
+        pantalla.volcar()
+    try:
+        with open(ruta, newline="", encoding="utf-8") as entrada:
+            resumen = carga_masiva.importar(
+                banco, entidad, carga_masiva.lector(carga_masiva.formato_de(ruta))(entrada),
+                progreso=progreso)
+    except OSError as e:
+        pantalla.escribir(Colors.RED + f"No se pudo leer el archivo: {e}" + Colors.END)
+    except (carga_masiva.ImportacionError, OperacionError) as e:
+        pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
+    else:
+        pantalla.escribir(Colors.GREEN + f"\nImportación completa: {resumen['agregadas']} nuevos, "
+                          f"{resumen['actualizadas']} actualizados" + Colors.END)
+
+def exportar_archivo(banco, entidades):
+    import carga_masiva
+    entidad = entidades[0] if len(entidades) == 1 else get_valid_input(
+        f"Exportar ({' / '.join(entidades)}): ", str, entidades)
+    ruta = pantalla.pedir("Archivo (.csv o .jsonl): ").strip()
+    try:
+        with open(ruta, "w", newline="", encoding="utf-8") as salida:
+            escritas = carga_masiva.exportar(banco, entidad, salida, carga_masiva.formato_de(ruta))
+    except OSError as e:
+        pantalla.escribir(Colors.RED + f"No se pudo escribir el archivo: {e}" + Colors.END)
+    else:
+        pantalla.escribir(Colors.GREEN + f"\n{escritas} filas exportadas a {ruta}" + Colors.END)
 
 def gestion_clientes(banco):
     print_header("GESTIÓN DE CLIENTES")
@@ -337,48 +2056,83 @@ def gestion_clientes(banco):
         "1": "Agregar cliente",
         "2": "Listar clientes",
         "3": "Editar cliente",
-        "4": "Volver al menú principal"
+        "4": "Abrir cuenta adicional",
+        "5": "Cerrar cuenta",
+        "6": "Importar clientes o cuentas",
+        "7": "Exportar clientes o cuentas",
+        "8": "Volver al menú principal"
     }
     print_menu(menu)
     
     opcion = get_valid_input("Seleccione una opción: ", str, menu.keys())
     
     if opcion == "1":
-        print("\n" + "="*30)
-        print("NUEVO CLIENTE")
-        print("="*30)
+        pantalla.escribir("\n" + "="*30)
+        pantalla.escribir("NUEVO CLIENTE")
+        pantalla.escribir("="*30)
         cliente_id = get_valid_input("ID del cliente: ", int)
-        nombre = input("Nombre completo: ")
-        password = input("Contraseña: ")
+        if cliente_id in banco.clientes_por_id:
+            pantalla.escribir(Colors.RED + f"Ya existe un cliente con ID {cliente_id}" + Colors.END)
+            pantalla.pedir("\nPresione Enter para continuar...")
+            return
+        nombre = pantalla.pedir("Nombre completo: ")
+        password = pantalla.pedir("Contraseña: ")
         
-        nuevo_cliente = Cliente(cliente_id, nombre, password)
-        banco.agregar_cliente(nuevo_cliente)
-        
-        # Crear cuenta automáticamente
-        cuenta_numero = f"CTA-{cliente_id:04d}"
-        nueva_cuenta = Cuenta(cuenta_numero, cliente_id, 0)
-        banco.agregar_cuenta(nueva_cuenta)
-        
-        print(Colors.GREEN + "\nCliente y cuenta creados exitosamente!" + Colors.END)
-        print(f"ID Cliente: {cliente_id}")
-        print(f"Cuenta asignada: {cuenta_numero}")
+        try:
+            banco.agregar_cliente(Cliente(cliente_id, nombre, banco.autenticador.generar(password)))
+            # Crear cuenta automáticamente
+            cuenta_numero = banco.nuevo_numero_cuenta(cliente_id)
+            banco.agregar_cuenta(Cuenta(cuenta_numero, cliente_id, 0))
+        except OperacionError as e:
+            pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
+        else:
+            pantalla.escribir(Colors.GREEN + "\nCliente y cuenta creados exitosamente!" + Colors.END)
+            pantalla.escribir(f"ID Cliente: {cliente_id}")
+            pantalla.escribir(f"Cuenta asignada: {cuenta_numero}")
     
     elif opcion == "2":
-        print("\n" + "="*30)
-        print("LISTADO DE CLIENTES")
-        print("="*30)
+        pantalla.escribir("\n" + "="*30)
+        pantalla.escribir("LISTADO DE CLIENTES")
+        pantalla.escribir("="*30)
         if not banco.clientes:
-            print("No hay clientes registrados")
+            pantalla.escribir("No hay clientes registrados")
         else:
-            clientes_ordenados = banco.quicksort(banco.clientes, 'id')
-            print(f"{'ID':<10} {'Nombre':<25} {'Cuenta Asignada':<15}")
-            print("-" * 50)
-            for cliente in clientes_ordenados:
-                cuenta = banco.cuentas_por_cliente.get(cliente.id)
-                cuenta_num = cuenta.numero if cuenta else "Sin cuenta"
-                print(f"{cliente.id:<10} {cliente.nombre:<25} {cuenta_num:<15}")
+            def filas():
+                for cliente in banco.listar_clientes():
+                    cuentas = banco.cuentas_de_cliente(cliente.id)
+                    cuenta_num = ", ".join(c.numero for c in cuentas) if cuentas else "Sin cuenta"
+                    yield f"{cliente.id:<10} {cliente.nombre:<25} {cuenta_num:<15}"
+            imprimir_paginado(f"{'ID':<10} {'Nombre':<25} {'Cuentas':<15}", filas())
     
-    input("\nPresione Enter para continuar...")
+    elif opcion == "4":
+        cliente_id = get_valid_input("ID del cliente: ", int)
+        if cliente_id not in banco.clientes_por_id:
+            pantalla.escribir(Colors.RED + f"No se encontró cliente con ID {cliente_id}" + Colors.END)
+        else:
+            try:
+                cuenta_numero = banco.nuevo_numero_cuenta(cliente_id)
+                banco.agregar_cuenta(Cuenta(cuenta_numero, cliente_id, 0))
+            except OperacionError as e:
+                pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
+            else:
+                pantalla.escribir(Colors.GREEN + f"\nCuenta {cuenta_numero} creada exitosamente!" + Colors.END)
+    
+    elif opcion == "5":
+        cuenta_numero = pantalla.pedir("Número de cuenta a cerrar: ").strip()
+        try:
+            banco.quitar_cuenta(cuenta_numero)
+        except OperacionError as e:
+            pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
+        else:
+            pantalla.escribir(Colors.GREEN + f"\nCuenta {cuenta_numero} cerrada" + Colors.END)
+    
+    elif opcion == "6":
+        importar_archivo(banco, ("clientes", "cuentas"))
+    
+    elif opcion == "7":
+        exportar_archivo(banco, ("clientes", "cuentas"))
+    
+    pantalla.pedir("\nPresione Enter para continuar...")
 
 def gestion_cajeros(banco):
     print_header("GESTIÓN DE CAJEROS")
@@ -386,91 +2140,132 @@ def gestion_cajeros(banco):
         "1": "Agregar cajero",
         "2": "Listar cajeros",
         "3": "Editar billetes",
-        "4": "Volver al menú principal"
+        "4": "Plan de reposición",
+        "5": "Importar cajeros e inventarios",
+        "6": "Exportar cajeros",
+        "7": "Volver al menú principal"
     }
     print_menu(menu)
     
     opcion = get_valid_input("Seleccione una opción: ", str, menu.keys())
     
     if opcion == "1":
-        print("\n" + "="*30)
-        print("NUEVO CAJERO")
-        print("="*30)
+        pantalla.escribir("\n" + "="*30)
+        pantalla.escribir("NUEVO CAJERO")
+        pantalla.escribir("="*30)
         cajero_id = get_valid_input("ID del cajero: ", int)
-        ubicacion = input("Ubicación: ")
+        ubicacion = pantalla.pedir("Ubicación: ")
         
         nuevo_cajero = Dispensador(cajero_id, ubicacion)
-        banco.dispensadores.append(nuevo_cajero)
-        
-        print(Colors.GREEN + "\nCajero creado exitosamente!" + Colors.END)
+        try:
+            banco.agregar_dispensador(nuevo_cajero)
+        except OperacionError as e:
+            pantalla.escribir(Colors.RED + f"Error: {e}" + Colors.END)
+        else:
+            pantalla.escribir(Colors.GREEN + "\nCajero creado exitosamente!" + Colors.END)
     
     elif opcion == "2":
-        print("\n" + "="*30)
-        print("LISTADO DE CAJEROS")
-        print("="*30)
+        pantalla.escribir("\n" + "="*30)
+        pantalla.escribir("LISTADO DE CAJEROS")
+        pantalla.escribir("="*30)
         if not banco.dispensadores:
-            print("No hay cajeros registrados")
+            pantalla.escribir("No hay cajeros registrados")
         else:
-            cajeros_ordenados = banco.quicksort(banco.dispensadores, 'id')
-            print(f"{'ID':<10} {'Ubicación':<25} {'Billetes Disponibles'}")
-            print("-" * 60)
-            for cajero in cajeros_ordenados:
-                billetes_info = ", ".join([f"${k}:{v}" for k, v in cajero.billetes.items()])
-                print(f"{cajero.id:<10} {cajero.ubicacion:<25} {billetes_info}")
+            filas = (f"{cajero.id:<10} {cajero.ubicacion:<25} "
+                     + ", ".join([f"${k}:{v}" for k, v in cajero.billetes.items()])
+                     for cajero in banco.listar_dispensadores())
+            imprimir_paginado(f"{'ID':<10} {'Ubicación':<25} {'Billetes Disponibles'}", filas)
     
     elif opcion == "3":
         if not banco.dispensadores:
-            print(Colors.RED + "No hay cajeros registrados" + Colors.END)
+            pantalla.escribir(Colors.RED + "No hay cajeros registrados" + Colors.END)
         else:
             cajero_id = get_valid_input("ID del cajero a editar: ", int)
-            cajero = next((c for c in banco.dispensadores if c.id == cajero_id), None)
+            cajero = buscar_dispensador(banco, cajero_id)
             
             if cajero:
-                print("\n" + "="*30)
-                print(f"EDITAR CAJERO #{cajero_id}")
-                print("="*30)
-                print("Ingrese nueva cantidad de billetes:")
+                pantalla.escribir("\n" + "="*30)
+                pantalla.escribir(f"EDITAR CAJERO #{cajero_id}")
+                pantalla.escribir("="*30)
+                pantalla.escribir("Ingrese nueva cantidad de billetes:")
                 
-                for denom in [200, 100, 50, 20]:
-                    cantidad = get_valid_input(f"Billetes de ${denom}: ", int, min_value=0)
-                    cajero.billetes[denom] = cantidad
+                nuevos = {}
+                for denom in DENOMINACIONES:
+                    nuevos[denom] = get_valid_input(f"Billetes de ${denom}: ", int, min_value=0)
+                with cajero.bloqueo:
+                    cajero.billetes.update(nuevos)
                 
-                print(Colors.GREEN + "\nCajero actualizado exitosamente!" + Colors.END)
+                pantalla.escribir(Colors.GREEN + "\nCajero actualizado exitosamente!" + Colors.END)
             else:
-                print(Colors.RED + f"No se encontró cajero con ID {cajero_id}" + Colors.END)
+                pantalla.escribir(Colors.RED + f"No se encontró cajero con ID {cajero_id}" + Colors.END)
+    
+    elif opcion == "4":
+        pantalla.escribir("\n" + "="*30)
+        pantalla.escribir("PLAN DE REPOSICIÓN")
+        pantalla.escribir("="*30)
+        # Import diferido: el planificador carga NumPy si está instalado
+        import planificador
+        plan = planificador.Planificador.desde_banco(banco).planificar(
+            planificador.inventarios_de_banco(banco))
+        def filas():
+            for fila in plan:
+                cargar = ", ".join(f"${d['denominacion']}:{d['reponer']}"
+                                   for d in fila["denominaciones"] if d["reponer"])
+                color = Colors.RED if fila["urgente"] else ""
+                yield (f"{color}{fila['cajero']:<10} {fila['reponer_el'] or 'Sin consumo':<15}"
+                       f"{Colors.END if color else ''} {cargar or '-'}")
+        imprimir_paginado(f"{'ID':<10} {'Reponer el':<15} {'Billetes a cargar'}", filas())
+    
+    elif opcion == "5":
+        importar_archivo(banco, ("dispensadores",))
+    
+    elif opcion == "6":
+        exportar_archivo(banco, ("dispensadores",))
     
-    input("\nPresione Enter para continuar...")
+    pantalla.pedir("\nPresione Enter para continuar...")
 
 def autenticar_usuario(banco):
     print_header("AUTENTICACIÓN")
     try:
-        cliente_id = int(input("Ingrese su ID de cliente: "))
-        password = input("Ingrese su contraseña: ")
+        cliente_id = int(pantalla.pedir("Ingrese su ID de cliente: "))
+        password = pantalla.pedir("Ingrese su contraseña: ")
     except:
         return None
     
-    cliente = banco.clientes_por_id.get(cliente_id)
-    if cliente and cliente.password == password:
-        return banco.cuentas_por_cliente.get(cliente_id)
-    return None
+    try:
+        return autenticar(banco, cliente_id, password, origen="consola")
+    except credenciales.IntentosExcedidos as e:
+        pantalla.escribir(Colors.RED + f"\n{e}" + Colors.END)
+        return None
 
-# Función principal con menús jerárquicos
-def main():
-    # Crear banco y datos de ejemplo
+# Con varias cuentas el cliente elige con cuál operar; 'cuenta' es la principal
+def seleccionar_cuenta(banco, cuenta):
+    cuentas = banco.cuentas_de_cliente(cuenta.cliente_id)
+    if len(cuentas) <= 1:
+        return cuenta
+    pantalla.escribir("\nSeleccione la cuenta:")
+    opciones = {str(i): otra for i, otra in enumerate(cuentas, 1)}
+    for clave, otra in opciones.items():
+        pantalla.escribir(f"{clave}. {otra.numero} (${formatear(otra.saldo)})")
+    return opciones[get_valid_input("Cuenta: ", str, opciones.keys())]
+
+# Banco con los datos de ejemplo del sistema
+def crear_banco_ejemplo():
     banco = Banco()
     
     # Crear clientes de ejemplo
-    cliente1 = Cliente(1, "Luis Sánchez", "1234")
-    cliente2 = Cliente(2, "Paola Olivos", "5678")
-    cliente3 = Cliente(3, "Luis Salazar", "9012")
+    generar = banco.autenticador.generar
+    cliente1 = Cliente(1, "Luis Sánchez", generar("1234"))
+    cliente2 = Cliente(2, "Paola Olivos", generar("5678"))
+    cliente3 = Cliente(3, "Luis Salazar", generar("9012"))
     banco.agregar_cliente(cliente1)
     banco.agregar_cliente(cliente2)
     banco.agregar_cliente(cliente3)
     
     # Crear cuentas de ejemplo
-    cuenta1 = Cuenta("001-123456", 1, 5000)
-    cuenta2 = Cuenta("001-654321", 2, 3000)
-    cuenta3 = Cuenta("001-987654", 3, 7000)
+    cuenta1 = Cuenta("001-123456", 1, 5000 * CENTAVOS)
+    cuenta2 = Cuenta("001-654321", 2, 3000 * CENTAVOS)
+    cuenta3 = Cuenta("001-987654", 3, 7000 * CENTAVOS)
     banco.agregar_cuenta(cuenta1)
     banco.agregar_cuenta(cuenta2)
     banco.agregar_cuenta(cuenta3)
@@ -478,11 +2273,58 @@ def main():
     # Crear dispensadores de ejemplo
     dispensador1 = Dispensador(1, "Sucursal Central")
     dispensador1.billetes = {200: 10, 100: 20, 50: 30, 20: 40}
-    banco.dispensadores.append(dispensador1)
+    banco.agregar_dispensador(dispensador1)
     
     dispensador2 = Dispensador(2, "Sucursal Norte")
     dispensador2.billetes = {200: 5, 100: 15, 50: 25, 20: 35}
-    banco.dispensadores.append(dispensador2)
+    banco.agregar_dispensador(dispensador2)
+    
+    return banco
+
+# Función principal con menús jerárquicos
+def main():
+    # Recuperar el estado de ejecuciones anteriores: la instantánea más la
+    # cola del diario, o los datos de ejemplo más el diario completo
+    directorio_datos = os.environ.get("CAJERO_DATOS", "cajero_datos")
+    ruta_diario = os.environ.get("CAJERO_DIARIO", os.path.join(directorio_datos, "cajero.diario"))
+    os.makedirs(directorio_datos, exist_ok=True)
+    cargado = cargar_instantanea(directorio_datos, ruta_diario)
+    if cargado is None:
+        banco = crear_banco_ejemplo()
+        abrir_diario(banco, ruta_diario)
+    else:
+        banco = cargado[0]
+    # Compactar: la base nueva reemplaza a la anterior y a sus deltas
+    seq = guardar_instantanea(banco, directorio_datos)
+    REFERENCIAS.abrir(os.path.join(directorio_datos, "referencias.tope"))
+    punto_control = PuntoControl(banco, directorio_datos, seq)
+    
+    # Métricas: CAJERO_METRICAS=1 las activa; CAJERO_METRICAS_PUERTO además
+    # las expone por HTTP en /metrics y /metrics.json
+    puerto_metricas = os.environ.get("CAJERO_METRICAS_PUERTO")
+    if os.environ.get("CAJERO_METRICAS") == "1" or puerto_metricas:
+        metricas.activar()
+    if puerto_metricas:
+        metricas.servir_http(int(puerto_metricas))
+    
+    # Credenciales: CAJERO_HASH elige algoritmo y costo de los hashes (p. ej.
+    # "scrypt:n=32768" o "pbkdf2_sha256:iteraciones=600000"); con
+    # CAJERO_PROCESOS_HASH las verificaciones corren en ese número de procesos
+    banco.autenticador = credenciales.Autenticador(
+        credenciales.leer_parametros(os.environ.get("CAJERO_HASH")),
+        procesos=int(os.environ.get("CAJERO_PROCESOS_HASH", "0")))
+    # Antifraude: CAJERO_ANTIFRAUDE ajusta las reglas (p. ej.
+    # "retiro_diario=15000,destinos=3/1800") y CAJERO_ANTIFRAUDE_MODO elige
+    # sombra (solo registra, por omisión), activo (rechaza) o apagado
+    banco.antifraude = antifraude.Antifraude.desde_entorno()
+    
+    # Una terminal con CAJERO_ID atiende con su propio dispensador. Sin él,
+    # los retiros van al cajero que puede entregar el monto y los depósitos
+    # al que menos efectivo tiene, entre los de CAJERO_UBICACION si se indica
+    # (una etiqueta de la ubicación, ver enrutador.py)
+    cajero_id = os.environ.get("CAJERO_ID")
+    dispensador_sesion = buscar_dispensador(banco, int(cajero_id)) if cajero_id else None
+    etiqueta = os.environ.get("CAJERO_UBICACION")
     
     # Menú principal
     while True:
@@ -500,9 +2342,10 @@ def main():
         if opcion == "1":  # Operaciones Bancarias
             cuenta_actual = autenticar_usuario(banco)
             if not cuenta_actual:
-                print(Colors.RED + "\nError: Autenticación fallida" + Colors.END)
-                input("\nPresione Enter para continuar...")
+                pantalla.escribir(Colors.RED + "\nError: Autenticación fallida" + Colors.END)
+                pantalla.pedir("\nPresione Enter para continuar...")
                 continue
+            cuenta_actual = seleccionar_cuenta(banco, cuenta_actual)
                 
             while True:
                 print_header(f"OPERACIONES BANCARIAS - Cliente: {banco.clientes_por_id[cuenta_actual.cliente_id].nombre}")
@@ -520,34 +2363,35 @@ def main():
                 sub_opcion = get_valid_input("Seleccione una operación: ", str, operaciones_menu.keys())
                 
                 if sub_opcion == "1":  # Retiro
-                    if banco.dispensadores:
-                        realizar_retiro(banco, cuenta_actual, banco.dispensadores[0])
+                    if dispensador_sesion or banco.dispensadores:
+                        realizar_retiro(banco, cuenta_actual, dispensador_sesion, etiqueta)
                     else:
-                        print(Colors.RED + "No hay dispensadores disponibles" + Colors.END)
-                    input("\nPresione Enter para continuar...")
+                        pantalla.escribir(Colors.RED + "No hay dispensadores disponibles" + Colors.END)
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "2":  # Depósito
-                    if banco.dispensadores:
-                        realizar_deposito(banco, cuenta_actual, banco.dispensadores[0])
+                    dispensador = dispensador_sesion or banco.enrutador.elegir_deposito(etiqueta)
+                    if dispensador:
+                        realizar_deposito(banco, cuenta_actual, dispensador)
                     else:
-                        print(Colors.RED + "No hay dispensadores disponibles" + Colors.END)
-                    input("\nPresione Enter para continuar...")
+                        pantalla.escribir(Colors.RED + "No hay dispensadores disponibles" + Colors.END)
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "3":  # Transferencia
                     realizar_transferencia(banco, cuenta_actual)
-                    input("\nPresione Enter para continuar...")
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "4":  # Pago de Servicios
                     realizar_pago_servicios(cuenta_actual)
-                    input("\nPresione Enter para continuar...")
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "5":  # Consulta de Saldo
                     consultar_saldo(cuenta_actual)
-                    input("\nPresione Enter para continuar...")
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "6":  # Movimientos
                     mostrar_movimientos(cuenta_actual)
-                    input("\nPresione Enter para continuar...")
+                    pantalla.pedir("\nPresione Enter para continuar...")
                 
                 elif sub_opcion == "7":
                     break
@@ -559,7 +2403,13 @@ def main():
             gestion_cajeros(banco)
         
         elif opcion == "4":  # Salir
-            print(Colors.YELLOW + "\nGracias por usar nuestro sistema. ¡Hasta pronto!" + Colors.END)
+            pantalla.escribir(Colors.YELLOW + "\nGracias por usar nuestro sistema. ¡Hasta pronto!" + Colors.END)
+            punto_control.detener()
+            guardar_instantanea(banco, directorio_datos)
+            banco.diario.cerrar()
+            banco.autenticador.cerrar()
+            REFERENCIAS.cerrar()
+            pantalla.volcar()
             sys.exit()
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+import metricas
+from dinero import CENTAVOS
+
+# Control antifraude en línea para retiros y transferencias. Por cuenta se
+# llevan agregados en ventanas móviles (montos retirados, cantidad y monto
+# de transferencias, últimos destinatarios) en un solo array('q') con
+# anillos de divisiones fijas (unos 600 bytes por cuenta activa): anotar o
+# consultar una ventana avanza el anillo y suma o lee un total ya
+# acumulado, sin recorrer movimientos. Cada regla se evalúa en tiempo
+# constante.
+#
+# Una ventana de S segundos en D divisiones descarta lo viejo de a una
+# división: lo que cuenta son entre S - S/D y S segundos hacia atrás. Los
+# agregados viven en memoria (reloj monotónico) y empiezan vacíos en cada
+# arranque.
+#
+# Modos (CAJERO_ANTIFRAUDE_MODO):
+#   activo    una operación que viola una regla se rechaza
+#   sombra    se evalúa y se registra la decisión (métricas y eventos),
+#             pero la operación sigue; es el modo por omisión, así los
+#             límites se ajustan mirando las marcas antes de rechazar nada
+#   apagado   no se evalúa ni se anota nada
+#
+# Reglas (CAJERO_ANTIFRAUDE), "nombre=límite[/segundos]" separadas por
+# comas; un límite 0 desactiva la regla:
+#   retiro_diario      pesos retirados en la ventana
+#   transferencias     transferencias enviadas en la ventana
+#   monto_transferido  pesos transferidos en la ventana
+#   destinos           destinatarios distintos en la ventana: transferir a
+#                      uno que ya está entre ellos siempre se permite
+
+ACTIVO = "activo"
+SOMBRA = "sombra"
+APAGADO = "apagado"
+MODOS = (ACTIVO, SOMBRA, APAGADO)
+
+# nombre -> (límite, segundos)
+REGLAS = {"retiro_diario": (20_000, 86_400),
+          "transferencias": (10, 600),
+          "monto_transferido": (100_000, 86_400),
+          "destinos": (5, 3_600)}
+DIVISIONES = 12
+# Destinatarios recordados por cuenta: al menos el doble del límite
+MIN_DESTINOS = 8
+
+MENSAJES = {"retiro_diario": "Se superó el límite diario de retiros",
+            "transferencias": "Demasiadas transferencias en poco tiempo",
+            "monto_transferido": "Se superó el límite de monto transferido",
+            "destinos": "Demasiados destinatarios distintos en poco tiempo"}
+
+class ReglaError(ValueError):
+    pass
+
+# Reglas desde un texto como "retiro_diario=15000,destinos=3/1800"; las no
+# mencionadas quedan con su valor por omisión
+def leer_reglas(texto=None):
+    reglas = dict(REGLAS)
+    for par in filter(None, (texto or "").split(",")):
+        nombre, _, valor = par.strip().partition("=")
+        if nombre not in reglas:
+            raise ReglaError(f"Regla antifraude desconocida: {nombre}")
+        limite, _, segundos = valor.partition("/")
+        try:
+            regla = (int(limite), int(segundos) if segundos else reglas[nombre][1])
+        except ValueError:
+            raise ReglaError(f"Valor inválido para {nombre}: {valor!r}") from None
+        if regla[0] < 0 or regla[1] <= 0:
+            raise ReglaError(f"Valor inválido para {nombre}: {valor!r}")
+        reglas[nombre] = regla
+    return reglas
+
+# Anillo de 'divisiones' valores dentro del arreglo de una cuenta, desde
+# la posición 'inicio': [última división, total, valor por división...]
+class _Ventana:
+    __slots__ = ('ancho', 'divisiones', 'inicio', 'tamano', '_ceros')
+
+    def __init__(self, segundos, divisiones, inicio):
+        self.ancho = segundos / divisiones
+        self.divisiones = divisiones
+        self.inicio = inicio
+        self.tamano = 2 + divisiones
+        self._ceros = array('q', bytes(8 * (divisiones + 1)))
+
+    # Descarta las divisiones que salieron de la ventana; solo se llama
+    # cuando cambió la división actual
+    def _avanzar(self, estado, actual):
+        i = self.inicio
+        ultima = estado[i]
+        if actual > ultima:
+            if actual - ultima >= self.divisiones:
+                estado[i + 1:i + self.tamano] = self._ceros
+            else:
+                for division in range(ultima + 1, actual + 1):
+                    j = i + 2 + division % self.divisiones
+                    estado[i + 1] -= estado[j]
+                    estado[j] = 0
+            estado[i] = actual
+
+    def total(self, estado, ahora):
+        actual = int(ahora / self.ancho)
+        if actual != estado[self.inicio]:
+            self._avanzar(estado, actual)
+        return estado[self.inicio + 1]
+
+    def agregar(self, estado, ahora, valor):
+        i = self.inicio
+        actual = int(ahora / self.ancho)
+        if actual != estado[i]:
+            self._avanzar(estado, actual)
+        estado[i + 2 + actual % self.divisiones] += valor
+        estado[i + 1] += valor
+
+# Los últimos 'capacidad' destinatarios (hash del destino y milisegundos
+# de su última transferencia): [hashes..., tiempos...]. Cada destino
+# aparece una vez; uno nuevo ocupa el lugar del más viejo.
+class _Destinos:
+    __slots__ = ('milisegundos', 'capacidad', 'inicio', 'tamano')
+
+    def __init__(self, segundos, capacidad, inicio):
+        self.milisegundos = segundos * 1000
+        self.capacidad = capacidad
+        self.inicio = inicio
+        self.tamano = 2 * capacidad
+
+    # (el destino está entre los recientes, destinatarios distintos
+    # recientes); si está, la cantidad no hace falta y vale 0
+    def revisar(self, estado, ahora, clave):
+        i, n = self.inicio, self.capacidad
+        desde = max(0, int(ahora * 1000) - self.milisegundos)
+        hashes = estado[i:i + n]
+        if clave in hashes and estado[i + n + hashes.index(clave)] > desde:
+            return True, 0
+        return False, n - bisect_right(sorted(estado[i + n:i + 2 * n]), desde)
+
+    def agregar(self, estado, ahora, clave):
+        i, n = self.inicio, self.capacidad
+        hashes = estado[i:i + n]
+        if clave in hashes:
+            j = hashes.index(clave)
+        else:
+            tiempos = estado[i + n:i + 2 * n]
+            j = tiempos.index(min(tiempos))
+        estado[i + j] = clave
+        # +1: un tiempo 0 es una posición vacía
+        estado[i + n + j] = int(ahora * 1000) + 1
+
+class Antifraude:
+    def __init__(self, reglas=None, modo=SOMBRA):
+        if modo not in MODOS:
+            raise ReglaError(f"Modo antifraude desconocido: {modo}")
+        reglas = leer_reglas() if reglas is None else reglas
+        self.modo = modo
+        self.reglas = reglas
+        self.limite_retiro = reglas["retiro_diario"][0] * CENTAVOS
+        self.limite_transferencias = reglas["transferencias"][0]
+        self.limite_monto = reglas["monto_transferido"][0] * CENTAVOS
+        self.limite_destinos = reglas["destinos"][0]
+        # Posición 0 del arreglo de cada cuenta: último uso, en segundos
+        self._retiros = _Ventana(reglas["retiro_diario"][1], DIVISIONES, 1)
+        self._transferencias = _Ventana(reglas["transferencias"][1], DIVISIONES,
+                                        self._retiros.inicio + self._retiros.tamano)
+        self._montos = _Ventana(reglas["monto_transferido"][1], DIVISIONES,
+                                self._transferencias.inicio + self._transferencias.tamano)
+        self._destinos = _Destinos(reglas["destinos"][1],
+                                   max(MIN_DESTINOS, 2 * self.limite_destinos),
+                                   self._montos.inicio + self._montos.tamano)
+        self._vacio = array('q', bytes(8 * (self._destinos.inicio + self._destinos.tamano)))
+        # Una cuenta sin operaciones en la ventana más larga se descarta
+        self._olvido = max(segundos for _, segundos in reglas.values())
+        self._proxima_limpieza = 0.0
+        # número de cuenta -> array('q'); se crean y se descartan con el
+        # bloqueo, y cada una se modifica con el bloqueo de su cuenta
+        self._cuentas = {}
+        self._bloqueo = threading.Lock()
+        # Operaciones marcadas por regla, también en modo sombra
+        self.marcadas = dict.fromkeys(reglas, 0)
+
+    @classmethod
+    def desde_entorno(cls):
+        return cls(leer_reglas(os.environ.get("CAJERO_ANTIFRAUDE")),
+                   os.environ.get("CAJERO_ANTIFRAUDE_MODO", SOMBRA))
+
+    def __len__(self):
+        return len(self._cuentas)
+
+    def _nueva(self, cuenta_numero, ahora):
+        with self._bloqueo:
+            if ahora >= self._proxima_limpieza:
+                self._limpiar(ahora)
+            return self._cuentas.setdefault(cuenta_numero, array('q', self._vacio))
+
+    def _limpiar(self, ahora):
+        limite = ahora - self._olvido
+        self._cuentas = {numero: estado for numero, estado in self._cuentas.items()
+                         if estado[0] >= limite}
+        self._proxima_limpieza = ahora + self._olvido
+
+    # Registra la decisión; en modo activo devuelve el mensaje de rechazo.
+    # Cuentas distintas se revisan a la vez: el contador va con el bloqueo.
+    def _marcar(self, regla, cuenta_numero):
+        with self._bloqueo:
+            self.marcadas[regla] += 1
+        if metricas.activas:
+            metricas.contar("cajero_antifraude_total", (("regla", regla), ("modo", self.modo)))
+            metricas.evento("antifraude", regla=regla, cuenta=cuenta_numero, modo=self.modo)
+        return MENSAJES[regla] if self.modo == ACTIVO else None
+
+    # revisar_*: None si la operación puede seguir o el motivo del rechazo.
+    # anotar_*: después de que la operación se hizo. Ambas con el bloqueo
+    # de la cuenta tomado.
+    def revisar_retiro(self, cuenta_numero, monto, ahora=None):
+        if self.modo == APAGADO or not self.limite_retiro:
+            return None
+        ahora = time.monotonic() if ahora is None else ahora
+        estado = self._cuentas.get(cuenta_numero)
+        retirado = self._retiros.total(estado, ahora) if estado is not None else 0
+        if retirado + monto > self.limite_retiro:
+            return self._marcar("retiro_diario", cuenta_numero)
+        return None
+
+    def anotar_retiro(self, cuenta_numero, monto, ahora=None):
+        if self.modo == APAGADO:
+            return
+        ahora = time.monotonic() if ahora is None else ahora
+        estado = self._cuentas.get(cuenta_numero) or self._nueva(cuenta_numero, ahora)
+        estado[0] = int(ahora)
+        self._retiros.agregar(estado, ahora, monto)
+
+    # 'destino': número de cuenta o, si no se conoce, el destino indicado
+    def revisar_transferencia(self, cuenta_numero, destino, monto, ahora=None):
+        if self.modo == APAGADO:
+            return None
+        ahora = time.monotonic() if ahora is None else ahora
+        estado = self._cuentas.get(cuenta_numero)
+        if estado is None:
+            cantidad, transferido, conocido, destinos = 0, 0, False, 0
+        else:
+            cantidad = self._transferencias.total(estado, ahora)
+            transferido = self._montos.total(estado, ahora)
+            conocido, destinos = self._destinos.revisar(estado, ahora, hash(destino))
+        motivo = None
+        if self.limite_transferencias and cantidad >= self.limite_transferencias:
+            motivo = self._marcar("transferencias", cuenta_numero)
+        if self.limite_monto and transferido + monto > self.limite_monto:
+            motivo = motivo or self._marcar("monto_transferido", cuenta_numero)
+        if self.limite_destinos and not conocido and destinos >= self.limite_destinos:
+            motivo = motivo or self._marcar("destinos", cuenta_numero)
+        return motivo
+
+    def anotar_transferencia(self, cuenta_numero, destino, monto, ahora=None):
+        if self.modo == APAGADO:
+            return
+        ahora = time.monotonic() if ahora is None else ahora
+        estado = self._cuentas.get(cuenta_numero) or self._nueva(cuenta_numero, ahora)
+        estado[0] = int(ahora)
+        self._transferencias.agregar(estado, ahora, 1)
+        self._montos.agregar(estado, ahora, monto)
+        self._destinos.agregar(estado, ahora, hash(destino))
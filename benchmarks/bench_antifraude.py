@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import antifraude
+from dinero import CENTAVOS
+from Sistema_de_Cajero import Banco, Dispensador, OperacionError, retirar, transferir
+
+# Costo del control antifraude con las reglas por omisión: microsegundos
+# por revisión + anotación con muchas cuentas activas, descontada una
+# llamada vacía con los mismos argumentos; retiros y transferencias
+# completos con el control apagado, en sombra (evalúa todo y nunca
+# rechaza) y activo; y memoria por cuenta con agregados.
+
+def _vacia(*args):
+    return None
+
+def micro(cuentas, operaciones, semilla):
+    control = antifraude.Antifraude(modo=antifraude.SOMBRA)
+    azar = random.Random(semilla)
+    numeros = [f"001-{i:08d}" for i in range(cuentas)]
+    elegidas = [numeros[azar.randrange(cuentas)] for _ in range(operaciones)]
+    destinos = [numeros[azar.randrange(cuentas)] for _ in range(operaciones)]
+    resultado = {}
+
+    def medir(revisar, anotar, con_destino):
+        inicio = time.perf_counter()
+        if con_destino:
+            for numero, destino in zip(elegidas, destinos):
+                revisar(numero, destino, 100)
+                anotar(numero, destino, 100)
+        else:
+            for numero in elegidas:
+                revisar(numero, 100)
+                anotar(numero, 100)
+        return (time.perf_counter() - inicio) / operaciones * 1e6
+
+    base = medir(_vacia, _vacia, False)
+    resultado["retiro_us"] = round(medir(control.revisar_retiro, control.anotar_retiro, False) - base, 3)
+    base = medir(_vacia, _vacia, True)
+    resultado["transferencia_us"] = round(
+        medir(control.revisar_transferencia, control.anotar_transferencia, True) - base, 3)
+    resultado["cuentas_activas"] = len(control)
+    resultado["marcadas"] = control.marcadas
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    otro = antifraude.Antifraude()
+    for numero in numeros:
+        otro.anotar_transferencia(numero, numero, 100)
+    resultado["bytes_por_cuenta"] = round((tracemalloc.get_traced_memory()[0] - antes) / cuentas)
+    tracemalloc.stop()
+    return resultado
+
+def crear_banco(cuentas, modo):
+    banco = Banco()
+    banco.antifraude = antifraude.Antifraude(modo=modo)
+    banco.agregar_cuentas([f"001-{i:08d}" for i in range(cuentas)], list(range(cuentas)),
+                          array('q', [10_000_000 * CENTAVOS]) * cuentas)
+    dispensador = Dispensador(1, "Cajero 1")
+    dispensador.billetes = {200: 10_000_000, 100: 10_000_000, 50: 10_000_000, 20: 10_000_000}
+    banco.agregar_dispensador(dispensador)
+    return banco
+
+def operaciones_completas(cuentas, operaciones, semilla):
+    azar = random.Random(semilla)
+    indices = [(azar.randrange(cuentas), azar.randrange(cuentas)) for _ in range(operaciones)]
+    resultado = {}
+    for modo in (antifraude.APAGADO, antifraude.SOMBRA, antifraude.ACTIVO):
+        banco = crear_banco(cuentas, modo)
+        todas, dispensador = banco.cuentas, banco.dispensadores[0]
+        inicio = time.perf_counter()
+        for i, _ in indices:
+            retirar(banco, todas[i], dispensador, 100 * CENTAVOS)
+        retiro = (time.perf_counter() - inicio) / operaciones * 1e6
+        inicio = time.perf_counter()
+        for i, j in indices:
+            try:
+                transferir(banco, todas[i], todas[j].numero, 100)
+            except OperacionError:
+                # a su propia cuenta, o rechazada por antifraude
+                pass
+        transferencia = (time.perf_counter() - inicio) / operaciones * 1e6
+        resultado[modo] = {"retiro_us": round(retiro, 2), "transferencia_us": round(transferencia, 2),
+                           "marcadas": sum(banco.antifraude.marcadas.values())}
+    for modo in (antifraude.SOMBRA, antifraude.ACTIVO):
+        for operacion in ("retiro_us", "transferencia_us"):
+            resultado[modo][f"extra_{operacion}"] = round(
+                resultado[modo][operacion] - resultado[antifraude.APAGADO][operacion], 2)
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Costo del control antifraude por operación")
+    parser.add_argument("--cuentas", type=int, default=200_000)
+    parser.add_argument("--operaciones", type=int, default=1_000_000)
+    parser.add_argument("--completas", type=int, default=100_000,
+                        help="retiros y transferencias completos por modo")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args(argv)
+    resultado = {"micro": micro(args.cuentas, args.operaciones, args.semilla),
+                 "completas": operaciones_completas(args.cuentas, args.completas, args.semilla)}
+    print(resultado, file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
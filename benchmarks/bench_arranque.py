@@ -0,0 +1,95 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dinero import CENTAVOS
+from Sistema_de_Cajero import (Banco, Cliente, Cuenta, Dispensador, Movimiento, abrir_diario,
+                               cargar_instantanea, guardar_instantanea)
+
+# Tiempo de arranque con N cuentas: cargar la instantánea y reaplicar solo
+# la cola del diario, contra reconstruir el banco y reaplicar el diario
+# completo. El historial se reparte al azar entre las cuentas.
+
+def crear_banco(cuentas):
+    banco = Banco()
+    # Una sola credencial para todos: con el caché se verifica una vez
+    credencial = banco.autenticador.generar("1234")
+    for i in range(1, cuentas + 1):
+        banco.agregar_cliente(Cliente(i, f"Cliente {i}", credencial))
+        banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, 100_000 * CENTAVOS))
+    for i in range(1, 5):
+        dispensador = Dispensador(i, f"Cajero {i}")
+        dispensador.billetes = {200: 5_000, 100: 5_000, 50: 5_000, 20: 5_000}
+        banco.agregar_dispensador(dispensador)
+    return banco
+
+def depositos(banco, cantidad, azar):
+    for _ in range(cantidad):
+        cuenta = banco.cuentas[azar.randrange(len(banco.cuentas))]
+        monto = azar.randint(1, 50) * 20 * CENTAVOS
+        cuenta.saldo += monto
+        cuenta.movimientos.append(Movimiento("DEPÓSITO", monto, cuenta.numero))
+
+def medir(cuentas, movimientos, cola, directorio):
+    azar = random.Random(cuentas)
+    ruta_diario = os.path.join(directorio, "bench.diario")
+    resultado = {}
+
+    banco = crear_banco(cuentas)
+    abrir_diario(banco, ruta_diario)
+    banco.diario.durable = False
+    depositos(banco, movimientos, azar)
+    inicio = time.perf_counter()
+    guardar_instantanea(banco, directorio)
+    resultado["guardar_base_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["base_mb"] = round(os.path.getsize(os.path.join(directorio, "base.inst")) / 2**20, 1)
+    depositos(banco, cola, azar)
+    esperado = banco.total_saldos()
+    banco.diario.cerrar()
+    del banco
+    gc.collect()
+
+    inicio = time.perf_counter()
+    banco, _ = cargar_instantanea(directorio, ruta_diario)
+    resultado["arranque_instantanea_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["consistente"] = banco.total_saldos() == esperado
+    banco.diario.cerrar()
+    del banco
+    gc.collect()
+
+    # Sin instantánea: crear todas las entidades y reaplicar todo el diario
+    inicio = time.perf_counter()
+    banco = crear_banco(cuentas)
+    abrir_diario(banco, ruta_diario)
+    resultado["arranque_diario_completo_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["consistente"] &= banco.total_saldos() == esperado
+    banco.diario.cerrar()
+    del banco
+    gc.collect()
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque con instantáneas")
+    parser.add_argument("--cuentas", default="1000000,10000000")
+    parser.add_argument("--movimientos", type=int, default=1_000_000,
+                        help="registros del diario cubiertos por la instantánea")
+    parser.add_argument("--cola", type=int, default=10_000,
+                        help="registros del diario posteriores a la instantánea")
+    args = parser.parse_args(argv)
+
+    salida = {}
+    for cuentas in (int(c) for c in args.cuentas.split(",")):
+        with tempfile.TemporaryDirectory() as directorio:
+            salida[cuentas] = medir(cuentas, args.movimientos, args.cola, directorio)
+        print(f"cuentas={cuentas:<9} {salida[cuentas]}", file=sys.stderr)
+    print(json.dumps(salida, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import credenciales
+from Sistema_de_Cajero import Banco, Cliente, autenticar
+
+# Ingresos por segundo con credenciales hasheadas: cada verificación en el
+# hilo que atiende contra un pool de procesos, con el caché de
+# verificaciones, y el retraso máximo que sufre un ciclo de eventos asyncio
+# mientras atiende ingresos en el mismo hilo o fuera de él. Mide también
+# los límites de intentos con muchas claves distintas.
+
+def crear_banco(clientes, parametros, procesos):
+    banco = Banco()
+    banco.autenticador = credenciales.Autenticador(parametros, procesos=procesos, capacidad_cache=0)
+    # Cada cliente con su propia sal: los hashes se generan en paralelo
+    with ProcessPoolExecutor(max(1, os.cpu_count() or 1)) as pool:
+        textos = list(pool.map(credenciales.generar, [f"clave-{i}" for i in range(clientes)],
+                               [parametros] * clientes))
+    banco.agregar_clientes([Cliente(i, f"Cliente {i}", texto) for i, texto in enumerate(textos)])
+    banco.agregar_cuentas([f"001-{i:08d}" for i in range(clientes)], list(range(clientes)),
+                          array('q', bytes(8 * clientes)))
+    return banco
+
+def ingresos(banco, cantidad, clientes, hilos):
+    def ingresar(i):
+        return autenticar(banco, i % clientes, f"clave-{i % clientes}") is not None
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(hilos) as ejecutor:
+        correctos = sum(ejecutor.map(ingresar, range(cantidad)))
+    if correctos != cantidad:
+        raise RuntimeError(f"{cantidad - correctos} ingresos rechazados")
+    return cantidad / (time.perf_counter() - inicio)
+
+# Retraso máximo de un temporizador de 1 ms mientras se atienden 'cantidad'
+# ingresos: en el ciclo de eventos o en un ejecutor aparte
+def retraso_ciclo(banco, cantidad, clientes, fuera_del_ciclo):
+    async def correr():
+        ciclo = asyncio.get_running_loop()
+        maximo = 0.0
+        terminado = False
+
+        async def latido():
+            nonlocal maximo
+            while not terminado:
+                inicio = ciclo.time()
+                await asyncio.sleep(0.001)
+                maximo = max(maximo, ciclo.time() - inicio - 0.001)
+
+        async def ingresar(i, ejecutor):
+            argumentos = (banco, i % clientes, f"clave-{i % clientes}")
+            if fuera_del_ciclo:
+                await ciclo.run_in_executor(ejecutor, autenticar, *argumentos)
+            else:
+                autenticar(*argumentos)
+                await asyncio.sleep(0)
+
+        tarea = asyncio.create_task(latido())
+        with ThreadPoolExecutor(8) as ejecutor:
+            await asyncio.gather(*(ingresar(i, ejecutor) for i in range(cantidad)))
+        terminado = True
+        await tarea
+        return maximo
+    return asyncio.run(correr())
+
+def limites(claves, intentos):
+    limite = credenciales.LimiteIntentos(5, 60.0)
+    inicio = time.perf_counter()
+    for i in range(intentos):
+        clave = i % claves
+        if not limite.espera(clave):
+            limite.registrar(clave)
+    return intentos / (time.perf_counter() - inicio), len(limite)
+
+def medir(args):
+    parametros = credenciales.leer_parametros(args.hash)
+    resultado = {"hash": parametros[0], "costo": parametros[1]}
+    texto = credenciales.generar("clave", parametros)
+    inicio = time.perf_counter()
+    credenciales.verificar(texto, "clave")
+    resultado["ms_por_hash"] = round((time.perf_counter() - inicio) * 1e3, 1)
+
+    for procesos in (int(p) for p in args.procesos.split(",")):
+        banco = crear_banco(args.clientes, parametros, procesos)
+        etiqueta = f"procesos_{procesos}" if procesos else "en_hilo"
+        resultado[etiqueta] = {
+            "ingresos_por_s": round(ingresos(banco, args.ingresos, args.clientes, args.hilos), 1),
+            "retraso_ciclo_ms": round(retraso_ciclo(banco, args.ingresos // 4, args.clientes,
+                                                    True) * 1e3, 1)}
+        if not procesos:
+            resultado[etiqueta]["retraso_ciclo_en_el_ciclo_ms"] = round(
+                retraso_ciclo(banco, args.ingresos // 4, args.clientes, False) * 1e3, 1)
+        banco.autenticador.cerrar()
+
+    # Con caché: después de la primera verificación de cada cliente
+    banco = crear_banco(args.clientes, parametros, 0)
+    banco.autenticador.cache.capacidad = args.clientes
+    ingresos(banco, args.clientes, args.clientes, 1)
+    resultado["con_cache_ingresos_por_s"] = round(
+        ingresos(banco, args.ingresos * 100, args.clientes, args.hilos), 1)
+
+    por_segundo, claves = limites(args.claves, args.claves * 10)
+    resultado["limites_ops_por_s"] = round(por_segundo)
+    resultado["limites_claves"] = claves
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingresos por segundo con credenciales hasheadas")
+    parser.add_argument("--hash", default=None, help="p. ej. scrypt:n=16384,r=8,p=1")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--ingresos", type=int, default=400)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--procesos", default="0,1,2,4", help="0: verificar en el hilo que atiende")
+    parser.add_argument("--claves", type=int, default=100_000, help="claves para los límites de intentos")
+    args = parser.parse_args(argv)
+    resultado = medir(args)
+    print(resultado, file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
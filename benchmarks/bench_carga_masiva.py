@@ -0,0 +1,135 @@
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carga_masiva
+import credenciales
+from dinero import a_centavos
+from Sistema_de_Cajero import Banco, Cliente, Cuenta
+
+# Carga masiva de N clientes con una cuenta cada uno desde CSV y JSONL:
+# filas por segundo de la lectura sola del archivo (el techo de "velocidad
+# de disco"), del parseo y de la importación completa, contra el alta de a
+# un cliente y una cuenta como la hace el menú desde las mismas filas;
+# exportación por segundo; y memoria: lo que queda en el banco por cliente
+# contra el pico extra durante la importación, que con lectura en flujo no
+# depende del tamaño del archivo.
+
+# Mil credenciales distintas, con un costo bajo: solo tienen que ser hashes
+def _credenciales():
+    parametros = credenciales.leer_parametros("pbkdf2_sha256:iteraciones=1000")
+    return [credenciales.generar(f"clave{i}", parametros) for i in range(1000)]
+
+def generar(directorio, clientes, formato):
+    hashes = _credenciales()
+    rutas = {}
+    for entidad in (carga_masiva.CLIENTES, carga_masiva.CUENTAS):
+        ruta = rutas[entidad] = os.path.join(directorio, f"{entidad}.{formato}")
+        with open(ruta, "w", newline="", encoding="utf-8") as salida:
+            if formato == "csv":
+                salida.write(",".join(carga_masiva.CAMPOS[entidad]) + "\n")
+            for inicio in range(1, clientes + 1, carga_masiva.LOTE):
+                ids = range(inicio, min(inicio + carga_masiva.LOTE, clientes + 1))
+                if entidad == carga_masiva.CLIENTES and formato == "csv":
+                    filas = [f"{i},Cliente {i},{hashes[i % 1000]}\n" for i in ids]
+                elif entidad == carga_masiva.CLIENTES:
+                    filas = [f'{{"id": {i}, "nombre": "Cliente {i}", "credencial": "{hashes[i % 1000]}"}}\n'
+                             for i in ids]
+                elif formato == "csv":
+                    filas = [f"001-{i:08d},{i},{i % 100000}.{i % 100:02d}\n" for i in ids]
+                else:
+                    filas = [f'{{"numero": "001-{i:08d}", "cliente_id": {i}, '
+                             f'"saldo": "{i % 100000}.{i % 100:02d}"}}\n' for i in ids]
+                salida.write("".join(filas))
+    return rutas
+
+def _por_segundo(filas, inicio):
+    return round(filas / (time.perf_counter() - inicio))
+
+def medir(clientes, formato, directorio, muestra):
+    rutas = generar(directorio, clientes, formato)
+    lector = carga_masiva.lector(formato)
+    resultado = {"bytes": sum(os.path.getsize(r) for r in rutas.values())}
+
+    inicio = time.perf_counter()
+    for ruta in rutas.values():
+        with open(ruta, encoding="utf-8") as entrada:
+            for _ in entrada:
+                pass
+    resultado["lectura_filas_por_s"] = _por_segundo(2 * clientes, inicio)
+
+    inicio = time.perf_counter()
+    for ruta in rutas.values():
+        with open(ruta, newline="", encoding="utf-8") as entrada:
+            for _ in lector(entrada):
+                pass
+    resultado["parseo_filas_por_s"] = _por_segundo(2 * clientes, inicio)
+
+    resultado["de_a_uno_filas_por_s"] = de_a_uno(rutas, lector)
+    banco = Banco()
+    inicio = time.perf_counter()
+    for entidad in (carga_masiva.CLIENTES, carga_masiva.CUENTAS):
+        with open(rutas[entidad], newline="", encoding="utf-8") as entrada:
+            carga_masiva.importar(banco, entidad, lector(entrada))
+    resultado["importacion_filas_por_s"] = _por_segundo(2 * clientes, inicio)
+    assert len(banco.clientes) == len(banco.cuentas) == clientes
+
+    salida = io.StringIO()
+    inicio = time.perf_counter()
+    for entidad in (carga_masiva.CLIENTES, carga_masiva.CUENTAS):
+        carga_masiva.exportar(banco, entidad, salida, formato)
+        salida.seek(0)
+        salida.truncate()
+    resultado["exportacion_filas_por_s"] = _por_segundo(2 * clientes, inicio)
+    del banco
+
+    # Memoria con una muestra: tracemalloc hace todo varias veces más lento
+    gc.collect()
+    rutas = generar(directorio, muestra, formato)
+    banco = Banco()
+    tracemalloc.start()
+    for entidad in (carga_masiva.CLIENTES, carga_masiva.CUENTAS):
+        with open(rutas[entidad], newline="", encoding="utf-8") as entrada:
+            carga_masiva.importar(banco, entidad, lector(entrada))
+    retenido, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    resultado["retenido_bytes_por_cliente"] = round(retenido / muestra)
+    resultado["pico_extra_mb"] = round((pico - retenido) / 2**20, 1)
+    return resultado
+
+# La forma anterior: alta de a un cliente y una cuenta (agregar_cliente,
+# agregar_cuenta, como el menú) desde el mismo archivo ya parseado
+def de_a_uno(rutas, lector):
+    banco = Banco()
+    inicio = time.perf_counter()
+    with open(rutas[carga_masiva.CLIENTES], newline="", encoding="utf-8") as entrada:
+        for fila in lector(entrada):
+            banco.agregar_cliente(Cliente(int(fila["id"]), fila["nombre"], fila["credencial"]))
+    with open(rutas[carga_masiva.CUENTAS], newline="", encoding="utf-8") as entrada:
+        for fila in lector(entrada):
+            banco.agregar_cuenta(Cuenta(fila["numero"], int(fila["cliente_id"]), a_centavos(fila["saldo"])))
+    return _por_segundo(len(banco.clientes) + len(banco.cuentas), inicio)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importación y exportación masiva")
+    parser.add_argument("--clientes", type=int, default=1_000_000)
+    parser.add_argument("--muestra", type=int, default=200_000, help="clientes para medir memoria")
+    parser.add_argument("--formatos", default="csv,jsonl")
+    args = parser.parse_args(argv)
+    resultado = {"clientes": args.clientes}
+    with tempfile.TemporaryDirectory() as directorio:
+        for formato in args.formatos.split(","):
+            resultado[formato] = medir(args.clientes, formato, directorio, args.muestra)
+            print(formato, resultado[formato], file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dinero import CENTAVOS
+from Sistema_de_Cajero import Banco, Cliente, Cuenta, Dispensador, abrir_diario
+from servidor_sesiones import ServidorSesiones, Sesion
+
+# Rendimiento del servidor de sesiones con distinta cantidad de hilos y de
+# procesos. Cada proceso tiene su propio banco (una porción de las cuentas).
+# Al final de cada corrida se verifica que no se creó ni perdió dinero:
+# suma(saldos) - suma(efectivo en cajeros) + pagos no cambia.
+
+def crear_banco(clientes, cajeros, primer_id=1):
+    banco = Banco()
+    # Una sola credencial para todos: con el caché se verifica una vez
+    credencial = banco.autenticador.generar("1234")
+    for i in range(primer_id, primer_id + clientes):
+        banco.agregar_cliente(Cliente(i, f"Cliente {i}", credencial))
+        banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, 100_000 * CENTAVOS))
+    for i in range(1, cajeros + 1):
+        dispensador = Dispensador(i, f"Cajero {i}")
+        dispensador.billetes = {200: 5_000, 100: 5_000, 50: 5_000, 20: 5_000}
+        banco.agregar_dispensador(dispensador)
+    return banco
+
+def crear_sesiones(cantidad, clientes, cajeros, ops_por_sesion, primer_id=1, semilla=0):
+    azar = random.Random(semilla)
+    ultimo = primer_id + clientes - 1
+    sesiones = []
+    for _ in range(cantidad):
+        operaciones = []
+        for _ in range(ops_por_sesion):
+            r = azar.random()
+            if r < 0.35:
+                operaciones.append(("retiro", azar.choice((100, 200, 300, 500, 1000)) * CENTAVOS))
+            elif r < 0.55:
+                operaciones.append(("deposito", {100: azar.randint(1, 5), 20: azar.randint(0, 5)}))
+            elif r < 0.80:
+                operaciones.append(("transferencia", azar.randint(primer_id, ultimo),
+                                    azar.randint(1, 500 * CENTAVOS)))
+            elif r < 0.90:
+                operaciones.append(("pago", azar.choice(("Luz", "Agua", "Gas", "Internet")),
+                                    azar.randint(80 * CENTAVOS, 500 * CENTAVOS)))
+            else:
+                operaciones.append(("saldo",))
+        sesiones.append(Sesion(azar.randint(primer_id, ultimo), "1234", operaciones,
+                               cajero_id=azar.randint(1, cajeros)))
+    return sesiones
+
+def _balance(banco, pagos):
+    saldos = sum(cuenta.saldo for cuenta in banco.cuentas)
+    efectivo = sum(sum(k * v for k, v in d.billetes.items()) for d in banco.dispensadores) * CENTAVOS
+    return saldos - efectivo + pagos
+
+def correr(hilos, clientes, cajeros, sesiones, ops_por_sesion, primer_id=1, semilla=0, diario=False):
+    banco = crear_banco(clientes, cajeros, primer_id)
+    directorio = None
+    if diario:
+        directorio = tempfile.TemporaryDirectory()
+        abrir_diario(banco, os.path.join(directorio.name, "bench.diario"))
+    lote = crear_sesiones(sesiones, clientes, cajeros, ops_por_sesion, primer_id, semilla)
+    inicial = _balance(banco, 0)
+
+    with ServidorSesiones(banco, hilos) as servidor:
+        inicio = time.perf_counter()
+        resultados = servidor.atender_todas(lote)
+        duracion = time.perf_counter() - inicio
+
+    latencias = [l for r in resultados for l in r.latencias]
+    pagos = sum(op[2] for sesion, r in zip(lote, resultados)
+                for op, (_, ok, _) in zip(sesion.operaciones, r.resultados)
+                if op[0] == "pago" and ok)
+    if banco.diario is not None:
+        banco.diario.cerrar()
+        directorio.cleanup()
+    return {"operaciones": len(latencias), "segundos": duracion, "latencias": latencias,
+            "consistente": _balance(banco, pagos) == inicial}
+
+def _correr_en_proceso(argumentos):
+    resultado = correr(*argumentos)
+    resultado["latencias"] = sorted(resultado["latencias"])
+    return resultado
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+def resumen(operaciones, segundos, latencias, consistente):
+    latencias = sorted(latencias)
+    return {"ops_por_segundo": round(operaciones / segundos, 1),
+            "p50_us": round(_percentil(latencias, 0.50) * 1e6, 1),
+            "p99_us": round(_percentil(latencias, 0.99) * 1e6, 1),
+            "consistente": consistente}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rendimiento del servidor de sesiones")
+    parser.add_argument("--clientes", type=int, default=10_000)
+    parser.add_argument("--cajeros", type=int, default=16)
+    parser.add_argument("--sesiones", type=int, default=4_000)
+    parser.add_argument("--ops-por-sesion", type=int, default=10)
+    parser.add_argument("--hilos", default="1,2,4,8,16")
+    parser.add_argument("--procesos", default="1,2,4")
+    parser.add_argument("--diario", action="store_true",
+                        help="escribir cada movimiento al diario con fsync agrupado")
+    args = parser.parse_args(argv)
+
+    salida = {"hilos": {}, "procesos": {}}
+    for hilos in (int(h) for h in args.hilos.split(",")):
+        r = correr(hilos, args.clientes, args.cajeros, args.sesiones, args.ops_por_sesion,
+                   diario=args.diario)
+        salida["hilos"][hilos] = resumen(r["operaciones"], r["segundos"], r["latencias"], r["consistente"])
+        print(f"hilos={hilos:<3} {salida['hilos'][hilos]}", file=sys.stderr)
+
+    # Cada proceso atiende su porción de clientes y sesiones con 4 hilos
+    for procesos in (int(p) for p in args.procesos.split(",")):
+        por_proceso = args.clientes // procesos
+        trabajos = [(4, por_proceso, args.cajeros, args.sesiones // procesos, args.ops_por_sesion,
+                     1 + i * por_proceso, i, args.diario) for i in range(procesos)]
+        with Pool(procesos) as pool:
+            partes = pool.map(_correr_en_proceso, trabajos)
+        # Se cuenta solo el tiempo de atención, sin armar bancos ni arrancar procesos
+        duracion = max(parte["segundos"] for parte in partes)
+        latencias = [l for parte in partes for l in parte["latencias"]]
+        salida["procesos"][procesos] = resumen(
+            sum(parte["operaciones"] for parte in partes), duracion, latencias,
+            all(parte["consistente"] for parte in partes))
+        print(f"procesos={procesos:<3} {salida['procesos'][procesos]}", file=sys.stderr)
+
+    print(json.dumps(salida, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dinero
+from dinero import CENTAVOS
+from Sistema_de_Cajero import Banco, Cuenta
+
+# Aritmética masiva de saldos: la forma anterior (float por objeto Cuenta)
+# contra la columna de centavos int64 del banco (Banco.saldos). Mide el
+# total de conciliación, el cálculo de intereses y el de comisiones.
+
+TASA_PB = 125
+COMISION = 50 * CENTAVOS
+MINIMO = 1_000 * CENTAVOS
+
+class CuentaAnterior:
+    __slots__ = ('numero', 'cliente_id', 'saldo')
+
+    def __init__(self, numero, cliente_id, saldo):
+        self.numero = numero
+        self.cliente_id = cliente_id
+        self.saldo = saldo
+
+def _tiempo(funcion, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def medir(n, repeticiones):
+    azar = random.Random(n)
+    centavos = [azar.randint(0, 5_000_000) for _ in range(n)]
+    anteriores = [CuentaAnterior(f"001-{i:08d}", i, c / CENTAVOS) for i, c in enumerate(centavos)]
+    banco = Banco()
+    for i, c in enumerate(centavos):
+        banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, c))
+    saldos = banco.saldos
+
+    def total_float():
+        return sum(cuenta.saldo for cuenta in anteriores)
+
+    def intereses_float():
+        return [round(cuenta.saldo * TASA_PB / 10_000, 2) if cuenta.saldo > 0 else 0.0
+                for cuenta in anteriores]
+
+    def comisiones_float():
+        comision, minimo = COMISION / CENTAVOS, MINIMO / CENTAVOS
+        return [min(comision, max(cuenta.saldo, 0.0)) if cuenta.saldo < minimo else 0.0
+                for cuenta in anteriores]
+
+    resultados = {}
+    for nombre, anterior, columna in (
+            ("total", total_float, lambda: dinero.total(saldos)),
+            ("intereses", intereses_float, lambda: dinero.intereses(saldos, TASA_PB)),
+            ("comisiones", comisiones_float, lambda: dinero.comisiones(saldos, COMISION, MINIMO))):
+        t_anterior = _tiempo(anterior, repeticiones)
+        t_columna = _tiempo(columna, repeticiones)
+        resultados[nombre] = {"float_objetos_ms": round(t_anterior * 1e3, 2),
+                              "int64_columna_ms": round(t_columna * 1e3, 2),
+                              "aceleracion": round(t_anterior / t_columna, 2)}
+
+    # Exactitud: el total en float se aleja del exacto en centavos
+    resultados["total"]["diferencia_float"] = total_float() - dinero.total(saldos) / CENTAVOS
+    return resultados
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aritmética masiva de saldos: float vs int64")
+    parser.add_argument("-n", type=int, default=1_000_000, help="cantidad de cuentas")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+    resultados = medir(args.n, args.repeticiones)
+    for nombre, r in resultados.items():
+        print(f"{nombre:<12} {r}", file=sys.stderr)
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == "__main__":
+    main()
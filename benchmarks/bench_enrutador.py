@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import antifraude
+import enrutador
+from dinero import CENTAVOS
+from Sistema_de_Cajero import DENOMINACIONES, Banco, Dispensador, OperacionError, retirar, retirar_en_red
+
+# Elección del cajero para un retiro entre miles: microsegundos por
+# elección del enrutador, sin etiqueta y con etiqueta de zona, contra
+# recorrer todos los cajeros sumando sus billetes y quedarse con el de más
+# efectivo que puede entregar el monto; y desgaste: después de muchos
+# retiros enrutados, qué tan parejo quedó el efectivo entre cajeros y
+# cuántos quedaron sin poder entregar el retiro más chico, contra mandar
+# cada retiro al primer cajero que puede entregarlo.
+
+MONTOS = (20, 50, 100, 200, 300, 500, 700, 1000, 1500, 2000, 3000)
+
+def crear_banco(cajeros, zonas, semilla):
+    azar = random.Random(semilla)
+    banco = Banco()
+    banco.antifraude = antifraude.Antifraude(modo=antifraude.APAGADO)
+    cuentas = 1000
+    banco.agregar_cuentas([f"001-{i:08d}" for i in range(cuentas)], list(range(cuentas)),
+                          array('q', [10**9 * CENTAVOS]) * cuentas)
+    for i in range(1, cajeros + 1):
+        dispensador = Dispensador(i, f"Zona {i % zonas} / Sucursal {i}")
+        dispensador.billetes = {denom: azar.randrange(0, 200) for denom in DENOMINACIONES}
+        banco.agregar_dispensador(dispensador)
+    return banco
+
+# La forma sin enrutador: recorrer todos los cajeros
+def elegir_recorriendo(dispensadores, pesos, etiqueta=None):
+    mejor, maximo = None, -1
+    for dispensador in dispensadores:
+        if etiqueta is not None and etiqueta not in enrutador.etiquetas(dispensador.ubicacion):
+            continue
+        efectivo = sum(denom * cant for denom, cant in dispensador.billetes.items())
+        if efectivo >= pesos and efectivo > maximo and dispensador.puede_dispensar(pesos):
+            mejor, maximo = dispensador, efectivo
+    return mejor
+
+def _us(funcion, argumentos):
+    inicio = time.perf_counter()
+    for args in argumentos:
+        funcion(*args)
+    return round((time.perf_counter() - inicio) / len(argumentos) * 1e6, 2)
+
+def eleccion(cajeros, zonas, elecciones, semilla):
+    banco = crear_banco(cajeros, zonas, semilla)
+    azar = random.Random(semilla)
+    montos = [azar.choice(MONTOS) for _ in range(elecciones)]
+    etiquetas = [f"zona {azar.randrange(zonas)}" for _ in range(elecciones)]
+    elegir, todos = banco.enrutador.elegir, banco.dispensadores
+    resultado = {"enrutador_us": _us(elegir, [(m,) for m in montos]),
+                 "enrutador_etiqueta_us": _us(elegir, list(zip(montos, etiquetas)))}
+    # El recorrido es miles de veces más lento: una muestra alcanza
+    muestra = max(1, elecciones // 100)
+    resultado["recorrido_us"] = _us(lambda p: elegir_recorriendo(todos, p), [(m,) for m in montos[:muestra]])
+    resultado["recorrido_etiqueta_us"] = _us(
+        lambda p, e: elegir_recorriendo(todos, p, e), list(zip(montos, etiquetas))[:muestra])
+    for m, e in list(zip(montos, etiquetas))[:muestra]:
+        assert elegir(m, e) is elegir_recorriendo(todos, m, e)
+    return resultado
+
+def _desgaste(banco):
+    efectivos = [d.efectivo for d in banco.dispensadores]
+    return {"efectivo_desvio_relativo": round(statistics.pstdev(efectivos) / statistics.mean(efectivos), 3),
+            "cajeros_sin_efectivo_minimo": sum(not d.puede_dispensar(min(MONTOS)) for d in banco.dispensadores)}
+
+def desgaste(cajeros, zonas, retiros, semilla):
+    azar = random.Random(semilla)
+    montos = [azar.choice(MONTOS) for _ in range(retiros)]
+    resultado = {}
+
+    banco = crear_banco(cajeros, zonas, semilla)
+    cuentas, rechazos = banco.cuentas, 0
+    inicio = time.perf_counter()
+    for i, monto in enumerate(montos):
+        try:
+            retirar_en_red(banco, cuentas[i % len(cuentas)], monto * CENTAVOS)
+        except OperacionError:
+            rechazos += 1
+    resultado["enrutado"] = {"retiro_us": round((time.perf_counter() - inicio) / retiros * 1e6, 2),
+                             "rechazos": rechazos, **_desgaste(banco)}
+
+    banco = crear_banco(cajeros, zonas, semilla)
+    cuentas, rechazos = banco.cuentas, 0
+    for i, monto in enumerate(montos):
+        dispensador = next((d for d in banco.dispensadores if d.puede_dispensar(monto)), None)
+        if dispensador is None:
+            rechazos += 1
+            continue
+        retirar(banco, cuentas[i % len(cuentas)], dispensador, monto * CENTAVOS)
+    resultado["primero_que_puede"] = {"rechazos": rechazos, **_desgaste(banco)}
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrutamiento de retiros entre cajeros")
+    parser.add_argument("--cajeros", type=int, default=5000)
+    parser.add_argument("--zonas", type=int, default=20)
+    parser.add_argument("--elecciones", type=int, default=100_000)
+    parser.add_argument("--retiros", type=int, default=200_000)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args(argv)
+    resultado = {"cajeros": args.cajeros,
+                 "eleccion": eleccion(args.cajeros, args.zonas, args.elecciones, args.semilla)}
+    print(resultado, file=sys.stderr)
+    resultado["desgaste"] = desgaste(args.cajeros, args.zonas, args.retiros, args.semilla)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Sistema_de_Cajero
+from dinero import CENTAVOS
+from Sistema_de_Cajero import (SERVICIOS, Banco, Cliente, Dispensador, Movimiento, OperacionError,
+                               autenticar, calcular_desglose_billetes, depositar, pagar_servicio,
+                               retirar, transferir)
+
+# Carga sintética del flujo completo del cajero: un banco con N clientes
+# (una cuenta cada uno), M cajeros y K movimientos previos, y una mezcla de
+# ingresos, retiros, depósitos, transferencias, pagos y consultas de
+# historial y saldo. Por tipo de operación mide ops/s, latencias p50/p99 y
+# el pico de memoria (tracemalloc, en una pasada aparte para no pesar en los
+# tiempos). Incluye micro-benchmarks de calcular_desglose_billetes,
+# Banco.quicksort y Banco.busqueda_binaria.
+#
+# La salida es JSON; con --comparar se compara contra una corrida anterior
+# y el código de salida es 1 si alguna métrica empeoró más que --tolerancia.
+
+MEZCLA = "ingreso=5,retiro=30,deposito=15,transferencia=20,pago=10,movimientos=15,saldo=5"
+MONTOS_RETIRO = (100, 200, 300, 500, 1000, 1500)
+
+def crear_banco(clientes, cajeros, movimientos, semilla):
+    azar = random.Random(semilla)
+    banco = Banco()
+    # Una credencial para todos: los ingresos miden el camino con caché
+    credencial = banco.autenticador.generar("1234")
+    banco.agregar_clientes([Cliente(i, f"Cliente {i}", credencial) for i in range(1, clientes + 1)])
+    banco.agregar_cuentas([f"001-{i:08d}" for i in range(1, clientes + 1)],
+                          list(range(1, clientes + 1)),
+                          array('q', [100_000 * CENTAVOS]) * clientes)
+    for i in range(1, cajeros + 1):
+        dispensador = Dispensador(i, f"Cajero {i}")
+        dispensador.billetes = {200: 1_000_000, 100: 1_000_000, 50: 1_000_000, 20: 1_000_000}
+        banco.agregar_dispensador(dispensador)
+    # Historial previo: depósitos repartidos al azar
+    cuentas = banco.cuentas
+    for _ in range(movimientos):
+        cuenta = cuentas[azar.randrange(clientes)]
+        monto = azar.randint(1, 50) * 20 * CENTAVOS
+        cuenta.saldo += monto
+        cuenta.movimientos.append(Movimiento("DEPÓSITO", monto, cuenta.numero,
+                                             dispensador_id=1, billetes={20: monto // (20 * CENTAVOS)}))
+    return banco
+
+def leer_mezcla(texto):
+    pesos = {}
+    for par in texto.split(","):
+        nombre, _, peso = par.partition("=")
+        pesos[nombre.strip()] = float(peso)
+    desconocidas = set(pesos) - set(dict(p.split("=") for p in MEZCLA.split(",")))
+    if desconocidas:
+        raise SystemExit(f"Operaciones desconocidas en la mezcla: {', '.join(sorted(desconocidas))}")
+    return pesos
+
+def crear_operaciones(cantidad, mezcla, clientes, cajeros, semilla):
+    azar = random.Random(semilla)
+    tipos = azar.choices(list(mezcla), weights=list(mezcla.values()), k=cantidad)
+    servicios = [(nombre, minimo, maximo) for nombre, minimo, maximo in SERVICIOS.values()]
+    operaciones = []
+    for tipo in tipos:
+        cliente = azar.randint(1, clientes)
+        cajero = azar.randint(1, cajeros)
+        if tipo == "retiro":
+            datos = (azar.choice(MONTOS_RETIRO) * CENTAVOS,)
+        elif tipo == "deposito":
+            datos = ({100: azar.randint(1, 5), 20: azar.randint(0, 5)},)
+        elif tipo == "transferencia":
+            datos = (azar.randint(1, clientes), azar.randint(1, 500 * CENTAVOS))
+        elif tipo == "pago":
+            nombre, minimo, maximo = azar.choice(servicios)
+            datos = (nombre, azar.randint(minimo, maximo) * CENTAVOS)
+        else:
+            datos = ()
+        operaciones.append((tipo, cliente, cajero, datos))
+    return operaciones
+
+def ejecutar(banco, tipo, cliente, cajero, datos):
+    cuenta = banco.cuentas_por_cliente[cliente]
+    if tipo == "ingreso":
+        return autenticar(banco, cliente, "1234")
+    if tipo == "retiro":
+        return retirar(banco, cuenta, banco.dispensadores[cajero - 1], datos[0])
+    if tipo == "deposito":
+        return depositar(banco, cuenta, banco.dispensadores[cajero - 1], datos[0])
+    if tipo == "transferencia":
+        return transferir(banco, cuenta, *datos)
+    if tipo == "pago":
+        return pagar_servicio(cuenta, *datos)
+    if tipo == "movimientos":
+        return cuenta.consultar_movimientos(limite=20)
+    return cuenta.saldo
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def medir_flujo(banco, operaciones):
+    latencias = {}
+    rechazos = {}
+    inicio = time.perf_counter()
+    for tipo, cliente, cajero, datos in operaciones:
+        antes = time.perf_counter_ns()
+        try:
+            ejecutar(banco, tipo, cliente, cajero, datos)
+        except OperacionError:
+            rechazos[tipo] = rechazos.get(tipo, 0) + 1
+        latencias.setdefault(tipo, []).append(time.perf_counter_ns() - antes)
+    total = time.perf_counter() - inicio
+
+    por_tipo = {}
+    for tipo, valores in sorted(latencias.items()):
+        valores.sort()
+        por_tipo[tipo] = {"operaciones": len(valores),
+                          "ops_por_s": round(len(valores) / (sum(valores) / 1e9), 1),
+                          "p50_us": round(_percentil(valores, 0.50) / 1e3, 1),
+                          "p99_us": round(_percentil(valores, 0.99) / 1e3, 1),
+                          "rechazadas": rechazos.get(tipo, 0)}
+    return {"ops_por_s": round(len(operaciones) / total, 1), "segundos": round(total, 3)}, por_tipo
+
+# Pico de memoria de cada tipo, con tracemalloc, sobre una muestra de sus
+# operaciones; 'retenidos' es lo que queda asignado al terminar (historial)
+def medir_memoria(banco, operaciones, muestra):
+    por_tipo = {}
+    for tipo, cliente, cajero, datos in operaciones:
+        lista = por_tipo.setdefault(tipo, [])
+        if len(lista) < muestra:
+            lista.append((cliente, cajero, datos))
+    resultado = {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for tipo, lista in sorted(por_tipo.items()):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            for cliente, cajero, datos in lista:
+                try:
+                    ejecutar(banco, tipo, cliente, cajero, datos)
+                except OperacionError:
+                    pass
+            actual, pico = tracemalloc.get_traced_memory()
+            resultado[tipo] = {"pico_kb": round((pico - base) / 1024, 1),
+                               "retenidos_bytes_por_op": round((actual - base) / len(lista), 1)}
+    finally:
+        tracemalloc.stop()
+    return resultado
+
+def _mejor(funcion, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def medir_micro(banco, n_orden, llamadas, repeticiones, semilla):
+    azar = random.Random(semilla)
+    resultado = {}
+
+    dispensador = Dispensador(0, "Micro")
+    dispensador.billetes = {200: 40, 100: 40, 50: 40, 20: 40}
+    montos = [azar.randint(1, 300) * 10 for _ in range(llamadas)]
+    memo = Sistema_de_Cajero._desgloses_memo
+
+    def desglose():
+        for monto in montos:
+            calcular_desglose_billetes(monto, dispensador)
+
+    def desglose_sin_memo():
+        for monto in montos:
+            memo.clear()
+            calcular_desglose_billetes(monto, dispensador)
+
+    resultado["desglose_us"] = round(_mejor(desglose, repeticiones) / llamadas * 1e6, 2)
+    resultado["desglose_sin_memo_us"] = round(_mejor(desglose_sin_memo, repeticiones) / llamadas * 1e6, 2)
+
+    clientes = list(banco.indice_clientes.objetos[:n_orden])
+    azar.shuffle(clientes)
+    resultado["quicksort_ms"] = round(_mejor(lambda: banco.quicksort(clientes), repeticiones) * 1e3, 2)
+    resultado["quicksort_n"] = len(clientes)
+
+    ordenados = banco.indice_clientes.objetos
+    objetivos = [azar.randint(1, len(ordenados) + len(ordenados) // 10) for _ in range(llamadas)]
+
+    def busquedas():
+        for objetivo in objetivos:
+            banco.busqueda_binaria(ordenados, objetivo)
+
+    resultado["busqueda_binaria_us"] = round(_mejor(busquedas, repeticiones) / llamadas * 1e6, 2)
+    resultado["busqueda_binaria_n"] = len(ordenados)
+    return resultado
+
+def medir(args):
+    mezcla = leer_mezcla(args.mezcla)
+    inicio = time.perf_counter()
+    banco = crear_banco(args.clientes, args.cajeros, args.movimientos, args.semilla)
+    salida = {"parametros": {"clientes": args.clientes, "cajeros": args.cajeros,
+                             "movimientos": args.movimientos, "operaciones": args.operaciones,
+                             "mezcla": mezcla, "semilla": args.semilla},
+              "entorno": {"python": platform.python_version(), "plataforma": platform.platform()},
+              "crear_banco_s": round(time.perf_counter() - inicio, 3)}
+    operaciones = crear_operaciones(args.operaciones, mezcla, args.clientes, args.cajeros, args.semilla)
+    salida["total"], salida["operaciones"] = medir_flujo(banco, operaciones)
+    for tipo, memoria in medir_memoria(banco, operaciones, args.muestra_memoria).items():
+        salida["operaciones"][tipo].update(memoria)
+    salida["micro"] = medir_micro(banco, args.n_orden, args.llamadas, args.repeticiones, args.semilla)
+    return salida
+
+# Métricas comparables: (ruta, más alto es mejor)
+def _metricas(resultado):
+    metricas = {("total", "ops_por_s"): (resultado["total"]["ops_por_s"], True)}
+    for tipo, valores in resultado["operaciones"].items():
+        metricas[("operaciones", tipo, "ops_por_s")] = (valores["ops_por_s"], True)
+        metricas[("operaciones", tipo, "p99_us")] = (valores["p99_us"], False)
+        metricas[("operaciones", tipo, "pico_kb")] = (valores["pico_kb"], False)
+    for nombre, valor in resultado["micro"].items():
+        if not nombre.endswith("_n"):
+            metricas[("micro", nombre)] = (valor, False)
+    return metricas
+
+# Cambio relativo de cada métrica contra 'anterior'; positivo es peor
+def comparar(anterior, actual, tolerancia):
+    previas = _metricas(anterior)
+    cambios, regresiones = {}, []
+    for clave, (valor, mayor_mejor) in _metricas(actual).items():
+        if clave not in previas or not previas[clave][0]:
+            continue
+        relativo = (valor - previas[clave][0]) / previas[clave][0]
+        if mayor_mejor:
+            relativo = -relativo
+        nombre = ".".join(clave)
+        cambios[nombre] = round(relativo, 3)
+        if relativo > tolerancia:
+            regresiones.append(nombre)
+    return {"tolerancia": tolerancia, "cambios": cambios, "regresiones": regresiones}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga sintética del flujo completo del cajero")
+    parser.add_argument("--clientes", type=int, default=100_000)
+    parser.add_argument("--cajeros", type=int, default=50)
+    parser.add_argument("--movimientos", type=int, default=200_000, help="historial previo")
+    parser.add_argument("--operaciones", type=int, default=200_000)
+    parser.add_argument("--mezcla", default=MEZCLA, help="pesos por tipo de operación")
+    parser.add_argument("--muestra-memoria", type=int, default=2_000,
+                        help="operaciones por tipo en la pasada con tracemalloc")
+    parser.add_argument("--n-orden", type=int, default=10_000, help="elementos para quicksort")
+    parser.add_argument("--llamadas", type=int, default=10_000,
+                        help="llamadas por micro-benchmark de desglose y búsqueda")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("-o", "--salida", help="guardar el resultado en este archivo JSON")
+    parser.add_argument("--comparar", help="resultado JSON anterior contra el cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.15,
+                        help="empeoramiento relativo admitido antes de marcar una regresión")
+    args = parser.parse_args(argv)
+
+    resultado = medir(args)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            resultado["comparacion"] = comparar(json.load(archivo), resultado, args.tolerancia)
+    for tipo, valores in resultado["operaciones"].items():
+        print(f"{tipo:<14} {valores}", file=sys.stderr)
+    print(f"{'total':<14} {resultado['total']}", file=sys.stderr)
+    print(f"{'micro':<14} {resultado['micro']}", file=sys.stderr)
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+    print(texto)
+    if args.comparar and resultado["comparacion"]["regresiones"]:
+        print("Regresiones: " + ", ".join(resultado["comparacion"]["regresiones"]), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import procesador_lotes
+from dinero import CENTAVOS
+from Sistema_de_Cajero import SERVICIOS, Banco, Dispensador, abrir_diario
+
+# Throughput del procesador por lotes en un núcleo: N operaciones mezcladas
+# (retiros enrutados, depósitos, transferencias y pagos) sobre C cuentas y
+# M cajeros, leídas de JSONL o CSV en memoria y con la salida a memoria,
+# así se mide el procesador y no el disco. Da ops/s de la mezcla, de cada
+# tipo por separado, con diario (sin fsync por operación, como el lote) y
+# de la capa de lotes sola (lectura, despacho y salida con operaciones
+# vacías), que es el techo para el procesador con estas operaciones.
+
+MEZCLA = "retiro=30,deposito=20,transferencia=30,pago=20"
+MONTOS_RETIRO = (100, 200, 300, 500, 1000)
+OBJETIVO = 100_000
+
+def crear_banco(cuentas, cajeros):
+    banco = Banco()
+    banco.agregar_cuentas([f"001-{i:08d}" for i in range(cuentas)], list(range(cuentas)),
+                          array('q', [10**7 * CENTAVOS]) * cuentas)
+    for i in range(1, cajeros + 1):
+        dispensador = Dispensador(i, f"Sucursal {i}")
+        dispensador.billetes = {200: 10**6, 100: 10**6, 50: 10**6, 20: 10**6}
+        banco.agregar_dispensador(dispensador)
+    return banco
+
+def generar(operaciones, cuentas, mezcla, semilla):
+    azar = random.Random(semilla)
+    tipos, pesos = zip(*((tipo, int(peso)) for tipo, peso in
+                         (parte.split("=") for parte in mezcla.split(","))))
+    servicios = [nombre for nombre, _, _ in SERVICIOS.values()]
+    lista = []
+    for tipo in azar.choices(tipos, pesos, k=operaciones):
+        cuenta = f"001-{azar.randrange(cuentas):08d}"
+        if tipo == "retiro":
+            lista.append({"op": "retiro", "cuenta": cuenta, "monto": str(azar.choice(MONTOS_RETIRO))})
+        elif tipo == "deposito":
+            lista.append({"op": "deposito", "cuenta": cuenta,
+                          "billetes": f"100:{azar.randint(1, 5)}|50:{azar.randint(0, 3)}"})
+        elif tipo == "transferencia":
+            lista.append({"op": "transferencia", "cuenta": cuenta,
+                          "destino": f"001-{azar.randrange(cuentas):08d}",
+                          "monto": f"{azar.randint(100, 50_000) / 100:.2f}"})
+        else:
+            lista.append({"op": "pago", "cuenta": cuenta, "servicio": azar.choice(servicios),
+                          "monto": f"{azar.randint(10_000, 50_000) / 100:.2f}"})
+    return lista
+
+def a_jsonl(lista):
+    return "".join(json.dumps(operacion) + "\n" for operacion in lista)
+
+def a_csv(lista):
+    salida = io.StringIO()
+    salida.write(",".join(procesador_lotes.CAMPOS) + "\n")
+    for operacion in lista:
+        salida.write(",".join(operacion.get(campo, "") for campo in procesador_lotes.CAMPOS) + "\n")
+    return salida.getvalue()
+
+def _por_s(banco, texto, formato, operaciones):
+    inicio = time.perf_counter()
+    aplicadas, rechazadas = procesador_lotes.procesar_archivo(banco, io.StringIO(texto), io.StringIO(),
+                                                              formato)
+    return {"ops_por_s": round(operaciones / (time.perf_counter() - inicio)),
+            "aplicadas": aplicadas, "rechazadas": rechazadas}
+
+# La capa de lotes sin el costo de las operaciones: cada una devuelve ""
+def capa_lotes(banco, texto, operaciones):
+    procesador = procesador_lotes.ProcesadorLotes(banco)
+    for tipo in procesador._operaciones:
+        procesador._operaciones[tipo] = lambda cuenta, operacion: ""
+    inicio = time.perf_counter()
+    procesador.procesar(procesador_lotes.leer_jsonl(io.StringIO(texto)), io.StringIO())
+    return round(operaciones / (time.perf_counter() - inicio))
+
+def medir(operaciones, cuentas, cajeros, mezcla, semilla, directorio):
+    lista = generar(operaciones, cuentas, mezcla, semilla)
+    texto = a_jsonl(lista)
+    resultado = {"operaciones": operaciones, "cuentas": cuentas, "cajeros": cajeros, "mezcla": mezcla,
+                 "objetivo_por_s": OBJETIVO}
+    resultado["jsonl"] = _por_s(crear_banco(cuentas, cajeros), texto, "jsonl", operaciones)
+    resultado["csv"] = _por_s(crear_banco(cuentas, cajeros), a_csv(lista), "csv", operaciones)
+
+    banco = crear_banco(cuentas, cajeros)
+    abrir_diario(banco, os.path.join(directorio, "lotes.diario"))
+    resultado["jsonl_con_diario"] = _por_s(banco, texto, "jsonl", operaciones)
+    banco.diario.cerrar()
+
+    resultado["por_tipo"] = {}
+    for tipo in ("retiro", "deposito", "transferencia", "pago"):
+        de_tipo = generar(operaciones // 4, cuentas, f"{tipo}=1", semilla)
+        resultado["por_tipo"][tipo] = _por_s(crear_banco(cuentas, cajeros), a_jsonl(de_tipo), "jsonl",
+                                             len(de_tipo))["ops_por_s"]
+    resultado["capa_lotes_por_s"] = capa_lotes(crear_banco(cuentas, cajeros), texto, operaciones)
+    resultado["alcanza_objetivo"] = resultado["jsonl"]["ops_por_s"] >= OBJETIVO
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput del procesador por lotes")
+    parser.add_argument("--operaciones", type=int, default=200_000)
+    parser.add_argument("--cuentas", type=int, default=10_000)
+    parser.add_argument("--cajeros", type=int, default=20)
+    parser.add_argument("--mezcla", default=MEZCLA, help="pesos por tipo, p. ej. " + MEZCLA)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = medir(args.operaciones, args.cuentas, args.cajeros, args.mezcla, args.semilla,
+                          directorio)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sistema_de_Cajero import Cliente, Cuenta, Movimiento
+
+# Memoria por registro antes y después de la representación compacta.
+# Las clases "Anterior*" reproducen las definiciones originales con __dict__
+# y lista de objetos Movimiento por cuenta.
+
+class ClienteAnterior:
+    def __init__(self, id, nombre, password):
+        self.id = id
+        self.nombre = nombre
+        self.password = password
+
+class CuentaAnterior:
+    def __init__(self, numero, cliente_id, saldo=0):
+        self.numero = numero
+        self.cliente_id = cliente_id
+        self.saldo = saldo
+        self.movimientos = []
+
+class MovimientoAnterior:
+    def __init__(self, tipo, monto, cuenta_numero, cuenta_destino=None, servicio=None):
+        self.fecha = datetime.datetime.now()
+        self.tipo = tipo
+        self.monto = monto
+        self.cuenta_numero = cuenta_numero
+        self.cuenta_destino = cuenta_destino
+        self.servicio = servicio
+
+def medir(construir):
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objetos = construir()
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objetos
+    return despues - antes
+
+# Las cuentas actuales guardan el saldo en la columna del banco
+# (Banco.saldos); se mide cada una ya ubicada en su fila
+def cuenta_en_columna():
+    saldos = array('q')
+    def nueva(numero, cliente_id, saldo):
+        saldos.append(saldo)
+        return Cuenta.en_columna(numero, cliente_id, saldos, len(saldos) - 1)
+    return nueva
+
+def clientes(clase, n):
+    return lambda: [clase(i, f"Cliente {i}", "1234") for i in range(n)]
+
+def cuentas(clase, n):
+    return lambda: [clase(f"001-{i:06d}", i, 1000) for i in range(n)]
+
+# n movimientos repartidos en cuentas de 'por_cuenta' movimientos cada una
+def movimientos(clase_cuenta, clase_movimiento, n, por_cuenta):
+    def construir():
+        lista = []
+        for i in range(n // por_cuenta):
+            cuenta = clase_cuenta(f"002-{i:06d}", i, 1000)
+            for j in range(por_cuenta):
+                if j % 3 == 0:
+                    mov = clase_movimiento("TRANSFERENCIA", -150, cuenta.numero, "001-000001")
+                elif j % 3 == 1:
+                    mov = clase_movimiento("PAGO_SERVICIO", -200, cuenta.numero, servicio="Luz")
+                else:
+                    mov = clase_movimiento("RETIRO", -100, cuenta.numero)
+                cuenta.movimientos.append(mov)
+            lista.append(cuenta)
+        return lista
+    return construir
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bytes por registro antes y después")
+    parser.add_argument("-n", type=int, default=200_000, help="registros por medición")
+    parser.add_argument("--por-cuenta", type=int, default=100, help="movimientos por cuenta")
+    args = parser.parse_args(argv)
+
+    n = args.n
+    # La memoria de las cuentas se descuenta para quedarse con la de los movimientos
+    base_anterior = medir(cuentas(CuentaAnterior, n // args.por_cuenta))
+    base_actual = medir(cuentas(cuenta_en_columna(), n // args.por_cuenta))
+    resultados = {
+        "cliente": (medir(clientes(ClienteAnterior, n)) / n, medir(clientes(Cliente, n)) / n),
+        "cuenta": (medir(cuentas(CuentaAnterior, n)) / n, medir(cuentas(cuenta_en_columna(), n)) / n),
+        "movimiento": (
+            (medir(movimientos(CuentaAnterior, MovimientoAnterior, n, args.por_cuenta)) - base_anterior) / n,
+            (medir(movimientos(cuenta_en_columna(), Movimiento, n, args.por_cuenta)) - base_actual) / n,
+        ),
+    }
+
+    print(f"{'Registro':<12} {'Antes (B)':>12} {'Después (B)':>12} {'Reducción':>10}")
+    for nombre, (antes, despues) in resultados.items():
+        print(f"{nombre:<12} {antes:>12.1f} {despues:>12.1f} {antes / despues:>9.1f}x")
+    print(json.dumps({nombre: {"antes": round(antes, 1), "despues": round(despues, 1)}
+                      for nombre, (antes, despues) in resultados.items()}))
+
+if __name__ == "__main__":
+    main()
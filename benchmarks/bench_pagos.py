@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pagos
+from dinero import CENTAVOS, a_centavos
+from Sistema_de_Cajero import SERVICIOS, Banco, OperacionError, abrir_diario, pagar_servicio
+
+# Liquidación de N facturas repartidas entre C cuentas, con un porcentaje de
+# reintentos (claves repetidas). Compara el pago de a una factura
+# (pagar_servicio) con el procesador por lotes en un proceso y repartido
+# por cuenta entre P procesos, y verifica que reprocesar el mismo archivo
+# no cobre nada de nuevo, también con diarios y otra cantidad de procesos.
+# Con diario, el pago de a una espera un fsync por factura y el lote uno por
+# lote.
+
+def crear_banco(cuentas):
+    numeros = [f"001-{i:08d}" for i in range(cuentas)]
+    banco = Banco()
+    banco.agregar_cuentas(numeros, list(range(len(numeros))), array('q', [50_000 * CENTAVOS]) * len(numeros))
+    return banco
+
+def generar(facturas, cuentas, reintentos, semilla):
+    azar = random.Random(semilla)
+    servicios = [(nombre, minimo, maximo) for nombre, minimo, maximo in SERVICIOS.values()]
+    lista = []
+    for i in range(facturas):
+        if lista and azar.random() < reintentos:
+            lista.append(dict(azar.choice(lista)))
+            continue
+        nombre, minimo, maximo = azar.choice(servicios)
+        lista.append({"clave": f"F-{i}", "cuenta": f"001-{azar.randrange(cuentas):08d}",
+                      "servicio": nombre, "monto": f"{azar.randint(minimo * 100, maximo * 100) / 100:.2f}"})
+    return lista
+
+def de_a_una(banco, facturas):
+    inicio = time.perf_counter()
+    for factura in facturas:
+        try:
+            pagar_servicio(banco.cuentas_por_numero[factura["cuenta"]], factura["servicio"],
+                           a_centavos(factura["monto"]))
+        except OperacionError:
+            pass
+    return round(len(facturas) / (time.perf_counter() - inicio))
+
+def medir(facturas, cuentas, reintentos, procesos, muestra, muestra_diario, lote, directorio):
+    lista = generar(facturas, cuentas, reintentos, cuentas)
+    resultado = {"facturas": facturas, "cuentas": cuentas}
+
+    # De a una, sin idempotencia: la forma anterior
+    resultado["de_a_una_por_s"] = de_a_una(crear_banco(cuentas), lista[:muestra])
+
+    # Con diario: un fsync por factura contra uno por lote
+    banco = crear_banco(cuentas)
+    abrir_diario(banco, os.path.join(directorio, "diario-de-a-una"))
+    resultado["diario_de_a_una_por_s"] = de_a_una(banco, lista[:muestra_diario])
+    banco.diario.cerrar()
+    banco = crear_banco(cuentas)
+    abrir_diario(banco, os.path.join(directorio, "diario-lotes"))
+    procesador = pagos.ProcesadorPagos(banco)
+    inicio = time.perf_counter()
+    for _ in procesador.procesar(lista[:muestra], lote):
+        pass
+    resultado["diario_lotes_por_s"] = round(min(muestra, facturas) / (time.perf_counter() - inicio))
+    banco.diario.cerrar()
+
+    banco = crear_banco(cuentas)
+    inicial = banco.total_saldos()
+    procesador = pagos.ProcesadorPagos(banco)
+    inicio = time.perf_counter()
+    for _ in procesador.procesar(lista, lote):
+        pass
+    resultado["lotes_por_s"] = round(facturas / (time.perf_counter() - inicio))
+    resultado["resumen"] = procesador.resumen()
+    cobrado = inicial - banco.total_saldos()
+
+    # Reintento del archivo completo: todo debe salir duplicado
+    estados = {}
+    for _, _, estado, _, _ in procesador.procesar(lista, lote):
+        estados[estado] = estados.get(estado, 0) + 1
+    resultado["consistente"] = (cobrado == procesador.monto_aplicado
+                                and banco.total_saldos() == inicial - cobrado
+                                and estados.get(pagos.APLICADO, 0) == 0)
+    del banco, procesador
+
+    for cantidad in procesos:
+        ruta = os.path.join(directorio, f"procesos-{cantidad}")
+        os.makedirs(ruta)
+        resumenes = {}
+        inicio = time.perf_counter()
+        for _ in pagos.procesar_en_procesos(lista, cantidad, partial(crear_banco, cuentas),
+                                            ruta, lote, resumenes):
+            pass
+        aplicados = sum(r["aplicados"] for r in resumenes.values())
+        resultado[f"procesos_{cantidad}"] = {
+            "facturas_por_s": round(facturas / (time.perf_counter() - inicio)),
+            "aplicados": aplicados,
+            "consistente": aplicados == resultado["resumen"]["aplicados"]}
+
+    # Con diarios, la muestra con la primera cantidad de procesos y después
+    # con una más: el segundo pase no cobra nada
+    ruta = os.path.join(directorio, "reproceso")
+    os.makedirs(ruta)
+    aplicados = []
+    for cantidad in (procesos[0], procesos[0] + 1):
+        resumenes = {}
+        for _ in pagos.procesar_en_procesos(lista[:muestra], cantidad, partial(crear_banco, cuentas),
+                                            ruta, lote, resumenes, os.path.join(ruta, "pagos.diario")):
+            pass
+        aplicados.append(sum(r["aplicados"] for r in resumenes.values()))
+    resultado["reproceso_con_diario"] = {"aplicados": aplicados, "consistente": aplicados[1] == 0}
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Liquidación de facturas por lotes")
+    parser.add_argument("--facturas", type=int, default=1_000_000)
+    parser.add_argument("--cuentas", type=int, default=100_000)
+    parser.add_argument("--reintentos", type=float, default=0.02, help="fracción de claves repetidas")
+    parser.add_argument("--procesos", default="1,2,4")
+    parser.add_argument("--muestra", type=int, default=200_000, help="facturas para el pago de a una")
+    parser.add_argument("--muestra-diario", type=int, default=2_000,
+                        help="facturas para el pago de a una con diario")
+    parser.add_argument("--lote", type=int, default=pagos.LOTE)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = medir(args.facturas, args.cuentas, args.reintentos,
+                          [int(p) for p in args.procesos.split(",")], args.muestra, args.muestra_diario, args.lote,
+                          directorio)
+    print(resultado, file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
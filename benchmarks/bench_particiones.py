@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_concurrencia import crear_sesiones
+from dinero import CENTAVOS
+from particiones import BancoParticionado, particion_cliente
+from Sistema_de_Cajero import Banco, Cliente, Cuenta, Dispensador
+
+# Escalado del banco particionado: las mismas sesiones (con transferencias
+# a clientes de cualquier partición) atendidas por 1, 2, 4... procesos. Por
+# corrida mide sesiones y operaciones por segundo, la aceleración contra
+# una partición y qué fracción de las transferencias cruzó particiones, y
+# verifica que no se creó ni perdió dinero: saldos finales = iniciales +
+# depósitos - retiros - pagos. Con --durable cada partición escribe su
+# diario y su registro de transferencias en un directorio temporal.
+#
+# La aceleración no puede pasar de min(particiones, CPUs) ("techo"). Con
+# menos CPUs que particiones los procesos se turnan en los mismos núcleos
+# y la corrida mide lo que cuesta el camino particionado: las dos fases de
+# cada transferencia cruzada, el ida y vuelta por las tuberías y el frente.
+# Con una sola CPU (50.000 sesiones, lotes de 5.000) dio 0,79 con dos
+# particiones y 0,84 con cuatro.
+
+CALENTAMIENTO = 200
+
+def crear_particion(particion, particiones, clientes, cajeros):
+    banco = Banco()
+    # Una sola credencial para todos: con el caché se verifica una vez
+    credencial = banco.autenticador.generar("1234")
+    for i in range(1, clientes + 1):
+        if particion_cliente(i, particiones) == particion:
+            banco.agregar_cliente(Cliente(i, f"Cliente {i}", credencial))
+            banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, 100_000 * CENTAVOS))
+    # Cada partición con sus cajeros
+    for i in range(1, cajeros + 1):
+        dispensador = Dispensador(i, f"Cajero {i}")
+        dispensador.billetes = {200: 50_000, 100: 50_000, 50: 50_000, 20: 50_000}
+        banco.agregar_dispensador(dispensador)
+    return banco
+
+# Dinero que entró o salió del banco según los resultados
+def _movido(sesiones, resultados):
+    neto = 0
+    for sesion, resultado in zip(sesiones, resultados):
+        for operacion, (tipo, ok, detalle) in zip(sesion.operaciones, resultado.resultados):
+            if not ok:
+                continue
+            if tipo == "deposito":
+                neto += detalle
+            elif tipo == "retiro":
+                neto -= sum(denom * cant for denom, cant in detalle.items()) * CENTAVOS
+            elif tipo == "pago":
+                neto -= operacion[2]
+    return neto
+
+def _cruzadas(sesiones, resultados, particiones):
+    total = cruzadas = 0
+    for sesion, resultado in zip(sesiones, resultados):
+        origen = particion_cliente(sesion.cliente_id, particiones)
+        for operacion, (tipo, ok, _) in zip(sesion.operaciones, resultado.resultados):
+            if tipo == "transferencia" and ok:
+                total += 1
+                cruzadas += particion_cliente(operacion[1], particiones) != origen
+    return cruzadas / total if total else 0.0
+
+def medir(particiones, sesiones, clientes, cajeros, lote, durable):
+    fabrica = partial(crear_particion, clientes=clientes, cajeros=cajeros)
+    with tempfile.TemporaryDirectory() as directorio:
+        with BancoParticionado(particiones, fabrica, directorio if durable else None) as banco:
+            # Primer ingreso en cada partición: el hash que después queda en caché
+            banco.atender_todas(sesiones[:CALENTAMIENTO])
+            inicial = banco.total_saldos()
+            resto = sesiones[CALENTAMIENTO:]
+            resultados = []
+            inicio, cpu = time.perf_counter(), time.process_time()
+            for i in range(0, len(resto), lote):
+                resultados.extend(banco.atender_todas(resto[i:i + lote]))
+            segundos = time.perf_counter() - inicio
+            cpu = time.process_time() - cpu
+            final = banco.total_saldos()
+    operaciones = sum(len(sesion.operaciones) for sesion in resto)
+    return {"sesiones_por_s": round(len(resto) / segundos),
+            "ops_por_s": round(operaciones / segundos),
+            # CPU del frente por segundo de corrida: el techo del escalado
+            # es cerca de 1 / frente_cpu particiones
+            "frente_cpu": round(cpu / segundos, 3),
+            "transferencias_cruzadas": round(_cruzadas(resto, resultados, particiones), 3),
+            "consistente": final == inicial + _movido(resto, resultados)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Escalado del banco particionado en procesos")
+    parser.add_argument("--particiones", default="1,2,4")
+    parser.add_argument("--sesiones", type=int, default=50_000)
+    parser.add_argument("--clientes", type=int, default=20_000)
+    parser.add_argument("--cajeros", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=5, help="operaciones por sesión")
+    parser.add_argument("--lote", type=int, default=2_000, help="sesiones por envío a las particiones")
+    parser.add_argument("--durable", action="store_true", help="diario y registros en disco")
+    args = parser.parse_args(argv)
+    sesiones = crear_sesiones(args.sesiones, args.clientes, args.cajeros, args.ops)
+    resultado = {"cpus": os.cpu_count(), "sesiones": args.sesiones, "durable": args.durable}
+    base = None
+    for particiones in (int(p) for p in args.particiones.split(",")):
+        corrida = medir(particiones, sesiones, args.clientes, args.cajeros, args.lote, args.durable)
+        base = base or corrida["sesiones_por_s"]
+        corrida["aceleracion"] = round(corrida["sesiones_por_s"] / base, 2)
+        corrida["eficiencia"] = round(corrida["aceleracion"] / particiones, 2)
+        corrida["techo"] = min(particiones, os.cpu_count() or 1)
+        resultado[f"particiones_{particiones}"] = corrida
+        print(particiones, corrida, file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import diario
+import planificador
+import reportes
+
+# Plan de reposición sobre un diario sintético: N cajeros, D días de
+# historia y R retiros (y un depósito cada 10 retiros) por cajero y día.
+# Mide la agrupación del diario en consumo diario (NumPy y registro por
+# registro) y el plan de todos los cajeros.
+
+def generar(ruta, cajeros, dias, por_dia, semilla):
+    azar = np.random.default_rng(semilla)
+    total = cajeros * dias * por_dia
+    registros = np.zeros(total, dtype=reportes._dtype_registro())
+    registros['seq'] = np.arange(total)
+    inicio = (planificador.hoy() - dias) * planificador.DIA_US - planificador._DESFASE_US
+    registros['fecha'] = inicio + np.sort(azar.integers(0, dias * planificador.DIA_US, total))
+    depositos = azar.random(total) < 1 / 11
+    registros['tipo'] = np.where(depositos, diario.TIPOS.index("DEPÓSITO") + 1,
+                                 diario.TIPOS.index("RETIRO") + 1)
+    registros['dispensador'] = azar.integers(1, cajeros + 1, total)
+    registros['billetes'] = azar.integers(0, 4, (total, len(diario.DENOMINACIONES)))
+    montos = registros['billetes'] @ np.array(diario.DENOMINACIONES) * 100
+    registros['monto'] = np.where(depositos, montos, -montos)
+    registros['cuenta'] = b"001-00000001"
+    with open(ruta, "wb") as archivo:
+        archivo.write(diario.CABECERA.pack(diario.MAGICO, diario.VERSION, diario.REGISTRO.size))
+        registros.tofile(archivo)
+    return total
+
+def medir(cajeros, dias, por_dia, muestra, directorio):
+    ruta = os.path.join(directorio, "bench.diario")
+    total = generar(ruta, cajeros, dias, por_dia, cajeros)
+    resultado = {"registros": total, "diario_mb": round(os.path.getsize(ruta) / 2**20, 1)}
+    inventarios = {i: {denom: 2_000 for denom in diario.DENOMINACIONES} for i in range(1, cajeros + 1)}
+
+    inicio = time.perf_counter()
+    plan_numpy = planificador.Planificador()
+    plan_numpy.actualizar_desde_diario(ruta)
+    resultado["agrupar_numpy_s"] = round(time.perf_counter() - inicio, 3)
+    inicio = time.perf_counter()
+    plan = plan_numpy.planificar(inventarios)
+    resultado["planificar_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["urgentes"] = sum(fila["urgente"] for fila in plan)
+
+    # Registro por registro (sin NumPy), sobre una muestra
+    inicio = time.perf_counter()
+    por_registro = planificador._consumo_diario_registros(ruta, 0, muestra)
+    segundos = time.perf_counter() - inicio
+    resultado["registros_por_s_sin_numpy"] = round(min(muestra, total) / segundos)
+    resultado["consistente"] = por_registro == planificador._consumo_diario_numpy(ruta, 0, muestra)
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan de reposición de efectivo")
+    parser.add_argument("--cajeros", type=int, default=2_000)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--por-dia", type=int, default=50, help="movimientos por cajero y día")
+    parser.add_argument("--muestra", type=int, default=1_000_000,
+                        help="registros para medir el recorrido sin NumPy")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = medir(args.cajeros, args.dias, args.por_dia, args.muestra, directorio)
+    print(resultado, file=sys.stderr)
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import diario
+import reportes
+
+# Conciliación de fin de día sobre un diario sintético de N registros
+# repartidos entre M cuentas. El diario se genera con NumPy (sin CRC: los
+# reportes no lo validan) y los saldos finales se calculan aparte, así que
+# la conciliación debe dar cero descuadres.
+
+def generar(ruta, cuentas, movimientos, semilla):
+    azar = np.random.default_rng(semilla)
+    numeros = np.array([f"001-{i:08d}".encode() for i in range(cuentas)], dtype='S24')
+    iniciales = azar.integers(0, 10_000_000, cuentas, dtype=np.int64)
+    registros = np.zeros(movimientos, dtype=reportes._dtype_registro())
+    registros['seq'] = np.arange(movimientos)
+    inicio = int(time.time() * 1_000_000) - 86_400 * 1_000_000
+    registros['fecha'] = inicio + np.sort(azar.integers(0, 86_400 * 1_000_000, movimientos))
+    registros['tipo'] = azar.integers(1, len(diario.TIPOS) + 1, movimientos)
+    pagos = registros['tipo'] == diario.TIPOS.index("PAGO_SERVICIO") + 1
+    registros['servicio'][pagos] = azar.integers(1, len(diario.SERVICIOS) + 1, int(pagos.sum()))
+    registros['monto'] = azar.integers(-50_000, 50_000, movimientos)
+    registros['dispensador'] = diario.SIN_DISPENSADOR
+    efectivo = registros['tipo'] <= diario.TIPOS.index("DEPÓSITO") + 1  # retiros y depósitos
+    registros['dispensador'][efectivo] = azar.integers(1, 1_000, int(efectivo.sum()))
+    filas = azar.integers(0, cuentas, movimientos)
+    registros['cuenta'] = numeros[filas]
+    with open(ruta, "wb") as archivo:
+        archivo.write(diario.CABECERA.pack(diario.MAGICO, diario.VERSION, diario.REGISTRO.size))
+        registros.tofile(archivo)
+    finales = iniciales.copy()
+    np.add.at(finales, filas, registros['monto'])
+    # Orden distinto al de la tabla inicial, como las altas de un banco real
+    orden = azar.permutation(cuentas)
+    return (numeros, iniciales), (numeros[orden], finales[orden])
+
+def medir(cuentas, movimientos, directorio):
+    ruta = os.path.join(directorio, "bench.diario")
+    inicio = time.perf_counter()
+    iniciales, finales = generar(ruta, cuentas, movimientos, cuentas)
+    resultado = {"generar_s": round(time.perf_counter() - inicio, 3),
+                 "diario_mb": round(os.path.getsize(ruta) / 2**20, 1)}
+
+    inicio = time.perf_counter()
+    movs = reportes.leer_diario(ruta)
+    por_tipo = reportes.totales_por_tipo(movs)
+    reportes.totales_por_servicio(movs)
+    resultado["totales_s"] = round(time.perf_counter() - inicio, 3)
+
+    inicio = time.perf_counter()
+    conciliacion = reportes.conciliar(finales, movs, iniciales)
+    resultado["conciliar_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["movimientos_por_s"] = round(movimientos / (resultado["totales_s"] + resultado["conciliar_s"]))
+    resultado["consistente"] = (conciliacion["diferencia"] == 0
+                                and conciliacion["cuentas_descuadradas"] == 0
+                                and sum(t["movimientos"] for t in por_tipo) == movimientos)
+    return resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conciliación de fin de día con NumPy")
+    parser.add_argument("--cuentas", type=int, default=1_000_000)
+    parser.add_argument("--movimientos", default="1000000,10000000")
+    args = parser.parse_args(argv)
+
+    salida = {}
+    for movimientos in (int(m) for m in args.movimientos.split(",")):
+        with tempfile.TemporaryDirectory() as directorio:
+            salida[movimientos] = medir(args.cuentas, movimientos, directorio)
+        print(f"movimientos={movimientos:<9} {salida[movimientos]}", file=sys.stderr)
+    print(json.dumps(salida, indent=2))
+
+if __name__ == "__main__":
+    main()
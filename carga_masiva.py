@@ -0,0 +1,419 @@
+import argparse
+import csv
+import gc
+import itertools
+import os
+import re
+import sys
+import time
+from array import array
+from json.encoder import encode_basestring
+from operator import itemgetter
+
+from credenciales import CredencialError, exigir_hash
+from diario import MAX_CUENTA
+from dinero import CENTAVOS, MontoError, a_centavos, formatear
+from procesador_lotes import leer_csv, leer_jsonl
+from Sistema_de_Cajero import (DENOMINACIONES, Cliente, Dispensador, OperacionError, abrir_diario,
+                               buscar_dispensador, cargar_instantanea, crear_banco_ejemplo,
+                               guardar_instantanea)
+
+# Importación y exportación masiva de clientes, cuentas y dispensadores en
+# CSV o JSONL. La entrada se lee como flujo y se valida de a LOTE filas
+# contra los índices del banco (clientes_por_id, cuentas_por_numero) y
+# contra las filas anteriores del mismo archivo; lo válido se acumula ya
+# con la forma que usan las altas masivas del banco (Cliente, columnas de
+# cuentas), no como filas leídas, así la memoria extra es la de los datos
+# nuevos. Un archivo es un solo lote: si alguna fila es inválida no se
+# agrega nada y el error lista las primeras. Sin errores, clientes y
+# cuentas se agregan de una vez con el bloqueo del banco y quedan en las
+# altas del próximo punto de control.
+#
+# Campos (encabezado en CSV, claves en JSONL):
+#   clientes       id, nombre, credencial (hash de credenciales.py; una
+#                  contraseña en claro se rechaza: hashearla acá costaría
+#                  decenas de milisegundos por fila)
+#   cuentas        numero (hasta MAX_CUENTA bytes en UTF-8, ver diario.py),
+#                  cliente_id (un cliente ya existente), saldo (pesos con
+#                  hasta dos decimales, por omisión 0)
+#   dispensadores  id, ubicacion, billetes ("200:10|50:4" en CSV,
+#                  {"200": 10, "50": 4} en JSONL; lo que falta queda en 0).
+#                  Un id que ya existe no es un error: su inventario se
+#                  reemplaza y, si viene, también su ubicación.
+#
+# La exportación escribe los mismos campos, en orden de id/número, así un
+# archivo exportado se puede volver a importar en otro banco.
+
+CLIENTES = "clientes"
+CUENTAS = "cuentas"
+DISPENSADORES = "dispensadores"
+ENTIDADES = (CLIENTES, CUENTAS, DISPENSADORES)
+CAMPOS = {CLIENTES: ("id", "nombre", "credencial"),
+          CUENTAS: ("numero", "cliente_id", "saldo"),
+          DISPENSADORES: ("id", "ubicacion", "billetes")}
+LOTE = 100_000
+# Errores que se conservan para el mensaje; el resto solo se cuenta
+MAX_ERRORES = 20
+
+class ImportacionError(ValueError):
+    def __init__(self, entidad, errores, cantidad):
+        detalle = "; ".join(f"fila {fila}: {mensaje}" for fila, mensaje in errores)
+        super().__init__(f"{cantidad} filas inválidas en {entidad}, no se importó nada ({detalle})")
+        self.errores = errores
+        self.cantidad = cantidad
+
+def _entero(fila, campo):
+    valor = fila.get(campo)
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise OperacionError(f"{campo} inválido: {valor!r}")
+    try:
+        return int(valor)
+    except ValueError:
+        raise OperacionError(f"{campo} inválido: {valor!r}") from None
+
+# Los textos van a las instantáneas, que los separan con NUL
+def _texto(fila, campo, obligatorio=True):
+    valor = fila.get(campo)
+    valor = "" if valor is None else str(valor).strip()
+    if obligatorio and not valor:
+        raise OperacionError(f"Falta {campo}")
+    if "\0" in valor:
+        raise OperacionError(f"{campo} no puede contener el carácter NUL")
+    return valor
+
+def _billetes(fila):
+    valor = fila.get("billetes") or ""
+    try:
+        if isinstance(valor, dict):
+            pares = valor.items()
+        else:
+            pares = (par.split(":") for par in str(valor).split("|") if par.strip())
+        billetes = {int(denom): int(cant) for denom, cant in pares}
+    except (TypeError, ValueError):
+        raise OperacionError(f"billetes inválido: {valor!r}") from None
+    for denom, cant in billetes.items():
+        if denom not in DENOMINACIONES:
+            raise OperacionError(f"Denominación no soportada: {denom}")
+        if cant < 0:
+            raise OperacionError(f"Cantidad negativa de billetes de ${denom}")
+    return {denom: billetes.get(denom, 0) for denom in DENOMINACIONES}
+
+# Montos del camino rápido: pesos sin signo con hasta dos decimales y 13
+# cifras enteras. Con ese tope el error de pasar por float queda muy por
+# debajo de medio centavo y round(float(texto) * 100) es exacto.
+_MONTO = re.compile(r"\d{1,13}(?:\.\d{1,2})?")
+
+def _columna_enteros(valores):
+    # int() también acepta float, Decimal y bool: solo texto o int
+    if not set(map(type, valores)) <= {int, str}:
+        raise TypeError
+    return list(map(int, valores))
+
+def _columna_textos(valores):
+    textos = [valor.strip() for valor in valores]
+    if not all(textos) or "\0" in "".join(textos):
+        raise ValueError
+    return textos
+
+# Cada validador revisa un lote entero por columnas (validar_lote: la
+# cantidad de filas nuevas, o None si algo no pasa) y, solo si falla, fila
+# por fila para dar el error exacto (validar: True si la fila agrega y
+# False si actualiza algo existente). Ambos acumulan recién cuando todo
+# lo revisado es válido.
+class _Clientes:
+    def __init__(self, banco):
+        self.existentes = banco.clientes_por_id
+        # id -> Cliente, en orden de archivo
+        self.nuevos = {}
+
+    def validar_lote(self, bloque):
+        try:
+            ids = _columna_enteros(list(map(itemgetter("id"), bloque)))
+            nombres = _columna_textos(map(itemgetter("nombre"), bloque))
+            credenciales = list(map(exigir_hash, _columna_textos(map(itemgetter("credencial"), bloque))))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+        unicos = set(ids)
+        if (min(ids) < 1 or len(unicos) != len(ids) or not unicos.isdisjoint(self.existentes)
+                or not unicos.isdisjoint(self.nuevos)):
+            return None
+        self.nuevos.update(zip(ids, map(Cliente, ids, nombres, credenciales)))
+        return len(bloque)
+
+    def validar(self, fila):
+        cliente_id = _entero(fila, "id")
+        if cliente_id < 1:
+            raise OperacionError(f"id inválido: {cliente_id}")
+        if cliente_id in self.existentes or cliente_id in self.nuevos:
+            raise OperacionError(f"Ya existe un cliente con ID {cliente_id}")
+        try:
+            credencial = exigir_hash(_texto(fila, "credencial"))
+        except CredencialError as e:
+            raise OperacionError(str(e)) from None
+        self.nuevos[cliente_id] = Cliente(cliente_id, _texto(fila, "nombre"), credencial)
+        return True
+
+    def aplicar(self, banco):
+        with banco.bloqueo:
+            if not self.nuevos.keys().isdisjoint(banco.clientes_por_id):
+                raise OperacionError("Se agregaron clientes del archivo durante la importación")
+            clientes = list(self.nuevos.values())
+            banco.agregar_clientes(clientes)
+            if banco.altas_clientes is not None:
+                banco.altas_clientes.extend((c.id, c.nombre, c.credencial) for c in clientes)
+
+class _Cuentas:
+    def __init__(self, banco):
+        self.existentes = banco.cuentas_por_numero
+        self.clientes = banco.clientes_por_id
+        # número -> None: un dict mantiene el orden del archivo
+        self.numeros = {}
+        self.cliente_ids = array('q')
+        self.saldos = array('q')
+
+    def validar_lote(self, bloque):
+        try:
+            numeros = _columna_textos(map(itemgetter("numero"), bloque))
+            if max(map(len, map(str.encode, numeros))) > MAX_CUENTA:
+                return None
+            cliente_ids = _columna_enteros(list(map(itemgetter("cliente_id"), bloque)))
+            montos = [fila.get("saldo") or "0" for fila in bloque]
+            if not all(map(_MONTO.fullmatch, montos)):
+                return None
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+        unicos = set(numeros)
+        if (len(unicos) != len(numeros) or not unicos.isdisjoint(self.existentes)
+                or not unicos.isdisjoint(self.numeros) or not self.clientes.keys() >= set(cliente_ids)):
+            return None
+        self.numeros.update(dict.fromkeys(numeros))
+        self.cliente_ids.extend(cliente_ids)
+        self.saldos.extend(map(round, map((float(CENTAVOS)).__mul__, map(float, montos))))
+        return len(bloque)
+
+    def validar(self, fila):
+        numero = _texto(fila, "numero")
+        if len(numero.encode('utf-8')) > MAX_CUENTA:
+            raise OperacionError(f"El número de cuenta no puede pasar de {MAX_CUENTA} bytes")
+        if numero in self.existentes or numero in self.numeros:
+            raise OperacionError(f"Ya existe la cuenta {numero}")
+        cliente_id = _entero(fila, "cliente_id")
+        if cliente_id not in self.clientes:
+            raise OperacionError(f"No existe el cliente {cliente_id}")
+        saldo = fila.get("saldo")
+        try:
+            saldo = a_centavos(saldo) if saldo not in (None, "") else 0
+        except MontoError as e:
+            raise OperacionError(str(e)) from None
+        if saldo < 0:
+            raise OperacionError("El saldo inicial no puede ser negativo")
+        self.numeros[numero] = None
+        self.cliente_ids.append(cliente_id)
+        self.saldos.append(saldo)
+        return True
+
+    def aplicar(self, banco):
+        with banco.bloqueo:
+            if not self.numeros.keys().isdisjoint(banco.cuentas_por_numero):
+                raise OperacionError("Se agregaron cuentas del archivo durante la importación")
+            cuentas = banco.agregar_cuentas(list(self.numeros), self.cliente_ids, self.saldos)
+            if banco.altas_cuentas is not None:
+                banco.altas_cuentas.extend((c.numero, c.cliente_id, c.saldo) for c in cuentas)
+
+class _Dispensadores:
+    def __init__(self, banco):
+        self.banco = banco
+        # id -> (ubicación, billetes)
+        self.nuevos = {}
+
+    def validar(self, fila):
+        dispensador_id = _entero(fila, "id")
+        if dispensador_id in self.nuevos:
+            raise OperacionError(f"Cajero {dispensador_id} repetido en el archivo")
+        ubicacion = _texto(fila, "ubicacion", obligatorio=False)
+        existente = buscar_dispensador(self.banco, dispensador_id)
+        if existente is None and not ubicacion:
+            raise OperacionError("Falta ubicacion")
+        self.nuevos[dispensador_id] = (ubicacion, _billetes(fila))
+        return existente is None
+
+    # Pocos y con inventarios: siempre fila por fila
+    def validar_lote(self, bloque):
+        return None
+
+    # Las altas toman el bloqueo del banco en agregar_dispensador
+    def aplicar(self, banco):
+        for dispensador_id, (ubicacion, billetes) in self.nuevos.items():
+            dispensador = buscar_dispensador(banco, dispensador_id)
+            if dispensador is None:
+                dispensador = Dispensador(dispensador_id, ubicacion)
+                dispensador.billetes = billetes
+                banco.agregar_dispensador(dispensador)
+                continue
+            with dispensador.bloqueo:
+                dispensador.billetes.update(billetes)
+            if ubicacion and ubicacion != dispensador.ubicacion:
+                dispensador.ubicacion = ubicacion
+                # Etiquetas nuevas en el enrutador
+                banco.enrutador.agregar(dispensador)
+
+_VALIDADORES = {CLIENTES: _Clientes, CUENTAS: _Cuentas, DISPENSADORES: _Dispensadores}
+
+# Importa las filas (dicts, de leer_csv/leer_jsonl) de 'entidad'. 'progreso'
+# recibe las filas leídas después de cada lote. Devuelve un resumen o
+# levanta ImportacionError sin haber tocado el banco.
+def importar(banco, entidad, filas, lote=LOTE, progreso=None):
+    validador = _VALIDADORES[entidad](banco)
+    inicio = time.perf_counter()
+    leidas = agregadas = 0
+    errores, invalidas = [], 0
+    filas = iter(filas)
+    # Millones de objetos nuevos sin ciclos: el recolector solo los recorrería
+    gc.disable()
+    try:
+        while True:
+            bloque = list(itertools.islice(filas, lote))
+            if not bloque:
+                break
+            nuevas = validador.validar_lote(bloque)
+            if nuevas is not None:
+                leidas += len(bloque)
+                agregadas += nuevas
+                bloque = ()
+            for fila in bloque:
+                leidas += 1
+                try:
+                    if not isinstance(fila, dict):
+                        raise OperacionError("Se esperaba un objeto JSON")
+                    if "_invalida" in fila:
+                        raise OperacionError(f"Línea inválida: {fila['_invalida']}")
+                    agregadas += validador.validar(fila)
+                except OperacionError as e:
+                    invalidas += 1
+                    if len(errores) < MAX_ERRORES:
+                        errores.append((leidas, str(e)))
+            if progreso is not None:
+                progreso(leidas)
+        if invalidas:
+            raise ImportacionError(entidad, errores, invalidas)
+        validador.aplicar(banco)
+    finally:
+        gc.enable()
+    return {"entidad": entidad, "filas": leidas, "agregadas": agregadas,
+            "actualizadas": leidas - agregadas, "segundos": round(time.perf_counter() - inicio, 3)}
+
+def _filas_clientes(banco):
+    for cliente in banco.listar_clientes():
+        yield cliente.id, cliente.nombre, cliente.credencial
+
+def _filas_cuentas(banco):
+    for cuenta in banco.listar_cuentas():
+        yield cuenta.numero, cuenta.cliente_id, formatear(cuenta.saldo)
+
+def _filas_dispensadores(banco):
+    for dispensador in banco.listar_dispensadores():
+        with dispensador.bloqueo:
+            billetes = dict(dispensador.billetes)
+        yield dispensador.id, dispensador.ubicacion, billetes
+
+def _jsonl(entidad, fila):
+    if entidad == CLIENTES:
+        return (f'{{"id": {fila[0]}, "nombre": {encode_basestring(fila[1])}, '
+                f'"credencial": {encode_basestring(fila[2])}}}\n')
+    if entidad == CUENTAS:
+        return (f'{{"numero": {encode_basestring(fila[0])}, "cliente_id": {fila[1]}, '
+                f'"saldo": "{fila[2]}"}}\n')
+    billetes = ", ".join(f'"{denom}": {cant}' for denom, cant in fila[2].items())
+    return f'{{"id": {fila[0]}, "ubicacion": {encode_basestring(fila[1])}, "billetes": {{{billetes}}}}}\n'
+
+# Escribe todas las filas de 'entidad' en orden, de a LOTE filas por
+# escritura. Los saldos se leen de a uno: con el banco en uso el archivo
+# no es una foto de un único instante.
+def exportar(banco, entidad, salida, formato="jsonl", lote=LOTE, progreso=None):
+    filas = {CLIENTES: _filas_clientes, CUENTAS: _filas_cuentas,
+             DISPENSADORES: _filas_dispensadores}[entidad](banco)
+    escritor = csv.writer(salida) if formato == "csv" else None
+    if escritor:
+        escritor.writerow(CAMPOS[entidad])
+    escritas = 0
+    while True:
+        bloque = list(itertools.islice(filas, lote))
+        if not bloque:
+            break
+        if escritor:
+            if entidad == DISPENSADORES:
+                bloque = [(i, ubicacion, "|".join(f"{denom}:{cant}" for denom, cant in billetes.items()))
+                          for i, ubicacion, billetes in bloque]
+            escritor.writerows(bloque)
+        else:
+            salida.write("".join([_jsonl(entidad, fila) for fila in bloque]))
+        escritas += len(bloque)
+        if progreso is not None:
+            progreso(escritas)
+    return escritas
+
+def formato_de(ruta, indicado=None):
+    if indicado:
+        return indicado
+    return "csv" if ruta.endswith(".csv") else "jsonl"
+
+def lector(formato):
+    return leer_csv if formato == "csv" else leer_jsonl
+
+# Banco del directorio de datos, como lo abre el cajero al arrancar
+def _abrir_banco(directorio, ruta_diario):
+    os.makedirs(directorio, exist_ok=True)
+    cargado = cargar_instantanea(directorio, ruta_diario)
+    if cargado is not None:
+        return cargado[0]
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, ruta_diario)
+    return banco
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa o exporta clientes, cuentas y cajeros")
+    parser.add_argument("accion", choices=("importar", "exportar"))
+    parser.add_argument("entidad", choices=ENTIDADES)
+    parser.add_argument("archivo", help="archivo CSV/JSONL ('-' para stdin/stdout)")
+    parser.add_argument("--formato", choices=("csv", "jsonl"))
+    parser.add_argument("--datos", default=os.environ.get("CAJERO_DATOS", "cajero_datos"),
+                        help="directorio de instantáneas del cajero (con el cajero detenido)")
+    parser.add_argument("--diario", help="diario de movimientos (por omisión el del directorio)")
+    parser.add_argument("--lote", type=int, default=LOTE)
+    args = parser.parse_args(argv)
+    ruta_diario = args.diario or os.environ.get("CAJERO_DIARIO",
+                                                os.path.join(args.datos, "cajero.diario"))
+    formato = formato_de(args.archivo, args.formato)
+    def progreso(filas):
+        print(f"{args.entidad}: {filas} filas", file=sys.stderr)
+
+    banco = _abrir_banco(args.datos, ruta_diario)
+    try:
+        if args.accion == "exportar":
+            salida = sys.stdout if args.archivo == "-" else open(args.archivo, "w", newline="",
+                                                                  encoding="utf-8")
+            try:
+                escritas = exportar(banco, args.entidad, salida, formato, args.lote, progreso)
+            finally:
+                if salida is not sys.stdout:
+                    salida.close()
+            print(f"Exportadas: {escritas}", file=sys.stderr)
+            return 0
+        entrada = sys.stdin if args.archivo == "-" else open(args.archivo, newline="", encoding="utf-8")
+        try:
+            resumen = importar(banco, args.entidad, lector(formato)(entrada), args.lote, progreso)
+        except ImportacionError as e:
+            print(e, file=sys.stderr)
+            return 1
+        finally:
+            if entrada is not sys.stdin:
+                entrada.close()
+        # La base nueva deja lo importado persistido para el próximo arranque
+        guardar_instantanea(banco, args.datos)
+        print(f"Importación: {resumen}", file=sys.stderr)
+        return 0
+    finally:
+        banco.diario.cerrar()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+# Cliente asyncio del protocolo de servidor_async.py y generador de carga:
+# abre muchas sesiones simultáneas (activas e inactivas) contra el servidor
+# y mide operaciones por segundo y latencias.
+
+class RespuestaError(Exception):
+    pass
+
+class ClienteCajero:
+    def __init__(self, lector, escritor):
+        self._lector = lector
+        self._escritor = escritor
+
+    @classmethod
+    async def conectar(cls, host="127.0.0.1", puerto=8765, unix=None):
+        if unix:
+            lector, escritor = await asyncio.open_unix_connection(unix)
+        else:
+            lector, escritor = await asyncio.open_connection(host, puerto)
+        return cls(lector, escritor)
+
+    async def orden(self, *partes):
+        self._escritor.write((" ".join(str(p) for p in partes) + "\n").encode("utf-8"))
+        await self._escritor.drain()
+        linea = (await self._lector.readline()).decode("utf-8").rstrip("\n")
+        if linea.startswith("OK "):
+            return json.loads(linea[3:])
+        raise RespuestaError(linea[4:] if linea.startswith("ERR ") else linea or "Conexión cerrada")
+
+    async def autenticar(self, cliente_id, password):
+        return await self.orden("AUTH", cliente_id, password)
+
+    async def saldo(self):
+        return (await self.orden("SALDO"))["saldo"]
+
+    async def movimientos(self, cantidad=20):
+        return (await self.orden("MOVIMIENTOS", cantidad))["movimientos"]
+
+    async def retirar(self, monto):
+        return await self.orden("RETIRO", monto)
+
+    async def depositar(self, billetes):
+        return await self.orden("DEPOSITO", "|".join(f"{d}:{c}" for d, c in billetes.items()))
+
+    async def transferir(self, destinatario_id, monto):
+        return await self.orden("TRANSFERENCIA", destinatario_id, monto)
+
+    async def pagar(self, servicio, monto):
+        return await self.orden("PAGO", servicio, monto)
+
+    async def cerrar(self):
+        try:
+            await self.orden("SALIR")
+        except (RespuestaError, ConnectionError):
+            pass
+        self._escritor.close()
+        await self._escritor.wait_closed()
+
+async def _sesion_activa(args, indice, latencias, errores):
+    azar = random.Random(indice)
+    cliente = await ClienteCajero.conectar(args.host, args.puerto, args.unix)
+    try:
+        await cliente.autenticar(*args.credenciales[indice % len(args.credenciales)])
+        for _ in range(args.ops):
+            r = azar.random()
+            inicio = time.perf_counter()
+            try:
+                if r < 0.3:
+                    await cliente.retirar(azar.choice((20, 60, 100, 200)))
+                elif r < 0.5:
+                    await cliente.depositar({100: 1, 20: 2})
+                elif r < 0.7:
+                    await cliente.saldo()
+                elif r < 0.85:
+                    await cliente.movimientos(10)
+                else:
+                    await cliente.pagar(azar.choice(("Luz", "Agua", "Gas", "Internet")), 100)
+            except RespuestaError:
+                errores[0] += 1
+            latencias.append(time.perf_counter() - inicio)
+    finally:
+        await cliente.cerrar()
+
+async def _carga(args):
+    # Sesiones inactivas: conectadas y autenticadas, sin enviar nada más
+    inactivas = []
+    for i in range(args.inactivas):
+        cliente = await ClienteCajero.conectar(args.host, args.puerto, args.unix)
+        await cliente.autenticar(*args.credenciales[i % len(args.credenciales)])
+        inactivas.append(cliente)
+
+    latencias, errores = [], [0]
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_sesion_activa(args, i, latencias, errores) for i in range(args.sesiones)))
+    duracion = time.perf_counter() - inicio
+
+    for cliente in inactivas:
+        await cliente.cerrar()
+
+    latencias.sort()
+    def percentil(p):
+        return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1e6 if latencias else 0.0
+    return {"sesiones": args.sesiones, "inactivas": args.inactivas,
+            "operaciones": len(latencias), "rechazadas": errores[0],
+            "ops_por_segundo": round(len(latencias) / duracion, 1),
+            "p50_us": round(percentil(0.50), 1), "p99_us": round(percentil(0.99), 1)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de carga para servidor_async.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--unix")
+    parser.add_argument("--sesiones", type=int, default=100, help="sesiones activas simultáneas")
+    parser.add_argument("--ops", type=int, default=100, help="operaciones por sesión activa")
+    parser.add_argument("--inactivas", type=int, default=1000, help="sesiones abiertas sin actividad")
+    args = parser.parse_args(argv)
+    # Clientes de crear_banco_ejemplo()
+    args.credenciales = [(1, "1234"), (2, "5678"), (3, "9012")]
+    print(json.dumps(asyncio.run(_carga(args)), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
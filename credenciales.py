@@ -0,0 +1,292 @@
+import base64
+import hashlib
+import hmac
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import metricas
+
+# Credenciales de clientes: hashes con sal de costo configurable (scrypt, o
+# PBKDF2-SHA256 si hashlib no trae scrypt) guardados como texto:
+#
+#   scrypt$<n>$<r>$<p>$<sal>$<hash>          sal y hash en base64
+#   pbkdf2_sha256$<iteraciones>$<sal>$<hash>
+#
+# Un texto sin uno de esos prefijos es una contraseña en claro de datos
+# anteriores: se acepta y se reemplaza por un hash al primer ingreso.
+#
+# Verificar un hash cuesta decenas de milisegundos de CPU a propósito. El
+# Autenticador pone delante de esa verificación:
+#   - límites de intentos fallidos por cliente y por origen, con ventanas
+#     deslizantes de costo O(1) (LimiteIntentos);
+#   - un caché de verificaciones correctas recientes (CacheVerificaciones);
+#   - opcionalmente un pool de procesos, para que los hashes no compitan
+#     por el GIL con los hilos que atienden operaciones.
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+LARGO_SAL = 16
+LARGO_HASH = 32
+# Costos por omisión: unos 50 ms por verificación en un núcleo actual
+COSTOS = {SCRYPT: {"n": 2**14, "r": 8, "p": 1},
+          PBKDF2: {"iteraciones": 600_000}}
+ALGORITMO = SCRYPT if hasattr(hashlib, "scrypt") else PBKDF2
+
+class CredencialError(ValueError):
+    pass
+
+class IntentosExcedidos(CredencialError):
+    def __init__(self, espera):
+        super().__init__(f"Demasiados intentos fallidos; intente de nuevo en {math.ceil(espera)} s")
+        self.espera = espera
+
+# Algoritmo y costo de los hashes nuevos desde un texto como
+# "scrypt:n=16384,r=8,p=1" o "pbkdf2_sha256:iteraciones=600000"
+def leer_parametros(texto=None):
+    if not texto:
+        return (ALGORITMO, dict(COSTOS[ALGORITMO]))
+    algoritmo, _, resto = texto.partition(":")
+    if algoritmo not in COSTOS:
+        raise CredencialError(f"Algoritmo de hash desconocido: {algoritmo}")
+    if algoritmo == SCRYPT and not hasattr(hashlib, "scrypt"):
+        raise CredencialError("Este Python no tiene hashlib.scrypt")
+    costo = dict(COSTOS[algoritmo])
+    for par in filter(None, resto.split(",")):
+        nombre, _, valor = par.partition("=")
+        if nombre not in costo:
+            raise CredencialError(f"Parámetro desconocido para {algoritmo}: {nombre}")
+        try:
+            costo[nombre] = int(valor)
+        except ValueError:
+            raise CredencialError(f"Valor inválido para {nombre}: {valor!r}") from None
+    return (algoritmo, costo)
+
+def _b64(datos):
+    return base64.b64encode(datos).decode("ascii")
+
+def _derivar(algoritmo, costo, password, sal):
+    password = password.encode("utf-8")
+    if algoritmo == SCRYPT:
+        n, r, p = costo["n"], costo["r"], costo["p"]
+        return hashlib.scrypt(password, salt=sal, n=n, r=r, p=p, dklen=LARGO_HASH,
+                              maxmem=128 * r * (n + p + 2) + 2**20)
+    return hashlib.pbkdf2_hmac("sha256", password, sal, costo["iteraciones"], LARGO_HASH)
+
+def generar(password, parametros=None):
+    algoritmo, costo = parametros or leer_parametros()
+    sal = os.urandom(LARGO_SAL)
+    clave = _derivar(algoritmo, costo, password, sal)
+    campos = [costo["n"], costo["r"], costo["p"]] if algoritmo == SCRYPT else [costo["iteraciones"]]
+    return "$".join([algoritmo, *map(str, campos), _b64(sal), _b64(clave)])
+
+# (algoritmo, costo, sal, hash), o None para una contraseña en claro
+def _descomponer(credencial):
+    campos = credencial.split("$")
+    if campos[0] == SCRYPT and len(campos) == 6:
+        costo = {"n": int(campos[1]), "r": int(campos[2]), "p": int(campos[3])}
+    elif campos[0] == PBKDF2 and len(campos) == 4:
+        costo = {"iteraciones": int(campos[1])}
+    else:
+        return None
+    return (campos[0], costo, base64.b64decode(campos[-2]), base64.b64decode(campos[-1]))
+
+def es_hash(credencial):
+    return _descomponer(credencial) is not None
+
+# Para datos nuevos (altas, importaciones): la credencial tiene que ser un
+# hash bien formado. Las contraseñas en claro solo se aceptan en datos
+# anteriores, que se rehacen al primer ingreso.
+def exigir_hash(credencial):
+    try:
+        correcta = _descomponer(credencial) is not None
+    except ValueError:
+        correcta = False
+    if not correcta:
+        raise CredencialError("La credencial debe ser un hash (scrypt$... o pbkdf2_sha256$...), "
+                              "no una contraseña en claro")
+    return credencial
+
+def verificar(credencial, password):
+    partes = _descomponer(credencial)
+    if partes is None:
+        return hmac.compare_digest(credencial.encode("utf-8"), password.encode("utf-8"))
+    algoritmo, costo, sal, clave = partes
+    return hmac.compare_digest(_derivar(algoritmo, costo, password, sal), clave)
+
+# Verificación completa (la parte cara, la que corre en el pool): devuelve
+# (correcta, credencial nueva) con la credencial rehecha si estaba en claro
+# o con otro costo, o None si no hace falta cambiarla
+def verificar_y_actualizar(credencial, password, parametros):
+    if not verificar(credencial, password):
+        return (False, None)
+    partes = _descomponer(credencial)
+    if partes is not None and partes[:2] == tuple(parametros):
+        return (True, None)
+    return (True, generar(password, parametros))
+
+# Cuenta de intentos por clave con ventana deslizante aproximada: cada clave
+# guarda solo las cuentas de la ventana fija actual y de la anterior, y el
+# total se estima pesando la anterior por la parte que aún se solapa.
+class LimiteIntentos:
+    def __init__(self, limite, ventana):
+        self.limite = limite
+        self.ventana = ventana
+        # clave -> [número de ventana, cuenta actual, cuenta anterior]
+        self._cuentas = {}
+        self._proxima_limpieza = 0.0
+        self._bloqueo = threading.Lock()
+
+    def _cuenta(self, clave, numero):
+        cuenta = self._cuentas.get(clave)
+        if cuenta is None:
+            return None
+        if cuenta[0] != numero:
+            cuenta[2] = cuenta[1] if cuenta[0] == numero - 1 else 0
+            cuenta[1] = 0
+            cuenta[0] = numero
+        return cuenta
+
+    # Segundos hasta que la clave vuelva a tener intentos, o 0
+    def espera(self, clave, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        posicion = ahora / self.ventana
+        numero = int(posicion)
+        with self._bloqueo:
+            cuenta = self._cuenta(clave, numero)
+            if cuenta is None:
+                return 0.0
+            actual, anterior = cuenta[1], cuenta[2]
+        fraccion = posicion - numero
+        if anterior * (1 - fraccion) + actual < self.limite:
+            return 0.0
+        # Momento en que el peso de la ventana anterior baja lo suficiente;
+        # si la actual ya llegó al límite, pasa a ser la anterior y se espera
+        # a que ella baje
+        if actual >= self.limite:
+            return (2 - fraccion - self.limite / actual) * self.ventana + 1e-3
+        return (1 - (self.limite - actual) / anterior - fraccion) * self.ventana + 1e-3
+
+    def registrar(self, clave, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        numero = int(ahora / self.ventana)
+        with self._bloqueo:
+            cuenta = self._cuenta(clave, numero)
+            if cuenta is None:
+                self._cuentas[clave] = [numero, 1, 0]
+            else:
+                cuenta[1] += 1
+            # Una vez por ventana se descartan las claves sin intentos recientes
+            if ahora >= self._proxima_limpieza:
+                self._cuentas = {k: c for k, c in self._cuentas.items() if c[0] >= numero - 1}
+                self._proxima_limpieza = ahora + self.ventana
+
+    def olvidar(self, clave):
+        with self._bloqueo:
+            self._cuentas.pop(clave, None)
+
+    def __len__(self):
+        return len(self._cuentas)
+
+# Verificaciones correctas recientes, LRU acotado. Guarda un HMAC de
+# (credencial, contraseña) con una clave aleatoria del proceso, nunca la
+# contraseña; cambiar la credencial invalida su entrada.
+class CacheVerificaciones:
+    def __init__(self, capacidad=10_000):
+        self.capacidad = capacidad
+        self._clave = os.urandom(32)
+        self._entradas = OrderedDict()
+        self._bloqueo = threading.Lock()
+
+    def _resumen(self, credencial, password):
+        mensaje = credencial.encode("utf-8") + b"\0" + password.encode("utf-8")
+        return hmac.new(self._clave, mensaje, hashlib.sha256).digest()
+
+    def contiene(self, credencial, password):
+        resumen = self._resumen(credencial, password)
+        with self._bloqueo:
+            if resumen not in self._entradas:
+                return False
+            self._entradas.move_to_end(resumen)
+            return True
+
+    def agregar(self, credencial, password):
+        if self.capacidad <= 0:
+            return
+        resumen = self._resumen(credencial, password)
+        with self._bloqueo:
+            self._entradas[resumen] = None
+            self._entradas.move_to_end(resumen)
+            if len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entradas)
+
+class Autenticador:
+    def __init__(self, parametros=None, procesos=0, intentos_cliente=5, intentos_origen=50,
+                 ventana=300.0, capacidad_cache=10_000):
+        self.parametros = parametros or leer_parametros()
+        self.por_cliente = LimiteIntentos(intentos_cliente, ventana)
+        self.por_origen = LimiteIntentos(intentos_origen, ventana)
+        self.cache = CacheVerificaciones(capacidad_cache)
+        self._ficticia = None
+        # Pool de procesos con 'spawn': el banco tiene hilos (diario, punto
+        # de control) que un fork copiaría a medias
+        self._procesos = None
+        if procesos:
+            self._procesos = ProcessPoolExecutor(procesos, multiprocessing.get_context("spawn"))
+
+    def generar(self, password):
+        return generar(password, self.parametros)
+
+    # Para clientes inexistentes se verifica contra un hash cualquiera: la
+    # respuesta tarda lo mismo que con una contraseña incorrecta
+    def _credencial_ficticia(self):
+        if self._ficticia is None:
+            self._ficticia = generar(os.urandom(LARGO_SAL).hex(), self.parametros)
+        return self._ficticia
+
+    def _comprobar_limites(self, cliente_id, origen):
+        espera = self.por_cliente.espera(cliente_id)
+        if origen is not None:
+            espera = max(espera, self.por_origen.espera(origen))
+        if espera:
+            raise IntentosExcedidos(espera)
+
+    # Verifica 'password' contra 'credencial' (None: cliente inexistente).
+    # Devuelve (correcta, credencial nueva o None) como verificar_y_actualizar
+    # y lanza IntentosExcedidos si el cliente o el origen agotaron sus intentos.
+    # Bloquea al hilo que llama mientras corre el hash; con pool, el hash
+    # corre en otro proceso.
+    def verificar(self, cliente_id, credencial, password, origen=None):
+        self._comprobar_limites(cliente_id, origen)
+        if credencial is not None and self.cache.contiene(credencial, password):
+            if metricas.activas:
+                metricas.contar("cajero_credenciales_cache_total", (("resultado", "acierto"),))
+            return (True, None)
+        if metricas.activas:
+            metricas.contar("cajero_credenciales_cache_total", (("resultado", "fallo"),))
+
+        argumentos = (credencial or self._credencial_ficticia(), password, self.parametros)
+        if self._procesos is not None:
+            correcta, nueva = self._procesos.submit(verificar_y_actualizar, *argumentos).result()
+        else:
+            correcta, nueva = verificar_y_actualizar(*argumentos)
+        if credencial is None or not correcta:
+            self.por_cliente.registrar(cliente_id)
+            if origen is not None:
+                self.por_origen.registrar(origen)
+            return (False, None)
+        self.por_cliente.olvidar(cliente_id)
+        self.cache.agregar(nueva or credencial, password)
+        return (True, nueva)
+
+    def cerrar(self):
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=True)
+            self._procesos = None
@@ -0,0 +1,274 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Diario de movimientos: archivo binario de solo-agregado con registros de
+# tamaño fijo. Cada registro lleva su CRC32, así al abrir el archivo se
+# detecta y descarta un registro escrito a medias por una caída.
+
+MAGICO = b'CAJDIAR1'
+# Versión 4: pagos con clave de idempotencia y referencia
+VERSION = 4
+_VERSIONES_ANTERIORES = {1: "montos sin centavos",
+                         2: "retiros y depósitos sin dispensador ni billetes",
+                         3: "pagos sin clave de idempotencia"}
+CABECERA = struct.Struct('<8sHH4x')
+# Bytes (UTF-8) de un número de cuenta en un registro
+MAX_CUENTA = 24
+# seq, fecha (microsegundos desde epoch), tipo, servicio, monto en centavos,
+# dispensador (-1 si no hay), cuenta, cuenta destino, billetes por
+# denominación (en el orden de DENOMINACIONES), clave de idempotencia (16
+# bytes, ceros si no hay), código de referencia (0 si no hay), crc32
+REGISTRO = struct.Struct(f'<QqBB2xqq{MAX_CUENTA}s{MAX_CUENTA}s4H16sQI')
+_SIN_CRC = struct.Struct(f'<QqBB2xqq{MAX_CUENTA}s{MAX_CUENTA}s4H16sQ')
+SIN_CLAVE = bytes(16)
+_CLAVE = struct.Struct('<16sQ')
+_OFFSET_CLAVE = _SIN_CRC.size - _CLAVE.size
+
+TIPOS = ("RETIRO", "DEPÓSITO", "TRANSFERENCIA", "PAGO_SERVICIO")
+SERVICIOS = ("Luz", "Agua", "Gas", "Internet")
+DENOMINACIONES = (200, 100, 50, 20)
+SIN_DISPENSADOR = -1
+MAX_BILLETES = 0xFFFF
+_CODIGO_TIPO = {tipo: i + 1 for i, tipo in enumerate(TIPOS)}
+_CODIGO_SERVICIO = {servicio: i + 1 for i, servicio in enumerate(SERVICIOS)}
+
+class DiarioError(Exception):
+    pass
+
+def _texto(campo):
+    return campo.rstrip(b'\0').decode('utf-8') or None
+
+# (seq, fecha, tipo, servicio, monto, cuenta, destino, dispensador, billetes);
+# dispensador y billetes ({denominación: cantidad}) son None si no hay
+def decodificar(datos, offset=0):
+    (seq, fecha, tipo, servicio, monto, dispensador, cuenta, destino,
+     *cantidades, _, _, _) = REGISTRO.unpack_from(datos, offset)
+    billetes = None
+    if any(cantidades):
+        billetes = {denom: cant for denom, cant in zip(DENOMINACIONES, cantidades) if cant}
+    return (seq, fecha, TIPOS[tipo - 1], SERVICIOS[servicio - 1] if servicio else None,
+            monto, _texto(cuenta), _texto(destino),
+            None if dispensador == SIN_DISPENSADOR else dispensador, billetes)
+
+# Un número más largo se cortaría (quizás a mitad de un carácter) y al
+# reaplicar el diario su cuenta no aparecería
+def _cuenta(numero):
+    datos = numero.encode('utf-8')
+    if len(datos) > MAX_CUENTA:
+        raise DiarioError(f"Número de cuenta de más de {MAX_CUENTA} bytes: {numero!r}")
+    return datos
+
+def _cantidades(billetes):
+    if not billetes:
+        return (0,) * len(DENOMINACIONES)
+    if not billetes.keys() <= set(DENOMINACIONES):
+        raise DiarioError(f"Denominación no soportada por el diario: {set(billetes) - set(DENOMINACIONES)}")
+    cantidades = tuple(billetes.get(denom, 0) for denom in DENOMINACIONES)
+    if not all(0 <= cant <= MAX_BILLETES for cant in cantidades):
+        raise DiarioError(f"Cantidad de billetes fuera de rango: {billetes}")
+    return cantidades
+
+# Campos de un registro sin su número ni su CRC, validados: un valor que el
+# diario no puede guardar falla acá, antes de escribir nada
+def registro(tipo, monto, cuenta_numero, cuenta_destino=None, servicio=None, fecha=None,
+             dispensador=None, billetes=None, clave=None, referencia=None):
+    if fecha is None:
+        fecha = time.time_ns() // 1000
+    try:
+        codigo_tipo = _CODIGO_TIPO[tipo]
+        codigo_servicio = _CODIGO_SERVICIO[servicio] if servicio else 0
+    except KeyError as e:
+        raise DiarioError(f"Valor no soportado por el diario: {e.args[0]}") from None
+    cantidades = _cantidades(billetes)
+    cuenta, destino = _cuenta(cuenta_numero), _cuenta(cuenta_destino or '')
+    if dispensador is None:
+        dispensador = SIN_DISPENSADOR
+    if clave is not None and len(clave) != len(SIN_CLAVE):
+        raise DiarioError(f"La clave de idempotencia debe tener {len(SIN_CLAVE)} bytes")
+    return (fecha, codigo_tipo, codigo_servicio, monto, dispensador, cuenta, destino,
+            *cantidades, clave or SIN_CLAVE, referencia or 0)
+
+# Vista de solo lectura sobre el archivo mapeado en memoria; los registros
+# se decodifican uno a uno al pedirlos, sin crear objetos para el resto.
+# Cuando el archivo crece se mapea de nuevo, pero el mapa anterior no se
+# cierra: otro hilo puede estar leyéndolo y se libera al soltarlo el último.
+class VistaDiario:
+    def __init__(self, diario):
+        self._diario = diario
+        # (mapa, registros que cubre), reemplazados juntos
+        self._mapa = (None, 0)
+        self._bloqueo = threading.Lock()
+
+    def __len__(self):
+        return self._diario.total
+
+    def _asegurar(self, indice):
+        mapa, capacidad = self._mapa
+        if indice < capacidad:
+            return mapa
+        with self._bloqueo:
+            mapa, capacidad = self._mapa
+            if indice >= capacidad:
+                mapa = mmap.mmap(self._diario._fd, 0, access=mmap.ACCESS_READ)
+                self._mapa = (mapa, (len(mapa) - CABECERA.size) // REGISTRO.size)
+            return mapa
+
+    def __getitem__(self, indice):
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(indice)
+        return decodificar(self._asegurar(indice), CABECERA.size + indice * REGISTRO.size)
+
+    def __iter__(self):
+        for indice in range(len(self)):
+            yield self[indice]
+
+    def cerrar(self):
+        with self._bloqueo:
+            mapa, _ = self._mapa
+            self._mapa = (None, 0)
+        if mapa is not None:
+            mapa.close()
+
+# Escritor con commit agrupado: cada agregar() escribe de inmediato al
+# archivo, pero el fsync lo hace un hilo aparte una vez por ventana de
+# 'intervalo' segundos, cubriendo todos los registros acumulados
+class Diario:
+    # 'verificados': registros iniciales que no hace falta volver a validar
+    # porque ya los cubre una instantánea escrita después de su fsync
+    def __init__(self, ruta, intervalo=0.002, verificados=0):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        # Con durable=False agregar() no espera el fsync (procesos por lotes
+        # que llaman a sincronizar() al terminar)
+        self.durable = True
+        self._fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o644)
+        self.total = self._recuperar(verificados)
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self._condicion = threading.Condition(self._lock)
+        self._escrito = self.total
+        self._durable = self.total
+        self._cerrado = False
+        self.vista = VistaDiario(self)
+        self._hilo = threading.Thread(target=self._sincronizar, daemon=True)
+        self._hilo.start()
+
+    # Valida la cabecera y trunca el archivo en el primer registro
+    # incompleto o con CRC inválido
+    def _recuperar(self, verificados=0):
+        tamano = os.fstat(self._fd).st_size
+        if tamano == 0:
+            os.write(self._fd, CABECERA.pack(MAGICO, VERSION, REGISTRO.size))
+            os.fsync(self._fd)
+            return 0
+        cabecera = os.pread(self._fd, CABECERA.size, 0)
+        if len(cabecera) < CABECERA.size:
+            raise DiarioError(f"Cabecera incompleta en {self.ruta}")
+        magico, version, tamano_registro = CABECERA.unpack(cabecera)
+        if magico == MAGICO and version in _VERSIONES_ANTERIORES:
+            raise DiarioError(f"{self.ruta} usa el formato {version} "
+                              f"({_VERSIONES_ANTERIORES[version]}); "
+                              f"esta versión solo lee el formato {VERSION}")
+        if magico != MAGICO or version != VERSION or tamano_registro != REGISTRO.size:
+            raise DiarioError(f"Formato de diario no reconocido en {self.ruta}")
+
+        completos = (tamano - CABECERA.size) // REGISTRO.size
+        validos = min(verificados, completos)
+        if completos > validos:
+            with mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ) as mapa:
+                offset = CABECERA.size + validos * REGISTRO.size
+                for validos in range(validos, completos):
+                    seq = struct.unpack_from('<Q', mapa, offset)[0]
+                    crc = struct.unpack_from('<I', mapa, offset + _SIN_CRC.size)[0]
+                    if seq != validos or zlib.crc32(mapa[offset:offset + _SIN_CRC.size]) != crc:
+                        break
+                    offset += REGISTRO.size
+                else:
+                    validos = completos
+        fin = CABECERA.size + validos * REGISTRO.size
+        if fin != tamano:
+            os.ftruncate(self._fd, fin)
+            os.fsync(self._fd)
+        os.lseek(self._fd, fin, os.SEEK_SET)
+        return validos
+
+    # 'clave' (16 bytes) y 'referencia' identifican un pago idempotente: se
+    # escriben en el mismo registro que el movimiento, así no hay una caída
+    # que deje el cobro en el diario y la clave fuera
+    def agregar(self, tipo, monto, cuenta_numero, cuenta_destino=None, servicio=None,
+                fecha=None, durable=None, dispensador=None, billetes=None, clave=None,
+                referencia=None):
+        return self.agregar_registros([registro(tipo, monto, cuenta_numero, cuenta_destino, servicio,
+                                                fecha, dispensador, billetes, clave, referencia)],
+                                      durable)[0]
+
+    # Varios registros de registro() en una sola escritura, con números
+    # consecutivos; devuelve el range de sus números. Los dos lados de una
+    # transferencia van juntos: si la escritura falla no queda ninguno.
+    def agregar_registros(self, registros, durable=None):
+        if durable is None:
+            durable = self.durable
+        with self._lock:
+            if self._cerrado:
+                raise DiarioError("El diario está cerrado")
+            inicio = self.total
+            datos = bytearray()
+            for seq, campos in enumerate(registros, inicio):
+                cuerpo = _SIN_CRC.pack(seq, *campos)
+                datos += cuerpo
+                datos += struct.pack('<I', zlib.crc32(cuerpo))
+            os.write(self._fd, datos)
+            self.total += len(registros)
+            self._escrito = self.total
+            self._condicion.notify_all()
+            if durable:
+                while self._durable < self.total and not self._cerrado:
+                    self._condicion.wait()
+        return range(inicio, inicio + len(registros))
+
+    # (clave, referencia) de cada registro con clave de idempotencia, en orden
+    def claves(self):
+        for indice in range(self.total):
+            offset = CABECERA.size + indice * REGISTRO.size + _OFFSET_CLAVE
+            clave, referencia = _CLAVE.unpack_from(self.vista._asegurar(indice), offset)
+            if clave != SIN_CLAVE:
+                yield clave, referencia
+
+    def _sincronizar(self):
+        while True:
+            with self._lock:
+                while self._escrito == self._durable and not self._cerrado:
+                    self._condicion.wait()
+                if self._cerrado:
+                    return
+            # Ventana para juntar más registros en el mismo fsync
+            time.sleep(self.intervalo)
+            with self._lock:
+                objetivo = self._escrito
+            os.fsync(self._fd)
+            with self._lock:
+                self._durable = max(self._durable, objetivo)
+                self._condicion.notify_all()
+
+    def sincronizar(self):
+        with self._lock:
+            os.fsync(self._fd)
+            self._durable = self._escrito
+            self._condicion.notify_all()
+
+    def cerrar(self):
+        if self._cerrado:
+            return
+        self.sincronizar()
+        with self._lock:
+            self._cerrado = True
+            self._condicion.notify_all()
+        self._hilo.join()
+        self.vista.cerrar()
+        os.close(self._fd)
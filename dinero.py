@@ -0,0 +1,83 @@
+from array import array
+from decimal import Decimal, DecimalException
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Dinero en centavos enteros. Saldos, montos de movimientos y operaciones
+# trabajan siempre con int; los textos se convierten solo en los bordes
+# (menús, lotes, protocolo) con a_centavos y se muestran con formatear.
+#
+# Reglas de redondeo:
+#   - Al leer un monto no se redondea: más de dos decimales es un error.
+#   - Los montos calculados (intereses, comisiones) se redondean al centavo
+#     con la mitad hacia arriba.
+
+CENTAVOS = 100
+# Tasas en puntos básicos: 125 = 1.25 %
+PUNTOS_BASICOS = 10_000
+
+class MontoError(ValueError):
+    pass
+
+# Un int se toma como pesos enteros; un texto (o Decimal) puede tener hasta
+# dos decimales. Los float se rechazan: su valor ya no es exacto.
+def a_centavos(valor):
+    if isinstance(valor, bool) or isinstance(valor, float):
+        raise MontoError(f"Monto inválido: {valor!r}")
+    if isinstance(valor, int):
+        return valor * CENTAVOS
+    # Un exponente enorme ("9e999999") desborda el contexto decimal: también
+    # es un monto inválido, no un error aritmético que corte el menú
+    try:
+        decimal = Decimal(str(valor).strip())
+        if not decimal.is_finite():
+            raise MontoError(f"Monto inválido: {valor!r}")
+        centavos = decimal * CENTAVOS
+        entero = centavos.to_integral_value()
+    except DecimalException:
+        raise MontoError(f"Monto inválido: {valor!r}") from None
+    if centavos != entero:
+        raise MontoError(f"El monto no puede tener más de dos decimales: {valor}")
+    return int(entero)
+
+def formatear(centavos):
+    signo = "-" if centavos < 0 else ""
+    pesos, resto = divmod(abs(centavos), CENTAVOS)
+    return f"{signo}{pesos}.{resto:02d}"
+
+# Operaciones masivas sobre columnas de saldos (array('q') de centavos,
+# como Banco.saldos). Con numpy (opcional) intereses y comisiones son una
+# pasada vectorizada sobre el mismo búfer, sin copiarlo; sin numpy, o si
+# el producto por la tasa pudiera desbordar int64, se recorre en Python.
+
+def total(saldos):
+    return sum(saldos)
+
+def _columna(saldos):
+    return np.frombuffer(saldos, dtype=np.int64)
+
+def _arreglo(columna):
+    resultado = array('q')
+    resultado.frombytes(columna.tobytes())
+    return resultado
+
+# Interés de cada saldo positivo, en centavos
+def intereses(saldos, tasa_pb):
+    mitad = PUNTOS_BASICOS // 2
+    if np is not None and len(saldos):
+        columna = _columna(saldos)
+        limite = (np.iinfo(np.int64).max - mitad) // max(abs(tasa_pb), 1)
+        if -limite <= columna.min() and columna.max() <= limite:
+            return _arreglo(np.where(columna > 0, (columna * tasa_pb + mitad) // PUNTOS_BASICOS, 0))
+    return array('q', [(s * tasa_pb + mitad) // PUNTOS_BASICOS if s > 0 else 0 for s in saldos])
+
+# Comisión fija a los saldos bajo 'minimo', sin dejar ninguno en negativo
+def comisiones(saldos, comision, minimo):
+    if np is not None and len(saldos):
+        columna = _columna(saldos)
+        return _arreglo(np.where(columna >= minimo, 0, np.clip(columna, 0, comision)))
+    return array('q', [0 if s >= minimo else comision if s >= comision else s if s > 0 else 0
+                       for s in saldos])
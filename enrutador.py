@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left, insort
+
+# Elección del cajero para un retiro (o un depósito) entre muchos. Cada
+# Dispensador lleva su efectivo total al día (Dispensador.efectivo, que
+# cambia con cada cambio de billetes) y le avisa al enrutador, que mantiene
+# los cajeros ordenados de más a menos efectivo: todos juntos y por
+# etiqueta de ubicación, en listas ordenadas de claves (-efectivo, id).
+#
+# Para un retiro de P pesos, los cajeros con al menos P en efectivo son un
+# prefijo de esa lista (una búsqueda binaria); se recorre en orden y se
+# elige el primero que puede entregar el monto exacto con sus billetes
+# (Dispensador.puede_dispensar, O(1) sobre su máscara de montos). Atiende
+# el que más efectivo tiene, así los cajeros se vacían parejo; el depósito
+# va al que menos tiene. Dentro del cajero el desglose de un retiro
+# enrutado cuida las denominaciones escasas (ver retirar_en_red).
+#
+# Etiquetas: la ubicación partida en "/" o "," y en minúsculas. "CDMX /
+# Centro / Sucursal Norte" tiene las etiquetas cdmx, centro y sucursal
+# norte; elegir con etiqueta "Centro" solo mira esos cajeros.
+#
+# Bloqueos: un Dispensador avisa con su bloqueo tomado y después toma el
+# del enrutador. Elegir, con el del enrutador tomado, solo prueba bloqueos
+# de dispensadores sin esperar: un cajero ocupado se deja para el final y
+# se consulta ya sin el bloqueo del enrutador.
+
+def etiquetas(ubicacion):
+    partes = (parte.strip().lower() for parte in ubicacion.replace(",", "/").split("/"))
+    return frozenset(parte for parte in partes if parte)
+
+class Enrutador:
+    def __init__(self, dispensadores=()):
+        self._bloqueo = threading.Lock()
+        # id -> Dispensador
+        self._dispensadores = {}
+        # id -> (clave actual, etiquetas)
+        self._claves = {}
+        self._todos = []
+        # etiqueta -> lista ordenada de claves
+        self._por_etiqueta = {}
+        for dispensador in dispensadores:
+            self.agregar(dispensador)
+
+    def __len__(self):
+        return len(self._dispensadores)
+
+    def __contains__(self, dispensador_id):
+        return dispensador_id in self._dispensadores
+
+    def _listas(self, grupo):
+        yield self._todos
+        for etiqueta in grupo:
+            yield self._por_etiqueta.setdefault(etiqueta, [])
+
+    # Registra un dispensador, o lo vuelve a registrar si cambió su ubicación
+    def agregar(self, dispensador):
+        with dispensador.bloqueo, self._bloqueo:
+            self._quitar(dispensador.id)
+            clave = (-dispensador.efectivo, dispensador.id)
+            grupo = etiquetas(dispensador.ubicacion)
+            for orden in self._listas(grupo):
+                insort(orden, clave)
+            self._dispensadores[dispensador.id] = dispensador
+            self._claves[dispensador.id] = (clave, grupo)
+            dispensador._enrutador = self
+
+    def _quitar(self, dispensador_id):
+        anterior = self._claves.pop(dispensador_id, None)
+        if anterior is None:
+            return
+        clave, grupo = anterior
+        for orden in self._listas(grupo):
+            del orden[bisect_left(orden, clave)]
+        for etiqueta in grupo:
+            if not self._por_etiqueta[etiqueta]:
+                del self._por_etiqueta[etiqueta]
+        self._dispensadores.pop(dispensador_id)._enrutador = None
+
+    # Lo llama el Dispensador, con su bloqueo tomado, cuando cambia su efectivo
+    def _mover(self, dispensador):
+        with self._bloqueo:
+            clave, grupo = self._claves[dispensador.id]
+            nueva = (-dispensador.efectivo, dispensador.id)
+            if nueva == clave:
+                return
+            for orden in self._listas(grupo):
+                del orden[bisect_left(orden, clave)]
+                insort(orden, nueva)
+            self._claves[dispensador.id] = (nueva, grupo)
+
+    def _orden(self, etiqueta):
+        if etiqueta is None:
+            return self._todos
+        return self._por_etiqueta.get(etiqueta.strip().lower(), ())
+
+    # Efectivo del cajero más cargado: el tope de un retiro
+    def efectivo_maximo(self, etiqueta=None):
+        with self._bloqueo:
+            orden = self._orden(etiqueta)
+            return -orden[0][0] if orden else 0
+
+    # Cajero con más efectivo que puede entregar exactamente 'pesos', o None.
+    # 'excluir': ids ya probados (un retiro concurrente se llevó los billetes)
+    def elegir(self, pesos, etiqueta=None, excluir=()):
+        ocupados = []
+        with self._bloqueo:
+            orden = self._orden(etiqueta)
+            # Claves (-efectivo, id) con efectivo >= pesos
+            fin = bisect_left(orden, (1 - pesos,))
+            dispensadores = self._dispensadores
+            for i in range(fin):
+                dispensador = dispensadores[orden[i][1]]
+                if dispensador.id in excluir:
+                    continue
+                if not dispensador.bloqueo.acquire(blocking=False):
+                    ocupados.append(dispensador)
+                    continue
+                try:
+                    if dispensador.puede_dispensar(pesos):
+                        return dispensador
+                finally:
+                    dispensador.bloqueo.release()
+        for dispensador in ocupados:
+            with dispensador.bloqueo:
+                if dispensador.efectivo >= pesos and dispensador.puede_dispensar(pesos):
+                    return dispensador
+        return None
+
+    # Cajero con menos efectivo, para un depósito
+    def elegir_deposito(self, etiqueta=None):
+        with self._bloqueo:
+            orden = self._orden(etiqueta)
+            return self._dispensadores[orden[-1][1]] if orden else None
@@ -0,0 +1,102 @@
+import os
+import struct
+import zlib
+from array import array
+
+# Formato binario de instantáneas del banco. Un archivo es una cabecera y
+# una serie de secciones (etiqueta de 4 bytes, largo, contenido), cerrado
+# con el CRC32 de todo lo anterior. Las columnas numéricas se guardan como
+# arreglos crudos y los textos como un solo bloque UTF-8 separado por NUL,
+# así cargar millones de registros es un frombytes y un split por columna.
+
+MAGICO = b'CAJINST1'
+# Versión 2: saldos y montos en centavos (int64)
+VERSION = 2
+BASE = 1
+DELTA = 2
+# magico, version, tipo, seq_inicio, seq_fin (registros del diario cubiertos).
+# Una base cubre todo hasta seq_fin y en seq_inicio lleva el número del
+# último delta que ya incluye.
+CABECERA = struct.Struct('<8sHH4xQQ')
+SECCION = struct.Struct('<4sQ')
+CRC = struct.Struct('<I')
+
+class InstantaneaError(Exception):
+    pass
+
+def empaquetar_textos(textos):
+    bloque = "\0".join(textos)
+    if bloque.count("\0") != max(len(textos) - 1, 0):
+        raise InstantaneaError("Los textos no pueden contener el carácter NUL")
+    return bloque.encode("utf-8")
+
+def desempaquetar_textos(datos, cantidad):
+    if cantidad == 0:
+        return []
+    return datos.decode("utf-8").split("\0")
+
+def empaquetar_numeros(valores, codigo='q'):
+    if isinstance(valores, array) and valores.typecode == codigo:
+        return valores.tobytes()
+    return array(codigo, valores).tobytes()
+
+def desempaquetar_numeros(datos, codigo='q'):
+    valores = array(codigo)
+    valores.frombytes(datos)
+    return valores
+
+# Escribe a un temporal, fsync y rename: quien lea nunca ve un archivo a medias
+def escribir(ruta, tipo, seq_inicio, seq_fin, secciones):
+    temporal = ruta + ".tmp"
+    crc = 0
+    with open(temporal, "wb") as archivo:
+        def escribir_bloque(bloque):
+            nonlocal crc
+            crc = zlib.crc32(bloque, crc)
+            archivo.write(bloque)
+        escribir_bloque(CABECERA.pack(MAGICO, VERSION, tipo, seq_inicio, seq_fin))
+        for etiqueta, contenido in secciones.items():
+            escribir_bloque(SECCION.pack(etiqueta, len(contenido)))
+            escribir_bloque(contenido)
+        archivo.write(CRC.pack(crc))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+    directorio = os.open(os.path.dirname(os.path.abspath(ruta)), os.O_RDONLY)
+    try:
+        os.fsync(directorio)
+    finally:
+        os.close(directorio)
+
+# Solo la cabecera: (tipo, seq_inicio, seq_fin), sin leer las secciones
+def leer_cabecera(ruta):
+    with open(ruta, "rb") as archivo:
+        datos = archivo.read(CABECERA.size)
+    if len(datos) < CABECERA.size:
+        raise InstantaneaError(f"Instantánea incompleta: {ruta}")
+    magico, version, tipo, seq_inicio, seq_fin = CABECERA.unpack(datos)
+    if magico != MAGICO or version != VERSION:
+        raise InstantaneaError(f"Formato de instantánea no reconocido en {ruta}")
+    return tipo, seq_inicio, seq_fin
+
+# Devuelve (tipo, seq_inicio, seq_fin, {etiqueta: bytes})
+def leer(ruta):
+    with open(ruta, "rb") as archivo:
+        datos = archivo.read()
+    if len(datos) < CABECERA.size + CRC.size:
+        raise InstantaneaError(f"Instantánea incompleta: {ruta}")
+    cuerpo = memoryview(datos)[:-CRC.size]
+    if zlib.crc32(cuerpo) != CRC.unpack_from(datos, len(datos) - CRC.size)[0]:
+        raise InstantaneaError(f"CRC inválido en {ruta}")
+    magico, version, tipo, seq_inicio, seq_fin = CABECERA.unpack_from(datos, 0)
+    if magico != MAGICO or version != VERSION:
+        raise InstantaneaError(f"Formato de instantánea no reconocido en {ruta}")
+
+    secciones = {}
+    offset = CABECERA.size
+    while offset < len(cuerpo):
+        etiqueta, largo = SECCION.unpack_from(datos, offset)
+        offset += SECCION.size
+        secciones[etiqueta] = bytes(cuerpo[offset:offset + largo])
+        offset += largo
+    return tipo, seq_inicio, seq_fin, secciones
@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Métricas en proceso: contadores, histogramas de latencia y eventos
+# recientes, exportables en formato de texto de Prometheus y como JSON.
+# Se activan y desactivan en tiempo de ejecución; desactivadas, cada punto
+# de medición solo consulta la variable 'activas'.
+
+activas = False
+
+# Límites superiores de los histogramas de latencia, en segundos
+LIMITES_LATENCIA = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                    0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+MAX_EVENTOS = 256
+
+_AYUDAS = {
+    "cajero_operaciones_total": "Operaciones atendidas por tipo y resultado",
+    "cajero_operacion_segundos": "Latencia de cada operación",
+    "cajero_desglose_fallas_total": "Retiros o desgloses rechazados por motivo",
+    "cajero_desglose_memo_total": "Consultas al memo de desgloses",
+    "cajero_agotamientos_total": "Denominaciones que quedaron en cero tras un retiro",
+    "cajero_credenciales_cache_total": "Verificaciones de credenciales resueltas o no por el caché",
+    "cajero_pagos_lote_total": "Facturas liquidadas por lotes según su estado",
+    "cajero_transferencias_particiones_total": "Transferencias entre particiones confirmadas o abortadas",
+    "cajero_antifraude_total": "Operaciones marcadas por el control antifraude, por regla y modo",
+    "cajero_enrutamiento_total": "Retiros enrutados: cajero elegido, reintento o ningún cajero",
+}
+
+def activar():
+    global activas
+    activas = True
+
+def desactivar():
+    global activas
+    activas = False
+
+class Histograma:
+    __slots__ = ('cuentas', 'suma', 'total')
+
+    def __init__(self):
+        # Una cuenta por límite más la de +Inf, sin acumular
+        self.cuentas = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            # Claves (nombre, etiquetas) con etiquetas como tupla de pares
+            self.contadores = {}
+            self.histogramas = {}
+            self.eventos = deque(maxlen=MAX_EVENTOS)
+
+    def contar(self, nombre, etiquetas=(), valor=1):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, segundos, etiquetas=()):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma()
+            histograma.cuentas[bisect_left(LIMITES_LATENCIA, segundos)] += 1
+            histograma.suma += segundos
+            histograma.total += 1
+
+    # Contador y latencia de una operación con un solo bloqueo
+    def operacion(self, clave_contador, clave_histograma, segundos):
+        with self._lock:
+            self.contadores[clave_contador] = self.contadores.get(clave_contador, 0) + 1
+            histograma = self.histogramas.get(clave_histograma)
+            if histograma is None:
+                histograma = self.histogramas[clave_histograma] = Histograma()
+            histograma.cuentas[bisect_left(LIMITES_LATENCIA, segundos)] += 1
+            histograma.suma += segundos
+            histograma.total += 1
+
+    def evento(self, nombre, **datos):
+        datos["evento"] = nombre
+        datos["fecha"] = time.time()
+        with self._lock:
+            self.eventos.append(datos)
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                "contadores": [{"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                               for (nombre, etiquetas), valor in sorted(self.contadores.items())],
+                "histogramas": [{"nombre": nombre, "etiquetas": dict(etiquetas),
+                                 "limites": list(LIMITES_LATENCIA), "cuentas": list(h.cuentas),
+                                 "suma": h.suma, "total": h.total}
+                                for (nombre, etiquetas), h in sorted(self.histogramas.items())],
+                "eventos": list(self.eventos),
+            }
+
+    def json(self):
+        return json.dumps(self.instantanea(), ensure_ascii=False)
+
+    def prometheus(self):
+        with self._lock:
+            contadores = sorted(self.contadores.items())
+            histogramas = sorted((clave, list(h.cuentas), h.suma, h.total)
+                                 for clave, h in self.histogramas.items())
+        lineas = []
+        anterior = None
+        for (nombre, etiquetas), valor in contadores:
+            if nombre != anterior:
+                _cabecera(lineas, nombre, "counter")
+                anterior = nombre
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        for (nombre, etiquetas), cuentas, suma, total in histogramas:
+            if nombre != anterior:
+                _cabecera(lineas, nombre, "histogram")
+                anterior = nombre
+            acumulado = 0
+            for limite, cuenta in zip(LIMITES_LATENCIA + ("+Inf",), cuentas):
+                acumulado += cuenta
+                le = etiquetas + (("le", limite if limite == "+Inf" else repr(limite)),)
+                lineas.append(f"{nombre}_bucket{_etiquetas(le)} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma!r}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {total}")
+        return "\n".join(lineas) + "\n"
+
+def _cabecera(lineas, nombre, tipo):
+    if nombre in _AYUDAS:
+        lineas.append(f"# HELP {nombre} {_AYUDAS[nombre]}")
+    lineas.append(f"# TYPE {nombre} {tipo}")
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = ",".join('%s="%s"' % (clave, str(valor).replace("\\", "\\\\").replace('"', '\\"')
+                                  .replace("\n", "\\n"))
+                     for clave, valor in etiquetas)
+    return "{" + pares + "}"
+
+REGISTRO = Registro()
+
+def contar(nombre, etiquetas=(), valor=1):
+    REGISTRO.contar(nombre, etiquetas, valor)
+
+def evento(nombre, **datos):
+    REGISTRO.evento(nombre, **datos)
+
+# Decorador para las operaciones: cuenta cada llamada con su resultado
+# ("ok", "rechazada" si devuelve None, o el nombre de la excepción) y
+# registra su latencia
+def medir(operacion):
+    def decorador(funcion):
+        etiqueta = (("operacion", operacion),)
+        claves = {}
+
+        def registrar(segundos, resultado):
+            clave = claves.get(resultado)
+            if clave is None:
+                clave = claves[resultado] = ("cajero_operaciones_total",
+                                             etiqueta + (("resultado", resultado),))
+            REGISTRO.operacion(clave, ("cajero_operacion_segundos", etiqueta), segundos)
+
+        @wraps(funcion)
+        def medida(*args, **kwargs):
+            if not activas:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                valor = funcion(*args, **kwargs)
+            except Exception as e:
+                registrar(time.perf_counter() - inicio, type(e).__name__)
+                raise
+            registrar(time.perf_counter() - inicio, "ok" if valor is not None else "rechazada")
+            return valor
+        return medida
+    return decorador
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            cuerpo = REGISTRO.prometheus().encode("utf-8")
+            tipo = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            cuerpo = REGISTRO.json().encode("utf-8")
+            tipo = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+# Expone /metrics (Prometheus) y /metrics.json en un hilo aparte
+def servir_http(puerto, host="127.0.0.1"):
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
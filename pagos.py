@@ -0,0 +1,452 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from json.encoder import encode_basestring
+
+import metricas
+from diario import Diario, DiarioError
+from dinero import MontoError, a_centavos, formatear
+from procesador_lotes import leer_csv, leer_jsonl
+from Sistema_de_Cajero import (SERVICIOS, GeneradorReferencias, Movimiento, bloqueo_cuenta,
+                               crear_banco_ejemplo, reaplicar_diario)
+
+# Liquidación de facturas de servicios por lotes, idempotente. Cada factura
+# trae una clave de idempotencia: una factura cuya clave ya se aplicó no se
+# cobra de nuevo y devuelve la referencia del primer cobro, así reintentar
+# un archivo o un mensaje de la cola es seguro.
+#
+# Campos de cada factura (CSV o JSONL, como procesador_lotes):
+#   clave     clave de idempotencia, única por factura
+#   cuenta    número de la cuenta a debitar
+#   servicio  Luz | Agua | Gas | Internet
+#   monto     en pesos con hasta dos decimales
+#
+# Cada lote se agrupa por cuenta: una cuenta se bloquea y su saldo se
+# escribe una vez por lote, no una vez por factura, y el diario se
+# sincroniza una vez al cerrar el lote. La clave y la referencia de cada
+# cobro van en el mismo registro del diario que su movimiento: al abrir el
+# diario se reaplican los saldos y se cargan las claves a la vez, así una
+# caída no puede dejar un cobro sin su clave. Sin diario nada es durable:
+# ni los saldos ni las claves sobreviven al proceso.
+#
+# Las cuentas se reparten en PARTICIONES fijas (crc32 del número), cada una
+# con su archivo de diario; con varios procesos cada uno atiende algunas
+# particiones y no comparten bloqueos. El reparto no depende de la cantidad
+# de procesos: una cuenta cae siempre en el mismo diario, con sus saldos y
+# sus claves. Una clave es única por cuenta (la misma clave en otra cuenta
+# es otra factura). Cada proceso genera referencias con su propio nodo a
+# partir de NODO_PAGOS; el nodo 0 es el de los menús (REFERENCIAS).
+
+APLICADO = "aplicado"
+DUPLICADO = "duplicado"
+RECHAZADO = "rechazado"
+LOTE = 10_000
+CAMPOS_RESULTADO = ("clave", "cuenta", "estado", "referencia", "error")
+
+PARTICIONES = 16
+NODO_PAGOS = 1
+
+_SERVICIOS = frozenset(nombre for nombre, _, _ in SERVICIOS.values())
+# Las referencias se guardan como valor * _NODOS + nodo
+_NODOS = 1000
+
+class PagoError(ValueError):
+    pass
+
+def resumen_clave(cuenta_numero, clave):
+    datos = f"{cuenta_numero}\0{clave}".encode("utf-8")
+    return hashlib.blake2b(datos, digest_size=16).digest()
+
+def _referencia(codigo):
+    valor, nodo = divmod(codigo, _NODOS)
+    return f"REF-{valor:016d}-{nodo:03d}"
+
+# Claves ya aplicadas: resumen de 16 bytes -> código de referencia, en
+# memoria. Lo durable son los registros del diario, que llevan la clave
+# junto al movimiento; cargar(diario) las vuelve a leer al abrirlo.
+class IndiceIdempotencia:
+    def __init__(self):
+        self._claves = {}
+
+    def cargar(self, diario):
+        self._claves.update(diario.claves())
+
+    def buscar(self, resumen):
+        return self._claves.get(resumen)
+
+    # pares (resumen, código de referencia) de un lote ya sincronizado
+    def agregar_lote(self, pares):
+        self._claves.update(pares)
+
+    def __len__(self):
+        return len(self._claves)
+
+    def __contains__(self, resumen):
+        return resumen in self._claves
+
+# clave y cuenta de una factura para el resultado: una línea que no es un
+# objeto no tiene ninguna y un valor que no es texto se muestra como texto
+def _campos(factura):
+    if not isinstance(factura, dict):
+        return None, None
+    clave, numero = factura.get("clave"), factura.get("cuenta")
+    return (clave if clave is None or type(clave) is str else str(clave),
+            numero if numero is None or type(numero) is str else str(numero))
+
+def en_lotes(facturas, lote=LOTE):
+    iterador = iter(facturas)
+    while True:
+        bloque = list(itertools.islice(iterador, lote))
+        if not bloque:
+            return
+        yield bloque
+
+# Lotes desde una queue.Queue: un lote se cierra al llegar a 'lote' facturas
+# o cuando la cola queda 'espera' segundos sin mensajes; 'fin' la termina
+def lotes_de_cola(cola, lote=LOTE, espera=0.5, fin=None):
+    bloque = []
+    while True:
+        try:
+            factura = cola.get(timeout=espera if bloque else None)
+        except queue.Empty:
+            yield bloque
+            bloque = []
+            continue
+        if factura is fin:
+            if bloque:
+                yield bloque
+            return
+        bloque.append(factura)
+        if len(bloque) >= lote:
+            yield bloque
+            bloque = []
+
+# 'diarios': los que se sincronizan al cerrar cada lote; por omisión el del
+# banco, si tiene
+class ProcesadorPagos:
+    def __init__(self, banco, indice=None, referencias=None, diarios=None):
+        self.banco = banco
+        self.indice = indice if indice is not None else IndiceIdempotencia()
+        self.referencias = (referencias if referencias is not None
+                            else GeneradorReferencias(nodo=NODO_PAGOS))
+        if diarios is None:
+            diarios = [] if banco.diario is None else [banco.diario]
+        self.diarios = diarios
+        self.aplicados = 0
+        self.duplicados = 0
+        self.rechazados = 0
+        self.monto_aplicado = 0
+
+    # Aplica un lote y devuelve un resultado (clave, cuenta, estado,
+    # referencia, error) por factura, en el orden del lote
+    def aplicar_lote(self, facturas):
+        resultados = [None] * len(facturas)
+        por_cuenta = {}
+        en_lote = {}
+        repetidas = []
+        # Búsquedas fuera del ciclo: se recorre una vez por factura
+        buscar = self.indice.buscar
+        cuenta_de = self.banco.cuentas_por_numero.get
+        for i, factura in enumerate(facturas):
+            clave, numero = _campos(factura)
+            try:
+                if not isinstance(factura, dict):
+                    raise TypeError(f"se esperaba un objeto, no {type(factura).__name__}")
+                if "_invalida" in factura:
+                    raise PagoError(f"Línea inválida: {factura['_invalida']}")
+                if clave is None or clave == "":
+                    raise PagoError("Falta la clave de idempotencia")
+                servicio = factura.get("servicio")
+                if servicio not in _SERVICIOS:
+                    raise PagoError(f"Servicio desconocido: {servicio}")
+                monto = a_centavos(factura["monto"])
+                if monto <= 0:
+                    raise PagoError("El monto debe ser mayor a cero")
+            except (PagoError, MontoError) as e:
+                resultados[i] = (clave, numero, RECHAZADO, None, str(e))
+                continue
+            except (KeyError, TypeError, ValueError) as e:
+                resultados[i] = (clave, numero, RECHAZADO, None, f"Factura mal formada: {e!r}")
+                continue
+            resumen = resumen_clave(numero, clave)
+            codigo = buscar(resumen)
+            if codigo is not None:
+                resultados[i] = (clave, numero, DUPLICADO, _referencia(codigo), "")
+                continue
+            primera = en_lote.setdefault(resumen, i)
+            if primera != i:
+                repetidas.append((i, primera))
+                continue
+            cuenta = cuenta_de(numero)
+            if cuenta is None:
+                resultados[i] = (clave, numero, RECHAZADO, None, "Cuenta no encontrada")
+                continue
+            pagos = por_cuenta.get(cuenta)
+            if pagos is None:
+                por_cuenta[cuenta] = [(i, clave, resumen, servicio, monto)]
+            else:
+                pagos.append((i, clave, resumen, servicio, monto))
+
+        # Un rango de referencias para todo el lote; los rechazos dejan huecos
+        valores = iter(self.referencias.reservar(sum(map(len, por_cuenta.values()))))
+        nodo = self.referencias.nodo
+        nuevos = []
+        aplicado = 0
+        for cuenta, pagos in por_cuenta.items():
+            numero = cuenta.numero
+            agregar = cuenta.movimientos.append
+            with bloqueo_cuenta(cuenta):
+                saldo = cuenta.saldo
+                for i, clave, resumen, servicio, monto in pagos:
+                    if monto > saldo:
+                        resultados[i] = (clave, numero, RECHAZADO, None,
+                                         "Saldo insuficiente para realizar el pago")
+                        continue
+                    # El registro va primero: si el diario falla, la
+                    # factura se rechaza sin cobrar ni guardar su clave
+                    codigo = next(valores) * _NODOS + nodo
+                    try:
+                        agregar(Movimiento("PAGO_SERVICIO", -monto, numero, servicio=servicio,
+                                           clave=resumen, referencia=codigo))
+                    except (DiarioError, OSError) as e:
+                        resultados[i] = (clave, numero, RECHAZADO, None, str(e))
+                        continue
+                    saldo -= monto
+                    aplicado += monto
+                    nuevos.append((resumen, codigo))
+                    resultados[i] = (clave, numero, APLICADO, _referencia(codigo), "")
+                cuenta.saldo = saldo
+        self.monto_aplicado += aplicado
+
+        for diario in self.diarios:
+            diario.sincronizar()
+        self.indice.agregar_lote(nuevos)
+
+        # Una clave repetida dentro del lote sigue a la primera aparición
+        for i, primera in repetidas:
+            clave, numero, estado, referencia, error = resultados[primera]
+            if estado == APLICADO:
+                estado = DUPLICADO
+            resultados[i] = (*_campos(facturas[i]), estado, referencia, error)
+
+        aplicados = len(nuevos)
+        duplicados = sum(1 for r in resultados if r[2] == DUPLICADO)
+        rechazados = len(resultados) - aplicados - duplicados
+        self.aplicados += aplicados
+        self.duplicados += duplicados
+        self.rechazados += rechazados
+        if metricas.activas:
+            for estado, cantidad in ((APLICADO, aplicados), (DUPLICADO, duplicados),
+                                     (RECHAZADO, rechazados)):
+                if cantidad:
+                    metricas.contar("cajero_pagos_lote_total", (("estado", estado),), cantidad)
+        return resultados
+
+    # Recorre un iterable de lotes (listas de facturas) y entrega los
+    # resultados de cada uno; con diario, los movimientos no esperan el fsync
+    # de a uno: se sincroniza al cerrar cada lote
+    def procesar_lotes(self, lotes):
+        for diario in self.diarios:
+            diario.durable = False
+        try:
+            for lote in lotes:
+                yield from self.aplicar_lote(lote)
+        finally:
+            for diario in self.diarios:
+                diario.sincronizar()
+                diario.durable = True
+
+    def procesar(self, facturas, lote=LOTE):
+        return self.procesar_lotes(en_lotes(facturas, lote))
+
+    def resumen(self):
+        return {"aplicados": self.aplicados, "duplicados": self.duplicados,
+                "rechazados": self.rechazados, "monto_aplicado": formatear(self.monto_aplicado)}
+
+    # Cierra el generador de referencias y los diarios
+    def cerrar(self):
+        self.referencias.cerrar()
+        for diario in self.diarios:
+            diario.cerrar()
+
+def particion_de(cuenta_numero):
+    return zlib.crc32(str(cuenta_numero).encode("utf-8")) % PARTICIONES
+
+def ruta_particion(ruta_diario, particion):
+    return f"{ruta_diario}.{particion:02d}"
+
+# Procesador para las particiones 'propias': el banco de fabrica_banco(),
+# con el diario de cada partición abierto en sus cuentas (saldos y claves
+# reaplicados) si hay 'ruta_diario', y las referencias de 'nodo' con su
+# tope en 'directorio'
+def abrir_procesador(fabrica_banco, propias, directorio, nodo, ruta_diario=None):
+    banco = fabrica_banco()
+    indice = IndiceIdempotencia()
+    diarios = {}
+    if ruta_diario:
+        for particion in propias:
+            diarios[particion] = Diario(ruta_particion(ruta_diario, particion))
+        for cuenta in banco.cuentas:
+            diario = diarios.get(particion_de(cuenta.numero))
+            if diario is not None:
+                cuenta.movimientos = diario
+        for diario in diarios.values():
+            reaplicar_diario(banco, 0, diario)
+            indice.cargar(diario)
+    referencias = GeneradorReferencias(nodo=nodo)
+    referencias.abrir(os.path.join(directorio, f"referencias-{nodo:03d}.tope"))
+    return ProcesadorPagos(banco, indice, referencias, list(diarios.values()))
+
+# Proceso 'proceso' de 'procesos': atiende las particiones p con
+# p % procesos == proceso, aplica los lotes que recibe y devuelve los
+# resultados por 'salida'. Al terminar envía (proceso, resumen).
+def _trabajador(proceso, procesos, fabrica_banco, directorio, ruta_diario, entrada, salida):
+    procesador = abrir_procesador(fabrica_banco, range(proceso, PARTICIONES, procesos),
+                                  directorio, NODO_PAGOS + proceso, ruta_diario)
+    for diario in procesador.diarios:
+        diario.durable = False
+    try:
+        for lote in iter(entrada.get, None):
+            salida.put(procesador.aplicar_lote(lote))
+    finally:
+        procesador.cerrar()
+    salida.put((proceso, procesador.resumen()))
+
+# Reparte 'facturas' por cuenta entre 'procesos' procesos (a lo sumo
+# PARTICIONES) y entrega los resultados a medida que llegan (agrupados por
+# lote, no en el orden de entrada). Al final 'resumenes' tiene el resumen
+# de cada proceso.
+def procesar_en_procesos(facturas, procesos, fabrica_banco, directorio, lote=LOTE,
+                         resumenes=None, ruta_diario=None):
+    procesos = min(procesos, PARTICIONES)
+    contexto = multiprocessing.get_context("spawn")
+    entradas = [contexto.Queue(maxsize=4) for _ in range(procesos)]
+    salida = contexto.Queue()
+    trabajadores = [contexto.Process(target=_trabajador, name=f"pagos-{p}",
+                                     args=(p, procesos, fabrica_banco, directorio, ruta_diario,
+                                           entradas[p], salida))
+                    for p in range(procesos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+
+    # Las facturas se reparten desde un hilo: el principal recoge resultados
+    # mientras tanto, así las colas acotadas no se trancan
+    def repartir():
+        pendientes = [[] for _ in range(procesos)]
+        try:
+            for factura in facturas:
+                # Una factura sin cuenta o que no es un objeto va a algún
+                # proceso igual, que la rechaza
+                p = particion_de(_campos(factura)[1]) % procesos
+                pendientes[p].append(factura)
+                if len(pendientes[p]) >= lote:
+                    entradas[p].put(pendientes[p])
+                    pendientes[p] = []
+            for p, bloque in enumerate(pendientes):
+                if bloque:
+                    entradas[p].put(bloque)
+        finally:
+            for entrada in entradas:
+                entrada.put(None)
+
+    repartidor = threading.Thread(target=repartir, name="pagos-reparto", daemon=True)
+    repartidor.start()
+    terminados = 0
+    try:
+        while terminados < procesos:
+            try:
+                mensaje = salida.get(timeout=1.0)
+            except queue.Empty:
+                if any(trabajador.exitcode not in (None, 0) for trabajador in trabajadores):
+                    raise PagoError("Un proceso de pagos terminó con error")
+                continue
+            if isinstance(mensaje, tuple):
+                terminados += 1
+                if resumenes is not None:
+                    resumenes[mensaje[0]] = mensaje[1]
+                continue
+            yield from mensaje
+    finally:
+        repartidor.join(timeout=1.0)
+        for trabajador in trabajadores:
+            trabajador.join(timeout=5.0)
+            if trabajador.is_alive():
+                trabajador.terminate()
+
+def escribir_resultados(resultados, salida, formato="jsonl"):
+    escritor = csv.writer(salida) if formato == "csv" else None
+    if escritor:
+        escritor.writerow(CAMPOS_RESULTADO)
+    for clave, cuenta, estado, referencia, error in resultados:
+        if escritor:
+            escritor.writerow((clave, cuenta, estado, referencia or "", error))
+        else:
+            salida.write(f'{{"clave": {"null" if clave is None else encode_basestring(str(clave))}, '
+                         f'"cuenta": {"null" if cuenta is None else encode_basestring(str(cuenta))}, '
+                         f'"estado": "{estado}", '
+                         f'"referencia": {"null" if referencia is None else encode_basestring(referencia)}, '
+                         f'"error": {encode_basestring(error)}}}\n')
+
+def _formato(ruta, indicado):
+    if indicado:
+        return indicado
+    return "csv" if ruta.endswith(".csv") else "jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Liquida facturas de servicios por lotes")
+    parser.add_argument("entrada", help="archivo CSV/JSONL de facturas ('-' para stdin)")
+    parser.add_argument("-o", "--salida", default="-", help="archivo de resultados ('-' para stdout)")
+    parser.add_argument("--formato-entrada", choices=("csv", "jsonl"))
+    parser.add_argument("--formato-salida", choices=("csv", "jsonl"))
+    parser.add_argument("--datos", default="pagos_datos",
+                        help="directorio de los topes de referencias")
+    parser.add_argument("--diario", help=f"diarios a recuperar y extender, uno por partición "
+                                         f"(RUTA.00 a RUTA.{PARTICIONES - 1:02d})")
+    parser.add_argument("--procesos", type=int, default=1,
+                        help=f"procesos, repartidos por cuenta (a lo sumo {PARTICIONES})")
+    parser.add_argument("--lote", type=int, default=LOTE)
+    args = parser.parse_args(argv)
+    os.makedirs(args.datos, exist_ok=True)
+
+    lector = leer_csv if _formato(args.entrada, args.formato_entrada) == "csv" else leer_jsonl
+    entrada = sys.stdin if args.entrada == "-" else open(args.entrada, newline="", encoding="utf-8")
+    salida = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    formato_salida = _formato(args.salida, args.formato_salida)
+    inicio = time.perf_counter()
+    try:
+        if args.procesos > 1:
+            resumenes = {}
+            escribir_resultados(procesar_en_procesos(lector(entrada), args.procesos,
+                                                     crear_banco_ejemplo, args.datos, args.lote,
+                                                     resumenes, args.diario),
+                                salida, formato_salida)
+            resumen = {campo: sum(r[campo] for r in resumenes.values())
+                       for campo in ("aplicados", "duplicados", "rechazados")}
+        else:
+            procesador = abrir_procesador(crear_banco_ejemplo, range(PARTICIONES), args.datos,
+                                          NODO_PAGOS, args.diario)
+            try:
+                escribir_resultados(procesador.procesar(lector(entrada), args.lote), salida,
+                                    formato_salida)
+            finally:
+                procesador.cerrar()
+            resumen = procesador.resumen()
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if salida is not sys.stdout:
+            salida.close()
+    resumen["segundos"] = round(time.perf_counter() - inicio, 3)
+    print(f"Facturas: {resumen}", file=sys.stderr)
+    return 0 if resumen["rechazados"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import re
+import shutil
+import sys
+
+# Salida de la interfaz de consola. Cada pantalla se arma en un buffer y se
+# escribe de una vez, junto con el mensaje de la siguiente entrada: en un
+# kiosco conectado por serie o SSH una pantalla es una sola escritura y no
+# una por línea. Limpiar es una secuencia ANSI, sin lanzar 'clear'.
+#
+# Modos (variable CAJERO_TERMINAL):
+#   ansi     colores y limpieza de pantalla; por omisión en una terminal
+#   simple   sin colores ni limpieza, para registros y ejecuciones sin
+#            terminal; por omisión si la salida no es una terminal
+# NO_COLOR (https://no-color.org) quita solo los colores.
+
+LIMPIAR = "\033[H\033[2J"
+_SECUENCIA_ANSI = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+# Líneas que quedan fuera de una página: título, encabezado y mensaje
+_LINEAS_FIJAS = 8
+
+class Pantalla:
+    def __init__(self, color=True, limpiar=True, salida=None):
+        self.color = color
+        self.limpieza = limpiar
+        # None: sys.stdout en el momento de escribir
+        self.salida = salida
+        self._partes = []
+
+    @classmethod
+    def desde_entorno(cls, salida=None):
+        modo = os.environ.get("CAJERO_TERMINAL")
+        if modo is None:
+            flujo = salida or sys.stdout
+            modo = "ansi" if hasattr(flujo, "isatty") and flujo.isatty() else "simple"
+        ansi = modo != "simple"
+        return cls(color=ansi and "NO_COLOR" not in os.environ, limpiar=ansi, salida=salida)
+
+    def escribir(self, texto=""):
+        self._partes.append(texto)
+        self._partes.append("\n")
+
+    # Lo pendiente se descarta: la pantalla nueva lo taparía antes de verse.
+    # Sin limpieza, una línea en blanco separa las pantallas en el registro.
+    def limpiar(self):
+        if self.limpieza:
+            self._partes = [LIMPIAR]
+        else:
+            self._partes.append("\n")
+
+    def volcar(self, extra=""):
+        if extra:
+            self._partes.append(extra)
+        if not self._partes:
+            return
+        texto = "".join(self._partes)
+        self._partes = []
+        if not self.color:
+            texto = _SECUENCIA_ANSI.sub("", texto)
+        salida = self.salida or sys.stdout
+        salida.write(texto)
+        salida.flush()
+
+    def pedir(self, mensaje=""):
+        self.volcar(mensaje)
+        return input()
+
+    # Alto de la terminal menos las líneas fijas, o 'por_omision' sin terminal
+    def filas_por_pagina(self, por_omision):
+        if not self.limpieza:
+            return por_omision
+        return max(5, shutil.get_terminal_size((0, por_omision + _LINEAS_FIJAS)).lines - _LINEAS_FIJAS)
+
+    # Recorre 'filas' (un iterador) de a una página, sin materializar el
+    # listado; cada página es una escritura
+    def paginar(self, encabezado, filas, por_pagina):
+        mostradas = 0
+        for fila in filas:
+            if mostradas and mostradas % por_pagina == 0:
+                if self.pedir(f"\n{mostradas} mostrados - Enter para ver más, 's' para salir: ").lower() == 's':
+                    return
+            if mostradas % por_pagina == 0:
+                self.escribir(encabezado)
+                self.escribir("-" * 60)
+            self.escribir(fila)
+            mostradas += 1
@@ -0,0 +1,507 @@
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+
+import metricas
+from credenciales import CredencialError
+from Sistema_de_Cajero import (GeneradorReferencias, Movimiento, OperacionError, abrir_diario,
+                               bloqueo_cuenta)
+from servidor_sesiones import ResultadoSesion, ServidorSesiones
+
+# Banco repartido en varios procesos. Cada partición es un proceso con su
+# propio Banco (los clientes con cliente_id % particiones == partición, sus
+# cuentas y sus dispensadores) que atiende sesiones completas como
+# ServidorSesiones. Un frente (BancoParticionado) reparte las sesiones por
+# cliente y coordina las transferencias entre particiones.
+#
+# Transferencia entre particiones, en dos fases con presunción de aborto:
+#   1. La partición de origen retiene el monto (lo descuenta del saldo sin
+#      escribir el movimiento) y registra la transferencia como preparada.
+#   2. El frente pide a la partición de destino que prepare el crédito: si
+#      la cuenta o el cliente no existe, vota que no.
+#   3. Si ambas votaron que sí, el frente registra la decisión (fsync): ese
+#      es el punto de no retorno. Después pide confirmar a las dos: el
+#      origen escribe el débito y el destino acredita.
+#   4. Si no, el origen devuelve lo retenido.
+# Las operaciones siguientes de la misma sesión ya ven el saldo sin lo
+# retenido; el destino recibe el dinero cuando el frente confirma, al
+# terminar el lote.
+# Con 'directorio', cada partición tiene su diario de movimientos y su
+# registro de transferencias, y el frente su registro de decisiones. Al
+# arrancar, una partición vuelve a retener lo preparado sin resolver (salvo
+# lo que ya llegó al diario) y el frente resuelve esas dudas: confirma lo
+# que tiene decidido y aborta el resto. Así el dinero retenido nunca se
+# pierde ni se acredita dos veces. Si una partición cae con el frente
+# andando, el frente falla (ParticionError) y hay que reiniciar todo.
+
+# Estados del registro de transferencias
+PREPARADA = 1
+CONFIRMADA = 2
+ABORTADA = 3
+# Solo en el registro del frente: las dos partes ya resolvieron
+FIN = 4
+# Papel de la partición en una transferencia
+DEBITO = 1
+CREDITO = 2
+
+# Los identificadores de transferencia son valor * _NODOS + partición
+_NODOS = 1000
+_DESTINO_NO_ENCONTRADO = "Cuenta o cliente destinatario no encontrado"
+
+class ParticionError(Exception):
+    pass
+
+def particion_cliente(cliente_id, particiones):
+    return cliente_id % particiones
+
+def _texto(campo):
+    return campo.rstrip(b'\0').decode('utf-8')
+
+# Registro de solo-agregado con registros fijos y CRC32, como el diario;
+# un registro incompleto o con CRC inválido al final se descarta al abrir.
+# Sin ruta solo vive en memoria (no hay nada que recuperar).
+class RegistroTransferencias:
+    # transferencia, estado, papel, monto, fecha (microsegundos), posición
+    # del diario al preparar, cuenta, contraparte, crc32
+    REGISTRO = struct.Struct('<QBB6xqqQ24s24sI')
+    _SIN_CRC = struct.Struct('<QBB6xqqQ24s24s')
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        # Registros encontrados al abrir, para recuperar
+        self.leidos = []
+        self._archivo = None
+        if ruta is None:
+            return
+        self._archivo = open(ruta, "a+b")
+        self._archivo.seek(0)
+        datos = self._archivo.read()
+        tamano, largo = self.REGISTRO.size, self._SIN_CRC.size
+        validos = 0
+        for offset in range(0, len(datos) - tamano + 1, tamano):
+            cuerpo = datos[offset:offset + largo]
+            if zlib.crc32(cuerpo) != struct.unpack_from('<I', datos, offset + largo)[0]:
+                break
+            tx, estado, papel, monto, fecha, seq, cuenta, contraparte = self._SIN_CRC.unpack(cuerpo)
+            self.leidos.append((tx, estado, papel, monto, fecha, seq, _texto(cuenta),
+                                _texto(contraparte)))
+            validos = offset + tamano
+        if validos != len(datos):
+            self._archivo.truncate(validos)
+
+    # Una escritura por lote; con sincronizar, un fsync antes de volver
+    def agregar_lote(self, registros, sincronizar=True):
+        if not registros or self._archivo is None:
+            return
+        empaquetar = self._SIN_CRC.pack
+        partes = []
+        for tx, estado, papel, monto, fecha, seq, cuenta, contraparte in registros:
+            cuerpo = empaquetar(tx, estado, papel, monto, fecha, seq, (cuenta or "").encode('utf-8'),
+                                (contraparte or "").encode('utf-8'))
+            partes.append(cuerpo)
+            partes.append(struct.pack('<I', zlib.crc32(cuerpo)))
+        self._archivo.write(b"".join(partes))
+        self._archivo.flush()
+        if sincronizar:
+            os.fsync(self._archivo.fileno())
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+# Lado de una partición: atiende sesiones de sus clientes y participa de
+# las transferencias hacia o desde otras particiones
+class Particion(ServidorSesiones):
+    def __init__(self, banco, particion, particiones, registro=None, referencias=None):
+        super().__init__(banco, hilos=1)
+        self.particion = particion
+        self.particiones = particiones
+        self.registro = registro if registro is not None else RegistroTransferencias()
+        self.referencias = referencias if referencias is not None else GeneradorReferencias(particion)
+        # transferencia -> (papel, cuenta, contraparte, monto, fecha, posición del diario)
+        self.pendientes = {}
+        self._preparadas = []
+        self._recuperar()
+
+    # Lo preparado sin resolver vuelve a quedar pendiente. Si el movimiento
+    # ya está en el diario la caída fue entre el diario y el registro: la
+    # transferencia se da por confirmada.
+    def _recuperar(self):
+        abiertas = {}
+        for tx, estado, papel, monto, fecha, seq, cuenta, contraparte in self.registro.leidos:
+            if estado == PREPARADA:
+                abiertas[tx] = (papel, cuenta, contraparte, monto, fecha, seq)
+            else:
+                abiertas.pop(tx, None)
+        self.registro.leidos = []
+        if not abiertas:
+            return
+        escritos = set()
+        diario = self.banco.diario
+        if diario is not None:
+            desde = min(seq for *_, seq in abiertas.values())
+            for seq in range(desde, diario.total):
+                _, fecha, tipo, _, monto, cuenta, *_ = diario.vista[seq]
+                if tipo == "TRANSFERENCIA":
+                    escritos.add((cuenta, fecha, monto))
+        confirmadas = []
+        for tx, (papel, numero, contraparte, monto, fecha, seq) in abiertas.items():
+            if (numero, fecha, monto if papel == CREDITO else -monto) in escritos:
+                confirmadas.append((tx, CONFIRMADA, papel, monto, fecha, seq, numero, contraparte))
+                continue
+            cuenta = self.banco.cuentas_por_numero[numero]
+            if papel == DEBITO:
+                with bloqueo_cuenta(cuenta):
+                    cuenta.saldo -= monto
+            self.pendientes[tx] = (papel, numero, contraparte, monto, fecha, seq)
+        self.registro.agregar_lote(confirmadas)
+
+    # Un cliente que agotó sus intentos no tumba el lote entero
+    def atender(self, sesion):
+        try:
+            return super().atender(sesion)
+        except CredencialError:
+            return ResultadoSesion(False, None)
+
+    def _es_local(self, destino):
+        if isinstance(destino, str):
+            return destino in self.banco.cuentas_por_numero
+        return particion_cliente(destino, self.particiones) == self.particion
+
+    def _ejecutar(self, cuenta, dispensador, operacion):
+        if operacion[0] == "transferencia" and not self._es_local(operacion[1]):
+            return self._retener(cuenta, operacion[1], operacion[2])
+        return super()._ejecutar(cuenta, dispensador, operacion)
+
+    # Primera fase en el origen: devuelve el identificador de la
+    # transferencia, que el frente reemplaza por el resultado final
+    def _retener(self, cuenta, destino, monto):
+        if type(monto) is not int:
+            raise OperacionError(f"Monto inválido: {monto!r} (se esperan centavos enteros)")
+        if monto < 1:
+            raise OperacionError("El monto mínimo a transferir es $0.01")
+        # El destino todavía no está resuelto: antifraude lo revisa tal como
+        # vino y la anota recién al confirmarla (ver resolver)
+        with bloqueo_cuenta(cuenta):
+            if monto > cuenta.saldo:
+                raise OperacionError("Saldo insuficiente para realizar la transferencia")
+            motivo = self.banco.antifraude.revisar_transferencia(cuenta.numero, destino, monto)
+            if motivo:
+                raise OperacionError(motivo)
+            cuenta.saldo -= monto
+        tx = self.referencias.reservar(1)[0] * _NODOS + self.particion
+        fecha = time.time_ns() // 1000
+        seq = self.banco.diario.total if self.banco.diario is not None else 0
+        self.pendientes[tx] = (DEBITO, cuenta.numero, destino, monto, fecha, seq)
+        self._preparadas.append((tx, PREPARADA, DEBITO, monto, fecha, seq, cuenta.numero, str(destino)))
+        return tx
+
+    # Atiende un lote de sesiones con un solo fsync del diario y del
+    # registro al final. Devuelve los resultados y las transferencias a
+    # otras particiones: (sesión, operación, transferencia, cuenta, destino,
+    # monto, fecha).
+    def atender_lote(self, sesiones):
+        diario = self.banco.diario
+        if diario is not None:
+            diario.durable = False
+        try:
+            resultados = [self.atender(sesion) for sesion in sesiones]
+        finally:
+            if diario is not None:
+                diario.sincronizar()
+                diario.durable = True
+        self.registro.agregar_lote(self._preparadas)
+        self._preparadas = []
+        remotas = []
+        for s, resultado in enumerate(resultados):
+            for i, (tipo, ok, detalle) in enumerate(resultado.resultados):
+                if ok and tipo == "transferencia" and type(detalle) is int:
+                    _, numero, destino, monto, fecha, _ = self.pendientes[detalle]
+                    remotas.append((s, i, detalle, numero, destino, monto, fecha))
+        return resultados, remotas
+
+    # Primera fase en el destino: (transferencia, destino, cuenta de
+    # origen, monto, fecha) -> (transferencia, voto, cuenta o error)
+    def preparar(self, transferencias):
+        seq = self.banco.diario.total if self.banco.diario is not None else 0
+        votos = []
+        registros = []
+        for tx, destino, origen, monto, fecha in transferencias:
+            cuenta = self.banco.cuenta_destino(destino)
+            if cuenta is None:
+                votos.append((tx, False, _DESTINO_NO_ENCONTRADO))
+                continue
+            self.pendientes[tx] = (CREDITO, cuenta.numero, origen, monto, fecha, seq)
+            registros.append((tx, PREPARADA, CREDITO, monto, fecha, seq, cuenta.numero, origen))
+            votos.append((tx, True, cuenta.numero))
+        self.registro.agregar_lote(registros)
+        return votos
+
+    # Segunda fase: (transferencia, confirmar, cuenta destino). Una
+    # transferencia desconocida ya se resolvió antes (el frente reenvía
+    # sus decisiones después de una caída). Antifraude anota en el origen
+    # solo las confirmadas, con el número de la cuenta destino.
+    def resolver(self, decisiones):
+        diario = self.banco.diario
+        if diario is not None:
+            diario.durable = False
+        registros = []
+        try:
+            for tx, confirmar, destino in decisiones:
+                pendiente = self.pendientes.pop(tx, None)
+                if pendiente is None:
+                    continue
+                papel, numero, contraparte, monto, fecha, seq = pendiente
+                cuenta = self.banco.cuentas_por_numero[numero]
+                if confirmar:
+                    with bloqueo_cuenta(cuenta):
+                        if papel == CREDITO:
+                            movimiento = Movimiento.desde_columnas(fecha, "TRANSFERENCIA", monto,
+                                                                   numero, contraparte, None)
+                        else:
+                            movimiento = Movimiento.desde_columnas(fecha, "TRANSFERENCIA", -monto,
+                                                                   numero, destino, None)
+                        # El movimiento va al diario antes que el saldo: si
+                        # el diario falla, la transferencia sigue pendiente
+                        try:
+                            cuenta.movimientos.append(movimiento)
+                        except Exception:
+                            self.pendientes[tx] = pendiente
+                            raise
+                        if papel == CREDITO:
+                            cuenta.saldo += monto
+                        else:
+                            self.banco.antifraude.anotar_transferencia(numero, destino, monto)
+                elif papel == DEBITO:
+                    with bloqueo_cuenta(cuenta):
+                        cuenta.saldo += monto
+                registros.append((tx, CONFIRMADA if confirmar else ABORTADA, papel, monto, fecha,
+                                  seq, numero, None))
+        finally:
+            # El diario queda en disco antes que la resolución en el
+            # registro; si una falló, las anteriores se registran igual
+            if diario is not None:
+                diario.sincronizar()
+                diario.durable = True
+            self.registro.agregar_lote(registros)
+
+    def ubicar(self, numeros):
+        return [numero for numero in numeros if numero in self.banco.cuentas_por_numero]
+
+    # Saldos y montos retenidos por transferencias sin resolver
+    def totales(self, _=None):
+        retenido = sum(monto for papel, _, _, monto, _, _ in self.pendientes.values()
+                       if papel == DEBITO)
+        return self.banco.total_saldos(), retenido
+
+# Proceso de una partición: arma su banco con fabrica_banco(particion,
+# particiones), avisa qué transferencias quedaron pendientes y atiende
+# órdenes (nombre, argumento) hasta recibir None
+def _servir_particion(particion, particiones, fabrica_banco, directorio, conexion):
+    banco = fabrica_banco(particion, particiones)
+    registro = RegistroTransferencias()
+    referencias = GeneradorReferencias(nodo=particion)
+    if directorio:
+        abrir_diario(banco, os.path.join(directorio, f"diario-{particion}"))
+        registro = RegistroTransferencias(os.path.join(directorio, f"transferencias-{particion}.log"))
+        referencias.abrir(os.path.join(directorio, f"transferencias-{particion}.tope"))
+    servidor = Particion(banco, particion, particiones, registro, referencias)
+    ordenes = {"sesiones": servidor.atender_lote, "preparar": servidor.preparar,
+               "resolver": servidor.resolver, "ubicar": servidor.ubicar,
+               "totales": servidor.totales}
+    try:
+        conexion.send((True, list(servidor.pendientes)))
+        for orden, argumento in iter(conexion.recv, None):
+            try:
+                respuesta = (True, ordenes[orden](argumento))
+            except Exception as e:
+                respuesta = (False, repr(e))
+            conexion.send(respuesta)
+    except (EOFError, OSError):
+        pass
+    finally:
+        servidor.cerrar()
+        registro.cerrar()
+        referencias.cerrar()
+        if banco.diario is not None:
+            banco.diario.cerrar()
+
+# Frente: reparte sesiones (servidor_sesiones.Sesion) entre los procesos
+# de las particiones y coordina las transferencias entre ellas. Misma
+# interfaz que ServidorSesiones para atender sesiones.
+class BancoParticionado:
+    def __init__(self, particiones, fabrica_banco, directorio=None):
+        self.particiones = particiones
+        self.directorio = directorio
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.decisiones = RegistroTransferencias(
+            os.path.join(directorio, "decisiones.log") if directorio else None)
+        # Número de cuenta -> partición, a medida que se ubican destinos
+        self._cuentas = {}
+        self._bloqueo = threading.Lock()
+        contexto = multiprocessing.get_context("spawn")
+        self._conexiones = []
+        self._procesos = []
+        for p in range(particiones):
+            propia, remota = contexto.Pipe()
+            proceso = contexto.Process(target=_servir_particion, name=f"particion-{p}", daemon=True,
+                                       args=(p, particiones, fabrica_banco, directorio, remota))
+            proceso.start()
+            remota.close()
+            self._conexiones.append(propia)
+            self._procesos.append(proceso)
+        try:
+            self._resolver_dudas(self._respuestas(range(particiones)))
+        except BaseException:
+            self.cerrar()
+            raise
+
+    def particion_cliente(self, cliente_id):
+        return particion_cliente(cliente_id, self.particiones)
+
+    def _recibir(self, p):
+        try:
+            return self._conexiones[p].recv()
+        except (EOFError, OSError):
+            raise ParticionError(f"La partición {p} dejó de responder") from None
+
+    # {partición: (orden, argumento)} -> {partición: respuesta}; las
+    # particiones trabajan a la vez. Se leen todas las respuestas antes de
+    # informar un error, así ninguna queda esperando en su conexión.
+    def _pedir(self, ordenes):
+        for p, orden in ordenes.items():
+            self._conexiones[p].send(orden)
+        return self._respuestas(ordenes)
+
+    def _respuestas(self, particiones):
+        respuestas = {p: self._recibir(p) for p in particiones}
+        for p, (correcto, valor) in respuestas.items():
+            if not correcto:
+                raise ParticionError(f"Error en la partición {p}: {valor}")
+        return {p: valor for p, (_, valor) in respuestas.items()}
+
+    # Al arrancar: lo que quedó pendiente en las particiones se confirma si
+    # el frente llegó a decidirlo y se aborta si no
+    def _resolver_dudas(self, pendientes):
+        confirmadas = {}
+        for tx, estado, _, _, _, _, destino, _ in self.decisiones.leidos:
+            if estado == CONFIRMADA:
+                confirmadas[tx] = destino
+            elif estado == FIN:
+                confirmadas.pop(tx, None)
+        self.decisiones.leidos = []
+        ordenes = {p: ("resolver", [(tx, tx in confirmadas, confirmadas.get(tx)) for tx in txs])
+                   for p, txs in pendientes.items() if txs}
+        if ordenes:
+            self._pedir(ordenes)
+        self.decisiones.agregar_lote([(tx, FIN, 0, 0, 0, 0, None, None) for tx in confirmadas])
+
+    # Partición de cada destino (ID de cliente o número de cuenta), o None
+    # si la cuenta no está en ninguna
+    def _particiones_destino(self, destinos):
+        faltan = sorted({d for d in destinos if isinstance(d, str) and d not in self._cuentas})
+        if faltan:
+            for p, encontradas in self._pedir({p: ("ubicar", faltan)
+                                               for p in range(self.particiones)}).items():
+                for numero in encontradas:
+                    self._cuentas[numero] = p
+        return [self._cuentas.get(d) if isinstance(d, str) else self.particion_cliente(d)
+                for d in destinos]
+
+    # transferencias: (transferencia, partición de origen, cuenta de
+    # origen, destino, monto, fecha) -> (ok, cuenta destino o error)
+    def _coordinar(self, transferencias):
+        destinos = self._particiones_destino([destino for _, _, _, destino, _, _ in transferencias])
+        preparar = {}
+        for (tx, _, origen, destino, monto, fecha), p in zip(transferencias, destinos):
+            if p is not None:
+                preparar.setdefault(p, []).append((tx, destino, origen, monto, fecha))
+        votos = {}
+        for lista in self._pedir({p: ("preparar", lista) for p, lista in preparar.items()}).values():
+            for tx, correcto, detalle in lista:
+                votos[tx] = (correcto, detalle)
+
+        resultados = []
+        decididas = []
+        resolver = {}
+        for (tx, p_origen, _, _, _, _), p_destino in zip(transferencias, destinos):
+            correcto, detalle = votos.get(tx, (False, _DESTINO_NO_ENCONTRADO))
+            resultados.append((correcto, detalle))
+            resolver.setdefault(p_origen, []).append((tx, correcto, detalle if correcto else None))
+            if correcto:
+                decididas.append((tx, CONFIRMADA, 0, 0, 0, 0, detalle, None))
+                resolver.setdefault(p_destino, []).append((tx, True, detalle))
+        # Punto de no retorno: a partir de acá se confirma aunque el frente caiga
+        self.decisiones.agregar_lote(decididas)
+        self._pedir({p: ("resolver", lista) for p, lista in resolver.items()})
+        # Sin fsync: si se pierde, al arrancar se reenvía la confirmación
+        self.decisiones.agregar_lote([(tx, FIN, 0, 0, 0, 0, None, None) for tx, *_ in decididas],
+                                     sincronizar=False)
+        if metricas.activas:
+            for estado, cantidad in (("confirmada", len(decididas)),
+                                     ("abortada", len(transferencias) - len(decididas))):
+                if cantidad:
+                    metricas.contar("cajero_transferencias_particiones_total",
+                                    (("estado", estado),), cantidad)
+        return resultados
+
+    # Devuelve un ResultadoSesion por sesión, en el mismo orden
+    def atender_todas(self, sesiones):
+        with self._bloqueo:
+            lotes = {}
+            for i, sesion in enumerate(sesiones):
+                lotes.setdefault(self.particion_cliente(sesion.cliente_id), []).append(i)
+            respuestas = self._pedir({p: ("sesiones", [sesiones[i] for i in indices])
+                                      for p, indices in lotes.items()})
+            resultados = [None] * len(sesiones)
+            ubicaciones = []
+            transferencias = []
+            for p, (parciales, remotas) in respuestas.items():
+                indices = lotes[p]
+                for i, resultado in zip(indices, parciales):
+                    resultados[i] = resultado
+                for s, i, tx, origen, destino, monto, fecha in remotas:
+                    ubicaciones.append((indices[s], i))
+                    transferencias.append((tx, p, origen, destino, monto, fecha))
+            if transferencias:
+                for (s, i), (correcto, detalle) in zip(ubicaciones, self._coordinar(transferencias)):
+                    operaciones = resultados[s].resultados
+                    operaciones[i] = (operaciones[i][0], correcto, detalle)
+            return resultados
+
+    def atender(self, sesion):
+        return self.atender_todas([sesion])[0]
+
+    # Suma de los saldos de todas las particiones, contando lo retenido por
+    # transferencias sin resolver
+    def total_saldos(self):
+        with self._bloqueo:
+            totales = self._pedir({p: ("totales", None) for p in range(self.particiones)})
+        return sum(saldos + retenido for saldos, retenido in totales.values())
+
+    def cerrar(self):
+        for conexion in self._conexiones:
+            try:
+                conexion.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for proceso in self._procesos:
+            proceso.join(timeout=5.0)
+            if proceso.is_alive():
+                proceso.terminate()
+        for conexion in self._conexiones:
+            conexion.close()
+        self._conexiones = []
+        self._procesos = []
+        self.decisiones.cerrar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
@@ -0,0 +1,356 @@
+import argparse
+import csv
+import datetime
+import json
+import math
+import mmap
+import sys
+import time
+from collections import deque
+
+import diario
+import instantaneas
+import reportes
+from diario import DENOMINACIONES
+
+# Pronóstico de efectivo y plan de reposición de los dispensadores. Los
+# retiros y depósitos del diario llevan el dispensador y los billetes de
+# cada denominación; el planificador los agrupa en el consumo neto diario
+# de cada dispensador (billetes que salen menos los que entran) y mantiene
+# por dispensador una ventana móvil de los últimos 'ventana' días con sus
+# sumas, que se actualiza al cerrar cada día sin volver a recorrer nada.
+#
+# Con el consumo diario promedio y el inventario actual estima en cuántos
+# días se agota cada denominación y arma, para todos los dispensadores en
+# una sola pasada, la fecha de reposición (con 'anticipacion' días de
+# margen) y los billetes a cargar para cubrir 'horizonte' días.
+#
+# Con NumPy (ver reportes.py) el diario se agrupa en una pasada vectorizada;
+# sin NumPy se recorre registro por registro.
+
+DIA_US = 86_400 * 1_000_000
+# Los días se cuentan en la hora local del proceso
+_DESFASE_US = int(datetime.datetime.now().astimezone().utcoffset().total_seconds() * 1_000_000)
+_RETIRO = diario.TIPOS.index("RETIRO") + 1
+_DEPOSITO = diario.TIPOS.index("DEPÓSITO") + 1
+
+def dia_de(fecha_us):
+    return (fecha_us + _DESFASE_US) // DIA_US
+
+def fecha_de_dia(dia):
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=dia)
+
+def hoy():
+    return dia_de(time.time_ns() // 1000)
+
+# Consumo neto de un dispensador en los últimos 'ventana' días completos
+class EstimadorConsumo:
+    __slots__ = ('ventana', 'dias', 'sumas', 'primer_dia')
+
+    def __init__(self, ventana):
+        self.ventana = ventana
+        # (día, consumo por denominación) de los días con movimientos
+        self.dias = deque()
+        self.sumas = [0] * len(DENOMINACIONES)
+        self.primer_dia = None
+
+    # Los días llegan en orden creciente
+    def agregar_dia(self, dia, consumo):
+        if self.primer_dia is None:
+            self.primer_dia = dia
+        self.dias.append((dia, consumo))
+        for i, cantidad in enumerate(consumo):
+            self.sumas[i] += cantidad
+        self._descartar(dia + 1)
+
+    def _descartar(self, hoy):
+        limite = hoy - self.ventana
+        while self.dias and self.dias[0][0] < limite:
+            _, consumo = self.dias.popleft()
+            for i, cantidad in enumerate(consumo):
+                self.sumas[i] -= cantidad
+
+    # Billetes por día de cada denominación en [hoy - ventana, hoy); con
+    # menos historia se promedian solo los días observados
+    def tasas(self, hoy):
+        self._descartar(hoy)
+        if self.primer_dia is None:
+            return [0.0] * len(DENOMINACIONES)
+        dias = max(1, min(self.ventana, hoy - self.primer_dia))
+        return [suma / dias for suma in self.sumas]
+
+class Planificador:
+    def __init__(self, ventana=14):
+        self.ventana = ventana
+        self.estimadores = {}
+        # Día en curso de cada dispensador: [día, consumo], todavía sin cerrar
+        self._abiertos = {}
+        # Registros del diario ya procesados
+        self.seq = 0
+
+    def _sumar(self, dispensador_id, dia, consumo):
+        abierto = self._abiertos.get(dispensador_id)
+        if abierto is not None and abierto[0] == dia:
+            acumulado = abierto[1]
+            for i, cantidad in enumerate(consumo):
+                acumulado[i] += cantidad
+            return
+        if abierto is not None:
+            self._cerrar(dispensador_id, abierto)
+        self._abiertos[dispensador_id] = [dia, list(consumo)]
+
+    def _cerrar(self, dispensador_id, abierto):
+        estimador = self.estimadores.get(dispensador_id)
+        if estimador is None:
+            estimador = self.estimadores[dispensador_id] = EstimadorConsumo(self.ventana)
+        estimador.agregar_dia(abierto[0], abierto[1])
+
+    # Un Movimiento más, en orden de fecha por dispensador; los que no son
+    # en efectivo se ignoran
+    def registrar(self, movimiento):
+        if movimiento.dispensador_id is None or not movimiento.billetes:
+            return
+        signo = 1 if movimiento.tipo == "RETIRO" else -1
+        self._sumar(movimiento.dispensador_id, dia_de(movimiento.fecha_us),
+                    [signo * movimiento.billetes.get(denom, 0) for denom in DENOMINACIONES])
+
+    # Procesa los registros del diario desde el último procesado hasta
+    # 'hasta' (por omisión, todos los completos)
+    def actualizar_desde_diario(self, ruta, hasta=None):
+        for dispensador_id, dia, consumo in consumo_diario(ruta, self.seq, hasta):
+            self._sumar(dispensador_id, dia, consumo)
+        if hasta is None:
+            hasta = _total_registros(ruta)
+        self.seq = max(self.seq, hasta)
+
+    # Planificador con toda la historia de 'banco': del diario si tiene, si
+    # no de los historiales en memoria
+    @classmethod
+    def desde_banco(cls, banco, ventana=14):
+        planificador = cls(ventana)
+        if banco.diario is not None:
+            planificador.actualizar_desde_diario(banco.diario.ruta, banco.diario.total)
+            return planificador
+        consumos = {}
+        for cuenta in banco.cuentas:
+            historial = cuenta._movimientos
+            efectivo = getattr(historial, 'efectivo', None)
+            if efectivo is None:
+                continue
+            n = len(DENOMINACIONES)
+            for i, (fila, dispensador_id) in enumerate(zip(efectivo.filas, efectivo.dispensadores)):
+                signo = 1 if historial.montos[fila] < 0 else -1
+                clave = (dispensador_id, dia_de(historial.fechas[fila]))
+                consumo = consumos.get(clave)
+                if consumo is None:
+                    consumo = consumos[clave] = [0] * n
+                for j, cantidad in enumerate(efectivo.billetes[i * n:(i + 1) * n]):
+                    consumo[j] += signo * cantidad
+        for (dispensador_id, dia), consumo in sorted(consumos.items()):
+            planificador._sumar(dispensador_id, dia, consumo)
+        return planificador
+
+    # Tasas de consumo por dispensador en la ventana que termina 'dia'
+    def tasas(self, dia):
+        for dispensador_id, abierto in list(self._abiertos.items()):
+            if abierto[0] < dia:
+                self._cerrar(dispensador_id, abierto)
+                del self._abiertos[dispensador_id]
+        return {dispensador_id: estimador.tasas(dia)
+                for dispensador_id, estimador in self.estimadores.items()}
+
+    # Plan de reposición para 'inventarios' ({dispensador_id: {denominación:
+    # cantidad}}), de la reposición más urgente a la más lejana; los
+    # dispensadores sin agotamiento previsto van al final
+    def planificar(self, inventarios, dia=None, horizonte=7, anticipacion=1):
+        dia = hoy() if dia is None else dia
+        tasas = self.tasas(dia)
+        sin_consumo = [0.0] * len(DENOMINACIONES)
+        plan = []
+        for dispensador_id, billetes in inventarios.items():
+            consumo = tasas.get(dispensador_id, sin_consumo)
+            detalle = []
+            reponer_el = None
+            for denom, tasa in zip(DENOMINACIONES, consumo):
+                existencias = billetes.get(denom, 0)
+                dias_restantes = existencias / tasa if tasa > 0 else None
+                if dias_restantes is not None:
+                    limite = max(dia, dia + math.floor(dias_restantes) - anticipacion)
+                    reponer_el = limite if reponer_el is None else min(reponer_el, limite)
+                detalle.append({"denominacion": denom, "existencias": existencias,
+                                "consumo_diario": round(tasa, 2),
+                                "dias_restantes": None if dias_restantes is None else round(dias_restantes, 1),
+                                "agotamiento": None if dias_restantes is None else
+                                fecha_de_dia(dia + math.floor(dias_restantes)).isoformat()})
+            # Cargar lo que falte para cubrir 'horizonte' días desde la reposición
+            if reponer_el is not None:
+                for fila, tasa in zip(detalle, consumo):
+                    restantes = max(0.0, fila["existencias"] - tasa * (reponer_el - dia))
+                    fila["reponer"] = max(0, math.ceil(tasa * horizonte - restantes))
+            else:
+                for fila in detalle:
+                    fila["reponer"] = 0
+            plan.append({"cajero": dispensador_id,
+                         "reponer_el": None if reponer_el is None else fecha_de_dia(reponer_el).isoformat(),
+                         "urgente": reponer_el == dia,
+                         "denominaciones": detalle})
+        plan.sort(key=lambda fila: (fila["reponer_el"] is None, fila["reponer_el"] or "", fila["cajero"]))
+        return plan
+
+def _total_registros(ruta):
+    with open(ruta, "rb") as archivo:
+        archivo.seek(0, 2)
+        return max(0, (archivo.tell() - diario.CABECERA.size) // diario.REGISTRO.size)
+
+# Consumo neto diario de los registros [desde, hasta) del diario:
+# (dispensador_id, día, consumo por denominación), ordenado por dispensador
+# y día. No valida los CRC (ver reportes.registros_diario).
+def consumo_diario(ruta, desde=0, hasta=None):
+    if reportes.np is not None:
+        return _consumo_diario_numpy(ruta, desde, hasta)
+    return _consumo_diario_registros(ruta, desde, hasta)
+
+def _consumo_diario_numpy(ruta, desde, hasta):
+    np = reportes.np
+    registros = reportes.registros_diario(ruta, desde, hasta)
+    tipos = registros['tipo']
+    dispensadores = registros['dispensador']
+    efectivo = (((tipos == _RETIRO) | (tipos == _DEPOSITO))
+                & (dispensadores != diario.SIN_DISPENSADOR))
+    # Se filtran solo las columnas necesarias, no los registros completos
+    dispensadores = dispensadores[efectivo]
+    if len(dispensadores) == 0:
+        return []
+    signos = np.where(tipos[efectivo] == _RETIRO, 1, -1)
+    dias = (registros['fecha'][efectivo] + _DESFASE_US) // DIA_US
+    billetes = registros['billetes'][efectivo]
+
+    # Un grupo por (dispensador, día): clave = (id - mínimo) * días + día.
+    # Con ids densos las claves se cuentan directo con bincount, sin ordenar.
+    primer_dia, minimo = int(dias.min()), int(dispensadores.min())
+    ancho = int(dias.max()) - primer_dia + 1
+    claves = (dispensadores - minimo) * ancho + (dias - primer_dia)
+    tamano = (int(dispensadores.max()) - minimo + 1) * ancho
+    if tamano <= 4 * len(claves) + 1_000_000:
+        grupos = claves
+        presentes = np.flatnonzero(np.bincount(claves, minlength=tamano))
+    else:
+        presentes, grupos = np.unique(claves, return_inverse=True)
+        tamano = len(presentes)
+    # bincount con pesos suma en double: exacto para cualquier cantidad real de billetes
+    consumo = np.stack([np.bincount(grupos, weights=billetes[:, i] * signos, minlength=tamano)
+                        for i in range(len(DENOMINACIONES))], axis=1)
+    if len(consumo) != len(presentes):
+        consumo = consumo[presentes]
+    consumo = consumo.round().astype(np.int64)
+    return list(zip((presentes // ancho + minimo).tolist(), (presentes % ancho + primer_dia).tolist(),
+                    consumo.tolist()))
+
+def _consumo_diario_registros(ruta, desde, hasta):
+    consumos = {}
+    n = len(DENOMINACIONES)
+    with open(ruta, "rb") as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        magico, version, tamano = diario.CABECERA.unpack_from(mapa)
+        if magico != diario.MAGICO or version != diario.VERSION or tamano != diario.REGISTRO.size:
+            raise diario.DiarioError(f"Formato de diario no reconocido en {ruta}")
+        completos = (len(mapa) - diario.CABECERA.size) // diario.REGISTRO.size
+        fin = completos if hasta is None else min(hasta, completos)
+        inicio = diario.CABECERA.size + desde * diario.REGISTRO.size
+        vista = memoryview(mapa)[inicio:diario.CABECERA.size + fin * diario.REGISTRO.size]
+        try:
+            for (_, fecha, tipo, _, _, dispensador_id, _, _,
+                 *cantidades, _, _, _) in diario.REGISTRO.iter_unpack(vista):
+                if dispensador_id == diario.SIN_DISPENSADOR or tipo not in (_RETIRO, _DEPOSITO):
+                    continue
+                clave = (dispensador_id, dia_de(fecha))
+                consumo = consumos.get(clave)
+                if consumo is None:
+                    consumo = consumos[clave] = [0] * n
+                signo = 1 if tipo == _RETIRO else -1
+                for i in range(n):
+                    consumo[i] += signo * cantidades[i]
+        finally:
+            vista.release()
+    return [(dispensador_id, dia, consumo)
+            for (dispensador_id, dia), consumo in sorted(consumos.items())]
+
+def inventarios_de_banco(banco):
+    inventarios = {}
+    for dispensador in banco.dispensadores:
+        with dispensador.bloqueo:
+            inventarios[dispensador.id] = dict(dispensador.billetes)
+    return inventarios
+
+def inventarios_de_instantanea(secciones):
+    ids = instantaneas.desempaquetar_numeros(secciones[b'DIID'])
+    cantidades = instantaneas.desempaquetar_numeros(secciones[b'DICA'])
+    billetes = instantaneas.desempaquetar_numeros(secciones[b'DIBI'])
+    inventarios = {}
+    posicion = 0
+    for dispensador_id, cantidad in zip(ids, cantidades):
+        pares = billetes[posicion:posicion + 2 * cantidad]
+        inventarios[dispensador_id] = dict(zip(pares[::2], pares[1::2]))
+        posicion += 2 * cantidad
+    return inventarios
+
+# Los movimientos del diario posteriores a la instantánea ya cambiaron los
+# inventarios: se descuentan (o suman) antes de planificar
+def _ajustar_inventarios(inventarios, ruta, desde):
+    for dispensador_id, _, consumo in consumo_diario(ruta, desde):
+        billetes = inventarios.get(dispensador_id)
+        if billetes is None:
+            continue
+        for denom, cantidad in zip(DENOMINACIONES, consumo):
+            billetes[denom] = billetes.get(denom, 0) - cantidad
+
+def escribir_csv(plan, salida):
+    escritor = csv.writer(salida)
+    escritor.writerow(("cajero", "reponer_el", "urgente", "denominacion", "existencias",
+                       "consumo_diario", "dias_restantes", "agotamiento", "reponer"))
+    for fila in plan:
+        for detalle in fila["denominaciones"]:
+            escritor.writerow((fila["cajero"], fila["reponer_el"] or "", int(fila["urgente"]),
+                               detalle["denominacion"], detalle["existencias"],
+                               detalle["consumo_diario"],
+                               "" if detalle["dias_restantes"] is None else detalle["dias_restantes"],
+                               detalle["agotamiento"] or "", detalle["reponer"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan de reposición de efectivo de los cajeros")
+    parser.add_argument("--diario", required=True)
+    parser.add_argument("--instantanea", required=True,
+                        help="base o delta con los inventarios de los dispensadores")
+    parser.add_argument("--ventana", type=int, default=14, help="días de historia del promedio")
+    parser.add_argument("--horizonte", type=int, default=7, help="días a cubrir con cada reposición")
+    parser.add_argument("--anticipacion", type=int, default=1,
+                        help="días antes del agotamiento previsto para reponer")
+    parser.add_argument("--formato", choices=("json", "csv"), default="json")
+    parser.add_argument("-o", "--salida", default="-")
+    args = parser.parse_args(argv)
+
+    try:
+        _, _, seq, secciones = instantaneas.leer(args.instantanea)
+        inventarios = inventarios_de_instantanea(secciones)
+        _ajustar_inventarios(inventarios, args.diario, seq)
+        planificador = Planificador(args.ventana)
+        planificador.actualizar_desde_diario(args.diario)
+        plan = planificador.planificar(inventarios, horizonte=args.horizonte,
+                                       anticipacion=args.anticipacion)
+    except (reportes.ReporteError, diario.DiarioError, instantaneas.InstantaneaError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    salida = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    try:
+        if args.formato == "csv":
+            escribir_csv(plan, salida)
+        else:
+            json.dump(plan, salida, ensure_ascii=False, indent=2)
+            salida.write("\n")
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
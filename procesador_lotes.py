@@ -0,0 +1,234 @@
+import argparse
+import csv
+import json
+import sys
+from decimal import Decimal
+from functools import lru_cache
+from json.encoder import encode_basestring
+
+import metricas
+from diario import DiarioError
+from dinero import MontoError, a_centavos, formatear
+from Sistema_de_Cajero import (OperacionError, crear_banco_ejemplo, abrir_diario, buscar_dispensador,
+                               depositar, leer_destino, pagar_servicio, retirar, retirar_en_red,
+                               transferir)
+
+# Procesador de operaciones por lotes, sin pantalla ni input(). Lee las
+# operaciones de un archivo o flujo CSV/JSONL, las aplica al banco con las
+# mismas reglas que los menús y escribe un resultado por línea a medida que
+# avanza, así la memoria no depende del tamaño de la entrada.
+#
+# Campos de cada operación:
+#   op           retiro | deposito | transferencia | pago
+#   cuenta       número de la cuenta que opera
+#   monto        retiro, transferencia y pago, en pesos con hasta dos decimales
+#   destino      ID del cliente o número de cuenta destino (transferencia)
+#   servicio     Luz | Agua | Gas | Internet (pago)
+#   dispensador  ID del cajero (por omisión lo elige el enrutador: el que
+#                puede entregar el retiro, el de menos efectivo para un depósito)
+#   billetes     depósito: "200:1|50:2" en CSV, {"200": 1, "50": 2} en JSONL
+
+CAMPOS = ("op", "cuenta", "monto", "destino", "servicio", "dispensador", "billetes")
+CAMPOS_RESULTADO = ("linea", "op", "cuenta", "ok", "saldo", "detalle", "error")
+
+def _billetes(valor):
+    if isinstance(valor, dict):
+        pares = valor.items()
+    else:
+        pares = (par.split(":") for par in str(valor).split("|") if par)
+    return {int(denom): int(cant) for denom, cant in pares}
+
+# op y cuenta se repiten mucho: se codifican una sola vez
+@lru_cache(maxsize=65536)
+def _json(valor):
+    if valor is None:
+        return "null"
+    return encode_basestring(str(valor))
+
+def leer_csv(archivo):
+    lector = csv.reader(archivo)
+    encabezado = next(lector, None)
+    if encabezado is None:
+        return
+    for fila in lector:
+        if fila:
+            yield dict(zip(encabezado, fila))
+
+# op y cuenta de una operación para la salida: una línea que no es un
+# objeto no tiene ninguno y un valor que no es texto se muestra como texto
+def _campos(operacion):
+    if not isinstance(operacion, dict):
+        return None, None
+    op, numero = operacion.get("op"), operacion.get("cuenta")
+    return (op if op is None or type(op) is str else str(op),
+            numero if numero is None or type(numero) is str else str(numero))
+
+# Decimal: un monto como 10.10 no pasa por float. Un solo decodificador:
+# json.loads con argumentos arma uno nuevo por línea.
+_decodificar = json.JSONDecoder(parse_float=Decimal).decode
+
+# Una línea que no es JSON válido se entrega como operación inválida para
+# que quede rechazada en la salida sin cortar el lote
+def leer_jsonl(archivo):
+    for linea in archivo:
+        if linea.strip():
+            try:
+                yield _decodificar(linea)
+            except ValueError as e:
+                yield {"op": None, "_invalida": str(e)}
+
+class ProcesadorLotes:
+    def __init__(self, banco):
+        self.banco = banco
+        self.aplicadas = 0
+        self.rechazadas = 0
+        self._operaciones = {
+            "retiro": self._retiro,
+            "deposito": self._deposito,
+            "transferencia": self._transferencia,
+            "pago": self._pago,
+        }
+
+    # Los cajeros se buscan en el banco: también los agregados después de
+    # crear el procesador
+    def _dispensador(self, operacion):
+        dispensador_id = operacion.get("dispensador")
+        if dispensador_id in (None, ""):
+            dispensador = self.banco.enrutador.elegir_deposito()
+            if dispensador is None:
+                raise OperacionError("No hay dispensadores disponibles")
+            return dispensador
+        dispensador = buscar_dispensador(self.banco, int(dispensador_id))
+        if dispensador is None:
+            raise OperacionError(f"Dispensador no encontrado: {dispensador_id}")
+        return dispensador
+
+    # Sin dispensador indicado, el enrutador elige el cajero
+    def _retiro(self, cuenta, operacion):
+        monto = a_centavos(operacion["monto"])
+        if operacion.get("dispensador") in (None, ""):
+            _, desglose = retirar_en_red(self.banco, cuenta, monto)
+        else:
+            desglose = retirar(self.banco, cuenta, self._dispensador(operacion), monto)
+        return "|".join(f"{denom}:{cant}" for denom, cant in desglose.items())
+
+    def _deposito(self, cuenta, operacion):
+        billetes = _billetes(operacion.get("billetes") or "")
+        return formatear(depositar(self.banco, cuenta, self._dispensador(operacion), billetes))
+
+    def _transferencia(self, cuenta, operacion):
+        destino = transferir(self.banco, cuenta, leer_destino(operacion["destino"]),
+                             a_centavos(operacion["monto"]))
+        return destino.numero
+
+    def _pago(self, cuenta, operacion):
+        return pagar_servicio(cuenta, operacion.get("servicio"), a_centavos(operacion["monto"]))
+
+    # Aplica una operación y devuelve (cuenta, ok, detalle, error). Nada de
+    # lo que traiga una línea corta el lote: lo que no es una operación
+    # válida queda rechazado con su error
+    def aplicar(self, operacion):
+        cuenta = None
+        try:
+            if not isinstance(operacion, dict):
+                raise TypeError(f"se esperaba un objeto, no {type(operacion).__name__}")
+            if "_invalida" in operacion:
+                raise OperacionError(f"Línea inválida: {operacion['_invalida']}")
+            cuenta = self.banco.cuentas_por_numero.get(operacion.get("cuenta"))
+            funcion = self._operaciones.get(operacion.get("op"))
+            if funcion is None:
+                raise OperacionError(f"Operación desconocida: {operacion.get('op')}")
+            if cuenta is None:
+                raise OperacionError("Cuenta no encontrada")
+            detalle = funcion(cuenta, operacion)
+        except (OperacionError, MontoError, DiarioError) as e:
+            self.rechazadas += 1
+            return cuenta, False, "", str(e)
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            self.rechazadas += 1
+            return cuenta, False, "", f"Operación mal formada: {e!r}"
+        self.aplicadas += 1
+        return cuenta, True, detalle, ""
+
+    def procesar(self, operaciones, salida, formato="jsonl"):
+        escritor = csv.writer(salida) if formato == "csv" else None
+        if escritor:
+            escritor.writerow(CAMPOS_RESULTADO)
+        for linea, operacion in enumerate(operaciones, 1):
+            cuenta, ok, detalle, error = self.aplicar(operacion)
+            saldo = formatear(cuenta.saldo) if cuenta is not None else None
+            op, numero = _campos(operacion)
+            if escritor:
+                escritor.writerow((linea, op, numero, int(ok), "" if saldo is None else saldo,
+                                   detalle, error))
+            else:
+                # Armado directo de la línea: json.dumps por resultado es lo
+                # más caro del ciclo
+                salida.write(f'{{"linea": {linea}, "op": {_json(op)}, '
+                             f'"cuenta": {_json(numero)}, '
+                             f'"ok": {"true" if ok else "false"}, '
+                             f'"saldo": {"null" if saldo is None else saldo}, '
+                             f'"detalle": {encode_basestring(detalle)}, '
+                             f'"error": {encode_basestring(error)}}}\n')
+        return self.aplicadas, self.rechazadas
+
+def procesar_archivo(banco, entrada, salida, formato_entrada="jsonl", formato_salida="jsonl"):
+    lector = leer_csv if formato_entrada == "csv" else leer_jsonl
+    procesador = ProcesadorLotes(banco)
+    # En lote no se espera el fsync de cada movimiento; se sincroniza al final
+    diario = banco.diario
+    if diario is not None:
+        diario.durable = False
+    try:
+        return procesador.procesar(lector(entrada), salida, formato_salida)
+    finally:
+        if diario is not None:
+            diario.sincronizar()
+            diario.durable = True
+
+def _formato(ruta, indicado):
+    if indicado:
+        return indicado
+    return "csv" if ruta.endswith(".csv") else "jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa operaciones bancarias por lotes")
+    parser.add_argument("entrada", help="archivo CSV/JSONL de operaciones ('-' para stdin)")
+    parser.add_argument("-o", "--salida", default="-", help="archivo de resultados ('-' para stdout)")
+    parser.add_argument("--formato-entrada", choices=("csv", "jsonl"))
+    parser.add_argument("--formato-salida", choices=("csv", "jsonl"))
+    parser.add_argument("--diario", help="diario de movimientos a recuperar y extender")
+    parser.add_argument("--metricas", help="guardar las métricas del lote (.prom: Prometheus, si no JSON)")
+    args = parser.parse_args(argv)
+    if args.metricas:
+        metricas.activar()
+
+    banco = crear_banco_ejemplo()
+    if args.diario:
+        abrir_diario(banco, args.diario)
+
+    entrada = sys.stdin if args.entrada == "-" else open(args.entrada, newline="", encoding="utf-8")
+    salida = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    try:
+        aplicadas, rechazadas = procesar_archivo(
+            banco, entrada, salida,
+            _formato(args.entrada, args.formato_entrada),
+            _formato(args.salida, args.formato_salida))
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+        if salida is not sys.stdout:
+            salida.close()
+        if banco.diario is not None:
+            banco.diario.cerrar()
+    if args.metricas:
+        with open(args.metricas, "w", encoding="utf-8") as archivo:
+            if args.metricas.endswith(".prom"):
+                archivo.write(metricas.REGISTRO.prometheus())
+            else:
+                archivo.write(metricas.REGISTRO.json())
+    print(f"Operaciones aplicadas: {aplicadas}, rechazadas: {rechazadas}", file=sys.stderr)
+    return 0 if rechazadas == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+import argparse
+import csv
+import datetime
+import json
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import diario
+import instantaneas
+from dinero import formatear
+
+# Conciliación y reportes de fin de día con columnas NumPy (dependencia
+# opcional: el resto del sistema no la necesita). Los movimientos se leen
+# como una vista sobre el archivo del diario, sin crear un objeto por
+# registro, y cada agregado es una pasada vectorizada:
+#
+#   - totales por tipo y por servicio (cantidad y monto)
+#   - efectivo por dispensador y denominación, y retiros y depósitos por
+#     dispensador
+#   - conciliación: saldo final = saldo inicial + flujo neto, por cuenta y
+#     en total, y las transferencias deben sumar cero
+#
+# Los montos son centavos int64 (ver dinero.py) y las sumas son exactas.
+# Las cuentas se emparejan por un hash de 64 bits del número y después se
+# verifica byte a byte, así no hace falta ordenar millones de textos.
+
+MAX_DESCUADRES = 100
+
+class ReporteError(Exception):
+    pass
+
+def _requerir_numpy():
+    if np is None:
+        raise ReporteError("Los reportes requieren numpy (pip install numpy)")
+
+def _dtype_registro():
+    dtype = np.dtype([('seq', '<u8'), ('fecha', '<i8'), ('tipo', 'u1'), ('servicio', 'u1'),
+                      ('relleno', 'V2'), ('monto', '<i8'), ('dispensador', '<i8'),
+                      ('cuenta', 'S24'), ('destino', 'S24'),
+                      ('billetes', '<u2', (len(diario.DENOMINACIONES),)),
+                      ('clave', 'V16'), ('referencia', '<u8'), ('crc', '<u4')])
+    assert dtype.itemsize == diario.REGISTRO.size
+    return dtype
+
+# Columnas de movimientos: fecha (µs), tipo y servicio (códigos del diario,
+# 0 = sin servicio), monto (centavos), cuenta (número, S24) y dispensador
+# (diario.SIN_DISPENSADOR si no es un movimiento en efectivo)
+class Movimientos:
+    __slots__ = ('fecha', 'tipo', 'servicio', 'monto', 'cuenta', 'dispensador')
+
+    def __init__(self, fecha, tipo, servicio, monto, cuenta, dispensador):
+        self.fecha = fecha
+        self.tipo = tipo
+        self.servicio = servicio
+        self.monto = monto
+        self.cuenta = cuenta
+        self.dispensador = dispensador
+
+    def __len__(self):
+        return len(self.monto)
+
+    def filtrar(self, mascara):
+        return Movimientos(self.fecha[mascara], self.tipo[mascara], self.servicio[mascara],
+                           self.monto[mascara], self.cuenta[mascara], self.dispensador[mascara])
+
+    # Movimientos con fecha en el día local 'dia' (datetime.date)
+    def del_dia(self, dia):
+        inicio = int(datetime.datetime.combine(dia, datetime.time()).timestamp() * 1_000_000)
+        fin = inicio + 86_400 * 1_000_000
+        return self.filtrar((self.fecha >= inicio) & (self.fecha < fin))
+
+# Vista de solo lectura de los registros [desde, hasta) del diario, como
+# arreglo estructurado. No valida los CRC: con el cajero en marcha, conviene
+# pasar 'hasta' (por ejemplo la posición de una instantánea) para no leer
+# un registro a medias.
+def registros_diario(ruta, desde=0, hasta=None):
+    _requerir_numpy()
+    mapa = np.memmap(ruta, dtype=np.uint8, mode='r')
+    if len(mapa) < diario.CABECERA.size:
+        raise ReporteError(f"Diario incompleto: {ruta}")
+    magico, version, tamano = diario.CABECERA.unpack(mapa[:diario.CABECERA.size].tobytes())
+    if magico != diario.MAGICO or version != diario.VERSION or tamano != diario.REGISTRO.size:
+        raise ReporteError(f"Formato de diario no reconocido en {ruta}")
+    completos = (len(mapa) - diario.CABECERA.size) // diario.REGISTRO.size
+    registros = np.frombuffer(mapa, dtype=_dtype_registro(), count=completos,
+                              offset=diario.CABECERA.size)
+    return registros[desde:completos if hasta is None else min(hasta, completos)]
+
+def leer_diario(ruta, desde=0, hasta=None):
+    registros = registros_diario(ruta, desde, hasta)
+    return Movimientos(registros['fecha'], registros['tipo'], registros['servicio'],
+                       registros['monto'], registros['cuenta'], registros['dispensador'])
+
+# Movimientos de un banco en memoria: del diario si tiene, si no de los
+# historiales columnares de cada cuenta
+def movimientos_de_banco(banco):
+    _requerir_numpy()
+    if banco.diario is not None:
+        return leer_diario(banco.diario.ruta, hasta=banco.diario.total)
+
+    from Sistema_de_Cajero import SERVICIOS_MOVIMIENTO, TIPOS_MOVIMIENTO
+    # Códigos del catálogo en memoria -> códigos del diario
+    tipos = np.zeros(256, np.uint8)
+    for codigo_diario, tipo in enumerate(diario.TIPOS, 1):
+        tipos[TIPOS_MOVIMIENTO.codigo(tipo)] = codigo_diario
+    servicios = np.zeros(256, np.uint8)
+    for codigo_diario, servicio in enumerate(diario.SERVICIOS, 1):
+        servicios[SERVICIOS_MOVIMIENTO.codigo(servicio)] = codigo_diario
+
+    partes = []
+    for cuenta in banco.cuentas:
+        historial = cuenta._movimientos
+        if historial is None or not len(historial):
+            continue
+        cantidad = len(historial)
+        dispensadores = np.full(cantidad, diario.SIN_DISPENSADOR, np.int64)
+        if historial.efectivo is not None:
+            dispensadores[np.frombuffer(historial.efectivo.filas, np.int64)] = \
+                np.frombuffer(historial.efectivo.dispensadores, np.int64)
+        partes.append((np.frombuffer(historial.fechas, np.int64),
+                       tipos[np.frombuffer(historial.tipos, np.uint8)],
+                       servicios[np.frombuffer(historial.servicios, np.uint8)],
+                       np.frombuffer(historial.montos, np.int64),
+                       np.full(cantidad, cuenta.numero.encode('utf-8'), dtype='S24'),
+                       dispensadores))
+    if not partes:
+        return Movimientos(np.zeros(0, np.int64), np.zeros(0, np.uint8), np.zeros(0, np.uint8),
+                           np.zeros(0, np.int64), np.zeros(0, 'S24'), np.zeros(0, np.int64))
+    return Movimientos(*(np.concatenate(columna) for columna in zip(*partes)))
+
+# Saldos por número de cuenta: (numeros S24, saldos int64)
+def saldos_de_banco(banco):
+    _requerir_numpy()
+    cuentas = banco.cuentas
+    numeros = np.array([cuenta.numero.encode('utf-8') for cuenta in cuentas], dtype='S24')
+    return numeros, np.frombuffer(banco.saldos, np.int64)[:len(cuentas)].copy()
+
+def saldos_de_instantanea(secciones):
+    _requerir_numpy()
+    saldos = np.frombuffer(secciones[b'CUSA'], np.int64)
+    if len(saldos) == 0:
+        return np.zeros(0, 'S24'), saldos
+    return np.array(secciones[b'CUNU'].split(b'\0'), dtype='S24'), saldos
+
+# Inventario de billetes: (cajero, denominacion, cantidad), un par por fila
+def dispensadores_de_banco(banco):
+    _requerir_numpy()
+    filas = []
+    for dispensador in banco.dispensadores:
+        with dispensador.bloqueo:
+            filas += [(dispensador.id, denom, cantidad)
+                      for denom, cantidad in dispensador.billetes.items()]
+    columnas = np.array(filas, dtype=np.int64).reshape(-1, 3)
+    return columnas[:, 0], columnas[:, 1], columnas[:, 2]
+
+def dispensadores_de_instantanea(secciones):
+    _requerir_numpy()
+    ids = np.frombuffer(secciones[b'DIID'], np.int64)
+    cantidades = np.frombuffer(secciones[b'DICA'], np.int64)
+    pares = np.frombuffer(secciones[b'DIBI'], np.int64).reshape(-1, 2)
+    return np.repeat(ids, cantidades), pares[:, 0], pares[:, 1]
+
+def _hash(numeros):
+    palabras = numeros.view('<u8').reshape(-1, 3)
+    valor = palabras[:, 0] * np.uint64(0x9E3779B97F4A7C15)
+    valor ^= palabras[:, 1] * np.uint64(0xC2B2AE3D27D4EB4F)
+    valor ^= palabras[:, 2] * np.uint64(0x165667B19E3779F9)
+    valor ^= valor >> np.uint64(29)
+    return valor
+
+# Fila de 'tabla' para cada número de 'buscados', -1 si no está
+def emparejar(tabla, buscados):
+    tabla = np.ascontiguousarray(tabla, dtype='S24')
+    buscados = np.ascontiguousarray(buscados, dtype='S24')
+    if len(tabla) == 0:
+        return np.full(len(buscados), -1, np.int64)
+    claves = _hash(tabla)
+    orden = np.argsort(claves)
+    claves = claves[orden]
+    if len(claves) > 1 and (claves[1:] == claves[:-1]).any():
+        # Colisión (o números repetidos): emparejar por texto
+        orden = np.argsort(tabla)
+        posiciones = np.searchsorted(tabla[orden], buscados)
+    else:
+        # Buscar en orden de clave: la búsqueda recorre la tabla sin saltos
+        buscadas = _hash(buscados)
+        recorrido = np.argsort(buscadas)
+        posiciones = np.empty(len(buscados), np.int64)
+        posiciones[recorrido] = np.searchsorted(claves, buscadas[recorrido])
+    filas = orden[np.minimum(posiciones, len(tabla) - 1)]
+    filas[tabla[filas] != buscados] = -1
+    return filas
+
+# Cantidad y monto por código: con pocos códigos, una máscara por código
+# suma en int64 más rápido que np.add.at
+def _por_codigo(codigos, montos, nombres):
+    codigos = np.ascontiguousarray(codigos)
+    montos = np.ascontiguousarray(montos)
+    totales = []
+    for i, nombre in enumerate(nombres, 1):
+        mascara = codigos == i
+        totales.append((nombre, int(np.count_nonzero(mascara)), int(montos[mascara].sum())))
+    return totales
+
+def totales_por_tipo(movimientos):
+    return [{"tipo": tipo, "movimientos": cantidad, "monto": monto} for tipo, cantidad, monto
+            in _por_codigo(movimientos.tipo, movimientos.monto, diario.TIPOS)]
+
+def totales_por_servicio(movimientos):
+    return [{"servicio": servicio, "movimientos": cantidad, "monto": monto} for servicio, cantidad, monto
+            in _por_codigo(movimientos.servicio, movimientos.monto, diario.SERVICIOS)]
+
+# Efectivo por dispensador, en centavos, con el detalle por denominación
+def totales_por_dispensador(dispensadores):
+    cajeros, denominaciones, cantidades = dispensadores
+    ids, filas = np.unique(cajeros, return_inverse=True)
+    efectivo = np.zeros(len(ids), np.int64)
+    np.add.at(efectivo, filas, denominaciones * cantidades * 100)
+    resultado = []
+    for i, cajero in enumerate(ids):
+        propias = filas == i
+        resultado.append({"cajero": int(cajero), "efectivo": int(efectivo[i]),
+                          "billetes": {str(int(d)): int(c) for d, c in
+                                       zip(denominaciones[propias], cantidades[propias])}})
+    return resultado
+
+# Retiros y depósitos por dispensador: cantidad y monto de cada tipo
+def movimientos_por_dispensador(movimientos):
+    retiro = diario.TIPOS.index("RETIRO") + 1
+    deposito = diario.TIPOS.index("DEPÓSITO") + 1
+    en_efectivo = movimientos.filtrar(movimientos.dispensador != diario.SIN_DISPENSADOR)
+    ids, filas = np.unique(en_efectivo.dispensador, return_inverse=True)
+    resultado = [{"cajero": int(cajero)} for cajero in ids]
+    for nombre, codigo in (("retiros", retiro), ("depositos", deposito)):
+        mascara = en_efectivo.tipo == codigo
+        cantidades = np.bincount(filas[mascara], minlength=len(ids))
+        montos = np.zeros(len(ids), np.int64)
+        np.add.at(montos, filas[mascara], en_efectivo.monto[mascara])
+        for fila, cantidad, monto in zip(resultado, cantidades, montos):
+            fila[nombre] = int(cantidad)
+            fila["monto_" + nombre] = int(monto)
+    return resultado
+
+# Saldo final = saldo inicial + flujo neto de 'movimientos', por cuenta.
+# 'iniciales' y 'finales' son pares (numeros, saldos); sin iniciales se
+# parte de cero. Una cuenta sin saldo inicial (alta del período) parte de
+# cero y se cuenta en 'cuentas_nuevas'.
+def conciliar(finales, movimientos, iniciales=None):
+    numeros, saldos = finales
+    esperados = np.zeros(len(numeros), np.int64)
+    nuevas = len(numeros)
+    if iniciales is not None and len(iniciales[0]):
+        filas_iniciales = emparejar(numeros, iniciales[0])
+        presentes = filas_iniciales >= 0
+        esperados[filas_iniciales[presentes]] = iniciales[1][presentes]
+        nuevas -= int(presentes.sum())
+
+    filas = emparejar(numeros, movimientos.cuenta)
+    con_cuenta = filas >= 0
+    flujo = np.zeros(len(numeros), np.int64)
+    np.add.at(flujo, filas[con_cuenta], movimientos.monto[con_cuenta])
+    esperados += flujo
+
+    diferencias = saldos - esperados
+    descuadradas = np.flatnonzero(diferencias)
+    transferencias = movimientos.monto[movimientos.tipo == diario.TIPOS.index("TRANSFERENCIA") + 1]
+    total_inicial = int(iniciales[1].sum()) if iniciales is not None else 0
+    total_movimientos = int(movimientos.monto.sum())
+    return {
+        "cuentas": len(numeros),
+        "cuentas_nuevas": nuevas,
+        "movimientos": len(movimientos),
+        "movimientos_sin_cuenta": int((~con_cuenta).sum()),
+        "saldo_inicial": total_inicial,
+        "flujo_neto": total_movimientos,
+        "saldo_final": int(saldos.sum()),
+        "diferencia": int(saldos.sum()) - total_inicial - total_movimientos,
+        "transferencias_netas": int(transferencias.sum()),
+        "cuentas_descuadradas": len(descuadradas),
+        "descuadres": [{"cuenta": numeros[i].decode('utf-8'), "esperado": int(esperados[i]),
+                        "saldo": int(saldos[i])} for i in descuadradas[:MAX_DESCUADRES]],
+    }
+
+# Reporte completo: totales del día 'dia' (o de todos los movimientos) y
+# la conciliación de todos los movimientos recibidos
+def reporte(movimientos, finales, iniciales=None, dispensadores=None, dia=None):
+    del_periodo = movimientos if dia is None else movimientos.del_dia(dia)
+    resultado = {
+        "dia": None if dia is None else dia.isoformat(),
+        "por_tipo": totales_por_tipo(del_periodo),
+        "por_servicio": totales_por_servicio(del_periodo),
+        "movimientos_por_dispensador": movimientos_por_dispensador(del_periodo),
+        "conciliacion": conciliar(finales, movimientos, iniciales),
+    }
+    if dispensadores is not None:
+        resultado["por_dispensador"] = totales_por_dispensador(dispensadores)
+    return resultado
+
+def reporte_banco(banco, iniciales=None, dia=None):
+    return reporte(movimientos_de_banco(banco), saldos_de_banco(banco), iniciales,
+                   dispensadores_de_banco(banco), dia)
+
+_MONTOS = frozenset(("monto", "efectivo", "saldo_inicial", "flujo_neto", "saldo_final",
+                     "diferencia", "transferencias_netas", "esperado", "saldo",
+                     "monto_retiros", "monto_depositos"))
+
+def _con_formato(valor, clave=None):
+    if isinstance(valor, dict):
+        return {k: _con_formato(v, k) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_con_formato(v) for v in valor]
+    if clave in _MONTOS:
+        return formatear(valor)
+    return valor
+
+def escribir_json(resultado, salida):
+    json.dump(_con_formato(resultado), salida, ensure_ascii=False, indent=2)
+    salida.write("\n")
+
+# CSV de una fila por dato: seccion, clave, movimientos, monto
+def escribir_csv(resultado, salida):
+    escritor = csv.writer(salida)
+    escritor.writerow(("seccion", "clave", "movimientos", "monto"))
+    for fila in resultado["por_tipo"]:
+        escritor.writerow(("tipo", fila["tipo"], fila["movimientos"], formatear(fila["monto"])))
+    for fila in resultado["por_servicio"]:
+        escritor.writerow(("servicio", fila["servicio"], fila["movimientos"], formatear(fila["monto"])))
+    for fila in resultado.get("por_dispensador", ()):
+        escritor.writerow(("dispensador", fila["cajero"], "", formatear(fila["efectivo"])))
+    for fila in resultado["movimientos_por_dispensador"]:
+        escritor.writerow(("retiros", fila["cajero"], fila["retiros"], formatear(fila["monto_retiros"])))
+        escritor.writerow(("depositos", fila["cajero"], fila["depositos"],
+                           formatear(fila["monto_depositos"])))
+    conciliacion = resultado["conciliacion"]
+    for clave, valor in conciliacion.items():
+        if clave == "descuadres":
+            continue
+        escritor.writerow(("conciliacion", clave, "",
+                           formatear(valor) if clave in _MONTOS else valor))
+    for descuadre in conciliacion["descuadres"]:
+        escritor.writerow(("descuadre", descuadre["cuenta"], "",
+                           formatear(descuadre["saldo"] - descuadre["esperado"])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Conciliación de fin de día: instantánea final contra la inicial más el diario")
+    parser.add_argument("--diario", required=True)
+    parser.add_argument("--final", required=True, help="instantánea base con los saldos finales")
+    parser.add_argument("--inicial", help="instantánea base con los saldos iniciales (copia del inicio del día)")
+    parser.add_argument("--dia", type=datetime.date.fromisoformat,
+                        help="día (AAAA-MM-DD) de los totales por tipo y servicio")
+    parser.add_argument("--formato", choices=("json", "csv"), default="json")
+    parser.add_argument("-o", "--salida", default="-")
+    args = parser.parse_args(argv)
+
+    try:
+        _requerir_numpy()
+        _, _, hasta, final = instantaneas.leer(args.final)
+        desde, iniciales = 0, None
+        if args.inicial:
+            _, _, desde, inicial = instantaneas.leer(args.inicial)
+            iniciales = saldos_de_instantanea(inicial)
+        resultado = reporte(leer_diario(args.diario, desde, hasta), saldos_de_instantanea(final),
+                            iniciales, dispensadores_de_instantanea(final), args.dia)
+    except (ReporteError, instantaneas.InstantaneaError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    salida = sys.stdout if args.salida == "-" else open(args.salida, "w", newline="", encoding="utf-8")
+    try:
+        (escribir_csv if args.formato == "csv" else escribir_json)(resultado, salida)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+    conciliacion = resultado["conciliacion"]
+    return 0 if conciliacion["diferencia"] == 0 and conciliacion["cuentas_descuadradas"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
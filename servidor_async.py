@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import metricas
+from credenciales import Autenticador, CredencialError, leer_parametros
+from diario import DiarioError
+from dinero import MontoError, a_centavos, formatear
+from Sistema_de_Cajero import (OperacionError, abrir_diario, autenticar, buscar_dispensador,
+                               crear_banco_ejemplo, depositar, leer_destino, pagar_servicio,
+                               retirar, retirar_en_red, transferir)
+
+# Servidor asyncio para sesiones de cajero sobre un socket local (TCP o Unix).
+# Protocolo de líneas de texto, una orden por línea:
+#
+#   AUTH <cliente_id> <password>
+#   CAJERO <id>                       elegir dispensador (ver abajo)
+#   SALDO
+#   MOVIMIENTOS [cantidad]            últimos movimientos, 20 por omisión
+#   RETIRO <monto>                    montos en pesos con hasta dos decimales
+#   DEPOSITO <denom>:<cant>[|<denom>:<cant>...]
+#   TRANSFERENCIA <destino> <monto>   ID de cliente o número de cuenta
+#   PAGO <servicio> <monto>
+#   SALIR
+#
+# Respuestas: "OK <json>" o "ERR <mensaje>", una línea por orden; los
+# montos y saldos van como texto con dos decimales. Sin CAJERO, cada
+# retiro va al cajero que puede entregarlo (retirar_en_red) y cada depósito
+# al que menos efectivo tiene; la respuesta dice qué cajero fue. Cada
+# conexión procesa una orden a la vez y espera a que el cliente lea la
+# respuesta (drain) antes de leer la siguiente, así un cliente lento no
+# acumula respuestas en memoria. Una sesión inactiva más de 'inactividad'
+# segundos se cierra.
+
+LARGO_MAXIMO_LINEA = 1024
+MOVIMIENTOS_POR_OMISION = 20
+
+class ServidorCajeroAsync:
+    def __init__(self, banco, inactividad=60.0, max_sesiones=10_000, hilos=8):
+        self.banco = banco
+        self.inactividad = inactividad
+        self.sesiones_activas = 0
+        self._cupo = asyncio.Semaphore(max_sesiones)
+        # Con diario las operaciones esperan el fsync: se sacan del ciclo de eventos
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="operacion")
+        self._servidor = None
+
+    async def _ejecutar(self, funcion, *args):
+        if self.banco.diario is None:
+            return funcion(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._ejecutor, funcion, *args)
+
+    async def _orden(self, sesion, partes):
+        comando = partes[0].upper()
+        if comando == "AUTH":
+            # El hash de la contraseña tarda: siempre fuera del ciclo de eventos
+            cuenta = await asyncio.get_running_loop().run_in_executor(
+                self._ejecutor, autenticar, self.banco, int(partes[1]), partes[2], sesion["origen"])
+            if cuenta is None:
+                raise OperacionError("Autenticación fallida")
+            sesion["cuenta"] = cuenta
+            return {"cuenta": cuenta.numero}
+        if comando == "CAJERO":
+            dispensador = buscar_dispensador(self.banco, int(partes[1]))
+            if dispensador is None:
+                raise OperacionError(f"Dispensador no encontrado: {partes[1]}")
+            sesion["dispensador"] = dispensador
+            return {"cajero": dispensador.id}
+
+        cuenta = sesion.get("cuenta")
+        if cuenta is None:
+            raise OperacionError("Debe autenticarse primero")
+        if comando == "SALDO":
+            return {"saldo": formatear(cuenta.saldo)}
+        if comando == "MOVIMIENTOS":
+            cantidad = int(partes[1]) if len(partes) > 1 else MOVIMIENTOS_POR_OMISION
+            total = len(cuenta.movimientos)
+            return {"movimientos": [
+                {"fecha": mov.fecha.isoformat(timespec="seconds"), "tipo": mov.tipo,
+                 "monto": formatear(mov.monto), "destino": mov.cuenta_destino, "servicio": mov.servicio}
+                for mov in cuenta.movimientos[max(0, total - cantidad):total]]}
+        if comando == "TRANSFERENCIA":
+            destino = await self._ejecutar(transferir, self.banco, cuenta, leer_destino(partes[1]),
+                                           a_centavos(partes[2]))
+            return {"destino": destino.numero, "saldo": formatear(cuenta.saldo)}
+        if comando == "PAGO":
+            referencia = await self._ejecutar(pagar_servicio, cuenta, partes[1],
+                                              a_centavos(partes[2]))
+            return {"referencia": referencia, "saldo": formatear(cuenta.saldo)}
+
+        if comando == "RETIRO":
+            monto = a_centavos(partes[1])
+            dispensador = sesion.get("dispensador")
+            if dispensador is None:
+                dispensador, desglose = await self._ejecutar(retirar_en_red, self.banco, cuenta, monto)
+            else:
+                desglose = await self._ejecutar(retirar, self.banco, cuenta, dispensador, monto)
+            return {"cajero": dispensador.id, "desglose": desglose, "saldo": formatear(cuenta.saldo)}
+        if comando == "DEPOSITO":
+            billetes = {int(d): int(c) for d, c in (par.split(":") for par in partes[1].split("|"))}
+            dispensador = sesion.get("dispensador") or self.banco.enrutador.elegir_deposito()
+            if dispensador is None:
+                raise OperacionError("No hay dispensadores disponibles")
+            total = await self._ejecutar(depositar, self.banco, cuenta, dispensador, billetes)
+            return {"cajero": dispensador.id, "total": formatear(total),
+                    "saldo": formatear(cuenta.saldo)}
+        raise OperacionError(f"Orden desconocida: {partes[0]}")
+
+    async def atender(self, lector, escritor):
+        async with self._cupo:
+            self.sesiones_activas += 1
+            # Origen para los límites de intentos: la IP del cliente
+            direccion = escritor.get_extra_info("peername")
+            sesion = {"origen": direccion[0] if isinstance(direccion, tuple) else "unix"}
+            try:
+                while True:
+                    try:
+                        linea = await asyncio.wait_for(lector.readline(), self.inactividad)
+                    except asyncio.TimeoutError:
+                        escritor.write(b"ERR Sesion cerrada por inactividad\n")
+                        break
+                    except ValueError:
+                        # Línea más larga que el límite del lector
+                        escritor.write(b"ERR Linea demasiado larga\n")
+                        break
+                    if not linea:
+                        break
+                    partes = linea.decode("utf-8", "replace").split()
+                    if not partes:
+                        continue
+                    if partes[0].upper() == "SALIR":
+                        escritor.write(b"OK {}\n")
+                        break
+                    try:
+                        respuesta = "OK " + json.dumps(await self._orden(sesion, partes),
+                                                       ensure_ascii=False)
+                    except (OperacionError, MontoError, CredencialError, DiarioError) as e:
+                        respuesta = f"ERR {e}"
+                    except (IndexError, ValueError, ArithmeticError):
+                        respuesta = f"ERR Orden mal formada: {' '.join(partes)}"
+                    escritor.write(respuesta.encode("utf-8") + b"\n")
+                    await escritor.drain()
+                await escritor.drain()
+            except ConnectionError:
+                pass
+            finally:
+                self.sesiones_activas -= 1
+                escritor.close()
+
+    async def iniciar(self, host="127.0.0.1", puerto=0, unix=None):
+        if unix:
+            self._servidor = await asyncio.start_unix_server(self.atender, unix,
+                                                             limit=LARGO_MAXIMO_LINEA)
+        else:
+            self._servidor = await asyncio.start_server(self.atender, host, puerto,
+                                                        limit=LARGO_MAXIMO_LINEA)
+        return self._servidor
+
+    async def cerrar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        self._ejecutor.shutdown(wait=True)
+
+async def _servir(args):
+    banco = crear_banco_ejemplo()
+    banco.autenticador = Autenticador(leer_parametros(args.hash), procesos=args.procesos_hash)
+    if args.diario:
+        abrir_diario(banco, args.diario)
+    servidor = ServidorCajeroAsync(banco, args.inactividad, args.max_sesiones)
+    socket_servidor = await servidor.iniciar(args.host, args.puerto, args.unix)
+    direccion = args.unix or "%s:%s" % socket_servidor.sockets[0].getsockname()[:2]
+    print(f"Escuchando en {direccion}", file=sys.stderr)
+    try:
+        await socket_servidor.serve_forever()
+    finally:
+        await servidor.cerrar()
+        banco.autenticador.cerrar()
+        if banco.diario is not None:
+            banco.diario.cerrar()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor asyncio de sesiones de cajero")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--unix", help="ruta de un socket Unix en lugar de TCP")
+    parser.add_argument("--inactividad", type=float, default=60.0)
+    parser.add_argument("--max-sesiones", type=int, default=10_000)
+    parser.add_argument("--diario", help="diario de movimientos a recuperar y extender")
+    parser.add_argument("--hash", help="algoritmo y costo de las credenciales, p. ej. scrypt:n=32768")
+    parser.add_argument("--procesos-hash", type=int, default=0,
+                        help="procesos para verificar contraseñas (0: en los hilos del servidor)")
+    parser.add_argument("--metricas-puerto", type=int,
+                        help="activar métricas y exponerlas por HTTP en /metrics y /metrics.json")
+    args = parser.parse_args(argv)
+    if args.metricas_puerto:
+        metricas.activar()
+        metricas.servir_http(args.metricas_puerto)
+    try:
+        asyncio.run(_servir(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from diario import DiarioError
+from dinero import MontoError
+from Sistema_de_Cajero import (OperacionError, autenticar, buscar_dispensador, depositar,
+                               pagar_servicio, retirar, retirar_en_red, transferir)
+
+# Servidor de sesiones concurrentes: cada sesión (un cliente frente a un
+# cajero) se atiende en un hilo del pool. Con cajero_id opera con ese
+# dispensador; sin él, cada retiro va al cajero que puede entregarlo
+# (retirar_en_red) y cada depósito al que menos efectivo tiene, como en los
+# menús. Los cajeros se buscan en el banco en cada sesión, así también
+# cuentan los que se agregan con el servidor andando.
+# La consistencia la dan los bloqueos de las operaciones: franjas por cuenta
+# y un bloqueo por dispensador, tomados siempre en el mismo orden.
+#
+# Operaciones de una sesión (tuplas; montos en centavos, ver dinero.py):
+#   ("retiro", monto)
+#   ("deposito", {200: 1, 50: 2})
+#   ("transferencia", destino, monto)  ID de cliente (int) o número de cuenta
+#   ("pago", servicio, monto)
+#   ("saldo",)
+#   ("movimientos", cantidad)   últimos 'cantidad' movimientos
+
+class Sesion:
+    __slots__ = ('cliente_id', 'password', 'cajero_id', 'operaciones')
+
+    def __init__(self, cliente_id, password, operaciones, cajero_id=None):
+        self.cliente_id = cliente_id
+        self.password = password
+        self.operaciones = operaciones
+        self.cajero_id = cajero_id
+
+class ResultadoSesion:
+    __slots__ = ('autenticado', 'dispensador_id', 'resultados', 'latencias')
+
+    def __init__(self, autenticado, dispensador_id):
+        self.autenticado = autenticado
+        self.dispensador_id = dispensador_id
+        # (operación, ok, detalle) por cada operación de la sesión
+        self.resultados = []
+        # segundos por operación, en el mismo orden
+        self.latencias = []
+
+class ServidorSesiones:
+    def __init__(self, banco, hilos=8):
+        self.banco = banco
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="sesion")
+
+    # Dispensador de la sesión, o None si cada operación elige el suyo
+    def _dispensador(self, sesion):
+        if sesion.cajero_id is None:
+            return None
+        dispensador = buscar_dispensador(self.banco, sesion.cajero_id)
+        if dispensador is None:
+            raise OperacionError(f"Dispensador no encontrado: {sesion.cajero_id}")
+        return dispensador
+
+    def _ejecutar(self, cuenta, dispensador, operacion):
+        tipo = operacion[0]
+        if tipo == "retiro":
+            if dispensador is None:
+                return retirar_en_red(self.banco, cuenta, operacion[1])[1]
+            return retirar(self.banco, cuenta, dispensador, operacion[1])
+        if tipo == "deposito":
+            if dispensador is None:
+                dispensador = self.banco.enrutador.elegir_deposito()
+                if dispensador is None:
+                    raise OperacionError("No hay dispensadores disponibles")
+            return depositar(self.banco, cuenta, dispensador, operacion[1])
+        if tipo == "transferencia":
+            return transferir(self.banco, cuenta, operacion[1], operacion[2]).numero
+        if tipo == "pago":
+            return pagar_servicio(cuenta, operacion[1], operacion[2])
+        if tipo == "saldo":
+            return cuenta.saldo
+        if tipo == "movimientos":
+            total = len(cuenta.movimientos)
+            return cuenta.movimientos[max(0, total - operacion[1]):total]
+        raise OperacionError(f"Operación desconocida: {tipo}")
+
+    def atender(self, sesion):
+        cuenta = autenticar(self.banco, sesion.cliente_id, sesion.password, sesion.cajero_id)
+        if cuenta is None:
+            return ResultadoSesion(False, None)
+        try:
+            dispensador = self._dispensador(sesion)
+        except (OperacionError, MontoError, DiarioError) as e:
+            resultado = ResultadoSesion(True, None)
+            resultado.resultados.append((None, False, str(e)))
+            return resultado
+
+        resultado = ResultadoSesion(True, dispensador.id if dispensador is not None else None)
+        for operacion in sesion.operaciones:
+            inicio = time.perf_counter()
+            # Un monto inválido o un error del diario rechazan la operación
+            # como cualquier otro error, y la sesión sigue; si el diario
+            # falla, la operación no cambió nada
+            try:
+                detalle = self._ejecutar(cuenta, dispensador, operacion)
+                ok = True
+            except (OperacionError, MontoError, DiarioError) as e:
+                detalle = str(e)
+                ok = False
+            resultado.latencias.append(time.perf_counter() - inicio)
+            resultado.resultados.append((operacion[0], ok, detalle))
+        return resultado
+
+    def enviar(self, sesion):
+        return self._ejecutor.submit(self.atender, sesion)
+
+    def atender_todas(self, sesiones):
+        return list(self._ejecutor.map(self.atender, sesiones))
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
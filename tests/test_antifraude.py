@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+import antifraude
+from dinero import CENTAVOS
+from particiones import Particion
+from Sistema_de_Cajero import Banco, Cliente, Cuenta
+
+# Lee y cede el hilo antes de que se escriba el valor nuevo: sin bloqueo,
+# un += de otro hilo en el medio se pierde
+class _Contadores(dict):
+    def __getitem__(self, clave):
+        valor = super().__getitem__(clave)
+        time.sleep(0)
+        return valor
+
+# Los contadores por regla no pierden marcas con muchas cuentas revisadas
+# a la vez
+def test_marcadas_sin_perdidas():
+    control = antifraude.Antifraude(antifraude.leer_reglas("retiro_diario=1"), antifraude.ACTIVO)
+    control.marcadas = _Contadores(control.marcadas)
+    hilos, revisiones = 8, 500
+
+    def revisar(h):
+        for i in range(revisiones):
+            assert control.revisar_retiro(f"{h}-{i % 50}", 2 * CENTAVOS)
+
+    trabajadores = [threading.Thread(target=revisar, args=(h,)) for h in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+    assert control.marcadas["retiro_diario"] == hilos * revisiones
+
+def _particion(particion, reglas):
+    banco = Banco()
+    banco.antifraude = antifraude.Antifraude(antifraude.leer_reglas(reglas), antifraude.ACTIVO)
+    credencial = banco.autenticador.generar("1234")
+    for i in range(1, 5):
+        if i % 2 == particion:
+            banco.agregar_cliente(Cliente(i, f"Cliente {i}", credencial))
+            banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, 10_000 * CENTAVOS))
+    return Particion(banco, particion, 2)
+
+# Una transferencia a otra partición que se aborta no cuenta para
+# antifraude: el límite solo lo consumen las confirmadas
+@pytest.mark.parametrize("reglas", ["transferencias=1", "monto_transferido=100"])
+def test_transferencia_abortada_no_se_anota(reglas):
+    origen = _particion(0, reglas)
+    cuenta = origen.banco.cuentas_por_numero["001-00000002"]
+    tx = origen._retener(cuenta, "999-no-existe", 100 * CENTAVOS)
+    origen.resolver([(tx, False, None)])
+    tx = origen._retener(cuenta, 1, 100 * CENTAVOS)
+    origen.resolver([(tx, True, "001-00000001")])
+    with pytest.raises(Exception, match="Demasiadas|límite"):
+        origen._retener(cuenta, 3, 100 * CENTAVOS)
+    assert cuenta.saldo == 9_900 * CENTAVOS
+
+# El destino se anota con el número de cuenta resuelto: transferir al
+# mismo cliente por su número de cuenta no es un destinatario nuevo
+def test_destino_anotado_con_numero_de_cuenta():
+    origen = _particion(0, "destinos=1")
+    cuenta = origen.banco.cuentas_por_numero["001-00000002"]
+    tx = origen._retener(cuenta, 1, 10 * CENTAVOS)
+    origen.resolver([(tx, True, "001-00000001")])
+    tx = origen._retener(cuenta, "001-00000001", 10 * CENTAVOS)
+    origen.resolver([(tx, True, "001-00000001")])
+    with pytest.raises(Exception, match="destinatarios"):
+        origen._retener(cuenta, "001-00000003", 10 * CENTAVOS)
+    assert origen.banco.antifraude.marcadas["destinos"] == 1
+
+# Por omisión el control solo marca: rechazar es opcional, con
+# CAJERO_ANTIFRAUDE_MODO=activo
+def test_modo_sombra_por_omision(monkeypatch):
+    monkeypatch.setenv("CAJERO_ANTIFRAUDE", "retiro_diario=1")
+    monkeypatch.delenv("CAJERO_ANTIFRAUDE_MODO", raising=False)
+    assert Banco().antifraude.modo == antifraude.SOMBRA
+    for control in (antifraude.Antifraude(antifraude.leer_reglas("retiro_diario=1")),
+                    antifraude.Antifraude.desde_entorno()):
+        assert control.modo == antifraude.SOMBRA
+        assert control.revisar_retiro("001-1", 2 * CENTAVOS) is None
+        assert control.marcadas["retiro_diario"] == 1
+
+    monkeypatch.setenv("CAJERO_ANTIFRAUDE_MODO", antifraude.ACTIVO)
+    assert antifraude.Antifraude.desde_entorno().revisar_retiro("001-1", 2 * CENTAVOS)
@@ -0,0 +1,101 @@
+import datetime
+
+import pytest
+
+from dinero import CENTAVOS
+from Sistema_de_Cajero import (Banco, Cliente, Cuenta, Dispensador, HistorialMovimientos, Movimiento,
+                               OperacionError, crear_banco_ejemplo, depositar, pagar_servicio, retirar,
+                               transferir)
+
+def _atributos(movimiento):
+    return (movimiento.fecha_us, movimiento.tipo, movimiento.monto, movimiento.cuenta_numero,
+            movimiento.cuenta_destino, movimiento.servicio, movimiento.dispensador_id, movimiento.billetes)
+
+# Las entidades no tienen __dict__ y el historial en columnas devuelve los
+# mismos atributos que se guardaron, fecha incluida
+def test_entidades_compactas_e_historial_en_columnas():
+    banco = crear_banco_ejemplo()
+    for objeto in (banco.clientes[0], banco.cuentas[0], banco.dispensadores[0],
+                   Movimiento("RETIRO", -100, "001-123456")):
+        assert not hasattr(objeto, "__dict__")
+        with pytest.raises(AttributeError):
+            objeto.otro = 1
+
+    cuenta, otra, _ = banco.cuentas
+    dispensador = banco.dispensadores[0]
+    retirar(banco, cuenta, dispensador, 300 * CENTAVOS)
+    depositar(banco, cuenta, dispensador, {100: 2, 20: 1})
+    transferir(banco, cuenta, otra.numero, 125_50)
+    pagar_servicio(cuenta, "Luz", 99_99)
+    historial = cuenta.movimientos
+    assert isinstance(historial, HistorialMovimientos)
+    assert historial.fechas.typecode == "q" and historial.tipos.typecode == "B"
+    leidos = list(historial)
+    assert [m.tipo for m in leidos] == ["RETIRO", "DEPÓSITO", "TRANSFERENCIA", "PAGO_SERVICIO"]
+    assert [m.monto for m in leidos] == [-300_00, 220_00, -125_50, -99_99]
+    assert leidos[0].dispensador_id == dispensador.id and sum(d * c for d, c in leidos[0].billetes.items()) == 300
+    assert leidos[1].billetes == {100: 2, 20: 1}
+    assert leidos[2].cuenta_destino == otra.numero and leidos[3].servicio == "Luz"
+    assert [_atributos(m) for m in historial[-2:]] == [_atributos(m) for m in leidos[2:]]
+
+    # Una fecha dada se guarda en microsegundos y se lee igual
+    fecha = datetime.datetime(2024, 5, 1, 12, 30, 15, 250)
+    nuevo = HistorialMovimientos(cuenta.numero)
+    nuevo.append(Movimiento("DEPÓSITO", 1, cuenta.numero, fecha=fecha))
+    assert nuevo[0].fecha == fecha and nuevo[0].dispensador_id is None
+
+# Los índices ordenados se mantienen con altas en cualquier orden (ids ya
+# ordenados, al revés o mezclados, que hundían a quicksort) y con bajas
+def test_indices_ordenados():
+    banco = Banco()
+    ids = list(range(5_000, 0, -1)) + list(range(5_001, 10_001))
+    for i in ids[:6_000]:
+        banco.agregar_cliente(Cliente(i, f"Cliente {i}", "x"))
+    banco.agregar_clientes([Cliente(i, f"Cliente {i}", "x") for i in ids[6_000:]])
+    assert [c.id for c in banco.listar_clientes()] == list(range(1, 10_001))
+    assert [c.id for c in banco.listar_clientes(4_998, 5_003)] == [4_998, 4_999, 5_000, 5_001, 5_002]
+    assert banco.indice_clientes.buscar(7_777).nombre == "Cliente 7777"
+    assert banco.indice_clientes.buscar(10_001) is None
+    assert banco.busqueda_binaria(banco.indice_clientes.objetos, 1).id == 1
+
+    for numero in ("003", "001", "002", "010"):
+        banco.agregar_cuenta(Cuenta(numero, 1, 0))
+    banco.quitar_cuenta("002")
+    assert [c.numero for c in banco.listar_cuentas()] == ["001", "003", "010"]
+    assert [c.numero for c in banco.listar_cuentas("002", "010")] == ["003"]
+    for i in (3, 1, 2):
+        banco.agregar_dispensador(Dispensador(i, f"Cajero {i}"))
+    assert [d.id for d in banco.listar_dispensadores()] == [1, 2, 3]
+
+# Un cliente con varias cuentas: la de menor número es la principal, las
+# transferencias llegan a una cuenta por su número y los índices siguen al
+# día con altas, bajas, cambios de saldo y altas rechazadas
+def test_varias_cuentas_por_cliente():
+    banco = Banco()
+    banco.agregar_cliente(Cliente(1, "Ana", "x"))
+    banco.agregar_cliente(Cliente(2, "Beto", "x"))
+    for numero, saldo in (("B-2", 500), ("B-1", 100), ("B-3", 0)):
+        banco.agregar_cuenta(Cuenta(numero, 1, saldo * CENTAVOS))
+    banco.agregar_cuenta(Cuenta("C-1", 2, 1_000 * CENTAVOS))
+    assert [c.numero for c in banco.cuentas_de_cliente(1)] == ["B-1", "B-2", "B-3"]
+    assert banco.cuenta_destino(1).numero == "B-1" and banco.cuenta_destino("B-2").numero == "B-2"
+
+    transferir(banco, banco.cuenta_destino(2), "B-3", 50 * CENTAVOS)
+    assert banco.cuentas_por_numero["B-3"].saldo == 50 * CENTAVOS
+    assert [c.numero for c in banco.cuentas_por_saldo(40 * CENTAVOS, 600 * CENTAVOS)] == ["B-3", "B-1", "B-2"]
+    banco.cuentas_por_numero["B-2"].saldo = 2_000 * CENTAVOS
+    assert [c.numero for c in banco.cuentas_por_saldo(900 * CENTAVOS)] == ["C-1", "B-2"]
+
+    with pytest.raises(OperacionError):
+        banco.agregar_cuenta(Cuenta("B-1", 2, 0))
+    with pytest.raises(OperacionError, match="sin saldo"):
+        banco.quitar_cuenta("B-1")
+    assert banco.cuenta_destino(2).numero == "C-1" and len(banco.cuentas) == 4
+
+    banco.cuentas_por_numero["B-1"].saldo = 0
+    banco.quitar_cuenta("B-1")
+    assert [c.numero for c in banco.cuentas_de_cliente(1)] == ["B-2", "B-3"]
+    assert banco.cuenta_destino(1).numero == "B-2" and "B-1" not in banco.cuentas_por_numero
+    assert [c.numero for c in banco.cuentas_por_saldo(hasta=100 * CENTAVOS)] == ["B-3"]
+    # La última cuenta pasó a la fila libre con su saldo
+    assert {c.numero: c.saldo // CENTAVOS for c in banco.cuentas} == {"B-2": 2_000, "B-3": 50, "C-1": 950}
@@ -0,0 +1,42 @@
+import copy
+import json
+
+import pytest
+
+from benchmarks import bench_flujo
+
+# Una corrida chica escribe el JSON con cada tipo de la mezcla, todas las
+# operaciones contadas una vez y los micro-benchmarks; comparada contra sí
+# misma con una métrica empeorada, la marca como regresión y sale con 1
+def test_corrida_chica_y_comparacion(tmp_path, capsys):
+    salida = tmp_path / "flujo.json"
+    argumentos = ["--clientes", "200", "--cajeros", "3", "--movimientos", "500", "--operaciones", "2000",
+                  "--muestra-memoria", "20", "--n-orden", "100", "--llamadas", "100",
+                  "--repeticiones", "1", "--semilla", "3", "-o", str(salida)]
+    bench_flujo.main(argumentos)
+    resultado = json.loads(salida.read_text(encoding="utf-8"))
+    assert json.loads(capsys.readouterr().out) == resultado
+
+    tipos = set(bench_flujo.leer_mezcla(bench_flujo.MEZCLA))
+    assert set(resultado["operaciones"]) == tipos
+    assert sum(v["operaciones"] for v in resultado["operaciones"].values()) == 2000
+    for valores in resultado["operaciones"].values():
+        assert valores["ops_por_s"] > 0 and 0 < valores["p50_us"] <= valores["p99_us"]
+        assert {"pico_kb", "retenidos_bytes_por_op", "rechazadas"} <= set(valores)
+    assert resultado["total"]["ops_por_s"] > 0
+    assert resultado["micro"]["quicksort_n"] == 100 and resultado["micro"]["busqueda_binaria_n"] == 200
+    # La misma semilla genera las mismas operaciones
+    assert (bench_flujo.crear_operaciones(50, bench_flujo.leer_mezcla(bench_flujo.MEZCLA), 200, 3, 3)
+            == bench_flujo.crear_operaciones(50, bench_flujo.leer_mezcla(bench_flujo.MEZCLA), 200, 3, 3))
+
+    anterior = copy.deepcopy(resultado)
+    anterior["total"]["ops_por_s"] *= 2
+    comparacion = bench_flujo.comparar(anterior, resultado, 0.15)
+    assert comparacion["regresiones"] == ["total.ops_por_s"] and comparacion["cambios"]["total.ops_por_s"] == 0.5
+    assert bench_flujo.comparar(resultado, resultado, 0.15)["regresiones"] == []
+
+    previo = tmp_path / "previo.json"
+    previo.write_text(json.dumps(anterior), encoding="utf-8")
+    with pytest.raises(SystemExit) as salida_con_error:
+        bench_flujo.main(argumentos + ["--comparar", str(previo)])
+    assert salida_con_error.value.code == 1
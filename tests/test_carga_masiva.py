@@ -0,0 +1,69 @@
+import io
+
+import pytest
+
+import carga_masiva
+import credenciales
+from Sistema_de_Cajero import Banco, crear_banco_ejemplo
+
+RAPIDO = credenciales.leer_parametros("pbkdf2_sha256:iteraciones=1000")
+
+def _clientes(cantidad, inicio=1):
+    credencial = credenciales.generar("1234", RAPIDO)
+    return [{"id": str(i), "nombre": f"Cliente {i}", "credencial": credencial}
+            for i in range(inicio, inicio + cantidad)]
+
+# Una contraseña en claro no entra por la carga masiva: la fila se rechaza
+# con el resto del archivo y el banco no cambia
+def test_credencial_en_claro_se_rechaza():
+    banco = Banco()
+    filas = _clientes(5)
+    filas[3]["credencial"] = "1234"
+    with pytest.raises(carga_masiva.ImportacionError, match="fila 4: .*en claro") as error:
+        carga_masiva.importar(banco, carga_masiva.CLIENTES, filas, lote=2)
+    assert error.value.cantidad == 1
+    assert not banco.clientes
+    resumen = carga_masiva.importar(banco, carga_masiva.CLIENTES, _clientes(5), lote=2)
+    assert resumen["agregadas"] == 5
+    assert all(credenciales.es_hash(cliente.credencial) for cliente in banco.clientes)
+
+def _foto(banco):
+    return ([(c.id, c.nombre, c.credencial) for c in banco.listar_clientes()],
+            [(c.numero, c.cliente_id, c.saldo) for c in banco.listar_cuentas()],
+            [(d.id, d.ubicacion, dict(d.billetes)) for d in banco.listar_dispensadores()])
+
+# Una fila mala en el último lote, después de lotes que ya se validaron
+# enteros, deja el banco sin cambios y el error dice su número de fila
+def test_fila_mala_en_el_ultimo_lote_no_importa_nada():
+    banco = crear_banco_ejemplo()
+    antes = _foto(banco)
+    filas = [{"numero": f"002-{i:04d}", "cliente_id": str(1 + i % 3), "saldo": "10.50"} for i in range(10)]
+    filas[9]["cliente_id"] = "99"
+    leidas = []
+    with pytest.raises(carga_masiva.ImportacionError, match="fila 10: No existe el cliente 99") as error:
+        carga_masiva.importar(banco, carga_masiva.CUENTAS, filas, lote=3, progreso=leidas.append)
+    assert error.value.cantidad == 1 and leidas == [3, 6, 9, 10]
+    assert _foto(banco) == antes
+
+    filas[9]["cliente_id"] = "1"
+    resumen = carga_masiva.importar(banco, carga_masiva.CUENTAS, filas, lote=3)
+    assert resumen["agregadas"] == 10 and banco.cuentas_por_numero["002-0009"].saldo == 10_50
+
+# Lo exportado, en CSV o JSONL, se importa en un banco vacío y queda igual
+@pytest.mark.parametrize("formato", ["csv", "jsonl"])
+def test_exportar_e_importar_en_otro_banco(formato):
+    origen = Banco()
+    carga_masiva.importar(origen, carga_masiva.CLIENTES, _clientes(7))
+    carga_masiva.importar(origen, carga_masiva.CUENTAS,
+                          [{"numero": f"001-{i}", "cliente_id": str(i), "saldo": f"{i}.05"} for i in range(1, 8)])
+    carga_masiva.importar(origen, carga_masiva.DISPENSADORES,
+                          [{"id": "2", "ubicacion": "Centro, \"Sur\"", "billetes": {"200": 3, "20": 1}}])
+    destino = Banco()
+    for entidad in carga_masiva.ENTIDADES:
+        salida = io.StringIO()
+        escritas = []
+        total = carga_masiva.exportar(origen, entidad, salida, formato, lote=3, progreso=escritas.append)
+        assert escritas[-1] == total and len(escritas) == -(-total // 3)
+        salida.seek(0)
+        carga_masiva.importar(destino, entidad, carga_masiva.lector(formato)(salida), lote=3)
+    assert _foto(destino) == _foto(origen)
@@ -0,0 +1,17 @@
+import pytest
+
+import credenciales
+from credenciales import CredencialError
+
+RAPIDO = credenciales.leer_parametros("pbkdf2_sha256:iteraciones=1000")
+
+# Los datos nuevos solo aceptan hashes bien formados; una contraseña en claro
+# sigue valiendo en datos anteriores y se rehace al verificarla
+def test_exigir_hash():
+    credencial = credenciales.generar("1234", RAPIDO)
+    assert credenciales.exigir_hash(credencial) == credencial
+    for invalida in ("1234", "scrypt$x$8$1$c2Fs$aGFzaA==", "pbkdf2_sha256$1000$c2Fs", "pbkdf2_sha256$1$!$a"):
+        with pytest.raises(CredencialError, match="en claro"):
+            credenciales.exigir_hash(invalida)
+    correcta, nueva = credenciales.verificar_y_actualizar("1234", "1234", RAPIDO)
+    assert correcta and credenciales.exigir_hash(nueva) and credenciales.verificar(nueva, "1234")
@@ -0,0 +1,140 @@
+import itertools
+import random
+
+import pytest
+
+import Sistema_de_Cajero as cajero
+from Sistema_de_Cajero import (MODO_MENOS_BILLETES, MODO_PRESERVAR_ESCASOS, Dispensador,
+                               calcular_desglose_billetes)
+
+# Todas las combinaciones posibles: (cantidad de billetes, costo con pesos
+# de escasez) mínimos para cada monto, o None
+def _fuerza_bruta(billetes, monto):
+    denoms = sorted(billetes)
+    mejor_cantidad = mejor_costo = None
+    for cantidades in itertools.product(*(range(billetes[d] + 1) for d in denoms)):
+        if sum(d * c for d, c in zip(denoms, cantidades)) != monto:
+            continue
+        cantidad = sum(cantidades)
+        costo = sum(c * (1 + cajero._ESCALA_ESCASEZ // billetes[d]) for d, c in zip(denoms, cantidades))
+        mejor_cantidad = cantidad if mejor_cantidad is None else min(mejor_cantidad, cantidad)
+        mejor_costo = costo if mejor_costo is None else min(mejor_costo, costo)
+    return mejor_cantidad, mejor_costo
+
+def _dispensador(billetes):
+    dispensador = Dispensador(1, "Prueba")
+    dispensador.billetes = billetes
+    return dispensador
+
+@pytest.fixture(autouse=True)
+def memo_vacio():
+    cajero._desgloses_memo.clear()
+    yield
+    cajero._desgloses_memo.clear()
+
+def test_desglose_contra_fuerza_bruta():
+    azar = random.Random(3)
+    for _ in range(150):
+        billetes = {d: azar.randrange(0, 5) for d in (200, 100, 50, 20)}
+        dispensador = _dispensador(billetes)
+        activos = {d: c for d, c in billetes.items() if c > 0}
+        for monto in range(10, 700, 10):
+            cantidad, costo = _fuerza_bruta(activos, monto)
+            assert dispensador.puede_dispensar(monto) == (cantidad is not None)
+            for modo in (MODO_MENOS_BILLETES, MODO_PRESERVAR_ESCASOS):
+                desglose = calcular_desglose_billetes(monto, dispensador, modo)
+                if cantidad is None:
+                    assert desglose is None
+                    continue
+                assert sum(d * c for d, c in desglose.items()) == monto
+                assert all(0 < c <= billetes[d] for d, c in desglose.items())
+                if modo == MODO_MENOS_BILLETES:
+                    assert sum(desglose.values()) == cantidad
+                else:
+                    assert sum(c * (1 + cajero._ESCALA_ESCASEZ // billetes[d])
+                               for d, c in desglose.items()) == costo
+
+# El memo devuelve lo mismo que un cálculo nuevo mientras el inventario cambia
+def test_memo_valido_despues_de_retiros():
+    azar = random.Random(7)
+    for _ in range(40):
+        dispensador = _dispensador({d: azar.randrange(0, 400) for d in (200, 100, 50, 20)})
+        for _ in range(40):
+            monto = azar.choice([20, 50, 100, 150, 300, 500, 1000, 2500])
+            modo = azar.choice([MODO_MENOS_BILLETES, MODO_PRESERVAR_ESCASOS])
+            desglose = calcular_desglose_billetes(monto, dispensador, modo)
+            memo = dict(cajero._desgloses_memo)
+            cajero._desgloses_memo.clear()
+            assert calcular_desglose_billetes(monto, dispensador, modo) == desglose
+            cajero._desgloses_memo.update(memo)
+            for denom, cantidad in (desglose or {}).items():
+                dispensador.billetes[denom] -= cantidad
+
+def test_cache_de_alcance_despues_de_clear():
+    dispensador = _dispensador({200: 1, 100: 1})
+    assert dispensador.puede_dispensar(300)
+    dispensador.billetes.clear()
+    assert dispensador.efectivo == 0
+    assert not dispensador.puede_dispensar(300)
+    assert calcular_desglose_billetes(300, dispensador) is None
+    dispensador.billetes[100] = 3
+    assert dispensador.efectivo == 300
+    assert dispensador.puede_dispensar(300)
+    assert calcular_desglose_billetes(300, dispensador) == {100: 3}
+
+def test_cache_de_alcance_con_cambios_del_inventario():
+    dispensador = _dispensador({50: 1})
+    assert not dispensador.puede_dispensar(70)
+    dispensador.billetes[20] = 1
+    assert dispensador.puede_dispensar(70)
+    del dispensador.billetes[50]
+    assert not dispensador.puede_dispensar(70)
+    assert dispensador.puede_dispensar(20)
+    dispensador.billetes.update({200: 2})
+    assert dispensador.puede_dispensar(420)
+    assert dispensador.efectivo == 420
+
+# La máscara por prefijos sigue igual a una reconstruida desde cero después
+# de retiros y depósitos, y un retiro solo rehace los prefijos desde la
+# denominación más chica que tocó
+def test_mascara_incremental_despues_de_retiros(monkeypatch):
+    azar = random.Random(11)
+    dispensador = _dispensador({d: azar.randrange(0, 300) for d in (200, 100, 50, 20)})
+    for _ in range(300):
+        if azar.random() < 0.7:
+            monto = azar.choice([20, 50, 100, 200, 300, 500, 1000])
+            for denom, cantidad in (calcular_desglose_billetes(monto, dispensador) or {}).items():
+                dispensador.billetes[denom] -= cantidad
+        else:
+            denom = azar.choice([200, 100, 50, 20])
+            dispensador.billetes[denom] += azar.randrange(1, 20)
+        assert dispensador.montos_alcanzables() == cajero._mascara_alcanzable(
+            dispensador.billetes, Dispensador.LIMITE_ALCANCE)
+
+    dispensador = _dispensador({200: 50, 100: 50, 50: 50, 20: 50})
+    dispensador.montos_alcanzables()
+    rehechas = []
+    original = cajero._agregar_billetes
+    monkeypatch.setattr(cajero, "_agregar_billetes",
+                        lambda mascara, denom, *args: rehechas.append(denom) or original(mascara, denom, *args))
+    dispensador.billetes[200] -= 3
+    assert dispensador.puede_dispensar(400)
+    assert rehechas == [200]
+    dispensador.billetes[100] -= 1
+    dispensador.billetes[200] -= 1
+    assert dispensador.puede_dispensar(300)
+    assert rehechas == [200, 100, 200]
+
+# Un retiro o depósito de varias denominaciones avisa al enrutador una sola
+# vez y deja efectivo y máscara igual que cambiarlas de a una
+def test_sumar_varias_denominaciones():
+    dispensador = _dispensador({200: 30, 100: 30, 50: 30})
+    dispensador.montos_alcanzables()
+    movidos = []
+    dispensador._enrutador = type("Enrutador", (), {"_mover": lambda self, d: movidos.append(d.efectivo)})()
+    dispensador.billetes.sumar({200: -2, 100: -1, 50: 0})
+    dispensador.billetes.sumar({50: 4, 20: 3})
+    assert movidos == [10500 - 500, 10500 - 500 + 260]
+    assert dispensador.billetes == {200: 28, 100: 29, 50: 34, 20: 3}
+    assert dispensador.montos_alcanzables() == cajero._mascara_alcanzable(
+        dispensador.billetes, Dispensador.LIMITE_ALCANCE)
@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+
+import pytest
+
+import carga_masiva
+from diario import MAX_CUENTA, REGISTRO, Diario, DiarioError
+from Sistema_de_Cajero import (Cuenta, OperacionError, abrir_diario, crear_banco_ejemplo, depositar,
+                               pagar_servicio, retirar, transferir)
+
+def _saldos(banco):
+    return {cuenta.numero: cuenta.saldo for cuenta in banco.cuentas}
+
+def _operar(banco):
+    cuenta1, cuenta2, _ = banco.cuentas
+    dispensador = banco.dispensadores[0]
+    retirar(banco, cuenta1, dispensador, 300_00)
+    depositar(banco, cuenta2, dispensador, {100: 2, 20: 1})
+    transferir(banco, cuenta1, cuenta2.numero, 125_50)
+    pagar_servicio(cuenta2, "Luz", 99_99)
+
+# Los saldos de ejemplo más el diario reaplicado dan el mismo estado
+def test_reaplicar_diario(tmp_path):
+    ruta = str(tmp_path / "cajero.diario")
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, ruta)
+    _operar(banco)
+    esperado = _saldos(banco)
+    movimientos = [list(c.movimientos) for c in banco.cuentas]
+    banco.diario.cerrar()
+
+    otro = crear_banco_ejemplo()
+    assert abrir_diario(otro, ruta) == 0
+    assert _saldos(otro) == esperado
+    assert otro.diario.total == 5
+    recuperados = [list(c.movimientos) for c in otro.cuentas]
+    assert [[(m.tipo, m.monto, m.cuenta_destino, m.billetes) for m in h] for h in recuperados] == \
+           [[(m.tipo, m.monto, m.cuenta_destino, m.billetes) for m in h] for h in movimientos]
+    otro.diario.cerrar()
+
+# Un registro escrito a medias o con CRC inválido se descarta con lo que sigue
+@pytest.mark.parametrize("dano", ["cortado", "crc"])
+def test_registro_danado_se_descarta(tmp_path, dano):
+    ruta = str(tmp_path / "cajero.diario")
+    diario = Diario(ruta)
+    for monto in (100, 200, 300):
+        diario.agregar("DEPÓSITO", monto, "001-123456")
+    diario.cerrar()
+    tamano = os.path.getsize(ruta)
+    with open(ruta, "r+b") as archivo:
+        if dano == "cortado":
+            archivo.truncate(tamano - REGISTRO.size // 2)
+        else:
+            archivo.seek(tamano - REGISTRO.size + 20)
+            archivo.write(b'\xff')
+    diario = Diario(ruta)
+    assert diario.total == 2
+    assert [registro[4] for registro in diario.vista] == [100, 200]
+    assert os.path.getsize(ruta) == tamano - REGISTRO.size
+    assert diario.agregar("RETIRO", -50, "001-123456") == 2
+    diario.cerrar()
+
+def test_numero_de_cuenta_largo(tmp_path):
+    diario = Diario(str(tmp_path / "cajero.diario"))
+    # 23 bytes más una ñ de dos: no entra sin cortar el carácter
+    largo = "0" * (MAX_CUENTA - 1) + "ñ"
+    with pytest.raises(DiarioError):
+        diario.agregar("DEPÓSITO", 100, largo)
+    with pytest.raises(DiarioError):
+        diario.agregar("TRANSFERENCIA", 100, "001-123456", largo)
+    assert diario.total == 0
+    justo = "0" * (MAX_CUENTA - 2) + "ñ"
+    diario.agregar("DEPÓSITO", 100, justo)
+    assert diario.vista[0][5] == justo
+    diario.cerrar()
+
+    banco = crear_banco_ejemplo()
+    with pytest.raises(OperacionError):
+        banco.agregar_cuenta(Cuenta(largo, 1, 0))
+    for filas in ([{"numero": largo, "cliente_id": 1}],
+                  [{"numero": f"002-{i}", "cliente_id": 1} for i in range(5)] + [{"numero": largo, "cliente_id": 1}]):
+        with pytest.raises(carga_masiva.ImportacionError):
+            carga_masiva.importar(banco, carga_masiva.CUENTAS, filas)
+    assert largo not in banco.cuentas_por_numero
+    assert len(banco.cuentas) == 3
+
+# Lectores que piden el último registro (y obligan a volver a mapear el
+# archivo) mientras otro hilo agrega: ninguno encuentra un mapa cerrado
+def test_lecturas_concurrentes_con_el_archivo_creciendo(tmp_path):
+    diario = Diario(str(tmp_path / "cajero.diario"))
+    diario.durable = False
+    diario.agregar("DEPÓSITO", 1, "001-123456")
+    errores, terminado = [], threading.Event()
+
+    def leer():
+        try:
+            while not terminado.is_set():
+                total = diario.total
+                assert diario.vista[total - 1][0] == total - 1
+                assert diario.vista[0][4] == 1
+        except Exception as e:
+            errores.append(e)
+
+    # Cambios de hilo muy seguidos para que las lecturas se crucen
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        lectores = [threading.Thread(target=leer) for _ in range(4)]
+        for lector in lectores:
+            lector.start()
+        for monto in range(2, 3000):
+            diario.agregar("DEPÓSITO", monto, "001-123456")
+        terminado.set()
+        for lector in lectores:
+            lector.join()
+    finally:
+        sys.setswitchinterval(intervalo)
+    diario.cerrar()
+    assert errores == []
+
+def _estado(banco):
+    return _saldos(banco), [dict(d.billetes) for d in banco.dispensadores], \
+           [len(c.movimientos) for c in banco.cuentas]
+
+# Si el diario no puede escribir el movimiento la operación falla sin tocar
+# saldos ni billetes: con el diario cerrado, con un billete que el diario no
+# guarda y con un error del sistema en la escritura
+def test_operacion_sin_diario_no_cambia_nada(tmp_path, monkeypatch):
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, str(tmp_path / "cajero.diario"))
+    cuenta1, cuenta2, _ = banco.cuentas
+    dispensador = banco.dispensadores[0]
+    antes = _estado(banco)
+
+    def fallar(*args):
+        raise OSError(28, "No queda espacio en el dispositivo")
+
+    monkeypatch.setattr(os, "write", fallar)
+    with pytest.raises(OSError):
+        transferir(banco, cuenta1, cuenta2.numero, 100_00)
+    with pytest.raises(OSError):
+        retirar(banco, cuenta1, dispensador, 100_00)
+    monkeypatch.undo()
+    assert _estado(banco) == antes and banco.diario.total == 0
+
+    dispensador.billetes[500] = 2
+    antes = _estado(banco)
+    with pytest.raises(DiarioError):
+        retirar(banco, cuenta1, dispensador, 1000_00)
+    assert _estado(banco) == antes
+
+    banco.diario.cerrar()
+    for operar in (lambda: retirar(banco, cuenta1, dispensador, 100_00),
+                   lambda: depositar(banco, cuenta1, dispensador, {100: 1}),
+                   lambda: transferir(banco, cuenta1, cuenta2.numero, 100_00),
+                   lambda: pagar_servicio(cuenta1, "Luz", 100_00)):
+        with pytest.raises(DiarioError):
+            operar()
+        assert _estado(banco) == antes
@@ -0,0 +1,44 @@
+import random
+from array import array
+
+import pytest
+
+import dinero
+from dinero import MontoError, a_centavos
+
+@pytest.mark.parametrize("valor, centavos", [("10", 1000), ("10.1", 1010), (" 0.05 ", 5),
+                                             ("-3.50", -350), (7, 700), ("1e3", 100_000)])
+def test_a_centavos(valor, centavos):
+    assert a_centavos(valor) == centavos
+
+# Un exponente que desborda el contexto decimal es un monto inválido más
+@pytest.mark.parametrize("valor", ["9e999999", "-9e999999", "abc", "nan",
+                                   "inf", "10.001", 1.5, True])
+def test_montos_invalidos_son_monto_error(valor):
+    with pytest.raises(MontoError):
+        a_centavos(valor)
+
+def _intereses(saldos, tasa_pb):
+    return [(s * tasa_pb + 5_000) // 10_000 if s > 0 else 0 for s in saldos]
+
+def _comisiones(saldos, comision, minimo):
+    return [0 if s >= minimo else min(comision, max(s, 0)) for s in saldos]
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_operaciones_masivas(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(dinero, "np", None)
+    azar = random.Random(11)
+    saldos = array('q', [azar.randint(-50_000, 5_000_000) for _ in range(10_000)] + [0, 1, 49, 50])
+    assert dinero.total(saldos) == sum(saldos)
+    for tasa in (0, 125, 10_000, -30):
+        resultado = dinero.intereses(saldos, tasa)
+        assert resultado.typecode == 'q' and list(resultado) == _intereses(saldos, tasa)
+    resultado = dinero.comisiones(saldos, 5_000, 100_000)
+    assert resultado.typecode == 'q' and list(resultado) == _comisiones(saldos, 5_000, 100_000)
+    assert list(dinero.intereses(array('q'), 125)) == []
+
+# Un saldo cuyo producto por la tasa no cabe en int64 se calcula igual de exacto
+def test_intereses_sin_desborde():
+    saldos = array('q', [2**62, 5, -2**62])
+    assert list(dinero.intereses(saldos, 125)) == _intereses(saldos, 125)
@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+
+from Sistema_de_Cajero import (Cliente, Cuenta, PuntoControl, abrir_diario, cargar_instantanea,
+                               crear_banco_ejemplo, guardar_instantanea, pagar_servicio)
+
+def _estado(banco):
+    return ({c.id: (c.nombre, c.credencial) for c in banco.clientes},
+            {c.numero: (c.cliente_id, c.saldo) for c in banco.cuentas})
+
+# Altas desde otro hilo mientras se escriben deltas: todas quedan en alguno
+def test_altas_concurrentes_con_puntos_de_control(tmp_path):
+    directorio, ruta = str(tmp_path / "datos"), str(tmp_path / "cajero.diario")
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, ruta)
+    seq = guardar_instantanea(banco, directorio)
+    punto = PuntoControl(banco, directorio, seq, intervalo=3600)
+
+    def altas():
+        for i in range(100, 2100):
+            banco.agregar_cliente(Cliente(i, f"Cliente {i}", "x"))
+            banco.agregar_cuenta(Cuenta(f"002-{i:06d}", i, i))
+
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        hilo = threading.Thread(target=altas)
+        hilo.start()
+        while hilo.is_alive():
+            punto.guardar()
+        hilo.join()
+    finally:
+        sys.setswitchinterval(intervalo)
+    punto.guardar()
+    punto.detener()
+    esperado = _estado(banco)
+    banco.diario.cerrar()
+
+    recuperado, _ = cargar_instantanea(directorio, ruta)
+    assert _estado(recuperado) == esperado
+    assert len(recuperado.cuentas) == 2003
+    recuperado.diario.cerrar()
+
+# Puntos de control con altas, bajas y cambios de credencial sin
+# movimientos entre ellos, intercalados con otros que sí tienen
+def test_deltas_sin_movimientos(tmp_path):
+    directorio, ruta = str(tmp_path / "datos"), str(tmp_path / "cajero.diario")
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, ruta)
+    punto = PuntoControl(banco, directorio, guardar_instantanea(banco, directorio), intervalo=3600)
+    banco.agregar_cliente(Cliente(10, "Diez", "x"))
+    punto.guardar()
+    banco.agregar_cuenta(Cuenta("002-000010", 10, 0))
+    punto.guardar()
+    banco.cambiar_credencial(banco.clientes_por_id[10], "y")
+    punto.guardar()
+    pagar_servicio(banco.cuentas_por_numero["001-123456"], "Luz", 100)
+    banco.agregar_cuenta(Cuenta("002-000011", 10, 500))
+    punto.guardar()
+    banco.quitar_cuenta("002-000010")
+    punto.guardar()
+    punto.detener()
+    esperado = _estado(banco)
+    banco.diario.cerrar()
+
+    recuperado, _ = cargar_instantanea(directorio, ruta)
+    assert _estado(recuperado) == esperado
+    assert len(recuperado.cuentas_por_numero["001-123456"].movimientos) == 1
+    recuperado.diario.cerrar()
+
+# Una compactación cortada después de escribir la base deja los deltas
+# anteriores: no se vuelven a aplicar
+def test_deltas_incluidos_en_la_base(tmp_path):
+    directorio, ruta = str(tmp_path / "datos"), str(tmp_path / "cajero.diario")
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, ruta)
+    punto = PuntoControl(banco, directorio, guardar_instantanea(banco, directorio), intervalo=3600)
+    banco.agregar_cliente(Cliente(10, "Diez", "x"))
+    punto.guardar()
+    pagar_servicio(banco.cuentas_por_numero["001-123456"], "Luz", 100)
+    punto.guardar()
+    punto.detener()
+    copias = {}
+    for nombre in os.listdir(directorio):
+        if nombre.startswith("delta-"):
+            with open(os.path.join(directorio, nombre), "rb") as archivo:
+                copias[nombre] = archivo.read()
+    assert len(copias) == 2
+    seq = guardar_instantanea(banco, directorio)
+    for nombre, datos in copias.items():
+        with open(os.path.join(directorio, nombre), "wb") as archivo:
+            archivo.write(datos)
+    # Los deltas nuevos siguen la numeración aunque los viejos estén
+    punto = PuntoControl(banco, directorio, seq, intervalo=3600)
+    banco.agregar_cliente(Cliente(11, "Once", "x"))
+    punto.guardar()
+    punto.detener()
+    esperado = _estado(banco)
+    banco.diario.cerrar()
+
+    recuperado, _ = cargar_instantanea(directorio, ruta)
+    assert _estado(recuperado) == esperado
+    recuperado.diario.cerrar()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import metricas
+from dinero import CENTAVOS
+from Sistema_de_Cajero import OperacionError, crear_banco_ejemplo, retirar
+
+@pytest.fixture(autouse=True)
+def registro_vacio():
+    metricas.REGISTRO.reiniciar()
+    yield
+    metricas.desactivar()
+    metricas.REGISTRO.reiniciar()
+
+def _contador(nombre, **etiquetas):
+    return metricas.REGISTRO.contadores.get((nombre, tuple(etiquetas.items())), 0)
+
+# Desactivadas no registran nada; activadas cuentan cada operación con su
+# resultado, los rechazos por motivo y los agotamientos, y se exportan en
+# texto de Prometheus y en JSON
+def test_metricas_de_retiros():
+    banco = crear_banco_ejemplo()
+    cuenta = banco.cuentas[0]
+    dispensador = banco.dispensadores[0]
+    dispensador.billetes = {200: 0, 100: 1, 50: 0, 20: 0}
+    retirar(banco, cuenta, dispensador, 100 * CENTAVOS)
+    assert metricas.REGISTRO.instantanea() == {"contadores": [], "histogramas": [], "eventos": []}
+
+    dispensador.billetes = {200: 0, 100: 1, 50: 0, 20: 0}
+    metricas.activar()
+    retirar(banco, cuenta, dispensador, 100 * CENTAVOS)
+    with pytest.raises(OperacionError):
+        retirar(banco, cuenta, dispensador, 100 * CENTAVOS)
+    assert _contador("cajero_operaciones_total", operacion="retiro", resultado="ok") == 1
+    assert _contador("cajero_operaciones_total", operacion="retiro", resultado="OperacionError") == 1
+    assert _contador("cajero_desglose_fallas_total", motivo="efectivo_insuficiente") == 1
+    assert _contador("cajero_agotamientos_total", cajero=dispensador.id, denominacion=100) == 1
+    assert [e["evento"] for e in metricas.REGISTRO.eventos] == ["denominacion_agotada", "cajero_sin_efectivo"]
+
+    texto = metricas.REGISTRO.prometheus()
+    assert "# TYPE cajero_operaciones_total counter" in texto
+    assert 'cajero_operaciones_total{operacion="retiro",resultado="ok"} 1' in texto
+    assert 'cajero_operacion_segundos_bucket{operacion="retiro",le="+Inf"} 2' in texto
+    assert 'cajero_operacion_segundos_count{operacion="retiro"} 2' in texto
+    buckets = [int(linea.rsplit(" ", 1)[1]) for linea in texto.splitlines()
+               if linea.startswith('cajero_operacion_segundos_bucket{operacion="retiro"')]
+    assert buckets == sorted(buckets) and len(buckets) == len(metricas.LIMITES_LATENCIA) + 1
+
+    datos = json.loads(metricas.REGISTRO.json())
+    [histograma] = [h for h in datos["histogramas"] if h["etiquetas"] == {"operacion": "retiro"}]
+    assert histograma["total"] == 2 and sum(histograma["cuentas"]) == 2
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from diario import Diario
+from Sistema_de_Cajero import HistorialDiario, HistorialMovimientos, Movimiento
+
+CUENTA = "001-000001"
+CONTRAPARTES = ("001-000002", "001-000003", "001-000004")
+SERVICIOS = ("Luz", "Agua", "Gas", "Internet")
+
+def _movimientos(azar, cantidad, desordenado):
+    fecha = 1_700_000_000_000_000
+    movimientos = []
+    for _ in range(cantidad):
+        fecha += azar.randrange(1, 5_000_000)
+        tipo = azar.choice(("RETIRO", "DEPÓSITO", "TRANSFERENCIA", "PAGO_SERVICIO"))
+        destino = azar.choice(CONTRAPARTES) if tipo == "TRANSFERENCIA" else None
+        servicio = azar.choice(SERVICIOS) if tipo == "PAGO_SERVICIO" else None
+        movimiento = Movimiento(tipo, azar.randrange(-10_000, 10_000), CUENTA, destino, servicio)
+        movimiento.fecha_us = fecha
+        movimientos.append(movimiento)
+    if desordenado:
+        # Uno llega con una fecha anterior a la de los previos
+        movimientos[cantidad // 2].fecha_us = movimientos[cantidad // 4].fecha_us - 1
+    return movimientos
+
+def _clave(movimiento):
+    return (movimiento.fecha_us, movimiento.tipo, movimiento.monto, movimiento.cuenta_destino,
+            movimiento.servicio)
+
+# Todas las páginas de una consulta, siguiendo el cursor
+def _todas(historial, limite, **filtros):
+    resultado, cursor = [], None
+    while True:
+        pagina = historial.consultar(limite=limite, cursor=cursor, **filtros)
+        assert len(pagina.movimientos) <= limite
+        resultado.extend(pagina.movimientos)
+        if pagina.cursor is None:
+            return resultado
+        assert len(pagina.movimientos) == limite
+        cursor = pagina.cursor
+
+def _fuerza_bruta(movimientos, desde=None, hasta=None, tipo=None, servicio=None, contraparte=None,
+                  descendente=True):
+    filtrados = [m for m in movimientos
+                 if (desde is None or m.fecha_us >= desde) and (hasta is None or m.fecha_us < hasta)
+                 and (tipo is None or m.tipo == tipo) and (servicio is None or m.servicio == servicio)
+                 and (contraparte is None or m.cuenta_destino == contraparte)]
+    return filtrados[::-1] if descendente else filtrados
+
+@pytest.fixture(params=["columnas", "diario"])
+def historial(request, tmp_path):
+    if request.param == "columnas":
+        yield HistorialMovimientos(CUENTA)
+        return
+    diario = Diario(str(tmp_path / "cajero.diario"))
+    diario.durable = False
+    yield HistorialDiario(diario, CUENTA)
+    diario.cerrar()
+
+# Consultas al azar contra el filtro por fuerza bruta
+@pytest.mark.parametrize("desordenado", [False, True])
+def test_consultas_contra_fuerza_bruta(historial, desordenado):
+    azar = random.Random(11)
+    movimientos = _movimientos(azar, 600, desordenado)
+    # La primera mitad antes de la primera consulta (el índice se arma
+    # entonces) y el resto después, con el índice ya mantenido al agregar
+    for movimiento in movimientos[:300]:
+        historial.append(movimiento)
+    historial.consultar(limite=1)
+    for movimiento in movimientos[300:]:
+        historial.append(movimiento)
+
+    fechas = sorted(m.fecha_us for m in movimientos)
+    for _ in range(300):
+        filtros = {"descendente": azar.random() < 0.5}
+        if azar.random() < 0.5:
+            filtros["desde"] = azar.choice(fechas) + azar.choice((-1, 0, 1))
+        if azar.random() < 0.5:
+            filtros["hasta"] = azar.choice(fechas) + azar.choice((-1, 0, 1))
+        if azar.random() < 0.4:
+            filtros["tipo"] = azar.choice(("RETIRO", "DEPÓSITO", "TRANSFERENCIA", "PAGO_SERVICIO"))
+        if azar.random() < 0.3:
+            filtros["servicio"] = azar.choice(SERVICIOS)
+        if azar.random() < 0.3:
+            filtros["contraparte"] = azar.choice(CONTRAPARTES + ("001-999999",))
+        obtenidos = _todas(historial, azar.choice((1, 3, 20, 1000)), **filtros)
+        assert list(map(_clave, obtenidos)) == list(map(_clave, _fuerza_bruta(movimientos, **filtros)))
@@ -0,0 +1,143 @@
+import os
+
+import pagos
+from diario import Diario
+from Sistema_de_Cajero import crear_banco_ejemplo
+
+CUENTAS = ("001-123456", "001-654321", "001-987654")
+
+def _facturas(cantidad, inicio=0):
+    return [{"clave": f"F-{i}", "cuenta": CUENTAS[i % len(CUENTAS)], "servicio": "Luz",
+             "monto": "10.50"} for i in range(inicio, inicio + cantidad)]
+
+def _estados(resultados):
+    estados = {}
+    for _, _, estado, _, _ in resultados:
+        estados[estado] = estados.get(estado, 0) + 1
+    return estados
+
+def _saldos(procesador):
+    return {numero: procesador.banco.cuentas_por_numero[numero].saldo for numero in CUENTAS}
+
+# Una clave repetida, en el mismo lote o en otro, no cobra de nuevo y
+# devuelve la referencia del primer cobro
+def test_claves_repetidas_no_cobran(tmp_path):
+    procesador = pagos.ProcesadorPagos(crear_banco_ejemplo())
+    facturas = _facturas(6)
+    primeros = list(procesador.procesar(facturas + facturas[:2], lote=4))
+    assert [estado for _, _, estado, _, _ in primeros] == [pagos.APLICADO] * 6 + [pagos.DUPLICADO] * 2
+    assert primeros[6][3] == primeros[0][3] and primeros[7][3] == primeros[1][3]
+    saldos = _saldos(procesador)
+    assert list(procesador.procesar(facturas)) == [
+        (clave, cuenta, pagos.DUPLICADO, referencia, "") for clave, cuenta, _, referencia, _ in primeros[:6]]
+    assert _saldos(procesador) == saldos
+    assert procesador.monto_aplicado == 6 * 1050
+    # Las referencias son únicas y no usan el nodo de los menús
+    referencias = {referencia for _, _, _, referencia, _ in primeros}
+    assert len(referencias) == 6
+    assert all(referencia.endswith(f"-{pagos.NODO_PAGOS:03d}") for referencia in referencias)
+
+# Las claves se recuperan del diario, en los mismos registros que los
+# cobros: al reabrir, los saldos y las claves coinciden
+def test_claves_se_recuperan_del_diario(tmp_path):
+    ruta = str(tmp_path / "pagos.diario")
+    procesador = pagos.abrir_procesador(crear_banco_ejemplo, range(pagos.PARTICIONES), str(tmp_path),
+                                        pagos.NODO_PAGOS, ruta)
+    primeros = list(procesador.procesar(_facturas(30), lote=7))
+    saldos = _saldos(procesador)
+    procesador.cerrar()
+
+    procesador = pagos.abrir_procesador(crear_banco_ejemplo, range(pagos.PARTICIONES), str(tmp_path),
+                                        pagos.NODO_PAGOS, ruta)
+    assert len(procesador.indice) == 30 and _saldos(procesador) == saldos
+    segundos = list(procesador.procesar(_facturas(30) + _facturas(3, 30)))
+    assert [r[3] for r in segundos[:30]] == [r[3] for r in primeros]
+    assert _estados(segundos) == {pagos.DUPLICADO: 30, pagos.APLICADO: 3}
+    procesador.cerrar()
+
+    # No hay otro índice que escribir después del diario: cada cobro lleva
+    # su clave en su registro
+    claves = []
+    for particion in range(pagos.PARTICIONES):
+        diario = Diario(pagos.ruta_particion(ruta, particion))
+        claves += diario.claves()
+        diario.cerrar()
+    assert len(claves) == 33 and len(set(claves)) == 33
+    assert not [nombre for nombre in os.listdir(tmp_path) if nombre.endswith(".idx")]
+
+# El reparto en particiones no depende de la cantidad de procesos: el mismo
+# archivo con otra cantidad de procesos, o en uno solo, no cobra nada de
+# nuevo y los saldos siguen iguales
+def test_reproceso_con_otra_cantidad_de_procesos(tmp_path):
+    ruta = str(tmp_path / "pagos.diario")
+    facturas = _facturas(60)
+    for procesos, aplicados in ((2, 60), (3, 0)):
+        resumenes = {}
+        resultados = list(pagos.procesar_en_procesos(facturas, procesos, crear_banco_ejemplo,
+                                                      str(tmp_path), 8, resumenes, ruta))
+        assert len(resultados) == 60 and len(resumenes) == procesos
+        assert sum(r["aplicados"] for r in resumenes.values()) == aplicados
+        if aplicados:
+            referencias = {referencia for _, _, _, referencia, _ in resultados}
+            assert len(referencias) == 60
+            # Un nodo por proceso, ninguno el de los menús
+            assert {referencia[-3:] for referencia in referencias} == {"001", "002"}
+
+    procesador = pagos.abrir_procesador(crear_banco_ejemplo, range(pagos.PARTICIONES), str(tmp_path),
+                                        pagos.NODO_PAGOS, ruta)
+    esperados = {numero: cuenta.saldo for numero, cuenta in crear_banco_ejemplo().cuentas_por_numero.items()}
+    for numero in CUENTAS:
+        esperados[numero] -= 20 * 1050
+    assert _saldos(procesador) == {numero: esperados[numero] for numero in CUENTAS}
+    assert _estados(procesador.procesar(facturas)) == {pagos.DUPLICADO: 60}
+    procesador.cerrar()
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [f"pagos.diario.{p:02d}" for p in range(pagos.PARTICIONES)]
+        + ["referencias-001.tope", "referencias-002.tope", "referencias-003.tope"])
+
+# Lo que no es una factura se rechaza sola, sin cortar el lote, también
+# repartida entre procesos
+def test_facturas_mal_formadas(tmp_path):
+    procesador = pagos.ProcesadorPagos(crear_banco_ejemplo())
+    saldos = _saldos(procesador)
+    facturas = [5, {"clave": "F-x", "cuenta": ["x"], "servicio": "Luz", "monto": "1"},
+                {"clave": 7, "cuenta": {"a": 1}, "servicio": "Luz", "monto": "1"}] + _facturas(2)
+    resultados = list(procesador.procesar(facturas))
+    assert [estado for _, _, estado, _, _ in resultados] == [pagos.RECHAZADO] * 3 + [pagos.APLICADO] * 2
+    assert resultados[0][:2] == (None, None) and resultados[1][:2] == ("F-x", "['x']")
+    assert _saldos(procesador) != saldos
+
+    resultados = list(pagos.procesar_en_procesos(facturas, 2, crear_banco_ejemplo, str(tmp_path), 2))
+    assert _estados(resultados) == {pagos.RECHAZADO: 3, pagos.APLICADO: 2}
+
+# Si el diario falla a mitad del lote, las facturas ya registradas quedan
+# cobradas con su clave y las demás se rechazan sin tocar el saldo
+def test_error_del_diario_a_mitad_del_lote(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "pagos.diario")
+    procesador = pagos.abrir_procesador(crear_banco_ejemplo, range(pagos.PARTICIONES), str(tmp_path),
+                                        pagos.NODO_PAGOS, ruta)
+    saldo = procesador.banco.cuentas_por_numero[CUENTAS[0]].saldo
+    escribir = os.write
+    escrituras = []
+
+    def fallar_despues_de_dos(fd, datos):
+        escrituras.append(fd)
+        if len(escrituras) > 2:
+            raise OSError(28, "No queda espacio en el dispositivo")
+        return escribir(fd, datos)
+    monkeypatch.setattr(os, "write", fallar_despues_de_dos)
+    facturas = [{"clave": f"F-{i}", "cuenta": CUENTAS[0], "servicio": "Luz", "monto": "10.50"}
+                for i in range(4)]
+    resultados = list(procesador.procesar(facturas))
+    monkeypatch.setattr(os, "write", escribir)
+    assert [estado for _, _, estado, _, _ in resultados] == [pagos.APLICADO] * 2 + [pagos.RECHAZADO] * 2
+    assert procesador.banco.cuentas_por_numero[CUENTAS[0]].saldo == saldo - 2 * 1050
+    assert len(procesador.indice) == 2
+    procesador.cerrar()
+
+    # Al reabrir, el diario dice lo mismo y las rechazadas se pueden cobrar
+    procesador = pagos.abrir_procesador(crear_banco_ejemplo, range(pagos.PARTICIONES), str(tmp_path),
+                                        pagos.NODO_PAGOS, ruta)
+    assert procesador.banco.cuentas_por_numero[CUENTAS[0]].saldo == saldo - 2 * 1050
+    assert _estados(procesador.procesar(facturas)) == {pagos.DUPLICADO: 2, pagos.APLICADO: 2}
+    procesador.cerrar()
@@ -0,0 +1,101 @@
+import builtins
+import os
+
+import pytest
+
+import Sistema_de_Cajero
+from pantalla import LIMPIAR, Pantalla
+
+# Flujo que guarda cada escritura por separado
+class Salida:
+    def __init__(self, terminal=False):
+        self.escrituras = []
+        self.terminal = terminal
+
+    def write(self, texto):
+        self.escrituras.append(texto)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.terminal
+
+def _guion(monkeypatch, respuestas):
+    respuestas = iter(respuestas)
+    monkeypatch.setattr(builtins, "input", lambda: next(respuestas))
+
+# Sesión completa por el menú: autenticación, saldo, un retiro enrutado y
+# salida. Cada pedido de entrada es una sola escritura con su pantalla, más
+# el volcado final al salir, y nada lanza un proceso para limpiar
+@pytest.mark.parametrize("ansi", [True, False])
+def test_sesion_una_escritura_por_pantalla(monkeypatch, tmp_path, ansi):
+    salida = Salida()
+    monkeypatch.setattr(Sistema_de_Cajero, "pantalla", Pantalla(color=ansi, limpiar=ansi, salida=salida))
+    monkeypatch.setattr(os, "system", lambda comando: pytest.fail(f"os.system({comando!r})"))
+    monkeypatch.setenv("CAJERO_DATOS", str(tmp_path))
+    for variable in ("CAJERO_DIARIO", "CAJERO_ID", "CAJERO_UBICACION", "CAJERO_HASH",
+                     "CAJERO_METRICAS", "CAJERO_METRICAS_PUERTO"):
+        monkeypatch.delenv(variable, raising=False)
+    respuestas = ["1", "1", "1234", "5", "", "1", "100", "", "7", "4"]
+    _guion(monkeypatch, respuestas)
+    with pytest.raises(SystemExit):
+        Sistema_de_Cajero.main()
+
+    assert len(salida.escrituras) == len(respuestas) + 1
+    texto = "".join(salida.escrituras)
+    assert "Retiro exitoso!" in texto and "Nuevo saldo: $4900.00" in texto
+    assert "¡Hasta pronto!" in salida.escrituras[-1]
+    if ansi:
+        # Cada pantalla nueva arranca limpiando, con colores
+        pantallas = [escritura for escritura in salida.escrituras if "=" * 60 in escritura]
+        assert len(pantallas) == 8
+        assert all(escritura.startswith(LIMPIAR) and escritura.count(LIMPIAR) == 1
+                   for escritura in pantallas)
+        assert Sistema_de_Cajero.Colors.GREEN in texto
+    else:
+        assert "\033" not in texto
+        assert salida.escrituras[1].startswith("\n=")
+
+def test_paginar_una_escritura_por_pagina(monkeypatch):
+    salida = Salida()
+    pantalla = Pantalla(color=False, limpiar=False, salida=salida)
+    _guion(monkeypatch, ["", "s"])
+    filas = (f"fila {i}" for i in range(45))
+    pantalla.paginar("encabezado", filas, 20)
+    pantalla.volcar()
+    # Dos páginas y el pedido de cada una; la tercera no se muestra
+    assert len(salida.escrituras) == 2
+    texto = "".join(salida.escrituras)
+    assert "fila 39" in texto and "fila 40" not in texto
+    assert texto.count("encabezado") == 2
+    # Sin terminal la página no depende de su alto
+    assert pantalla.filas_por_pagina(20) == 20
+
+def test_limpiar_descarta_lo_pendiente():
+    salida = Salida()
+    pantalla = Pantalla(salida=salida)
+    pantalla.escribir("vieja")
+    pantalla.limpiar()
+    pantalla.escribir("nueva")
+    pantalla.volcar()
+    assert salida.escrituras == [LIMPIAR + "nueva\n"]
+
+@pytest.mark.parametrize("entorno, terminal, color, limpiar", [
+    ({}, True, True, True),
+    ({}, False, False, False),
+    ({"CAJERO_TERMINAL": "simple"}, True, False, False),
+    ({"CAJERO_TERMINAL": "ansi"}, False, True, True),
+    ({"NO_COLOR": ""}, True, False, True),
+])
+def test_modo_desde_entorno(monkeypatch, entorno, terminal, color, limpiar):
+    for variable in ("CAJERO_TERMINAL", "NO_COLOR"):
+        monkeypatch.delenv(variable, raising=False)
+    for variable, valor in entorno.items():
+        monkeypatch.setenv(variable, valor)
+    salida = Salida(terminal)
+    pantalla = Pantalla.desde_entorno(salida)
+    assert (pantalla.color, pantalla.limpieza) == (color, limpiar)
+    pantalla.escribir(Sistema_de_Cajero.Colors.RED + "rojo" + Sistema_de_Cajero.Colors.END)
+    pantalla.volcar()
+    assert ("\033" in salida.escrituras[0]) == color
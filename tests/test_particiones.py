@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+import particiones
+from dinero import CENTAVOS
+from particiones import CONFIRMADA, BancoParticionado, RegistroTransferencias
+from servidor_sesiones import Sesion
+from Sistema_de_Cajero import Banco, Cliente, Cuenta, Dispensador, abrir_diario
+
+SALDO = 10_000 * CENTAVOS
+MONTO = 100 * CENTAVOS
+
+def crear_particion(particion, cantidad):
+    banco = Banco()
+    credencial = banco.autenticador.generar("1234")
+    for i in range(1, 5):
+        if particiones.particion_cliente(i, cantidad) == particion:
+            banco.agregar_cliente(Cliente(i, f"Cliente {i}", credencial))
+            banco.agregar_cuenta(Cuenta(f"001-{i:08d}", i, SALDO))
+    # Las sesiones se atienden en un cajero
+    banco.agregar_dispensador(Dispensador(1, "Sucursal"))
+    return banco
+
+# Las dos particiones atendiendo en hilos, con los mismos archivos que en
+# sus procesos; el frente lo hace la prueba a mano
+class Particiones:
+    def __init__(self, directorio):
+        self.conexiones = []
+        self.hilos = []
+        for p in range(2):
+            propia, remota = multiprocessing.Pipe()
+            hilo = threading.Thread(target=particiones._servir_particion,
+                                    args=(p, 2, crear_particion, directorio, remota))
+            hilo.start()
+            assert propia.recv() == (True, [])
+            self.conexiones.append(propia)
+            self.hilos.append(hilo)
+
+    def pedir(self, p, orden, argumento):
+        self.conexiones[p].send((orden, argumento))
+        correcto, valor = self.conexiones[p].recv()
+        assert correcto, valor
+        return valor
+
+    # Sin resolver nada más: lo que queda en disco es lo de una caída
+    def cerrar(self):
+        for conexion, hilo in zip(self.conexiones, self.hilos):
+            conexion.send(None)
+            hilo.join()
+            conexion.close()
+
+def _saldos(banco):
+    resultados = banco.atender_todas([Sesion(i, "1234", [("saldo",)]) for i in (1, 2)])
+    return [resultado.resultados[0][2] for resultado in resultados]
+
+# Transferencia del cliente 2 (partición 0) al 1 (partición 1) cortada en
+# cada punto de las dos fases; al arrancar, el frente confirma lo que llegó
+# a decidir y aborta el resto, sin crear ni perder dinero, y arrancar otra
+# vez no cambia nada
+@pytest.mark.parametrize("corte, confirmada", [
+    ("preparada", False),
+    ("decidida", True),
+    ("origen_resuelto", True),
+    ("diario_sin_registro", True),
+])
+def test_recuperacion_dos_fases(tmp_path, corte, confirmada):
+    directorio = str(tmp_path)
+    partes = Particiones(directorio)
+    try:
+        resultados, remotas = partes.pedir(0, "sesiones", [Sesion(2, "1234", [("transferencia", 1, MONTO)])])
+        assert resultados[0].resultados[0][1]
+        _, _, tx, origen, _, monto, fecha = remotas[0]
+        assert partes.pedir(1, "preparar", [(tx, 1, origen, monto, fecha)]) == [(tx, True, "001-00000001")]
+        if corte != "preparada":
+            decisiones = RegistroTransferencias(os.path.join(directorio, "decisiones.log"))
+            decisiones.agregar_lote([(tx, CONFIRMADA, 0, 0, 0, 0, "001-00000001", None)])
+            decisiones.cerrar()
+        if corte in ("origen_resuelto", "diario_sin_registro"):
+            partes.pedir(0, "resolver", [(tx, True, "001-00000001")])
+        # Retenido sin resolver del lado del origen
+        retenido = 0 if corte in ("origen_resuelto", "diario_sin_registro") else MONTO
+        assert partes.pedir(0, "totales", None) == (2 * SALDO - MONTO, retenido)
+    finally:
+        partes.cerrar()
+    if corte == "diario_sin_registro":
+        # El débito llegó al diario pero no la confirmación al registro
+        ruta = os.path.join(directorio, "transferencias-0.log")
+        os.truncate(ruta, os.path.getsize(ruta) - RegistroTransferencias.REGISTRO.size)
+
+    esperados = [SALDO + MONTO, SALDO - MONTO] if confirmada else [SALDO, SALDO]
+    for _ in range(2):
+        with BancoParticionado(2, crear_particion, directorio) as banco:
+            assert _saldos(banco) == esperados
+            assert banco.total_saldos() == 4 * SALDO
+
+# Si el diario falla al confirmar un crédito, el saldo del destino no cambia
+# y la transferencia sigue pendiente para cuando se reenvíe la decisión
+def test_credito_sin_diario_queda_pendiente(tmp_path, monkeypatch):
+    banco = crear_particion(1, 2)
+    abrir_diario(banco, str(tmp_path / "diario-1"))
+    particion = particiones.Particion(banco, 1, 2)
+    cuenta = banco.cuentas_por_numero["001-00000001"]
+    [(tx, voto, numero)] = particion.preparar([(7, 1, "001-00000002", MONTO, 0)])
+    assert voto and numero == cuenta.numero
+
+    def sin_espacio(fd, datos):
+        raise OSError(28, "No queda espacio en el dispositivo")
+    escribir = os.write
+    monkeypatch.setattr(os, "write", sin_espacio)
+    with pytest.raises(OSError):
+        particion.resolver([(tx, True, numero)])
+    monkeypatch.setattr(os, "write", escribir)
+    assert cuenta.saldo == SALDO and len(cuenta.movimientos) == 0
+    assert tx in particion.pendientes
+
+    particion.resolver([(tx, True, numero)])
+    assert cuenta.saldo == SALDO + MONTO and len(cuenta.movimientos) == 1
+    assert not particion.pendientes
+    banco.diario.cerrar()
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+import planificador
+import reportes
+from diario import Diario
+from Sistema_de_Cajero import Movimiento
+
+INICIO = datetime.datetime(2024, 5, 1, 12)
+
+# Diez días del cajero 1 (los tres primeros con más retiros, que quedan
+# fuera de la ventana de 7) y del 3; el 2 no tiene movimientos en efectivo
+def _movimientos():
+    movimientos = []
+    for d in range(10):
+        fecha = INICIO + datetime.timedelta(days=d)
+        retirados = 20 if d < 3 else 5
+        for dispensador_id in (1, 3):
+            movimientos.append(Movimiento("RETIRO", -retirados * 100_00, "001-123456", fecha=fecha,
+                                          dispensador_id=dispensador_id, billetes={100: retirados}))
+            movimientos.append(Movimiento("DEPÓSITO", 100_00, "001-123456", fecha=fecha,
+                                          dispensador_id=dispensador_id, billetes={100: 1}))
+    movimientos.append(Movimiento("PAGO_SERVICIO", -10_00, "001-123456", servicio="Luz", fecha=INICIO))
+    return movimientos
+
+def _fila(plan, cajero, denominacion):
+    entrada = next(p for p in plan if p["cajero"] == cajero)
+    return next(f for f in entrada["denominaciones"] if f["denominacion"] == denominacion)
+
+# El consumo neto sale igual de los movimientos y del diario (con y sin
+# NumPy), solo cuenta la ventana, y el plan ordena por urgencia y carga lo
+# que falta para cubrir el horizonte
+@pytest.mark.parametrize("con_numpy", [False, True])
+def test_plan_de_reposicion(tmp_path, monkeypatch, con_numpy):
+    if con_numpy and reportes.np is None:
+        pytest.skip("Sin NumPy")
+    if not con_numpy:
+        monkeypatch.setattr(reportes, "np", None)
+    movimientos = _movimientos()
+    dia = planificador.dia_de(movimientos[-2].fecha_us) + 1
+
+    en_memoria = planificador.Planificador(ventana=7)
+    for movimiento in movimientos:
+        en_memoria.registrar(movimiento)
+    diario = Diario(str(tmp_path / "cajero.diario"))
+    for m in movimientos:
+        diario.agregar(m.tipo, m.monto, m.cuenta_numero, servicio=m.servicio, fecha=m.fecha_us,
+                       dispensador=m.dispensador_id, billetes=m.billetes)
+    diario.cerrar()
+    del_diario = planificador.Planificador(ventana=7)
+    del_diario.actualizar_desde_diario(diario.ruta)
+    assert del_diario.seq == len(movimientos)
+    assert del_diario.tasas(dia) == en_memoria.tasas(dia)
+    assert en_memoria.tasas(dia)[1][planificador.DENOMINACIONES.index(100)] == 4.0
+
+    inventarios = {1: {200: 10, 100: 40}, 2: {100: 5}, 3: {100: 2}}
+    plan = del_diario.planificar(inventarios, dia, horizonte=7, anticipacion=1)
+    assert [p["cajero"] for p in plan] == [3, 1, 2]
+    assert plan[0]["urgente"] and plan[0]["reponer_el"] == planificador.fecha_de_dia(dia).isoformat()
+    assert not plan[1]["urgente"] and plan[1]["reponer_el"] == planificador.fecha_de_dia(dia + 9).isoformat()
+    cien = _fila(plan, 1, 100)
+    assert cien["dias_restantes"] == 10.0
+    assert cien["agotamiento"] == planificador.fecha_de_dia(dia + 10).isoformat()
+    # En la reposición quedan 4 billetes; para 7 días hacen falta 28
+    assert cien["reponer"] == 24
+    assert _fila(plan, 1, 200) == {"denominacion": 200, "existencias": 10, "consumo_diario": 0.0,
+                                   "dias_restantes": None, "agotamiento": None, "reponer": 0}
+    assert _fila(plan, 3, 100)["reponer"] == 26
+    assert plan[2]["reponer_el"] is None and _fila(plan, 2, 100)["reponer"] == 0
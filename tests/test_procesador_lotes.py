@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+
+import procesador_lotes
+from Sistema_de_Cajero import Dispensador, abrir_diario, crear_banco_ejemplo
+
+def _procesar(banco, lineas, formato="jsonl"):
+    salida = io.StringIO()
+    procesador = procesador_lotes.ProcesadorLotes(banco)
+    entrada = procesador_lotes.leer_jsonl(io.StringIO("".join(linea + "\n" for linea in lineas)))
+    resultado = procesador.procesar(entrada, salida, formato)
+    return resultado, salida.getvalue()
+
+# Ninguna línea mal formada corta el lote: cada una queda rechazada y las
+# válidas de alrededor se aplican
+def test_lineas_mal_formadas_no_cortan_el_lote():
+    banco = crear_banco_ejemplo()
+    valida = '{"op": "pago", "cuenta": "001-123456", "servicio": "Luz", "monto": "10"}'
+    malas = ['5', '"texto"', '[1, 2]', 'null', '{no es json',
+             '{"op": "retiro", "cuenta": ["x"], "monto": "10"}',
+             '{"op": ["retiro"], "cuenta": "001-123456", "monto": "10"}',
+             '{"op": "retiro", "cuenta": "001-123456", "monto": "9e999999"}',
+             '{"op": "retiro", "cuenta": "001-123456", "monto": [10]}',
+             '{"op": "retiro", "cuenta": "001-123456", "monto": "10", "dispensador": [1]}',
+             '{"op": "deposito", "cuenta": "001-123456", "billetes": 5}',
+             '{"op": "transferencia", "cuenta": "001-123456", "monto": "10"}']
+    lineas = [valida]
+    for mala in malas:
+        lineas += [mala, valida]
+    (aplicadas, rechazadas), salida = _procesar(banco, lineas)
+    assert (aplicadas, rechazadas) == (len(malas) + 1, len(malas))
+    resultados = [json.loads(linea) for linea in salida.splitlines()]
+    assert [r["linea"] for r in resultados] == list(range(1, len(lineas) + 1))
+    assert all(r["ok"] for r in resultados[::2])
+    assert not any(r["ok"] or not r["error"] for r in resultados[1::2])
+    assert banco.cuentas_por_numero["001-123456"].saldo == (5000 - 10 * (len(malas) + 1)) * 100
+
+def test_lineas_mal_formadas_en_csv():
+    banco = crear_banco_ejemplo()
+    (aplicadas, rechazadas), salida = _procesar(banco, ['5', '{"op": ["x"], "cuenta": {"a": 1}}'], "csv")
+    assert (aplicadas, rechazadas) == (0, 2)
+    filas = list(csv.DictReader(io.StringIO(salida)))
+    assert [(f["linea"], f["op"], f["cuenta"], f["ok"]) for f in filas] == \
+           [("1", "", "", "0"), ("2", "['x']", "{'a': 1}", "0")]
+    assert all(f["error"].startswith("Operación mal formada") for f in filas)
+
+# Un error del diario rechaza la operación en lugar de cortar el lote, y
+# rechazada quiere decir que no se aplicó: el saldo sigue igual
+def test_error_del_diario(tmp_path):
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, str(tmp_path / "cajero.diario"))
+    banco.diario.cerrar()
+    efectivo = [d.efectivo for d in banco.dispensadores]
+    (aplicadas, rechazadas), salida = _procesar(
+        banco, ['{"op": "pago", "cuenta": "001-123456", "servicio": "Luz", "monto": "10"}',
+                '{"op": "retiro", "cuenta": "001-123456", "monto": "100"}',
+                '{"op": "transferencia", "cuenta": "001-123456", "destino": "2", "monto": "10"}'])
+    assert (aplicadas, rechazadas) == (0, 3)
+    resultados = [json.loads(linea) for linea in salida.splitlines()]
+    assert all("diario" in r["error"] and r["saldo"] == 5000 for r in resultados)
+    assert banco.cuentas_por_numero["001-123456"].saldo == 5000 * 100
+    assert banco.cuentas_por_numero["001-654321"].saldo == 3000 * 100
+    assert [d.efectivo for d in banco.dispensadores] == efectivo
+
+# Los cajeros se buscan en el banco: uno agregado después de crear el
+# procesador se puede indicar por ID y recibe los depósitos sin cajero
+def test_cajero_agregado_despues_de_crear_el_procesador():
+    banco = crear_banco_ejemplo()
+    procesador = procesador_lotes.ProcesadorLotes(banco)
+    nuevo = Dispensador(3, "Sucursal Sur")
+    banco.agregar_dispensador(nuevo)
+    for operacion in ({"op": "deposito", "cuenta": "001-123456", "billetes": "100:1"},
+                      {"op": "retiro", "cuenta": "001-123456", "monto": "100", "dispensador": "3"}):
+        _, ok, _, error = procesador.aplicar(operacion)
+        assert ok, error
+    assert nuevo.billetes[100] == 0 and banco.cuentas_por_numero["001-123456"].saldo == 5000 * 100
@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+
+import pytest
+
+from dinero import CENTAVOS, formatear
+from Sistema_de_Cajero import (abrir_diario, crear_banco_ejemplo, depositar, pagar_servicio, retirar,
+                               transferir)
+
+np = pytest.importorskip("numpy")
+reportes = pytest.importorskip("reportes")
+
+def _operar(banco):
+    cuenta1, cuenta2, cuenta3 = banco.cuentas
+    dispensador1, dispensador2 = banco.dispensadores[:2]
+    retirar(banco, cuenta1, dispensador1, 300 * CENTAVOS)
+    retirar(banco, cuenta2, dispensador2, 100 * CENTAVOS)
+    depositar(banco, cuenta3, dispensador1, {100: 2, 20: 1})
+    transferir(banco, cuenta1, cuenta2.numero, 125_50)
+    transferir(banco, cuenta3, cuenta1.numero, 10_01)
+    pagar_servicio(cuenta2, "Luz", 99_99)
+    pagar_servicio(cuenta2, "Gas", 50_00)
+
+# Con los movimientos del diario o de los historiales en memoria, los
+# totales coinciden con sumar los movimientos de a uno, todo cuadra y un
+# saldo tocado a mano aparece como descuadre
+@pytest.mark.parametrize("con_diario", [False, True])
+def test_conciliacion_y_totales(tmp_path, con_diario):
+    banco = crear_banco_ejemplo()
+    if con_diario:
+        abrir_diario(banco, str(tmp_path / "cajero.diario"))
+    iniciales = reportes.saldos_de_banco(banco)
+    _operar(banco)
+    movimientos = [m for cuenta in banco.cuentas for m in cuenta.movimientos]
+
+    resultado = reportes.reporte_banco(banco, iniciales)
+    conciliacion = resultado["conciliacion"]
+    assert conciliacion["diferencia"] == 0 and conciliacion["cuentas_descuadradas"] == 0
+    assert conciliacion["transferencias_netas"] == 0 and conciliacion["movimientos"] == 9
+    assert conciliacion["flujo_neto"] == sum(m.monto for m in movimientos)
+    for fila in resultado["por_tipo"]:
+        de_tipo = [m.monto for m in movimientos if m.tipo == fila["tipo"]]
+        assert (fila["movimientos"], fila["monto"]) == (len(de_tipo), sum(de_tipo))
+    assert {f["servicio"]: f["monto"] for f in resultado["por_servicio"] if f["movimientos"]} == {
+        "Luz": -99_99, "Gas": -50_00}
+    por_cajero = {f["cajero"]: f for f in resultado["movimientos_por_dispensador"]}
+    assert por_cajero[1]["monto_retiros"] == -300_00 and por_cajero[1]["monto_depositos"] == 220_00
+    assert por_cajero[2]["retiros"] == 1 and por_cajero[2]["depositos"] == 0
+    assert {f["cajero"]: f["efectivo"] for f in resultado["por_dispensador"]} == {
+        d.id: d.efectivo * CENTAVOS for d in banco.dispensadores}
+
+    banco.cuentas[1].saldo += 1
+    conciliacion = reportes.reporte_banco(banco, iniciales)["conciliacion"]
+    assert conciliacion["diferencia"] == 1 and conciliacion["cuentas_descuadradas"] == 1
+    assert conciliacion["descuadres"][0]["cuenta"] == banco.cuentas[1].numero
+
+    salida = io.StringIO()
+    reportes.escribir_json(resultado, salida)
+    flujo = formatear(resultado["conciliacion"]["flujo_neto"])
+    assert json.loads(salida.getvalue())["conciliacion"]["flujo_neto"] == flujo
+    salida = io.StringIO()
+    reportes.escribir_csv(resultado, salida)
+    filas = list(csv.reader(io.StringIO(salida.getvalue())))
+    assert filas[0] == ["seccion", "clave", "movimientos", "monto"]
+    assert ["conciliacion", "diferencia", "", "0.00"] in filas
+    if con_diario:
+        banco.diario.cerrar()
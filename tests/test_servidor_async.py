@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from dinero import CENTAVOS
+from servidor_async import ServidorCajeroAsync
+from Sistema_de_Cajero import abrir_diario, crear_banco_ejemplo
+
+# Manda las órdenes por una conexión al servidor y devuelve las respuestas
+def _sesion(banco, ordenes):
+    async def correr():
+        servidor = ServidorCajeroAsync(banco, inactividad=5.0)
+        socket_servidor = await servidor.iniciar("127.0.0.1", 0)
+        puerto = socket_servidor.sockets[0].getsockname()[1]
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        respuestas = []
+        for orden in ordenes:
+            escritor.write(orden.encode("utf-8") + b"\n")
+            await escritor.drain()
+            respuestas.append((await lector.readline()).decode("utf-8").rstrip("\n"))
+        escritor.close()
+        await servidor.cerrar()
+        return respuestas
+    return asyncio.run(correr())
+
+# Un error fuera de las reglas de la operación responde ERR y la conexión sigue
+def test_errores_responden_sin_cortar_la_sesion(tmp_path):
+    banco = crear_banco_ejemplo()
+    respuestas = _sesion(banco, ["AUTH 1 1234", "RETIRO 9e999999", "TRANSFERENCIA 2 1e999999",
+                                 "RETIRO", "DEPOSITO 100:x", "SALDO"])
+    assert respuestas[0].startswith("OK")
+    assert all(r.startswith("ERR") for r in respuestas[1:5])
+    assert respuestas[5] == 'OK {"saldo": "5000.00"}'
+
+    abrir_diario(banco, str(tmp_path / "cajero.diario"))
+    banco.diario.cerrar()
+    respuestas = _sesion(banco, ["AUTH 1 1234", "PAGO Luz 10", "RETIRO 100", "TRANSFERENCIA 2 50",
+                                 "DEPOSITO 100:1", "SALDO"])
+    assert all(r.startswith("ERR") and "diario" in r for r in respuestas[1:5])
+    # ERR quiere decir que la operación no se aplicó
+    assert respuestas[5] == 'OK {"saldo": "5000.00"}'
+    assert banco.cuenta_destino(2).saldo == 3000 * CENTAVOS
+
+# Sin CAJERO, el retiro va al cajero que puede entregarlo y la respuesta
+# dice cuál fue
+def test_retiro_sin_cajero_usa_el_enrutador():
+    banco = crear_banco_ejemplo()
+    banco.dispensadores[0].billetes = {200: 0, 100: 0, 50: 0, 20: 0}
+    respuestas = _sesion(banco, ["AUTH 1 1234", "RETIRO 100", "RETIRO 100", "CAJERO 1", "RETIRO 100"])
+    assert all(json.loads(r[3:])["cajero"] == 2 for r in respuestas[1:3])
+    assert respuestas[4].startswith("ERR")
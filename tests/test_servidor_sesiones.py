@@ -0,0 +1,48 @@
+from servidor_sesiones import ServidorSesiones, Sesion
+from Sistema_de_Cajero import Dispensador, abrir_diario, crear_banco_ejemplo
+
+# Cajeros 1 y 2 sin efectivo; el 3 se agrega con el servidor ya creado
+def _agregar_cajero_con_efectivo(banco):
+    for dispensador in banco.dispensadores:
+        dispensador.billetes = {denom: 0 for denom in dispensador.billetes}
+    nuevo = Dispensador(3, "Sucursal Sur")
+    nuevo.billetes = {200: 5, 100: 5, 50: 5, 20: 5}
+    banco.agregar_dispensador(nuevo)
+    return nuevo
+
+# Sin cajero indicado, el retiro va al que puede entregarlo, aunque se haya
+# agregado después de crear el servidor
+def test_retiro_sin_cajero_va_al_que_puede_entregarlo():
+    banco = crear_banco_ejemplo()
+    with ServidorSesiones(banco, hilos=2) as servidor:
+        nuevo = _agregar_cajero_con_efectivo(banco)
+        resultados = servidor.atender_todas(
+            [Sesion(1, "1234", [("retiro", 100 * 100)]) for _ in range(3)])
+    assert all(r.resultados == [("retiro", True, {100: 1})] for r in resultados)
+    assert nuevo.billetes[100] == 2
+    assert banco.cuentas_por_numero["001-123456"].saldo == (5000 - 300) * 100
+
+def test_cajero_agregado_despues_se_puede_elegir():
+    banco = crear_banco_ejemplo()
+    with ServidorSesiones(banco, hilos=1) as servidor:
+        _agregar_cajero_con_efectivo(banco)
+        resultado = servidor.atender(Sesion(1, "1234", [("retiro", 200 * 100),
+                                                          ("deposito", {50: 2})], cajero_id=3))
+        desconocido = servidor.atender(Sesion(1, "1234", [("saldo",)], cajero_id=9))
+    assert resultado.dispensador_id == 3
+    assert [ok for _, ok, _ in resultado.resultados] == [True, True]
+    assert desconocido.resultados == [(None, False, "Dispensador no encontrado: 9")]
+
+# Un error del diario rechaza esa operación sin cambiar el saldo y la
+# sesión sigue con la siguiente
+def test_error_del_diario_no_corta_la_sesion(tmp_path):
+    banco = crear_banco_ejemplo()
+    abrir_diario(banco, str(tmp_path / "cajero.diario"))
+    banco.diario.cerrar()
+    with ServidorSesiones(banco, hilos=1) as servidor:
+        resultado = servidor.atender(Sesion(1, "1234", [("retiro", 100 * 100), ("pago", "Luz", 10 * 100),
+                                                        ("transferencia", 2, 50 * 100), ("saldo",)],
+                                            cajero_id=1))
+    assert [ok for _, ok, _ in resultado.resultados] == [False, False, False, True]
+    assert all("diario" in detalle for _, _, detalle in resultado.resultados[:3])
+    assert resultado.resultados[3][2] == 5000 * 100